@@ -2,97 +2,496 @@
 #py -m pip install -r requirements.txt
 #fastapi dev AgentRAGServer.py
 
+import time
+IMPORT_STARTED = time.perf_counter()
+
 from dotenv import load_dotenv
 load_dotenv()
-from langchain.chat_models import init_chat_model
-from langchain_openai import OpenAIEmbeddings
-from langchain_chroma import Chroma
-from langchain import hub
 from langchain_core.documents import Document
 from langgraph.graph import START, StateGraph
 from typing_extensions import List, TypedDict
-from fastapi import FastAPI
-import tiktoken
-from typing import Optional
-from langchain_core.messages import BaseMessage, HumanMessage, AIMessage
+from fastapi import FastAPI, Query, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from typing import Optional, Tuple
+from langchain_core.messages import HumanMessage, AIMessage
+from contextlib import asynccontextmanager
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
 import uuid
 from pydantic import BaseModel
+import settings
+from answer_cache import SemanticAnswerCache, history_scope
+from bm25 import BM25_FILENAME, PersistedBM25, fuse
+from context_packing import ContextPacker
+from embedding_cache import CachedQueryEmbeddings
+from embedding_providers import make_embeddings
+from history_manager import HistoryManager, compact_history, format_history, turns_json
+from metrics import CONTENT_TYPE, Counter, Gauge, Histogram, Registry
+from partitions import (CENTROIDS_FILENAME, PARTITIONS, PartitionedVectorStore, QueryRouter, merge_hits,
+                        partition_filter, partition_of)
+from prompts import get_prompt
+from rerank import make_reranker
+from session_store import make_session_store
+from singleflight import SingleFlight, question_key
+from vector_index import MmapVectorIndex, default_path as vector_index_path
+from structured_logging import setup_logging, stop_logging
+from token_accounting import TokenLedger, TokenUsage, count_prompt_stages, count_tokens, load_encoding, provider_usage
+
+logger = logging.getLogger(__name__)
+
+# Model, embedding and vector store clients and the prompt are built by init_backends(), from the
+# lifespan at start-up or by the first node that uses them, so importing this module is fast and needs
+# no network. Anything already set (by tests or benchmarks) is left alone.
+llm = None
+summary_llm = None
+embeddings = None
+vector_store = None
+prompt = None
+BACKENDS = ("llm", "summary_llm", "embeddings", "vector_store", "prompt")
+_backends_lock = threading.Lock()
+
+
+def backends_missing(*names: str) -> bool:
+    """Whether any of the named backends (all of them by default) is still unset"""
+    return any(globals()[name] is None for name in names or BACKENDS)
+
+
+def init_backends(*names: str):
+    """Build the named backends (all of them by default) that are still unset"""
+    global llm, summary_llm, embeddings, vector_store, prompt
+    names = names or BACKENDS
+    with _backends_lock:
+        if ("llm" in names and llm is None) or ("summary_llm" in names and summary_llm is None):
+            from langchain.chat_models import init_chat_model
+            if "llm" in names and llm is None:
+                # stream_usage makes streamed responses report token usage too
+                llm = init_chat_model("openai:gpt-4o", stream_usage=True)
+            if "summary_llm" in names and summary_llm is None:
+                # Smaller model that folds old turns into the running conversation summary
+                summary_llm = init_chat_model(settings.HISTORY_SUMMARY_MODEL)
+
+        if "embeddings" in names and embeddings is None:
+            embeddings = CachedQueryEmbeddings(
+                make_embeddings(),
+                max_entries=settings.QUERY_EMBEDDING_CACHE_SIZE,
+                disk_path=settings.QUERY_EMBEDDING_CACHE_PATH or None,
+            )
+
+        if "vector_store" in names and vector_store is None:
+            if settings.VECTOR_BACKEND == "mmap":
+                # Exact search over the export of the Chroma collection, see vector_index.py
+                vector_store = MmapVectorIndex(vector_index_path())
+            elif settings.PARTITIONED_COLLECTIONS:
+                from langchain_chroma import Chroma
+                vector_store = PartitionedVectorStore({
+                    partition: Chroma(
+                        collection_name=f"{settings.CHROMA_COLLECTION}_{partition}",
+                        embedding_function=embeddings,
+                        persist_directory=settings.CHROMA_PERSIST_DIRECTORY,
+                    )
+                    for partition in PARTITIONS
+                })
+            else:
+                from langchain_chroma import Chroma
+                vector_store = Chroma(
+                    collection_name=settings.CHROMA_COLLECTION,
+                    embedding_function=embeddings,
+                    persist_directory=settings.CHROMA_PERSIST_DIRECTORY,
+                )
+
+        if "prompt" in names and prompt is None:
+            # Local snapshot of rlm/rag-prompt, see prompts.py
+            prompt = get_prompt(settings.PROMPT_SNAPSHOT_PATH or None, settings.PROMPT_HUB_ID, settings.PROMPT_HUB_REFRESH)
+
+
+async def ensure_backends(*names: str):
+    """Build the named backends a node uses in a worker thread if unset; a no-op once the lifespan has run"""
+    if backends_missing(*names):
+        await asyncio.to_thread(init_backends, *names)
+
+
+def preload_vector_index():
+    """Run one query so Chroma loads its index from disk now rather than on the first request"""
+    if isinstance(vector_store, MmapVectorIndex):
+        vector_store.preload()
+        return
+    if isinstance(vector_store, PartitionedVectorStore):
+        collections = vector_store.collections()
+    elif getattr(vector_store, "_collection", None) is not None:
+        collections = [vector_store._collection]
+    else:
+        return
+    for collection in collections:
+        sample = collection.peek(1)
+        vectors = sample.get("embeddings")
+        if vectors is not None and len(vectors):
+            collection.query(query_embeddings=[list(vectors[0])], n_results=1)
+
+
+def run_timed_steps(steps, failure: str) -> Tuple[dict, List[str]]:
+    """Run each (name, load) step, logging `failure` rather than raising; returns the seconds each took and the failed names"""
+    timings, failed = {}, []
+    for step, load in steps:
+        started = time.perf_counter()
+        try:
+            load()
+        except Exception as e:
+            logger.warning(failure, extra={"step": step, "error": str(e)})
+            failed.append(step)
+        timings[step] = round(time.perf_counter() - started, 4)
+    return timings, failed
+
+
+def warm_up() -> dict:
+    """Load what the first request would otherwise wait for; returns the seconds each step took"""
+    return run_timed_steps((
+        ("vector_index", preload_vector_index),
+        ("bm25_index", lexical_index.get),
+        ("tokenizer", lambda: load_encoding(settings.TOKEN_ENCODING)),
+    ), "Warm-up step failed")[0]
+
 
-llm = init_chat_model("openai:gpt-4o")
+def preload_shared_state() -> Tuple[dict, List[str]]:
+    """
+    Load the read-only state before gunicorn forks its workers (see gunicorn.conf.py), so they
+    share it copy-on-write instead of each loading a copy: the prompt, the tokenizer, the BM25
+    index and, with VECTOR_BACKEND=mmap, the vector index. Model, embedding and Chroma clients hold
+    sockets or threads that do not survive a fork; each worker builds those in its lifespan.
+    Returns the seconds each step took and the steps that failed, which the workers load on first use.
+    """
 
-embeddings = OpenAIEmbeddings(
-    model="text-embedding-3-small"
+    def load_vector_index():
+        if settings.VECTOR_BACKEND == "mmap":
+            init_backends("vector_store")
+            preload_vector_index()
+
+    return run_timed_steps((
+        ("prompt", lambda: init_backends("prompt")),
+        ("vector_index", load_vector_index),
+        ("bm25_index", lexical_index.get),
+        ("tokenizer", lambda: load_encoding(settings.TOKEN_ENCODING)),
+    ), "Preload step failed")
+
+
+# BM25 index written by LoaderCloud.py next to the Chroma files; reloaded when re-indexing rewrites it
+lexical_index = PersistedBM25(os.path.join(settings.CHROMA_PERSIST_DIRECTORY, BM25_FILENAME))
+
+# Picks the source partitions a question searches from the centroids LoaderCloud.py writes, see partitions.py
+partition_router = QueryRouter(
+    os.path.join(settings.CHROMA_PERSIST_DIRECTORY, CENTROIDS_FILENAME),
+    margin=settings.PARTITION_ROUTING_MARGIN,
+) if settings.PARTITION_ROUTING else None
+
+answer_cache = SemanticAnswerCache(
+    similarity_threshold=settings.ANSWER_CACHE_SIMILARITY,
+    ttl_seconds=settings.ANSWER_CACHE_TTL_SECONDS,
+    max_entries=settings.ANSWER_CACHE_MAX_ENTRIES,
+) if settings.ANSWER_CACHE_ENABLED else None
+
+token_ledger = TokenLedger(max_records=settings.TOKEN_METRICS_RECENT)
+
+history_manager = HistoryManager(
+    token_budget=settings.HISTORY_TOKEN_BUDGET,
+    keep_turns=settings.HISTORY_KEEP_TURNS,
+    encoding_name=settings.TOKEN_ENCODING,
 )
 
-vector_store = Chroma(
-    collection_name="dgt_rag",
-    embedding_function=embeddings,
-    persist_directory="./chroma_dgt_rag",
+# None unless RERANKER is set; then retrieve over-fetches and the rerank node picks the chunks
+reranker = make_reranker(
+    settings.RERANKER,
+    token_budget=settings.RERANK_TOKEN_BUDGET,
+    diversity=settings.RERANK_DIVERSITY,
+    model_name=settings.RERANK_MODEL,
+    encoding_name=settings.TOKEN_ENCODING,
 )
 
-prompt = hub.pull("rlm/rag-prompt")
+# Shares one graph run between concurrent identical questions that carry no history; None runs each one
+coalescer = SingleFlight() if settings.REQUEST_COALESCING else None
+
+# Merges overlapping chunks and fills the context token budget; None sends the chunks as retrieved
+context_packer = ContextPacker(
+    token_budget=settings.CONTEXT_TOKEN_BUDGET,
+    encoding_name=settings.TOKEN_ENCODING,
+) if settings.CONTEXT_PACKING else None
+
+
+# Prometheus metrics served by GET /metrics. Latencies are observed on the request path; the
+# token, cache and session series are read from the existing stats() methods at scrape time.
+metrics_registry = Registry()
+NODE_SECONDS = metrics_registry.register(Histogram(
+    "agentrag_node_duration_seconds", "Latency of each LangGraph node", ("node",)))
+EMBEDDING_SECONDS = metrics_registry.register(Histogram(
+    "agentrag_query_embedding_duration_seconds", "Question embedding latency, query-embedding cache hits included"))
+LLM_SECONDS = metrics_registry.register(Histogram(
+    "agentrag_llm_duration_seconds", "Latency of the answer model call"))
+HTTP_SECONDS = metrics_registry.register(Histogram(
+    "agentrag_http_request_duration_seconds", "HTTP latency until the response starts (headers sent)",
+    ("method", "route", "status")))
+
+def token_series():
+    stats = token_ledger.stats(1)
+    return [((kind,), value) for kind, value in stats["totals"].items()]
+
+
+def answer_series():
+    stats = token_ledger.stats(1)
+    return [(("model",), stats["requests"] - stats["cached_requests"]), (("cache",), stats["cached_requests"])]
+
+
+def answer_cache_series():
+    if answer_cache is None:
+        return []
+    return [(("hit",), answer_cache.hits), (("miss",), answer_cache.misses)]
+
+
+def query_embedding_cache_series():
+    if not isinstance(embeddings, CachedQueryEmbeddings):
+        return []
+    return [(("memory_hit",), embeddings.memory_hits), (("disk_hit",), embeddings.disk_hits), (("miss",), embeddings.misses)]
+
+
+def coalescing_series():
+    if coalescer is None:
+        return []
+    stats = coalescer.stats()
+    return [(("leader",), stats["leaders"]), (("follower",), stats["followers"])]
+
+
+# Set while a /metrics scrape renders, so the session series share one stats() query (see render_metrics)
+_scrape = threading.local()
+
+
+def scraped_session_stats() -> dict:
+    stats = getattr(_scrape, "session_stats", None)
+    return conversation_sessions.stats() if stats is None else stats
+
+
+def render_metrics() -> str:
+    """The exposition text; runs in a worker thread, since the SQLite session store queries its file"""
+    _scrape.session_stats = conversation_sessions.stats()
+    try:
+        return metrics_registry.render()
+    finally:
+        _scrape.session_stats = None
+
+
+def session_eviction_series():
+    stats = scraped_session_stats()
+    return [(("capacity",), stats["capacity_evictions"]), (("idle",), stats["idle_evictions"])]
+
+
+for metric in (
+    Counter("agentrag_tokens_total", "Tokens per prompt stage, answer, model input/output and context saved by packing",
+            ("kind",), collect=token_series),
+    Counter("agentrag_answers_total", "Answers by where they came from", ("source",), collect=answer_series),
+    Counter("agentrag_answer_cache_lookups_total", "Semantic answer cache lookups", ("result",),
+            collect=answer_cache_series),
+    Gauge("agentrag_answer_cache_entries", "Answers in the semantic answer cache",
+          collect=lambda: [] if answer_cache is None else [((), len(answer_cache))]),
+    Counter("agentrag_query_embedding_cache_lookups_total", "Query-embedding cache lookups", ("result",),
+            collect=query_embedding_cache_series),
+    Counter("agentrag_coalesced_requests_total",
+            "Stateless /AgentInvoke requests that ran the graph (leader) or shared a run already in flight (follower)",
+            ("role",), collect=coalescing_series),
+    Gauge("agentrag_sessions", "Live conversation sessions",
+          collect=lambda: [((), scraped_session_stats()["sessions"])]),
+    Gauge("agentrag_session_bytes", "Approximate memory held by conversation histories",
+          collect=lambda: [((), scraped_session_stats()["approx_bytes"])]),
+    Counter("agentrag_session_evictions_total", "Sessions dropped", ("reason",), collect=session_eviction_series),
+    Counter("agentrag_history_summaries_total", "Conversation summarization calls", ("result",),
+            collect=lambda: [(("ok",), history_manager.summaries), (("failed",), history_manager.failures)]),
+    Counter("agentrag_partition_searches_total", "Questions that searched each source partition after routing",
+            ("partition",), collect=lambda: [] if partition_router is None else
+            [((partition,), count) for partition, count in partition_router.stats()["searches"].items()]),
+):
+    metrics_registry.register(metric)
+
+
+def instrument(node: str, function):
+    """Graph node that records its latency in agentrag_node_duration_seconds"""
+    async def timed_node(state: State):
+        with NODE_SECONDS.time(node=node):
+            return await function(state)
+    timed_node.__name__ = function.__name__
+    return timed_node
+
+
+async def timed_llm_call(messages):
+    with LLM_SECONDS.time():
+        return await llm.ainvoke(messages)
 
 
 class State(TypedDict):
     question: str
     context: List[Document]
     answer: str
-    conversation_history: List[BaseMessage]
+    # Turn records loaded from the session store, then the messages this run adds
+    conversation_history: List
     session_id: Optional[str]
+    question_embedding: List[float]
+    context_tokens_saved: int
+
+def index_version():
+    """Fingerprint of the persisted Chroma files (and vector index export); it changes whenever the index is written"""
+    version = []
+    for name in ("chroma.sqlite3", "chroma.sqlite3-wal"):
+        try:
+            version.append(os.stat(os.path.join(settings.CHROMA_PERSIST_DIRECTORY, name)).st_mtime_ns)
+        except FileNotFoundError:
+            version.append(None)
+    if isinstance(vector_store, MmapVectorIndex):
+        version.append(vector_store.version())
+    return tuple(version)
+
+def chunk_ids(documents: List[Document]) -> List[str]:
+    """IDs of the chunks behind `documents`: every chunk of a packed block (see context_packing), else the document's"""
+    ids = []
+    for doc in documents:
+        ids.extend(doc.metadata.get("chunk_ids") or [doc.id or hashlib.sha1(doc.page_content.encode("utf-8")).hexdigest()])
+    return ids
+
+def lexical_search(question: str, k: int) -> Optional[List[str]]:
+    """Chunk IDs of the BM25 hits, or None when hybrid retrieval is off or no BM25 index was built"""
+    index = lexical_index.get() if settings.HYBRID_RETRIEVAL else None
+    if index is None:
+        return None
+    return [doc_id for doc_id, _ in index.search(question, k)]
+
+def search_candidates(k: int) -> int:
+    """Vector hits to fetch for `k` results: more when they are fused with BM25 hits"""
+    return max(k, settings.HYBRID_CANDIDATES) if settings.HYBRID_RETRIEVAL else k
 
-def num_tokens_from_string(string: str, encoding_name: str) -> int:
-    """Returns the number of tokens in a text string."""
-    encoding = tiktoken.get_encoding(encoding_name)
-    num_tokens = len(encoding.encode(string))
-    return num_tokens
+def retrieval_k() -> int:
+    """Chunks retrieve returns: candidates for the rerank node or the packer, else the final RETRIEVAL_K"""
+    if reranker is not None:
+        return settings.RERANK_CANDIDATES
+    if context_packer is not None:
+        return settings.CONTEXT_CANDIDATES
+    return settings.RETRIEVAL_K
 
-def retrieve(state: State):
-    retrieved_docs = vector_store.similarity_search(
-        state["question"],
-        k=3,
+async def retrieve(state: State):
+    # Embed through the cached async client (a hit skips the OpenAI round trip),
+    # then search with the question's vector
+    await ensure_backends("embeddings", "vector_store")
+    with EMBEDDING_SECONDS.time():
+        query_embedding = await embeddings.aembed_query(state["question"])
+    retrieved_docs = await search(state["question"], query_embedding)
+    return {"context": retrieved_docs, "question_embedding": query_embedding}
+
+
+def route(query_embedding: List[float]) -> Optional[List[str]]:
+    """Source partitions the question searches, or None for all of them"""
+    return partition_router.route(query_embedding) if partition_router is not None else None
+
+
+async def vector_search(query_embedding: List[float], k: int, partitions: Optional[List[str]]) -> List[Document]:
+    """Vector hits from the given partitions: one search per partition collection in parallel, else one filtered search"""
+    if isinstance(vector_store, PartitionedVectorStore):
+        hits = await asyncio.gather(*(
+            asyncio.to_thread(vector_store.search_partition, partition, query_embedding, k)
+            for partition in partitions or vector_store.partitions()
+        ))
+        return merge_hits(hits, k)
+    if partitions is None:
+        return await asyncio.to_thread(vector_store.similarity_search_by_vector, query_embedding, k=k)
+    return await asyncio.to_thread(
+        vector_store.similarity_search_by_vector, query_embedding, k=k, filter=partition_filter(partitions)
     )
-    # print("Retrieved docs:")
-    # print(retrieved_docs)s
 
-    for document in retrieved_docs:
-        print(document.metadata["source"])
-    return {"context": retrieved_docs}
+
+async def search(question: str, query_embedding: List[float], vector_docs: Optional[List[Document]] = None,
+                 partitions: Optional[List[str]] = None) -> List[Document]:
+    """
+    Run the (synchronous) vector search of the routed partitions and the BM25
+    search in worker threads and fuse them; `vector_docs` skips routing and
+    the vector search when the hits (from `partitions`) are known.
+    """
+    k = retrieval_k()
+    candidates = search_candidates(k)
+    if vector_docs is None:
+        partitions = route(query_embedding)
+        vector_docs, lexical_ids = await asyncio.gather(
+            vector_search(query_embedding, candidates, partitions),
+            asyncio.to_thread(lexical_search, question, candidates),
+        )
+    else:
+        lexical_ids = await asyncio.to_thread(lexical_search, question, candidates)
+    if lexical_ids is None:
+        retrieved_docs = vector_docs[:k]
+    else:
+        fetch = vector_store.get_by_ids
+        if partitions is not None:
+            # The BM25 index spans every partition; its hits from the others are dropped
+            fetch = lambda ids: [doc for doc in vector_store.get_by_ids(ids) if partition_of(doc.metadata) in partitions]
+        # Codes and form titles the embeddings miss come in through BM25
+        retrieved_docs = await asyncio.to_thread(fuse, vector_docs, lexical_ids, fetch, k, settings.RRF_K)
+    logger.debug("Retrieved chunks", extra={"sources": [document.metadata.get("source") for document in retrieved_docs]})
+    return retrieved_docs
+
+
+async def rerank(state: State):
+    """Keep the best over-fetched chunks that fit the rerank token budget (CPU work, in a worker thread)"""
+    reranked_docs = await asyncio.to_thread(reranker.rerank, state["question"], state["context"])
+    return {"context": reranked_docs}
+
+
+async def pack_context(state: State):
+    """Merge overlapping chunks of the same file and keep what fits the context token budget"""
+    packed = await asyncio.to_thread(context_packer.pack, state["context"])
+    logger.debug("Packed context", extra={
+        "chunks": packed.chunks, "blocks": len(packed.documents),
+        "tokens": packed.tokens, "tokens_saved": packed.tokens_saved,
+    })
+    return {"context": packed.documents, "context_tokens_saved": packed.tokens_saved}
 
 
-def update_memory(state: State):
+# Nodes from retrieval to the prompt context, by name (see context_nodes)
+CONTEXT_NODE_FUNCTIONS = {"retrieve": retrieve, "rerank": rerank, "pack_context": pack_context}
+
+
+async def update_memory(state: State):
     """Update conversation history with the current question and prepare for response"""
     # Add the current question to conversation history
     new_history = state.get("conversation_history", []) + [HumanMessage(content=state["question"])]
     return {"conversation_history": new_history}
 
-def generate(state: State):
-    docs_content = "\n\n".join(doc.page_content for doc in state["context"])
-    
+async def condense_history(state: State):
+    """Fold old turns into the running summary when the history is over its token budget (runs alongside retrieve)"""
+    await ensure_backends("summary_llm")
+    condensed = await history_manager.condense(state["conversation_history"], summary_llm)
+    if condensed is None:
+        return {}
+    return {"conversation_history": condensed}
+
+async def generate(state: State):
+    await ensure_backends("llm", "prompt")
     # Get conversation history
     conversation_history = state.get("conversation_history", [])
     
-    # Build conversation context string
-    conversation_context = ""
-    if len(conversation_history) > 1:
-        # Exclude the last human message as it's the current question
-        history_messages = conversation_history[:-1]
-        conversation_parts = []
-        for msg in history_messages:
-            # Handle both message objects and dictionaries
-            if isinstance(msg, dict):
-                msg_type = msg.get("type", "")
-                msg_content = msg.get("content", "")
-                if msg_type == "HumanMessage":
-                    conversation_parts.append(f"Human: {msg_content}")
-                elif msg_type == "AIMessage":
-                    conversation_parts.append(f"Assistant: {msg_content}")
-            elif hasattr(msg, '__class__') and msg.__class__.__name__ == "HumanMessage":
-                conversation_parts.append(f"Human: {msg.content}")
-            elif hasattr(msg, '__class__') and msg.__class__.__name__ == "AIMessage":
-                conversation_parts.append(f"Assistant: {msg.content}")
-        
-        if conversation_parts:
-            conversation_context = "\n\nPrevious conversation:\n" + "\n".join(conversation_parts) + "\n\n"
+    # Reuse a cached answer for a near-identical question over the same chunks,
+    # scoped to the previous turns so follow-ups never get a standalone answer
+    cache_key = None
+    if answer_cache is not None and state.get("question_embedding"):
+        cache_key = (
+            history_scope(conversation_history[:-1]),
+            state["question_embedding"],
+            chunk_ids(state["context"]),
+        )
+        current_index = index_version()
+        cached_answer = answer_cache.lookup(*cache_key, index_version=current_index)
+        if cached_answer is not None:
+            token_ledger.record(TokenUsage(session_id=state.get("session_id"), source="cache", cached=True))
+            return {"answer": cached_answer, "conversation_history": conversation_history + [AIMessage(content=cached_answer)]}
+    
+    docs_content = "\n\n".join(doc.page_content for doc in state["context"])
+    
+    # Build conversation context string: the running summary plus the recent turns
+    # (excluding the last human message, as it's the current question)
+    conversation_context = format_history(conversation_history[:-1])
     
     
     # Create messages with conversation context
@@ -104,15 +503,37 @@ def generate(state: State):
         original_content = messages.messages[0].content
         messages.messages[0].content = conversation_context + original_content
     
-    #LLM Input Prompt and count
-    # print(messages.messages[0].content)
-    print("Input token count: " + str(num_tokens_from_string(messages.messages[0].content, "cl100k_base")))
-
-    #LLM Output and count
-    response = llm.invoke(messages)
+    # Count the prompt stages in a worker thread while the model is answering
+    stage_counts, response = await asyncio.gather(
+        asyncio.to_thread(
+            count_prompt_stages,
+            conversation_context,
+            docs_content,
+            state["question"],
+            messages.messages[0].content,
+            settings.TOKEN_ENCODING,
+        ),
+        timed_llm_call(messages),
+    )
     answer = response.content
-    print("Output token count: " + str(num_tokens_from_string(answer, "cl100k_base")))
-    print(answer)
+    
+    usage = TokenUsage(session_id=state.get("session_id"), context_saved=state.get("context_tokens_saved", 0), **stage_counts)
+    reported = provider_usage(response)
+    if reported:
+        usage.source = "provider"
+        usage.input_tokens = reported["input_tokens"]
+        usage.answer = usage.output_tokens = reported["output_tokens"]
+    else:
+        usage.answer = usage.output_tokens = await asyncio.to_thread(count_tokens, answer, settings.TOKEN_ENCODING)
+        usage.input_tokens = sum(stage_counts.values())
+    token_ledger.record(usage)
+    logger.info("Answer generated", extra={
+        "session_id": usage.session_id, "input_tokens": usage.input_tokens,
+        "output_tokens": usage.output_tokens, "token_source": usage.source,
+    })
+    
+    if cache_key is not None:
+        answer_cache.store(*cache_key, answer, index_version=current_index)
     
     # Add the AI response to conversation history
     updated_history = conversation_history + [AIMessage(content=answer)]
@@ -120,112 +541,403 @@ def generate(state: State):
     return {"answer": answer, "conversation_history": updated_history}
 
 
-graph_builder = StateGraph(State)
-graph_builder.add_node("update_memory", update_memory)
-graph_builder.add_node("retrieve", retrieve)
-graph_builder.add_node("generate", generate)
+def context_nodes() -> List[str]:
+    """Nodes from retrieval to the prompt context; the last one's update carries the final chunks"""
+    nodes = ["retrieve"]
+    if reranker is not None:
+        nodes.append("rerank")
+    if context_packer is not None:
+        nodes.append("pack_context")
+    return nodes
+
+
+def build_graph():
+    """Compile the pipeline; rerank and pack_context are only wired in when configured"""
+    graph_builder = StateGraph(State)
+    graph_builder.add_node("update_memory", instrument("update_memory", update_memory))
+    nodes = context_nodes()
+    for node in nodes:
+        graph_builder.add_node(node, instrument(node, CONTEXT_NODE_FUNCTIONS[node]))
+    graph_builder.add_node("condense_history", instrument("condense_history", condense_history))
+    graph_builder.add_node("generate", instrument("generate", generate))
 
-# Define the flow: START -> update_memory -> retrieve -> generate
-graph_builder.add_edge(START, "update_memory")
-graph_builder.add_edge("update_memory", "retrieve")
-graph_builder.add_edge("retrieve", "generate")
+    # Define the flow: START -> update_memory -> (retrieve [-> rerank] [-> pack_context], condense_history) -> generate
+    graph_builder.add_edge(START, "update_memory")
+    graph_builder.add_edge("update_memory", "retrieve")
+    graph_builder.add_edge("update_memory", "condense_history")
+    for source, target in zip(nodes, nodes[1:]):
+        graph_builder.add_edge(source, target)
+    # generate waits for both branches; two plain edges would run it once per branch when they end in different steps
+    graph_builder.add_edge([nodes[-1], "condense_history"], "generate")
+    return graph_builder.compile()
 
-graph = graph_builder.compile()
 
-# In-memory storage for conversation sessions
-conversation_sessions = {}
+graph = build_graph()
+
+# Conversation sessions, bounded by idle TTL, session count and history size; kept in this process
+# or, with SESSION_STORE=sqlite, in a file every worker shares
+conversation_sessions = make_session_store(
+    settings.SESSION_STORE,
+    path=settings.SESSION_DB_PATH,
+    ttl_seconds=settings.SESSION_TTL_SECONDS,
+    max_sessions=settings.SESSION_MAX_SESSIONS,
+    max_turns=settings.SESSION_MAX_TURNS,
+    max_bytes=settings.SESSION_MAX_BYTES,
+)
 
 class ChatRequest(BaseModel):
     question: str
     session_id: Optional[str] = None
+    # Return only the question and answer this request added, not the whole history
+    delta: bool = False
 
 class ChatResponse(BaseModel):
     answer: str
     session_id: str
     conversation_history: List[dict]
+    # Position of the first returned message in the stored history, and the stored history's length
+    history_offset: int = 0
+    history_length: Optional[int] = None
+
+class BatchRequest(BaseModel):
+    questions: List[str]
+
+class BatchResult(BaseModel):
+    question: str
+    answer: Optional[str] = None
+    sources: List[dict] = []
+    error: Optional[str] = None
+
+class BatchResponse(BaseModel):
+    results: List[BatchResult]
+
+# Filled in by the lifespan; /ready answers 503 until "ready" is set
+startup_state = {"ready": False}
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Build the clients and warm the indexes before the server takes traffic, and time it"""
+    setup_logging(settings.LOG_LEVEL, settings.LOG_JSON)
+    steps = {}
+    started = time.perf_counter()
+    await asyncio.to_thread(init_backends)
+    steps["backends"] = round(time.perf_counter() - started, 4)
+    if settings.STARTUP_WARMUP:
+        steps.update(await asyncio.to_thread(warm_up))
+    cold_start = time.perf_counter() - IMPORT_STARTED
+    startup_state.update(
+        ready=True,
+        cold_start_seconds=round(cold_start, 4),
+        budget_seconds=settings.STARTUP_TIME_BUDGET_SECONDS,
+        within_budget=cold_start <= settings.STARTUP_TIME_BUDGET_SECONDS,
+        steps=steps,
+    )
+    logger.log(
+        logging.INFO if startup_state["within_budget"] else logging.WARNING,
+        "Ready" if startup_state["within_budget"] else "Ready, cold start over budget",
+        extra={"cold_start_seconds": startup_state["cold_start_seconds"],
+               "budget_seconds": settings.STARTUP_TIME_BUDGET_SECONDS, "steps": steps},
+    )
+    yield
+    startup_state["ready"] = False
+    stop_logging()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+@app.middleware("http")
+async def record_http_latency(request: Request, call_next):
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # The route template keeps session IDs out of the labels
+        route = request.scope.get("route")
+        HTTP_SECONDS.observe(time.perf_counter() - started, method=request.method,
+                             route=getattr(route, "path", "unmatched"), status=status)
 
-app = FastAPI()
 
 @app.get("/")
 async def root():
     return "HTTP Endpoint for AgentRAG DGT with Memory"
 
-@app.post("/AgentInvoke", response_model=ChatResponse)
+def load_session_history(session_id: str) -> List:
+    """Return the stored history of a session as Turn records (see history_manager)"""
+    return compact_history(conversation_sessions.get(session_id, []))
+
+async def build_initial_state(question: str, session_id: str) -> State:
+    """Prepare the graph input with the session's conversation history (read in a worker thread)"""
+    return {
+        "question": question,
+        "context": [],
+        "answer": "",
+        "conversation_history": await asyncio.to_thread(load_session_history, session_id),
+        "session_id": session_id
+    }
+
+def history_json(session_id: str, history: List, offset: int = 0, limit: Optional[int] = None) -> str:
+    """
+    JSON fields for `limit` messages of a stored history from position `offset`, built from
+    each Turn's cached JSON instead of serializing the whole history on every request
+    """
+    page = history[offset:] if limit is None else history[offset:offset + limit]
+    return (f'"session_id":{json.dumps(session_id)},"conversation_history":{turns_json(page)},'
+            f'"history_offset":{offset},"history_length":{len(history)}')
+
+def chat_response_json(answer: str, session_id: str, history: List, delta: bool = False) -> str:
+    """ChatResponse as JSON; with `delta`, only the question and answer at the end of `history`"""
+    offset = max(0, len(history) - 2) if delta else 0
+    return f'{{"answer":{json.dumps(answer, ensure_ascii=False)},{history_json(session_id, history, offset)}}}'
+
+def document_sources(documents: List[Document]) -> List[dict]:
+    """Describe retrieved chunks for clients without sending their full text; merged blocks also list their chunks"""
+    sources = []
+    for doc in documents:
+        source = {"id": doc.id, "source": doc.metadata.get("source")}
+        if len(doc.metadata.get("chunk_ids", ())) > 1:
+            source["chunk_ids"] = doc.metadata["chunk_ids"]
+        sources.append(source)
+    return sources
+
+def server_sent_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+# The handler writes the ChatResponse JSON itself (see chat_response_json); the model documents it
+@app.post("/AgentInvoke", response_model=ChatResponse, response_class=JSONResponse)
 async def complete_text(request: ChatRequest):
     # Generate session ID if not provided
     session_id = request.session_id or str(uuid.uuid4())
     
-    # Get or create conversation history for this session
-    stored_history = conversation_sessions.get(session_id, [])
-    
-    # Convert dictionaries back to message objects if needed
-    conversation_history = []
-    for msg in stored_history:
-        if isinstance(msg, dict):
-            msg_type = msg.get("type", "")
-            msg_content = msg.get("content", "")
-            if msg_type == "HumanMessage":
-                conversation_history.append(HumanMessage(content=msg_content))
-            elif msg_type == "AIMessage":
-                conversation_history.append(AIMessage(content=msg_content))
-        else:
-            conversation_history.append(msg)
-    
     # Prepare the state with conversation history
-    state = {
-        "question": request.question,
-        "context": [],
-        "answer": "",
-        "conversation_history": conversation_history,
-        "session_id": session_id
-    }
+    state = await build_initial_state(request.question, session_id)
     
-    # Run the graph
-    response = graph.invoke(state)
+    if coalescer is not None and not state["conversation_history"]:
+        # Without history the answer depends on the question alone, so identical questions
+        # asked at the same time share one retrieval and one model call
+        response = await coalescer.run(question_key(request.question), lambda: graph.ainvoke(state))
+        history = [HumanMessage(content=request.question), AIMessage(content=response["answer"])]
+    else:
+        # Run the graph
+        response = await graph.ainvoke(state)
+        history = response["conversation_history"]
     
     # Update the session with the new conversation history
-    conversation_sessions[session_id] = response["conversation_history"]
-    
-    # Convert BaseMessage objects to dictionaries for JSON response
-    history_dicts = []
-    for msg in response["conversation_history"]:
-        history_dicts.append({
-            "type": msg.__class__.__name__,
-            "content": msg.content
-        })
+    history = await asyncio.to_thread(conversation_sessions.put, session_id, history)
     
-    return ChatResponse(
-        answer=response["answer"],
-        session_id=session_id,
-        conversation_history=history_dicts
+    return Response(content=chat_response_json(response["answer"], session_id, history, request.delta),
+                    media_type="application/json")
+
+async def embed_questions(questions: List[str]) -> List[List[float]]:
+    """Question vectors from one embeddings request (cache hits excluded)"""
+    if isinstance(embeddings, CachedQueryEmbeddings):
+        return await embeddings.aembed_queries(questions)
+    return await embeddings.aembed_documents(questions)
+
+async def answer_batch_item(question: str, query_embedding: List[float], llm_slots: asyncio.Semaphore,
+                            vector_docs: Optional[List[Document]] = None,
+                            partitions: Optional[List[str]] = None) -> State:
+    """The graph's path for one stateless question whose embedding (and vector hits) are already known"""
+    state = {
+        "question": question,
+        "context": await search(question, query_embedding, vector_docs, partitions),
+        "answer": "",
+        "conversation_history": [HumanMessage(content=question)],
+        "session_id": None,
+        "question_embedding": query_embedding,
+    }
+    for node in context_nodes()[1:]:
+        state.update(await CONTEXT_NODE_FUNCTIONS[node](state))
+    async with llm_slots:
+        state.update(await generate(state))
+    return state
+
+@app.post("/AgentInvoke/batch", response_model=BatchResponse)
+async def batch_text(request: BatchRequest):
+    """
+    Answer many stateless questions in one call, for offline jobs.
+
+    All questions are embedded in one embeddings request. With VECTOR_BACKEND=mmap
+    one pass over the index scores all of them; with Chroma each question runs its
+    own search, concurrently in worker threads. At most BATCH_CONCURRENCY model
+    calls run at once. Results come back in input order, with `error` set on the
+    items that failed. No session is kept.
+    """
+    questions = request.questions
+    if len(questions) > settings.BATCH_MAX_QUESTIONS:
+        return JSONResponse(status_code=413, content={
+            "error": f"At most {settings.BATCH_MAX_QUESTIONS} questions per batch, got {len(questions)}"
+        })
+    if not questions:
+        return BatchResponse(results=[])
+
+    await ensure_backends("embeddings", "vector_store", "llm", "prompt")
+    try:
+        vectors = await embed_questions(questions)
+    except Exception as e:
+        logger.warning("Batch embedding failed", extra={"questions": len(questions), "error": str(e)})
+        return BatchResponse(results=[BatchResult(question=q, error=f"Embedding failed: {e}") for q in questions])
+
+    vector_hits = routes = [None] * len(questions)
+    if isinstance(vector_store, MmapVectorIndex):
+        # One pass over the mapped matrix scores every question, each within its routed partitions
+        routes = [route(vector) for vector in vectors]
+        try:
+            vector_hits = await asyncio.to_thread(
+                vector_store.similarity_search_by_vectors, vectors, search_candidates(retrieval_k()), routes
+            )
+        except Exception as e:
+            logger.warning("Batch vector search failed", extra={"questions": len(questions), "error": str(e)})
+            return BatchResponse(results=[BatchResult(question=q, error=f"Search failed: {e}") for q in questions])
+
+    llm_slots = asyncio.Semaphore(settings.BATCH_CONCURRENCY)
+    outcomes = await asyncio.gather(
+        *(answer_batch_item(question, vector, llm_slots, hits, partitions)
+          for question, vector, hits, partitions in zip(questions, vectors, vector_hits, routes)),
+        return_exceptions=True,
+    )
+    results = []
+    for question, outcome in zip(questions, outcomes):
+        if isinstance(outcome, BaseException):
+            results.append(BatchResult(question=question, error=f"{type(outcome).__name__}: {outcome}"))
+        else:
+            results.append(BatchResult(question=question, answer=outcome["answer"],
+                                       sources=document_sources(outcome["context"])))
+    return BatchResponse(results=results)
+
+@app.post("/AgentInvoke/stream")
+async def stream_text(request: ChatRequest):
+    """
+    Server-Sent Events variant of /AgentInvoke.
+
+    Emits a `sources` event as soon as retrieval finishes, one `token` event per
+    chunk produced by the generate node, and a final `done` event carrying the
+    same payload as ChatResponse. The session is updated before `done` is sent.
+    """
+    session_id = request.session_id or str(uuid.uuid4())
+    state = await build_initial_state(request.question, session_id)
+
+    # Node whose update carries the chunks that reach the prompt
+    sources_node = context_nodes()[-1]
+
+    async def event_stream():
+        final_state = dict(state)
+        streamed_tokens = False
+        try:
+            async for mode, payload in graph.astream(state, stream_mode=["updates", "messages"]):
+                if mode == "messages":
+                    chunk, metadata = payload
+                    if metadata.get("langgraph_node") == "generate" and chunk.content:
+                        streamed_tokens = True
+                        yield server_sent_event("token", {"content": chunk.content})
+                    continue
+                for node, update in payload.items():
+                    if not update:
+                        continue
+                    final_state.update(update)
+                    if node == sources_node:
+                        yield server_sent_event("sources", document_sources(update["context"]))
+        except Exception as e:
+            yield server_sent_event("error", {"session_id": session_id, "detail": str(e)})
+            return
+
+        # The model produced no token stream (e.g. a non-streaming client): send the answer whole
+        if not streamed_tokens and final_state["answer"]:
+            yield server_sent_event("token", {"content": final_state["answer"]})
+
+        history = await asyncio.to_thread(conversation_sessions.put, session_id, final_state["conversation_history"])
+        done = chat_response_json(final_state["answer"], session_id, history, request.delta)
+        yield f"event: done\ndata: {done}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
 
 @app.get("/conversation/{session_id}")
-async def get_conversation(session_id: str):
-    """Get conversation history for a specific session"""
-    if session_id not in conversation_sessions:
+async def get_conversation(session_id: str, since: int = Query(0, ge=0), limit: Optional[int] = Query(None, ge=0)):
+    """Get conversation history for a specific session: all of it, or `limit` messages from position `since`"""
+    history = await asyncio.to_thread(conversation_sessions.get, session_id)
+    if history is None:
         return {"error": "Session not found"}
     
-    history_dicts = []
-    for msg in conversation_sessions[session_id]:
-        history_dicts.append({
-            "type": msg.__class__.__name__,
-            "content": msg.content
-        })
-    
-    return {
-        "session_id": session_id,
-        "conversation_history": history_dicts
-    }
+    return Response(content=f"{{{history_json(session_id, history, since, limit)}}}", media_type="application/json")
 
 @app.delete("/conversation/{session_id}")
 async def clear_conversation(session_id: str):
     """Clear conversation history for a specific session"""
-    if session_id in conversation_sessions:
-        del conversation_sessions[session_id]
+    if await asyncio.to_thread(conversation_sessions.pop, session_id) is not None:
         return {"message": f"Conversation {session_id} cleared"}
     return {"error": "Session not found"}
 
+@app.get("/ready")
+async def ready():
+    """Readiness probe: 200 with the cold-start timings once start-up finished, else 503"""
+    if not startup_state.get("ready"):
+        return JSONResponse(status_code=503, content={"ready": False})
+    return startup_state
+
+@app.get("/sessions/stats")
+async def session_stats():
+    """Live sessions, evictions and approximate memory held by conversation histories"""
+    return {**await asyncio.to_thread(conversation_sessions.stats), "history": history_manager.stats()}
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Hit/miss counters of the semantic answer cache and the query-embedding cache"""
+    stats = {"enabled": False} if answer_cache is None else {"enabled": True, **answer_cache.stats()}
+    if isinstance(embeddings, CachedQueryEmbeddings):
+        stats["query_embeddings"] = embeddings.stats()
+    return stats
+
+@app.delete("/cache")
+async def clear_cache():
+    """Drop every cached answer"""
+    if answer_cache is None:
+        return {"error": "Answer cache disabled"}
+    answer_cache.invalidate()
+    return {"message": "Answer cache cleared"}
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Node, embedding, model and HTTP latency histograms, token totals and cache/session gauges (Prometheus text format)"""
+    return Response(content=await asyncio.to_thread(render_metrics), media_type=CONTENT_TYPE)
+
+@app.get("/metrics/tokens")
+async def token_metrics(limit: Optional[int] = None):
+    """Token totals per stage and the most recent per-request token counts"""
+    return token_ledger.stats(limit)
+
+@app.get("/metrics/coalescing")
+async def coalescing_metrics():
+    """Stateless questions that shared an in-flight graph run, and the upstream calls that saved"""
+    if coalescer is None:
+        return {"enabled": False}
+    stats = coalescer.stats()
+    # Each follower skipped one question embedding, one vector search and one model call
+    return {"enabled": True, **stats, "upstream_calls_saved": {
+        "embeddings": stats["followers"], "searches": stats["followers"], "llm_calls": stats["followers"],
+    }}
+
+@app.get("/metrics/routing")
+async def routing_metrics():
+    """Questions routed to a subset of the source partitions, and searches per partition"""
+    if partition_router is None:
+        return {"enabled": False}
+    return {"enabled": True, **partition_router.stats()}
+
+@app.get("/metrics/rerank")
+async def rerank_metrics():
+    """Latency of the rerank node and how many candidates it kept"""
+    if reranker is None:
+        return {"enabled": False}
+    return {"enabled": True, **reranker.stats()}
+
 # if __name__ == "__main__":
 #     import uvicorn
 #     uvicorn.run(app, host="127.0.0.1", port=8000)
\ No newline at end of file
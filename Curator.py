@@ -1,11 +1,15 @@
 #Go through every file in the Docs_md folder and run a regex replace all
+import argparse
 import os
-import re
 import shutil
-from markitdown import MarkItDown, UnsupportedFormatException, FileConversionException
+import time
+import settings
+from cleaning import clean_files, markdown_files
+from conversion import ConversionReport, convert_files
 from scrape import Scrape
 
-def convert_documents(origin_folder: str, new_folder: str):
+def convert_documents(origin_folder: str, new_folder: str, workers: int = settings.CONVERSION_WORKERS,
+                      timeout: float = settings.CONVERSION_TIMEOUT_SECONDS) -> ConversionReport:
     """
     Converts all documents in the origin folder to markdown, places them in a new
     folder, and cleans up the directory structures.
@@ -13,24 +17,14 @@ def convert_documents(origin_folder: str, new_folder: str):
     Args:
         origin_folder (str): The source folder containing files to convert.
         new_folder (str): The destination folder for the markdown files.
+        workers (int): Worker processes converting in parallel; 0 converts one file at a time in this process.
+        timeout (float): Seconds a single file may take in a worker before the worker is killed.
     """
-    md = MarkItDown()
-
     # Convert all docs to markdown
     print(f"Converting files from '{origin_folder}'...")
-    for root, _, files in os.walk(origin_folder):
-        for file in files:
-            filename = os.path.join(root, file)
-            try:
-                result = md.convert(filename)
-                print(f"  Successfully converted: {filename}")
-                output_filename = re.sub(r"\.\w{2,4}$", ".md", filename)
-                with open(output_filename, "w", encoding="utf-8") as f:
-                    f.write(result.text_content)
-            except (UnsupportedFormatException, FileConversionException) as e:
-                print(f"  Skipping conversion for {filename}: {e}")
-            except Exception as e:
-                print(f"  An unexpected error occurred with {filename}: {e}")
+    sources = [os.path.join(root, file) for root, _, files in os.walk(origin_folder) for file in files]
+    report = convert_files(sources, workers=workers, timeout=timeout)
+    print(report.summary())
 
     # Make a copy of the origin folder
     if not os.path.exists(new_folder):
@@ -51,52 +45,67 @@ def convert_documents(origin_folder: str, new_folder: str):
             if file.endswith(".md"):
                 os.remove(os.path.join(root, file))
     print("\nConversion and cleanup complete.")
+    return report
 
 
-def clean_markdown_files(*directories):
-    for directory in directories:
-        print(f"Cleaning files in directory: {directory}")
-        for root, _, files in os.walk(directory):
-            for file_name in files:
-                if file_name.endswith(".md"):
-                    file_path = os.path.join(root, file_name)
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        content = f.read()
-
-                    #Remove repetitive footer/header data
-                    content = re.sub(r'PROCEDIMENTO OPERACIONAL PADRÃO SETOR SUPRIMENTOS(\n(.*)){10}', '', content)
-                    content = re.sub(r'PROCEDIMENTO OPERACIONAL PADRÃO(\n(.*)){14}', '', content)
-                    content = re.sub(r'DGT TECNOLOGIA LTDA(\n(.*)){7}', '', content)
-                    content = re.sub(r'DGT TECNOLOGIA LTDA', '', content)
-                    content = re.sub(r'R. Evaristo José Fernandes, 121,(\n(.*)){9}', '', content)
-                    # content = re.sub(r'.*\.\w{2,4}.*', '', content)
-                    content = re.sub(r'### Notes:\n(.*)', '', content)
-                    content = re.sub(r'.*(\n.*){12}.*PADRÃO\n\n(Elaborador).*(\n.*){6}', '', content)
-                    #Sumário
-                    content = re.sub(r'.*\.{4}.*\n.*|^\d\.\d$|^SUMÁRIO$|^\d{2}$\n.*', '', content, flags=re.MULTILINE)
-                    #URL
-                    content = re.sub(r'https?:\/\/(www\.)?[-a-zA-Z0-9@:%._\+~#=]{2,256}\.[a-z]{2,4}\b([-a-zA-Z0-9@:%_\+.~#?&//=]*)', '', content)
-
-
-                    #### Notes:\n(.*)
-
-                    # Example: Remove lines starting with '---'
-                    # content = re.sub(r'^---\s*$', '', content, flags=re.MULTILINE)
-                    # Example: Replace multiple newlines with a single newline
-                    content = re.sub(r'\n\n+', '\n\n', content)
-                    # Example: Remove leading/trailing whitespace from each line
-                    content = '\n'.join([line.strip() for line in content.split('\n')])
+def clean_markdown_files(*directories, workers: int = settings.CLEANING_WORKERS,
+                         rules_path: str = settings.CLEANING_RULES_PATH, profile: bool = False):
+    """
+    Applies the cleaning rules (see cleaning.py) in place to every .md file in the directories.
 
-                    with open(file_path, 'w', encoding='utf-8') as f:
-                        f.write(content)
-                    print(f"Cleaned: {file_path}")
+    Args:
+        workers (int): Worker processes cleaning files in parallel; 0 cleans them in this process.
+        rules_path (str): JSON rule set replacing the built-in rules; empty uses the built-in ones.
+        profile (bool): Print the time spent in each rule.
+    """
+    print(f"Cleaning files in directories: {', '.join(directories)}")
+    paths = markdown_files(*directories)
+    started = time.perf_counter()
+    profiler = clean_files(paths, workers=workers, rules_path=rules_path or None, profile=profile)
+    print(f"Cleaned {len(paths)} files in {time.perf_counter() - started:.1f}s")
+    if profiler is not None:
+        print(profiler.report())
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scrape the website, convert Docs/ to markdown and clean the results.")
+    parser.add_argument("--workers", type=int, default=settings.CONVERSION_WORKERS,
+                        help="Conversion worker processes (0 converts in-process, one file at a time)")
+    parser.add_argument("--timeout", type=float, default=settings.CONVERSION_TIMEOUT_SECONDS,
+                        help="Seconds a single file may take before its worker is killed")
+    parser.add_argument("--clean-workers", type=int, default=settings.CLEANING_WORKERS,
+                        help="Cleaning worker processes (0 cleans in-process)")
+    parser.add_argument("--profile-rules", action="store_true", help="Print the time spent in each cleaning rule")
+    parser.add_argument("--streaming", action="store_true",
+                        help="Convert and clean each document in memory and write it once to Docs_md/, leaving Docs/ untouched")
+    parser.add_argument("--index", action="store_true",
+                        help="With --streaming, also index the cleaned documents incrementally (no separate LoaderCloud run)")
+    args = parser.parse_args()
+
     Scrape()
     
     source_folder = "Docs"
     dest_folder = source_folder + "_md"
-    convert_documents(source_folder, dest_folder)
 
-    directories_to_clean = ["Docs_md", "ScrapedData"]
-    clean_markdown_files(*directories_to_clean)
+    if args.streaming:
+        from ingest import clean_in_place, ingest_documents, iter_clean_in_place
+        vector_store = scheduler = None
+        if args.index:
+            import LoaderCloud
+            vector_store = LoaderCloud.get_vector_store()
+            scheduler = LoaderCloud.get_scheduler(vector_store)
+        rules_path = settings.CLEANING_RULES_PATH or None
+        report = ingest_documents(source_folder, dest_folder, workers=args.workers, timeout=args.timeout,
+                                  rules_path=rules_path, vector_store=vector_store, scheduler=scheduler)
+        print(report.summary())
+        if vector_store is None:
+            print(f"Cleaned {clean_in_place('ScrapedData', rules_path)} files in ScrapedData")
+        else:
+            scraped = iter_clean_in_place("ScrapedData", rules_path)
+            print(LoaderCloud.index_texts(vector_store, scraped, scheduler=scheduler, prune_folders=["ScrapedData"]).summary())
+            LoaderCloud.export_vector_index(vector_store)
+            LoaderCloud.write_partition_centroids(vector_store)
+    else:
+        convert_documents(source_folder, dest_folder, workers=args.workers, timeout=args.timeout)
+
+        directories_to_clean = ["Docs_md", "ScrapedData"]
+        clean_markdown_files(*directories_to_clean, workers=args.clean_workers, profile=args.profile_rules)
@@ -1,38 +1,361 @@
+import argparse
+import hashlib
+import json
+import os
+import uuid
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
 from dotenv import load_dotenv
-from langchain_openai import OpenAIEmbeddings
 load_dotenv()
+from langchain_core.documents import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_chroma import Chroma
 from langchain_community.document_loaders import DirectoryLoader
+import settings
+from bm25 import BM25_FILENAME, BM25Index
+from embedding_providers import make_embeddings
+from embedding_scheduler import EmbeddingRunStats, EmbeddingScheduler, chroma_writer
+from partitions import (CENTROIDS_FILENAME, PARTITIONS, PartitionedVectorStore, collections_of, compute_centroids,
+                        partition_metadata, write_centroids)
 
-embeddings = OpenAIEmbeddings(
-    model="text-embedding-3-small"
-)
+SOURCE_FOLDERS = ["Docs_md/", "ScrapedData/"]
+MANIFEST_PATH = os.path.join(settings.CHROMA_PERSIST_DIRECTORY, "index_manifest.json")
+BM25_PATH = os.path.join(settings.CHROMA_PERSIST_DIRECTORY, BM25_FILENAME)
+CENTROIDS_PATH = os.path.join(settings.CHROMA_PERSIST_DIRECTORY, CENTROIDS_FILENAME)
 
-vector_store = Chroma(
-    collection_name="dgt_rag",
-    embedding_function=embeddings,
-    persist_directory="./chroma_dgt_rag",
-)
+# Split documents into chunks; start_index lets the server's context packer merge adjacent chunks
+text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200, add_start_index=True)
 
-loader = DirectoryLoader("Docs_md/", glob="**/*.*", show_progress=True, use_multithreading=True)
 
-scrapedLoader = DirectoryLoader("ScrapedData/", glob="**/*.*", show_progress=True, use_multithreading=True)
+def get_vector_store(partitioned: bool = settings.PARTITIONED_COLLECTIONS):
+    """The Chroma collection, or one collection per source partition (see partitions.py)"""
+    # Retries are handled by EmbeddingScheduler, which backs off on 429s
+    embeddings = make_embeddings(max_retries=0)
+    if partitioned:
+        return PartitionedVectorStore({
+            partition: Chroma(
+                collection_name=f"{settings.CHROMA_COLLECTION}_{partition}",
+                embedding_function=embeddings,
+                persist_directory=settings.CHROMA_PERSIST_DIRECTORY,
+            )
+            for partition in PARTITIONS
+        })
+    return Chroma(
+        collection_name=settings.CHROMA_COLLECTION,
+        embedding_function=embeddings,
+        persist_directory=settings.CHROMA_PERSIST_DIRECTORY,
+    )
 
-docs = loader.load()
-print(f"Loaded {len(docs)} documents.")
 
-scrapedDocs = scrapedLoader.load()
-print(f"Loaded {len(scrapedDocs)} documents.")
+def export_vector_index(vector_store):
+    """Refresh the memory-mapped copy of the collection the server searches when VECTOR_BACKEND=mmap"""
+    if settings.VECTOR_BACKEND != "mmap":
+        return
+    from vector_index import default_path, export_collection
+    path = export_collection(collections_of(vector_store), default_path(), settings.VECTOR_INDEX_DTYPE)
+    print(f"Exported the vector index to {path}.")
 
-allDocs = docs + scrapedDocs
 
-# Split documents into chunks
-text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-all_splits = text_splitter.split_documents(allDocs)
-print(f"Created {len(all_splits)} document splits.")
+def write_partition_centroids(vector_store, path: str = CENTROIDS_PATH):
+    """Save each partition's mean embedding, which the server's query router compares questions with"""
+    centroids = compute_centroids(collections_of(vector_store))
+    write_centroids(centroids, path)
+    print("Partition centroids: " + ", ".join(f"{name} ({entry['chunks']} chunks)" for name, entry in centroids.items()))
 
-# Index chunks into the vector store
-print("Adding documents to the vector store...")
-_ = vector_store.add_documents(documents=all_splits)
-print("Indexing complete.")
\ No newline at end of file
+
+def get_scheduler(vector_store: Chroma, max_concurrency: int = settings.EMBEDDING_CONCURRENCY,
+                  max_batch_tokens: int = settings.EMBEDDING_BATCH_TOKENS,
+                  max_batch_size: int = settings.EMBEDDING_BATCH_SIZE) -> EmbeddingScheduler:
+    writer = vector_store.writer() if isinstance(vector_store, PartitionedVectorStore) else chroma_writer(vector_store)
+    return EmbeddingScheduler(
+        vector_store.embeddings,
+        writer,
+        max_batch_tokens=max_batch_tokens,
+        max_batch_size=max_batch_size,
+        max_concurrency=max_concurrency,
+    )
+
+
+def embed_and_store(vector_store, documents, ids, scheduler: Optional[EmbeddingScheduler] = None) -> Optional[EmbeddingRunStats]:
+    """Embed and write chunks through the scheduler, or through add_documents when none is given"""
+    if not documents:
+        return None
+    if scheduler is None:
+        vector_store.add_documents(documents=documents, ids=ids)
+        return None
+    stats = scheduler.run_sync(documents, ids)
+    print(stats.summary())
+    return stats
+
+
+def bm25_path(manifest_path: str) -> str:
+    """The BM25 index is kept next to the manifest, so both always describe the same chunks"""
+    return os.path.join(os.path.dirname(manifest_path), BM25_FILENAME)
+
+
+def full_index(vector_store: Chroma, scheduler: Optional[EmbeddingScheduler] = None, lexical_path: str = BM25_PATH):
+    """Load, split and add every document. Each run adds a new copy of every chunk."""
+    loader = DirectoryLoader("Docs_md/", glob="**/*.*", show_progress=True, use_multithreading=True)
+
+    scrapedLoader = DirectoryLoader("ScrapedData/", glob="**/*.*", show_progress=True, use_multithreading=True)
+
+    docs = loader.load()
+    print(f"Loaded {len(docs)} documents.")
+
+    scrapedDocs = scrapedLoader.load()
+    print(f"Loaded {len(scrapedDocs)} documents.")
+
+    allDocs = docs + scrapedDocs
+
+    all_splits = text_splitter.split_documents(allDocs)
+    for split in all_splits:
+        split.metadata.update(partition_metadata(split.metadata["source"]))
+    print(f"Created {len(all_splits)} document splits.")
+
+    # Index chunks into the vector store
+    print("Adding documents to the vector store...")
+    ids = [str(uuid.uuid4()) for _ in all_splits]
+    embed_and_store(vector_store, all_splits, ids, scheduler)
+
+    lexical_index = BM25Index.load(lexical_path)
+    lexical_index.add(ids, [split.page_content for split in all_splits])
+    lexical_index.save(lexical_path)
+    print("Indexing complete.")
+
+
+@dataclass
+class IndexReport:
+    """What an incremental indexing run changed"""
+    added: list = field(default_factory=list)
+    updated: list = field(default_factory=list)
+    removed: list = field(default_factory=list)
+    unchanged: int = 0
+    skipped: list = field(default_factory=list)
+    chunks_added: int = 0
+    chunks_deleted: int = 0
+    chunks_retagged: int = 0
+    embedding: Optional[EmbeddingRunStats] = None
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.added or self.updated or self.removed)
+
+    def summary(self) -> str:
+        lines = [
+            f"Files added: {len(self.added)}, updated: {len(self.updated)}, "
+            f"removed: {len(self.removed)}, unchanged: {self.unchanged}, skipped: {len(self.skipped)}",
+            f"Chunks added: {self.chunks_added}, deleted: {self.chunks_deleted}, retagged: {self.chunks_retagged}",
+        ]
+        if self.embedding:
+            lines.append(self.embedding.summary())
+        for label, sources in (("+", self.added), ("~", self.updated), ("-", self.removed), ("!", self.skipped)):
+            lines.extend(f"  {label} {source}" for source in sources)
+        return "\n".join(lines)
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def chunk_id(source: str, index: int, text: str) -> str:
+    """Deterministic chunk ID: the same file content always yields the same IDs"""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{source}#{index}:{content_hash(text.encode('utf-8'))}"))
+
+
+def load_manifest(path: str = MANIFEST_PATH) -> dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)["files"]
+
+
+def save_manifest(files: dict, path: str = MANIFEST_PATH):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temp_path = path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump({"version": 1, "files": files}, f, ensure_ascii=False, indent=1)
+    os.replace(temp_path, path)
+
+
+def iter_source_files(folders):
+    """Yield every file path the DirectoryLoader glob ("**/*.*") would pick up"""
+    for folder in folders:
+        for path in sorted(Path(folder).glob("**/*.*")):
+            if path.is_file():
+                yield str(path)
+
+
+def split_file(source: str, text: str) -> tuple[list[Document], list[str]]:
+    metadata = {"source": source, **partition_metadata(source)}
+    splits = text_splitter.split_documents([Document(page_content=text, metadata=metadata)])
+    ids = [chunk_id(source, index, split.page_content) for index, split in enumerate(splits)]
+    for split, split_id in zip(splits, ids):
+        split.id = split_id
+    return splits, ids
+
+
+def retag_chunks(vector_store, splits: list[Document], ids: list[str]):
+    """Rewrite the metadata of stored chunks without re-embedding them"""
+    collection = getattr(vector_store, "_collection", None)
+    if collection is None:
+        # Stores without a metadata update (or a partitioned layout the chunks are not in yet) get them again
+        vector_store.add_documents(documents=splits, ids=ids)
+    else:
+        collection.update(ids=ids, metadatas=[split.metadata for split in splits])
+
+
+def read_source_files(folders):
+    """(source, raw bytes) of every file in the source folders"""
+    for source in iter_source_files(folders):
+        with open(source, "rb") as f:
+            yield source, f.read()
+
+
+def index_texts(vector_store, documents, manifest_path: str = MANIFEST_PATH,
+                scheduler: Optional[EmbeddingScheduler] = None, prune_folders=None, keep=(),
+                flush_chunks: int = 5000) -> IndexReport:
+    """
+    Bring the vector store in line with `documents`, an iterable of
+    (source, content) pairs where content is the file's text or raw bytes,
+    touching only what changed.
+
+    A manifest maps each file to its content hash and chunk IDs. New or changed
+    files are split and embedded (their old chunks are deleted first) and
+    unchanged files are skipped. Manifest entries whose file was not in
+    `documents` have their chunks deleted; `prune_folders` limits that to files
+    under those folders (None prunes every entry not seen), and sources in
+    `keep` are never pruned.
+
+    Chunks are embedded every `flush_chunks` chunks, so memory stays bounded
+    however many documents stream through. The manifest only records a file
+    once its chunks are stored; chunk IDs are deterministic, so an interrupted
+    run simply redoes the same upserts.
+
+    The BM25 index next to the manifest gets the same chunk IDs added and
+    deleted. Unchanged files whose chunks it lacks (an index built before it
+    existed) are split again and added to it without being re-embedded, and
+    so are unchanged files indexed before chunks carried their partition
+    (see partitions.py), whose stored metadata is rewritten.
+    """
+    manifest = load_manifest(manifest_path)
+    lexical_path = bm25_path(manifest_path)
+    lexical_index = BM25Index.load(lexical_path)
+    report = IndexReport()
+    seen = set()
+    pending_splits, pending_ids, pending_entries = [], [], {}
+
+    def flush():
+        stats = embed_and_store(vector_store, pending_splits, pending_ids, scheduler)
+        if stats is not None and report.embedding is not None:
+            report.embedding.merge(stats)
+        elif stats is not None:
+            report.embedding = stats
+        lexical_index.add(pending_ids, [split.page_content for split in pending_splits])
+        manifest.update(pending_entries)
+        pending_splits.clear()
+        pending_ids.clear()
+        pending_entries.clear()
+
+    for source, content in documents:
+        seen.add(source)
+        data = content.encode("utf-8") if isinstance(content, str) else content
+        digest = content_hash(data)
+        entry = manifest.get(source)
+        unchanged = entry and entry["sha256"] == digest
+        in_lexical = unchanged and all(chunk in lexical_index.documents for chunk in entry["chunk_ids"])
+        if unchanged and in_lexical and "partition" in entry:
+            report.unchanged += 1
+            continue
+
+        if isinstance(content, str):
+            text = content
+        else:
+            try:
+                text = data.decode("utf-8")
+            except UnicodeDecodeError as e:
+                print(f"  Skipping {source}: {e}")
+                report.skipped.append(source)
+                continue
+
+        splits, ids = split_file(source, text)
+        if unchanged:
+            if not in_lexical:
+                lexical_index.add(ids, [split.page_content for split in splits])
+            if "partition" not in entry:
+                if splits:
+                    retag_chunks(vector_store, splits, ids)
+                entry["partition"] = partition_metadata(source)["partition"]
+                report.chunks_retagged += len(splits)
+            report.unchanged += 1
+            continue
+        if entry:
+            vector_store.delete(ids=entry["chunk_ids"])
+            lexical_index.remove(entry["chunk_ids"])
+            report.chunks_deleted += len(entry["chunk_ids"])
+            report.updated.append(source)
+        else:
+            report.added.append(source)
+        pending_splits.extend(splits)
+        pending_ids.extend(ids)
+        report.chunks_added += len(splits)
+        pending_entries[source] = {"sha256": digest, "chunk_ids": ids, "partition": partition_metadata(source)["partition"]}
+        if len(pending_splits) >= flush_chunks:
+            flush()
+
+    flush()
+
+    prefixes = None if prune_folders is None else tuple(str(Path(folder)) + os.sep for folder in prune_folders)
+    for source in sorted(set(manifest) - seen - set(keep)):
+        if prefixes is not None and not source.startswith(prefixes):
+            continue
+        chunk_ids = manifest.pop(source)["chunk_ids"]
+        if chunk_ids:
+            vector_store.delete(ids=chunk_ids)
+            lexical_index.remove(chunk_ids)
+        report.chunks_deleted += len(chunk_ids)
+        report.removed.append(source)
+
+    save_manifest(manifest, manifest_path)
+    lexical_index.save(lexical_path)
+    return report
+
+
+def incremental_index(vector_store, folders=SOURCE_FOLDERS, manifest_path: str = MANIFEST_PATH,
+                      scheduler: Optional[EmbeddingScheduler] = None) -> IndexReport:
+    """Incremental indexing of every file in the source folders (see index_texts)"""
+    return index_texts(vector_store, read_source_files(folders), manifest_path, scheduler)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Embed Docs_md/ and ScrapedData/ into the Chroma collection.")
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Re-embed only new or changed files and delete chunks of removed files, using a manifest of content hashes",
+    )
+    parser.add_argument("--concurrency", type=int, default=settings.EMBEDDING_CONCURRENCY,
+                        help="Embedding requests in flight at once")
+    parser.add_argument("--batch-tokens", type=int, default=settings.EMBEDDING_BATCH_TOKENS,
+                        help="Token budget of a single embedding request")
+    parser.add_argument("--batch-size", type=int, default=settings.EMBEDDING_BATCH_SIZE,
+                        help="Maximum chunks in a single embedding request")
+    args = parser.parse_args()
+
+    vector_store = get_vector_store()
+    scheduler = get_scheduler(vector_store, args.concurrency, args.batch_tokens, args.batch_size)
+    if args.incremental:
+        chunks = sum(collection.count() for collection in collections_of(vector_store))
+        if not os.path.exists(MANIFEST_PATH) and chunks:
+            print("Warning: no index manifest found, chunks added by earlier full runs will stay in the collection.")
+        if load_manifest(MANIFEST_PATH) and not chunks:
+            print("Warning: the index manifest lists files but the collections are empty (switched PARTITIONED_COLLECTIONS?); "
+                  "delete it to index every file again.")
+        print("Indexing changed files...")
+        report = incremental_index(vector_store, scheduler=scheduler)
+        print(report.summary())
+        print("Indexing complete.")
+    else:
+        full_index(vector_store, scheduler)
+    export_vector_index(vector_store)
+    write_partition_centroids(vector_store)
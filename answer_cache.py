@@ -0,0 +1,158 @@
+"""
+Semantic answer cache placed in front of the generate step.
+
+An entry is keyed on the question embedding plus the set of chunk IDs that
+retrieval returned for it. A lookup hits when a stored entry has the same
+scope and chunk set and its question embedding is at least
+`similarity_threshold` cosine-similar to the new one. Scopes keep follow-up
+turns apart: an answer produced for one conversation history is only reused
+for exactly the same history.
+"""
+
+import hashlib
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+import numpy as np
+
+from history_manager import message_content, message_type
+
+STANDALONE_SCOPE = "standalone"
+
+
+def history_scope(history: Iterable) -> str:
+    """
+    Scope key for a question asked after `history` (the turns before it).
+
+    Questions without previous turns share the standalone scope; follow-ups get
+    a digest of the preceding turns, so they never reuse a standalone answer.
+    """
+    digest = hashlib.sha256()
+    empty = True
+    for msg in history:
+        empty = False
+        msg_type, content = message_type(msg), message_content(msg)
+        digest.update(f"{msg_type}\x1f{content}\x1e".encode("utf-8"))
+    return STANDALONE_SCOPE if empty else digest.hexdigest()
+
+
+@dataclass
+class CacheEntry:
+    scope: str
+    chunk_key: frozenset
+    embedding: np.ndarray
+    answer: str
+    expires_at: float
+
+
+class SemanticAnswerCache:
+    """
+    LRU + TTL bounded cache of generated answers.
+
+    Args:
+        similarity_threshold (float): Minimum cosine similarity between question embeddings.
+        ttl_seconds (float): Lifetime of an entry; 0 disables expiry.
+        max_entries (int): Maximum number of entries before the least recently used is evicted.
+        clock: Monotonic time source, replaceable in tests.
+    """
+
+    def __init__(self, similarity_threshold: float = 0.95, ttl_seconds: float = 3600,
+                 max_entries: int = 1000, clock=time.monotonic):
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.clock = clock
+        self.index_version = None
+        self._entries: "OrderedDict[int, CacheEntry]" = OrderedDict()
+        self._buckets: dict[tuple, set[int]] = {}
+        self._next_id = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _check_index_version(self, index_version) -> None:
+        if index_version != self.index_version:
+            if self._entries:
+                self.invalidate()
+            self.index_version = index_version
+
+    def _remove(self, entry_id: int) -> None:
+        entry = self._entries.pop(entry_id)
+        bucket = self._buckets[(entry.scope, entry.chunk_key)]
+        bucket.discard(entry_id)
+        if not bucket:
+            del self._buckets[(entry.scope, entry.chunk_key)]
+
+    def lookup(self, scope: str, embedding, chunk_ids: Iterable[str], index_version=None) -> Optional[str]:
+        """Return a cached answer for a similar question over the same chunks, or None."""
+        self._check_index_version(index_version)
+        bucket = self._buckets.get((scope, frozenset(chunk_ids)))
+        best_id, best_similarity = None, self.similarity_threshold
+        if bucket:
+            now = self.clock()
+            query = self._normalize(embedding)
+            for entry_id in list(bucket):
+                entry = self._entries[entry_id]
+                if self.ttl_seconds and entry.expires_at <= now:
+                    self._remove(entry_id)
+                    self.expirations += 1
+                    continue
+                similarity = float(np.dot(query, entry.embedding))
+                if similarity >= best_similarity:
+                    best_id, best_similarity = entry_id, similarity
+
+        if best_id is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(best_id)
+        self.hits += 1
+        return self._entries[best_id].answer
+
+    def store(self, scope: str, embedding, chunk_ids: Iterable[str], answer: str, index_version=None) -> None:
+        self._check_index_version(index_version)
+        chunk_key = frozenset(chunk_ids)
+        entry_id = self._next_id
+        self._next_id += 1
+        self._entries[entry_id] = CacheEntry(
+            scope=scope,
+            chunk_key=chunk_key,
+            embedding=self._normalize(embedding),
+            answer=answer,
+            expires_at=self.clock() + self.ttl_seconds,
+        )
+        self._buckets.setdefault((scope, chunk_key), set()).add(entry_id)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def invalidate(self) -> None:
+        """Drop every entry, e.g. after the vector index changed."""
+        self._entries.clear()
+        self._buckets.clear()
+        self.invalidations += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
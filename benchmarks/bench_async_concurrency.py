@@ -0,0 +1,70 @@
+"""
+Concurrency benchmark for POST /AgentInvoke.
+
+Drives the FastAPI app in-process with fake LLM, embeddings and vector store
+latencies and reports throughput per number of in-flight requests. The
+"blocking" rows emulate the old synchronous graph.invoke path, where one slow
+LLM call held the event loop and requests were served one at a time.
+
+Usage:
+    python -m benchmarks.bench_async_concurrency --llm-latency 0.3 --rounds 4
+"""
+
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from benchmarks.fakes import load_server, make_questions
+
+
+async def run_level(app, concurrency: int, rounds: int) -> tuple[float, float]:
+    questions = make_questions(concurrency * rounds)
+    queue = asyncio.Queue()
+    for question in questions:
+        queue.put_nowait(question)
+    latencies = []
+
+    async def worker(client: httpx.AsyncClient):
+        while not queue.empty():
+            question = queue.get_nowait()
+            started = time.perf_counter()
+            response = await client.post("/AgentInvoke", json={"question": question})
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - started)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return len(questions) / elapsed, sum(latencies) / len(latencies)
+
+
+async def main(args):
+    levels = [int(level) for level in args.levels.split(",")]
+    print(f"{'mode':<10}{'in-flight':>10}{'req/s':>10}{'mean s':>10}{'speedup':>10}")
+    for mode in ("async", "blocking"):
+        server = load_server(
+            llm_latency=args.llm_latency,
+            embedding_latency=args.embedding_latency,
+            search_latency=args.search_latency,
+            blocking=mode == "blocking",
+        )
+        baseline = None
+        for concurrency in levels:
+            server.conversation_sessions.clear()
+            throughput, mean_latency = await run_level(server.app, concurrency, args.rounds)
+            baseline = baseline or throughput
+            print(f"{mode:<10}{concurrency:>10}{throughput:>10.2f}{mean_latency:>10.3f}{throughput / baseline:>9.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--levels", default="1,2,4,8,16,32", help="Comma separated in-flight request counts")
+    parser.add_argument("--rounds", type=int, default=4, help="Requests per in-flight slot")
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--embedding-latency", type=float, default=0.05)
+    parser.add_argument("--search-latency", type=float, default=0.005)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,58 @@
+"""
+Wall time of a nightly batch job: one POST /AgentInvoke per question, sent
+one after another, vs. POST /AgentInvoke/batch.
+
+The batch endpoint embeds every question in one embeddings request, runs
+the searches together and keeps `--concurrency` model calls in flight.
+Embedding requests are counted on the fake embeddings client.
+
+Usage:
+    python -m benchmarks.bench_batch --questions 100 --concurrency 16
+"""
+
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from benchmarks.fakes import load_server, make_questions
+
+
+async def main(args):
+    server = load_server(llm_latency=args.llm_latency, embedding_latency=args.embedding_latency,
+                         search_latency=args.search_latency)
+    server.answer_cache = None
+    server.settings.BATCH_CONCURRENCY = args.concurrency
+    questions = make_questions(args.questions)
+    transport = httpx.ASGITransport(app=server.app)
+    print(f"{args.questions} questions, llm {args.llm_latency}s, embedding {args.embedding_latency}s, "
+          f"batch concurrency {args.concurrency}")
+    print(f"{'mode':<22}{'wall s':>9}{'embed calls':>13}{'errors':>8}{'speedup':>9}")
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        server.embeddings.calls = 0
+        started = time.perf_counter()
+        errors = 0
+        for question in questions:
+            response = await client.post("/AgentInvoke", json={"question": question})
+            errors += response.status_code != 200
+        sequential = time.perf_counter() - started
+        print(f"{'sequential requests':<22}{sequential:>9.2f}{server.embeddings.calls:>13}{errors:>8}{1.0:>8.1f}x")
+
+        server.embeddings.calls = 0
+        started = time.perf_counter()
+        response = await client.post("/AgentInvoke/batch", json={"questions": questions})
+        batch = time.perf_counter() - started
+        response.raise_for_status()
+        errors = sum(item["error"] is not None for item in response.json()["results"])
+        print(f"{'batch endpoint':<22}{batch:>9.2f}{server.embeddings.calls:>13}{errors:>8}{sequential / batch:>8.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=16, help="BATCH_CONCURRENCY")
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--embedding-latency", type=float, default=0.05)
+    parser.add_argument("--search-latency", type=float, default=0.005)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,121 @@
+"""
+Markdown cleaning: the original chain of re.sub calls vs. the compiled rule set
+in cleaning.py, on large synthetic POP documents.
+
+Both produce identical output (checked on every document); the report shows
+the time of each, the per-rule profile of the new rule set, and a run across
+worker processes.
+
+Usage:
+    python -m benchmarks.bench_cleaning --documents 4 --sections 60
+"""
+
+import argparse
+import os
+import random
+import re
+import shutil
+import tempfile
+import time
+
+from benchmarks.fakes import SUBJECTS
+from cleaning import RuleProfiler, clean_files, clean_text
+
+
+def reference_clean(content: str) -> str:
+    """The cleaning steps of Curator.clean_markdown_files before the rule engine"""
+    content = re.sub(r'PROCEDIMENTO OPERACIONAL PADRÃO SETOR SUPRIMENTOS(\n(.*)){10}', '', content)
+    content = re.sub(r'PROCEDIMENTO OPERACIONAL PADRÃO(\n(.*)){14}', '', content)
+    content = re.sub(r'DGT TECNOLOGIA LTDA(\n(.*)){7}', '', content)
+    content = re.sub(r'DGT TECNOLOGIA LTDA', '', content)
+    content = re.sub(r'R. Evaristo José Fernandes, 121,(\n(.*)){9}', '', content)
+    content = re.sub(r'### Notes:\n(.*)', '', content)
+    content = re.sub(r'.*(\n.*){12}.*PADRÃO\n\n(Elaborador).*(\n.*){6}', '', content)
+    content = re.sub(r'.*\.{4}.*\n.*|^\d\.\d$|^SUMÁRIO$|^\d{2}$\n.*', '', content, flags=re.MULTILINE)
+    content = re.sub(r'https?:\/\/(www\.)?[-a-zA-Z0-9@:%._\+~#=]{2,256}\.[a-z]{2,4}\b([-a-zA-Z0-9@:%_\+.~#?&//=]*)', '', content)
+    content = re.sub(r'\n\n+', '\n\n', content)
+    content = '\n'.join([line.strip() for line in content.split('\n')])
+    return content
+
+
+def make_document(seed: int, sections: int = 50, width: int = 120) -> str:
+    """A converted POP document: headers, footers, table of contents, signature blocks, tables and URLs"""
+    rng = random.Random(seed)
+    lines = ["SUMÁRIO", ""]
+    for i in range(1, 9):
+        lines.append(f"{i}. {SUBJECTS[i % len(SUBJECTS)].upper()} " + "." * rng.randint(4, 60) + f" {i + 2:02d}")
+        lines.append(f"{i}.{rng.randint(1, 9)}")
+    for section in range(sections):
+        subject = SUBJECTS[(seed + section) % len(SUBJECTS)]
+        block = rng.random()
+        if block < 0.15:
+            lines += ["PROCEDIMENTO OPERACIONAL PADRÃO"] + [f"Código: POP-{seed:04d}", "Revisão: 03", "", "Página"] * 4
+        elif block < 0.2:
+            lines += ["PROCEDIMENTO OPERACIONAL PADRÃO SETOR SUPRIMENTOS"] + [f"linha {n}" for n in range(12)]
+        elif block < 0.3:
+            lines += ["DGT TECNOLOGIA LTDA", "CNPJ 00.000.000/0001-00", "Jardim Paulista", "Campinas - SP"]
+            lines += [f"  {n}  " for n in range(8)] + ["R. Evaristo José Fernandes, 121,"] + ["", "Fone"] * 5
+        elif block < 0.4:
+            lines += [f"Texto {n} sobre {subject}" for n in range(12)]
+            lines += ["MANUAL DE PROCEDIMENTO PADRÃO", "", "Elaborador: Fulano", "Revisor: Ciclano",
+                      "Aprovador: Beltrano", "Data: 01/02/2024", "Versão 2", "Assinaturas", "fim"]
+        elif block < 0.45:
+            lines += ["### Notes:", "nota do apresentador"]
+        lines.append(f"## {section + 1}. {subject.title()}")
+        lines.append("")
+        lines.append(
+            f"   O colaborador deve registrar a solicitação de {subject} em https://portal.dgt.com.br/{subject.replace(' ', '-')}?id={section} "
+            "e aguardar a aprovação do gestor.   "
+        )
+        # Wide converted table rows are the worst case for patterns that start with .*
+        lines.append("| " + " | ".join(f"{subject} {n}" for n in range(rng.randint(width // 2, width))) + " |")
+        lines += ["", "", "", f"{rng.randint(10, 99)}", "rodapé", ""]
+    return "\n".join(lines)
+
+
+def main(args):
+    documents = [make_document(seed, args.sections) for seed in range(args.documents)]
+    size = sum(len(document) for document in documents)
+    print(f"{len(documents)} documents, {size / 1e6:.1f} MB\n")
+
+    started = time.perf_counter()
+    expected = [reference_clean(document) for document in documents]
+    reference_seconds = time.perf_counter() - started
+
+    profiler = RuleProfiler()
+    started = time.perf_counter()
+    cleaned = [clean_text(document, profiler=profiler) for document in documents]
+    rules_seconds = time.perf_counter() - started
+    mismatches = sum(a != b for a, b in zip(expected, cleaned))
+
+    folder = tempfile.mkdtemp(prefix="bench-cleaning-")
+    try:
+        paths = []
+        for index, document in enumerate(documents):
+            path = os.path.join(folder, f"POP-{index:04d}.md")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(document)
+            paths.append(path)
+        started = time.perf_counter()
+        clean_files(paths, workers=args.workers)
+        pool_seconds = time.perf_counter() - started
+        for path, want in zip(paths, expected):
+            with open(path, "r", encoding="utf-8") as f:
+                mismatches += f.read() != want
+    finally:
+        shutil.rmtree(folder)
+
+    print(f"{'implementation':<28}{'seconds':>9}{'speedup':>9}")
+    print(f"{'re.sub chain':<28}{reference_seconds:>9.2f}{1:>8.1f}x")
+    print(f"{'rule set':<28}{rules_seconds:>9.2f}{reference_seconds / rules_seconds:>8.1f}x")
+    print(f"{f'rule set, {args.workers} workers (files)':<28}{pool_seconds:>9.2f}{reference_seconds / pool_seconds:>8.1f}x")
+    print(f"\nOutputs differing from the original: {mismatches}\n")
+    print(profiler.report())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=4)
+    parser.add_argument("--sections", type=int, default=60, help="Sections per document")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    main(parser.parse_args())
@@ -0,0 +1,83 @@
+"""
+Upstream calls and latency for a burst of identical questions, each request
+on its own vs. coalesced into one in-flight graph run.
+
+Models the moment a new procedure is announced: `--burst` people ask one of
+`--distinct` questions within a few milliseconds, with small differences in
+casing and punctuation and no session history. Embedding calls come from
+the fake embeddings' counter; model calls from the token ledger.
+
+Usage:
+    python -m benchmarks.bench_coalescing --burst 200 --distinct 3
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+import httpx
+
+from benchmarks.fakes import SUBJECTS, load_server
+from singleflight import SingleFlight
+
+VARIANTS = ("{q}", "{q}?", "{q_lower}?", "  {q} ", "{q}!")
+
+
+def make_burst(size: int, distinct: int, seed: int = 0) -> list[tuple[float, str]]:
+    """(delay before sending, question) pairs spread over about 20 ms"""
+    rng = random.Random(seed)
+    base = [f"Qual o novo procedimento de {SUBJECTS[i % len(SUBJECTS)]}" for i in range(distinct)]
+    burst = []
+    for _ in range(size):
+        question = rng.choice(base)
+        variant = rng.choice(VARIANTS).format(q=question, q_lower=question.lower())
+        burst.append((rng.uniform(0, 0.02), variant))
+    return burst
+
+
+async def run(app, burst):
+    latencies = []
+
+    async def ask(client, delay, question):
+        await asyncio.sleep(delay)
+        started = time.perf_counter()
+        response = await client.post("/AgentInvoke", json={"question": question})
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - started)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(ask(client, delay, question) for delay, question in burst))
+        elapsed = time.perf_counter() - started
+    return latencies, elapsed
+
+
+async def main(args):
+    server = load_server(llm_latency=args.llm_latency, embedding_latency=args.embedding_latency)
+    server.answer_cache = None
+    burst = make_burst(args.burst, args.distinct)
+    print(f"{args.burst} requests over {args.distinct} distinct questions, llm {args.llm_latency}s")
+    print(f"{'mode':<12}{'llm calls':>10}{'embeds':>8}{'p50 s':>8}{'p95 s':>8}{'wall s':>8}")
+    for mode, coalescer in (("per-request", None), ("coalesced", SingleFlight())):
+        server.coalescer = coalescer
+        server.conversation_sessions.clear()
+        server.token_ledger.reset()
+        server.embeddings.calls = 0
+        latencies, elapsed = await run(server.app, burst)
+        latencies.sort()
+        print(
+            f"{mode:<12}{server.token_ledger.requests:>10}{server.embeddings.calls:>8}"
+            f"{statistics.median(latencies):>8.3f}{latencies[int(len(latencies) * 0.95) - 1]:>8.3f}{elapsed:>8.3f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--burst", type=int, default=200, help="Requests in the burst")
+    parser.add_argument("--distinct", type=int, default=3, help="Different questions among them")
+    parser.add_argument("--llm-latency", type=float, default=1.0)
+    parser.add_argument("--embedding-latency", type=float, default=0.05)
+    asyncio.run(main(parser.parse_args()))
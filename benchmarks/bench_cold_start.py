@@ -0,0 +1,105 @@
+"""
+Cold-start time of AgentRAGServer: module import, then the lifespan start-up
+(clients, prompt snapshot, warm-up) until /ready would answer 200.
+
+Each run is a fresh interpreter with its own temporary Chroma directory
+holding `--chunks` random vectors, so the warm-up has an index to load. No
+network is used: the prompt comes from the local snapshot and the OpenAI
+clients are only constructed. The import time is also measured with the
+hub pull and the Chroma client built at import, as the server did before
+start-up moved into the lifespan (the hub pull is replaced by the snapshot,
+so network time comes on top of that figure).
+
+Usage:
+    python -m benchmarks.bench_cold_start --runs 5 --chunks 5000
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SEED_INDEX = """
+import random, sys, chromadb
+client = chromadb.PersistentClient(path=sys.argv[1])
+collection = client.get_or_create_collection(sys.argv[2])
+rng = random.Random(0)
+count = int(sys.argv[3])
+for start in range(0, count, 1000):
+    ids = [str(i) for i in range(start, min(count, start + 1000))]
+    collection.add(ids=ids, documents=[f"POP-{i} texto" for i in ids],
+                   embeddings=[[rng.random() for _ in range(256)] for _ in ids])
+"""
+
+LAZY = """
+import asyncio, json, time
+started = time.perf_counter()
+import AgentRAGServer as server
+imported = time.perf_counter() - started
+
+async def main():
+    async with server.lifespan(server.app):
+        return dict(server.startup_state)
+
+state = asyncio.run(main())
+print(json.dumps({"import": imported, **state}))
+"""
+
+EAGER = """
+import json, time
+started = time.perf_counter()
+from langchain_chroma import Chroma
+from langchain_openai import OpenAIEmbeddings
+from langchain.chat_models import init_chat_model
+import AgentRAGServer as server, prompts, settings
+server.llm = init_chat_model("openai:gpt-4o")
+server.summary_llm = init_chat_model(settings.HISTORY_SUMMARY_MODEL)
+server.embeddings = OpenAIEmbeddings(model=settings.EMBEDDING_MODEL)
+server.vector_store = Chroma(collection_name=settings.CHROMA_COLLECTION, embedding_function=server.embeddings,
+                             persist_directory=settings.CHROMA_PERSIST_DIRECTORY)
+server.prompt = prompts.load_prompt()
+print(json.dumps({"import": time.perf_counter() - started}))
+"""
+
+
+def run(script: str, env: dict) -> dict:
+    result = subprocess.run([sys.executable, "-c", script], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as directory:
+        env = {
+            **os.environ,
+            "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY", "sk-offline-benchmark"),
+            "CHROMA_PERSIST_DIRECTORY": directory,
+            "PROMPT_HUB_REFRESH": "false",
+            "STARTUP_TIME_BUDGET_SECONDS": str(args.budget),
+        }
+        subprocess.run([sys.executable, "-c", SEED_INDEX, directory, env.get("CHROMA_COLLECTION", "dgt_rag"),
+                        str(args.chunks)], cwd=ROOT, env=env, check=True)
+        print(f"{args.chunks} vectors in a temporary Chroma index, {args.runs} runs, budget {args.budget}s")
+
+        eager = [run(EAGER, env)["import"] for _ in range(args.runs)]
+        lazy = [run(LAZY, env) for _ in range(args.runs)]
+
+    print(f"{'eager import (clients at import)':<36}{statistics.median(eager):>8.2f}s")
+    print(f"{'lazy import':<36}{statistics.median(row['import'] for row in lazy):>8.2f}s")
+    print(f"{'ready (import + lifespan)':<36}{statistics.median(row['cold_start_seconds'] for row in lazy):>8.2f}s")
+    for step in lazy[0]["steps"]:
+        print(f"{'  ' + step:<36}{statistics.median(row['steps'][step] for row in lazy):>8.3f}s")
+    within = sum(row["within_budget"] for row in lazy)
+    print(f"within budget: {within}/{len(lazy)} runs")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--chunks", type=int, default=5000, help="Vectors in the temporary Chroma index")
+    parser.add_argument("--budget", type=float, default=10.0, help="STARTUP_TIME_BUDGET_SECONDS")
+    main(parser.parse_args())
@@ -0,0 +1,96 @@
+"""
+Prompt context tokens per request, chunks joined as retrieved vs. the context
+packer.
+
+Uses the long synthetic POPs of `bench_rerank` (split 1000/200 like
+LoaderCloud.py) with hybrid retrieval, so neighbouring chunks of the asked POP
+are often retrieved together. For each question it reports the context
+tokens, how many distinct steps of the asked POP they hold, the tokens the
+packer saved by merging overlaps and the time packing took.
+
+Modes:
+- `top-k`: RETRIEVAL_K chunks joined with blank lines, as before packing;
+- `packed`: CONTEXT_CANDIDATES chunks merged and cut to `--budget` tokens.
+
+Usage:
+    python -m benchmarks.bench_context_packing --budget 800
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import random
+import statistics
+import tempfile
+import time
+
+import settings
+from benchmarks.bench_rerank import make_documents, split, steps_covered
+from benchmarks.fakes import SUBJECTS, FakeEmbeddings, FakeVectorStore, load_server
+from bm25 import BM25_FILENAME, BM25Index, PersistedBM25
+from context_packing import ContextPacker
+from token_accounting import count_tokens
+
+
+async def run(server, questions, encoding: str):
+    rows = []
+    for code, question in questions:
+        with contextlib.redirect_stdout(io.StringIO()):
+            state = {"question": question, **await server.retrieve({"question": question})}
+            started = time.perf_counter()
+            if server.context_packer is not None:
+                state.update(await server.pack_context(state))
+            packed = time.perf_counter()
+        context = state["context"]
+        tokens = count_tokens("\n\n".join(doc.page_content for doc in context), encoding)
+        rows.append((steps_covered(code, context), tokens, state.get("context_tokens_saved", 0), packed - started))
+    return rows
+
+
+async def main(args):
+    server = load_server(embedding_latency=0.0, search_latency=0.0)
+    server.reranker = None
+    chunks = split(make_documents(args.documents, args.steps))
+    server.vector_store = FakeVectorStore(FakeEmbeddings())
+    server.vector_store.add_documents(chunks)
+    encoding = server.settings.TOKEN_ENCODING
+    with tempfile.TemporaryDirectory() as directory:
+        index = BM25Index()
+        index.add([chunk.id for chunk in chunks], [chunk.page_content for chunk in chunks])
+        index.save(f"{directory}/{BM25_FILENAME}")
+        server.lexical_index = PersistedBM25(f"{directory}/{BM25_FILENAME}")
+        server.settings.HYBRID_RETRIEVAL = True
+
+        rng = random.Random(1)
+        questions = []
+        for _ in range(args.questions):
+            number = rng.randrange(args.documents)
+            questions.append((f"POP-{number:04d}",
+                              f"Quais são os passos de {SUBJECTS[number % len(SUBJECTS)]} no POP-{number:04d}?"))
+
+        modes = [
+            (f"top-{server.settings.RETRIEVAL_K}", None),
+            (f"packed {server.settings.CONTEXT_CANDIDATES}->{args.budget}t",
+             ContextPacker(token_budget=args.budget, encoding_name=encoding)),
+        ]
+        print(f"{'mode':<20}{'steps':>8}{'tokens':>9}{'steps/1k tok':>14}{'saved/req':>11}{'pack ms':>9}")
+        for mode, packer in modes:
+            server.context_packer = packer
+            rows = await run(server, questions, encoding)
+            steps = statistics.mean(row[0] for row in rows)
+            tokens = statistics.mean(row[1] for row in rows)
+            print(
+                f"{mode:<20}{steps:>8.1f}{tokens:>9.0f}{steps / tokens * 1000:>14.2f}"
+                f"{statistics.mean(row[2] for row in rows):>11.1f}"
+                f"{statistics.mean(row[3] for row in rows) * 1000:>9.2f}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=200)
+    parser.add_argument("--steps", type=int, default=30, help="Numbered steps per document")
+    parser.add_argument("--questions", type=int, default=100)
+    parser.add_argument("--budget", type=int, default=settings.CONTEXT_TOKEN_BUDGET, help="Context token budget")
+    asyncio.run(main(parser.parse_args()))
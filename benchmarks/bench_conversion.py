@@ -0,0 +1,86 @@
+"""
+Document conversion throughput: Curator's serial loop vs. ConversionPool.
+
+Generates a corpus of HTML, XLSX and CSV files shaped like the DGT procedure
+documents in a temporary folder and converts it with MarkItDown, first in
+process one file at a time, then on worker pools of several sizes. Speedup
+is bounded by the number of CPU cores.
+
+Usage:
+    python -m benchmarks.bench_conversion --files 120 --levels 2,4,8
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+
+from benchmarks.fakes import SUBJECTS
+from conversion import convert_files
+
+
+def write_html(path: str, index: int, rows: int):
+    subject = SUBJECTS[index % len(SUBJECTS)]
+    body = "".join(
+        f"<h2>{step}. Etapa</h2><p>O colaborador registra a solicitação de {subject} no portal "
+        f"e anexa os comprovantes exigidos pelo item {step}.</p>"
+        f"<table><tr><th>Campo</th><th>Valor</th></tr><tr><td>Prazo</td><td>{step % 7 + 1} dias</td></tr></table>"
+        for step in range(rows)
+    )
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f"<html><head><title>POP-{index:04d}</title></head><body><h1>{subject}</h1>{body}</body></html>")
+
+
+def write_csv(path: str, index: int, rows: int):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("codigo,assunto,responsavel,prazo\n")
+        for row in range(rows * 4):
+            f.write(f"POP-{index:04d}-{row},{SUBJECTS[row % len(SUBJECTS)]},Setor {row % 9},{row % 30}\n")
+
+
+def write_xlsx(path: str, index: int, rows: int):
+    from openpyxl import Workbook
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.append(["codigo", "assunto", "responsavel", "prazo"])
+    for row in range(rows * 4):
+        sheet.append([f"POP-{index:04d}-{row}", SUBJECTS[row % len(SUBJECTS)], f"Setor {row % 9}", row % 30])
+    workbook.save(path)
+
+
+def make_corpus(folder: str, files: int, rows: int) -> list[str]:
+    writers = [("html", write_html), ("csv", write_csv), ("xlsx", write_xlsx)]
+    paths = []
+    for index in range(files):
+        extension, write = writers[index % len(writers)]
+        path = os.path.join(folder, f"POP-{index:04d}.{extension}")
+        write(path, index, rows)
+        paths.append(path)
+    return paths
+
+
+def main(args):
+    folder = tempfile.mkdtemp(prefix="bench-conversion-")
+    try:
+        sources = make_corpus(folder, args.files, args.rows)
+        print(f"{len(sources)} files, {os.cpu_count()} CPUs\n")
+        print(f"{'mode':<14}{'seconds':>9}{'files/s':>9}{'speedup':>9}{'failed':>8}")
+        baseline = None
+        for workers in [0] + [int(level) for level in args.levels.split(",")]:
+            report = convert_files(sources, workers=workers, timeout=args.timeout, progress=False)
+            baseline = baseline or report.elapsed
+            failed = len(report.results) - len(report.by_status("converted"))
+            mode = "serial" if workers == 0 else f"pool x{workers}"
+            print(f"{mode:<14}{report.elapsed:>9.2f}{report.files_per_second:>9.1f}"
+                  f"{baseline / report.elapsed:>8.1f}x{failed:>8}")
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=120)
+    parser.add_argument("--rows", type=int, default=60, help="Sections/rows per generated document")
+    parser.add_argument("--levels", default="2,4,8", help="Comma separated worker counts")
+    parser.add_argument("--timeout", type=float, default=120)
+    main(parser.parse_args())
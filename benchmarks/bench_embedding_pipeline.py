@@ -0,0 +1,95 @@
+"""
+Indexing throughput: one-shot embed_documents (what add_documents did) vs.
+EmbeddingScheduler at several concurrency levels.
+
+Embeddings come from a local fake OpenAI server with per-request latency,
+per-token latency and a token-per-second rate limit, so the run is offline
+and exercises the 429 backoff path. Results are written to an in-memory sink,
+or to a temporary Chroma collection with --chroma.
+
+Usage:
+    python -m benchmarks.bench_embedding_pipeline --chunks 4000 --levels 1,4,8
+"""
+
+import argparse
+import tempfile
+import time
+
+from langchain_core.documents import Document
+from langchain_openai import OpenAIEmbeddings
+
+from benchmarks.fake_openai_server import FakeOpenAIServer
+from benchmarks.fakes import SUBJECTS
+from embedding_scheduler import EmbeddingScheduler, chroma_writer, estimate_tokens
+
+
+def make_chunks(count: int) -> list[Document]:
+    chunks = []
+    for i in range(count):
+        subject = SUBJECTS[i % len(SUBJECTS)]
+        sentence = f"O procedimento de {subject} exige registro no portal e aprovação do gestor (item {i}). "
+        chunks.append(Document(page_content=(sentence * 12)[:1000], metadata={"source": f"Docs_md/POP-{i // 8:04d}.md"}))
+    return chunks
+
+
+def make_embeddings(server: FakeOpenAIServer, max_retries: int) -> OpenAIEmbeddings:
+    return OpenAIEmbeddings(
+        model="text-embedding-3-small",
+        base_url=server.url,
+        api_key="sk-offline-benchmark",
+        max_retries=max_retries,
+        # Send raw strings; token-splitting needs tiktoken's BPE download
+        check_embedding_ctx_length=False,
+    )
+
+
+def make_writer(use_chroma: bool, embeddings):
+    if not use_chroma:
+        return lambda ids, documents, vectors: None
+    from langchain_chroma import Chroma
+    store = Chroma(collection_name="bench", embedding_function=embeddings, persist_directory=tempfile.mkdtemp())
+    return chroma_writer(store)
+
+
+def main(args):
+    chunks = make_chunks(args.chunks)
+    ids = [str(i) for i in range(len(chunks))]
+    total_tokens = sum(estimate_tokens(chunk.page_content) for chunk in chunks)
+    print(f"{len(chunks)} chunks, {total_tokens} tokens\n")
+    print(f"{'strategy':<22}{'seconds':>9}{'chunks/s':>10}{'tokens/s':>11}{'429s':>7}")
+
+    server_options = dict(latency=args.latency, token_latency=args.token_latency, tokens_per_second=args.rate_limit)
+    with FakeOpenAIServer(**server_options) as server:
+        started = time.perf_counter()
+        try:
+            make_embeddings(server, max_retries=2).embed_documents([chunk.page_content for chunk in chunks])
+            elapsed = time.perf_counter() - started
+            print(f"{'embed_documents':<22}{elapsed:>9.2f}{len(chunks) / elapsed:>10.1f}"
+                  f"{total_tokens / elapsed:>11.0f}{server.rate_limited:>7}")
+        except Exception as e:
+            print(f"{'embed_documents':<22}  failed after {time.perf_counter() - started:.2f}s: {type(e).__name__}")
+
+    for concurrency in [int(level) for level in args.levels.split(",")]:
+        with FakeOpenAIServer(**server_options) as server:
+            embeddings = make_embeddings(server, max_retries=0)
+            scheduler = EmbeddingScheduler(
+                embeddings, make_writer(args.chroma, embeddings),
+                max_batch_tokens=args.batch_tokens, max_batch_size=args.batch_size,
+                max_concurrency=concurrency, base_delay=0.1,
+            )
+            stats = scheduler.run_sync(chunks, ids)
+            print(f"{'scheduler x' + str(concurrency):<22}{stats.elapsed:>9.2f}{stats.chunks_per_second:>10.1f}"
+                  f"{stats.tokens_per_second:>11.0f}{server.rate_limited:>7}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=4000)
+    parser.add_argument("--levels", default="1,4,8", help="Comma separated scheduler concurrency levels")
+    parser.add_argument("--batch-tokens", type=int, default=50_000)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--latency", type=float, default=0.2, help="Fake server seconds per request")
+    parser.add_argument("--token-latency", type=float, default=4e-6, help="Fake server seconds per input token")
+    parser.add_argument("--rate-limit", type=float, default=150_000, help="Fake server tokens per second (0 disables)")
+    parser.add_argument("--chroma", action="store_true", help="Write to a temporary Chroma collection")
+    main(parser.parse_args())
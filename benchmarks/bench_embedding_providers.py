@@ -0,0 +1,108 @@
+"""
+Query latency and indexing throughput of the embedding providers: OpenAI
+(against the local stand-in API from `fake_openai_server.py`) vs. the local
+ONNX Runtime model, with and without batching of concurrent queries.
+
+Without `--model`, the ONNX side runs the synthetic int8 encoder from
+`onnx_stub.py` (MiniLM-sized compute, meaningless vectors). Pass a real
+export with `--model path/to/model_quantized.onnx` (tokenizer.json next to
+it) to measure that model instead.
+
+Query latency is measured one query at a time and in bursts of
+`--concurrency` simultaneous queries (what the server sees under load);
+indexing runs `--chunks` chunks through EmbeddingScheduler as
+LoaderCloud.py does.
+
+Usage:
+    python -m benchmarks.bench_embedding_providers --queries 200 --concurrency 16 --chunks 2000
+"""
+
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+
+from benchmarks.bench_embedding_pipeline import make_chunks, make_embeddings as make_openai_embeddings
+from benchmarks.fake_openai_server import FakeOpenAIServer
+from benchmarks.fakes import make_questions
+from benchmarks.onnx_stub import write_stub
+from embedding_providers import OnnxEmbeddings
+from embedding_scheduler import EmbeddingScheduler
+
+
+def percentile(ordered: list, share: float) -> float:
+    return ordered[min(len(ordered) - 1, max(0, int(len(ordered) * share + 0.5) - 1))]
+
+
+async def query_latencies(embeddings, questions: list, concurrency: int):
+    """Per-query latencies and queries/s, sending `concurrency` queries at a time"""
+    latencies = []
+
+    async def ask(question):
+        started = time.perf_counter()
+        await embeddings.aembed_query(question)
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    for start in range(0, len(questions), concurrency):
+        await asyncio.gather(*(ask(question) for question in questions[start:start + concurrency]))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return latencies, len(questions) / elapsed
+
+
+async def main(args):
+    model_path = args.model or write_stub(tempfile.mkdtemp(prefix="onnx-stub-"))
+    questions = make_questions(args.queries)
+    chunks = make_chunks(args.chunks)
+    ids = [str(i) for i in range(len(chunks))]
+    onnx_options = dict(tokenizer_path=args.tokenizer, intra_op_threads=args.threads, workers=args.workers)
+
+    with FakeOpenAIServer(latency=args.openai_latency, token_latency=args.token_latency,
+                          tokens_per_second=args.rate_limit) as server:
+        providers = [
+            ("openai", make_openai_embeddings(server, max_retries=0)),
+            ("onnx", OnnxEmbeddings(model_path, max_query_batch=1, **onnx_options)),
+            ("onnx batched", OnnxEmbeddings(model_path, max_query_batch=args.max_batch, **onnx_options)),
+        ]
+        # First call loads the model and opens the connection
+        for _, embeddings in providers:
+            await embeddings.aembed_query("aquecimento")
+
+        print(f"{args.queries} queries; openai stand-in {args.openai_latency}s per request; onnx model {model_path}")
+        print(f"{'provider':<14}{'in flight':>10}{'p50 ms':>9}{'p95 ms':>9}{'queries/s':>11}")
+        for name, embeddings in providers:
+            for concurrency in (1, args.concurrency):
+                latencies, rate = await query_latencies(embeddings, questions, concurrency)
+                print(f"{name:<14}{concurrency:>10}{statistics.median(latencies) * 1000:>9.1f}"
+                      f"{percentile(latencies, 0.95) * 1000:>9.1f}{rate:>11.1f}")
+
+        print(f"\nIndexing {len(chunks)} chunks through EmbeddingScheduler (concurrency {args.index_concurrency})")
+        print(f"{'provider':<14}{'seconds':>9}{'chunks/s':>10}{'429s':>7}")
+        for name, embeddings in providers[:2]:
+            scheduler = EmbeddingScheduler(
+                embeddings, lambda ids, documents, vectors: None, max_batch_tokens=args.batch_tokens,
+                max_batch_size=args.batch_size, max_concurrency=args.index_concurrency, base_delay=0.1,
+            )
+            stats = await scheduler.run(chunks, ids)
+            print(f"{name:<14}{stats.elapsed:>9.2f}{stats.chunks_per_second:>10.1f}{stats.rate_limited:>7}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16, help="Simultaneous queries in the burst runs")
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--model", help="ONNX model (default: synthetic int8 encoder)")
+    parser.add_argument("--tokenizer", help="tokenizer.json (default: next to the model)")
+    parser.add_argument("--threads", type=int, default=0, help="ONNX_INTRA_OP_THREADS")
+    parser.add_argument("--workers", type=int, default=2, help="ONNX_WORKERS")
+    parser.add_argument("--max-batch", type=int, default=32, help="ONNX_QUERY_MAX_BATCH")
+    parser.add_argument("--index-concurrency", type=int, default=4, help="EMBEDDING_CONCURRENCY")
+    parser.add_argument("--batch-tokens", type=int, default=50_000)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--openai-latency", type=float, default=0.15, help="Stand-in seconds per request")
+    parser.add_argument("--token-latency", type=float, default=4e-6, help="Stand-in seconds per input token")
+    parser.add_argument("--rate-limit", type=float, default=150_000, help="Stand-in tokens per second (0 disables)")
+    asyncio.run(main(parser.parse_args()))
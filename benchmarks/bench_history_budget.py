@@ -0,0 +1,86 @@
+"""
+Prompt size and latency over one long conversation, with and without the
+history token budget.
+
+Sends `--turns` questions in a single session through POST /AgentInvoke and
+reports the prompt tokens the model was billed for and the request latency at
+regular checkpoints. The fake model charges `--prompt-token-latency` seconds
+per prompt token, so a growing history shows up as growing latency. With the
+budget, turns older than `--keep-turns` are folded into a summary once
+the history passes `--budget` tokens.
+
+Usage:
+    python -m benchmarks.bench_history_budget --turns 50
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import time
+
+import httpx
+
+from benchmarks.fakes import load_server, make_questions
+
+
+async def run_session(server, turns: int) -> list[tuple[int, float]]:
+    server.conversation_sessions.clear()
+    server.token_ledger.reset()
+    rows = []
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        session_id = "bench-history"
+        for question in make_questions(turns):
+            started = time.perf_counter()
+            # Silence the server's per-request prints
+            with contextlib.redirect_stdout(io.StringIO()):
+                response = await client.post("/AgentInvoke", json={"question": question, "session_id": session_id})
+                response.raise_for_status()
+            elapsed = time.perf_counter() - started
+            rows.append((server.token_ledger.stats(limit=1)["recent"][0]["input_tokens"], elapsed))
+    return rows
+
+
+async def main(args):
+    server = load_server(
+        llm_latency=args.llm_latency,
+        embedding_latency=0.0,
+        search_latency=0.0,
+        prompt_token_latency=args.prompt_token_latency,
+    )
+    server.answer_cache = None
+    checkpoints = sorted({1, *range(10, args.turns + 1, 10), args.turns})
+    budget = args.budget
+    server.history_manager.keep_turns = args.keep_turns
+
+    results = {}
+    for mode, token_budget in (("full history", 10 ** 9), (f"budget {budget}", budget)):
+        server.history_manager.token_budget = token_budget
+        summaries = server.history_manager.summaries
+        results[mode] = await run_session(server, args.turns)
+        results[mode + " summaries"] = server.history_manager.summaries - summaries
+
+    print(f"{'turn':>6}" + "".join(f"{mode + ' tokens':>22}{'s':>8}" for mode in results if "summaries" not in mode))
+    for turn in checkpoints:
+        line = f"{turn:>6}"
+        for mode, rows in results.items():
+            if "summaries" in mode:
+                continue
+            tokens, elapsed = rows[turn - 1]
+            line += f"{tokens:>22}{elapsed:>8.3f}"
+        print(line)
+    for mode in results:
+        if "summaries" not in mode:
+            print(f"{mode}: {sum(t for t, _ in results[mode])} prompt tokens over {args.turns} turns, "
+                  f"{results[mode + ' summaries']} summaries")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=50)
+    parser.add_argument("--budget", type=int, default=800, help="History token budget")
+    parser.add_argument("--keep-turns", type=int, default=4, help="Recent turns kept verbatim")
+    parser.add_argument("--llm-latency", type=float, default=0.05)
+    parser.add_argument("--prompt-token-latency", type=float, default=1e-4, help="Fake model seconds per prompt token")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,109 @@
+"""
+Recall and latency of vector-only retrieval vs. hybrid BM25 + vector
+retrieval with reciprocal rank fusion.
+
+Builds a synthetic POP corpus (`fakes.make_corpus`, one procedure code per
+chunk), indexes it in the fake vector store and in a BM25 index, and runs the
+server's `retrieve` node for two kinds of questions:
+
+- code questions ("Qual o prazo do POP-0137?"), where only the chunk with that
+  code is relevant;
+- subject questions ("Como solicitar reembolso de despesas?"), where any
+  chunk about that subject is relevant.
+
+Recall@k is the share of questions with a relevant chunk in the k retrieved
+ones. The fake embeddings hash whole words, so they see a code as one word
+among thirty; real embedding models blur codes further, so the vector-only
+recall on code questions here is an upper bound.
+
+Usage:
+    python -m benchmarks.bench_hybrid_retrieval --corpus 2000
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import random
+import statistics
+import tempfile
+import time
+
+from benchmarks.fakes import SUBJECTS, load_server, make_corpus
+from bm25 import BM25_FILENAME, BM25Index, PersistedBM25
+
+
+def make_questions(corpus_size: int, count: int, seed: int = 0):
+    """(question, predicate on the retrieved chunk ID) pairs, half code and half subject questions"""
+    rng = random.Random(seed)
+    questions = []
+    for i in range(count):
+        if i % 2 == 0:
+            number = rng.randrange(corpus_size)
+            code = f"POP-{number:04d}"
+            template = rng.choice(["Qual o prazo do {code}?", "O que diz o {code}?", "Preciso do procedimento {code}"])
+            questions.append(("code", template.format(code=code), lambda doc_id, code=code: doc_id == f"{code}-0"))
+        else:
+            subject_index = rng.randrange(len(SUBJECTS))
+            question = f"Como solicitar {SUBJECTS[subject_index]}?"
+            questions.append((
+                "subject",
+                question,
+                lambda doc_id, s=subject_index: int(doc_id[4:8]) % len(SUBJECTS) == s,
+            ))
+    return questions
+
+
+async def run(server, questions, k: int):
+    hits = {"code": 0, "subject": 0}
+    totals = {"code": 0, "subject": 0}
+    latencies = []
+    for kind, question, relevant in questions:
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = await server.retrieve({"question": question})
+        latencies.append(time.perf_counter() - started)
+        totals[kind] += 1
+        if any(relevant(doc.id) for doc in result["context"][:k]):
+            hits[kind] += 1
+    return hits, totals, latencies
+
+
+async def main(args):
+    server = load_server(embedding_latency=0.0, search_latency=args.search_latency, corpus_size=args.corpus)
+    server.context_packer = None
+    corpus = make_corpus(args.corpus)
+    questions = make_questions(args.corpus, args.questions)
+    server.settings.RETRIEVAL_K = args.k
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = f"{directory}/{BM25_FILENAME}"
+        started = time.perf_counter()
+        index = BM25Index()
+        index.add([doc.id for doc in corpus], [doc.page_content for doc in corpus])
+        index.save(path)
+        print(f"BM25 index of {len(index)} chunks built and saved in {time.perf_counter() - started:.2f}s")
+        server.lexical_index = PersistedBM25(path)
+
+        print(f"{'mode':<14}{'recall code':>13}{'recall subject':>16}{'p50 ms':>9}{'p95 ms':>9}")
+        for mode, hybrid in (("vector", False), ("hybrid", True)):
+            server.settings.HYBRID_RETRIEVAL = hybrid
+            await run(server, questions[:4], args.k)  # Warm up (loads the BM25 file)
+            hits, totals, latencies = await run(server, questions, args.k)
+            latencies.sort()
+            print(
+                f"{mode:<14}"
+                f"{hits['code'] / totals['code']:>13.1%}"
+                f"{hits['subject'] / totals['subject']:>16.1%}"
+                f"{statistics.median(latencies) * 1000:>9.2f}"
+                f"{latencies[int(len(latencies) * 0.95) - 1] * 1000:>9.2f}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", type=int, default=2000, help="Chunks in the synthetic corpus")
+    parser.add_argument("--questions", type=int, default=200)
+    parser.add_argument("--k", type=int, default=3, help="Chunks retrieved per question")
+    parser.add_argument("--search-latency", type=float, default=0.005, help="Fake vector search seconds")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,205 @@
+"""
+Load test of POST /AgentInvoke over HTTP, fully offline.
+
+The server runs in its own process under uvicorn with the stand-ins from
+`fakes.py` (chat model, embeddings, vector store, prompt) and their
+simulated latencies, so its RSS is measured apart from the load generator.
+Closed-loop workers keep `--concurrency` requests in flight until
+`--requests` have been answered.
+
+Sessions: with `--sessions 0` every request starts a new conversation;
+with N > 0 requests cycle over N conversations, each seeded with
+`--history-turns` question/answer pairs before the run, so history
+condensation and session memory are exercised.
+
+Reports p50/p95/p99 latency, requests per second, errors, and the server's
+RSS before and after the run (Linux /proc). `--max-p95`, `--max-p99`,
+`--min-rps` and `--max-rss-growth-mb` turn it into a regression gate: the
+process exits with status 1 when a limit is missed. `--json` writes the
+results to a file for comparison between runs.
+
+Usage:
+    python -m benchmarks.bench_load --concurrency 32 --requests 2000 --sessions 200 --history-turns 10
+    python -m benchmarks.bench_load --requests 500 --max-p95 0.5 --min-rps 50 --json load.json
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import statistics
+import sys
+import time
+
+import httpx
+
+from benchmarks.fakes import FAKE_ANSWER, make_questions
+
+
+def serve(port: int, options: dict):
+    """Child process: AgentRAGServer with the fake backends, behind uvicorn"""
+    import uvicorn
+    from langchain_core.messages import AIMessage, HumanMessage
+    from benchmarks.fakes import load_server
+
+    server = load_server(
+        llm_latency=options["llm_latency"],
+        embedding_latency=options["embedding_latency"],
+        search_latency=options["search_latency"],
+        corpus_size=options["corpus"],
+    )
+    server.settings.LOG_LEVEL = options["log_level"]
+    if not options["answer_cache"]:
+        server.answer_cache = None
+    for i in range(options["sessions"]):
+        history = []
+        for turn in range(options["history_turns"]):
+            history += [HumanMessage(content=f"Pergunta anterior {turn} da conversa {i}"), AIMessage(content=FAKE_ANSWER)]
+        server.conversation_sessions[f"load-{i}"] = history
+    uvicorn.run(server.app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def memory_kb(pid: int) -> dict:
+    """VmRSS and VmHWM (peak RSS) of a process in kB, empty where /proc is unavailable"""
+    values = {}
+    try:
+        with open(f"/proc/{pid}/status", encoding="ascii") as status:
+            for line in status:
+                key, _, rest = line.partition(":")
+                if key in ("VmRSS", "VmHWM"):
+                    values[key] = int(rest.split()[0])
+    except OSError:
+        pass
+    return values
+
+
+def percentile(ordered: list, share: float) -> float:
+    return ordered[min(len(ordered) - 1, max(0, int(len(ordered) * share + 0.5) - 1))]
+
+
+async def wait_ready(client: httpx.AsyncClient, process, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if not process.is_alive():
+            raise RuntimeError("Server process exited during start-up")
+        try:
+            if (await client.get("/ready")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.1)
+    raise RuntimeError("Server not ready in time")
+
+
+async def drive(client: httpx.AsyncClient, requests: int, concurrency: int, sessions: int):
+    questions = make_questions(requests)
+    next_request = iter(range(requests))
+    latencies, errors = [], 0
+
+    async def worker():
+        nonlocal errors
+        for i in next_request:
+            body = {"question": questions[i]}
+            if sessions:
+                body["session_id"] = f"load-{i % sessions}"
+            started = time.perf_counter()
+            try:
+                response = await client.post("/AgentInvoke", json=body)
+                ok = response.status_code == 200
+            except httpx.HTTPError:
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - started)
+            else:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - started
+
+
+async def main(args) -> int:
+    options = {key: getattr(args, key) for key in (
+        "llm_latency", "embedding_latency", "search_latency", "corpus", "sessions", "history_turns",
+        "answer_cache", "log_level",
+    )}
+    process = multiprocessing.get_context("spawn").Process(target=serve, args=(args.port, options), daemon=True)
+    process.start()
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", timeout=None, limits=limits) as client:
+            await wait_ready(client, process)
+            await drive(client, args.warmup, args.concurrency, args.sessions)
+            before = memory_kb(process.pid)
+            latencies, errors, elapsed = await drive(client, args.requests, args.concurrency, args.sessions)
+            after = memory_kb(process.pid)
+    finally:
+        process.terminate()
+        process.join()
+
+    latencies.sort()
+    results = {
+        "concurrency": args.concurrency,
+        "requests": args.requests,
+        "sessions": args.sessions,
+        "history_turns": args.history_turns,
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 2),
+        "p50_s": round(statistics.median(latencies), 4) if latencies else None,
+        "p95_s": round(percentile(latencies, 0.95), 4) if latencies else None,
+        "p99_s": round(percentile(latencies, 0.99), 4) if latencies else None,
+        "rss_before_mb": round(before["VmRSS"] / 1024, 1) if "VmRSS" in before else None,
+        "rss_after_mb": round(after["VmRSS"] / 1024, 1) if "VmRSS" in after else None,
+        "rss_peak_mb": round(after["VmHWM"] / 1024, 1) if "VmHWM" in after else None,
+    }
+    if results["rss_before_mb"] is not None and results["rss_after_mb"] is not None:
+        results["rss_growth_mb"] = round(results["rss_after_mb"] - results["rss_before_mb"], 1)
+
+    print(f"{args.requests} requests, {args.concurrency} in flight, "
+          f"{args.sessions or 'new'} sessions, {args.history_turns} seeded turns, llm {args.llm_latency}s")
+    print(f"{'req/s':>8}{'p50 s':>9}{'p95 s':>9}{'p99 s':>9}{'errors':>8}{'RSS MB':>9}{'growth':>8}{'peak':>8}")
+    print(
+        f"{results['rps']:>8.1f}{results['p50_s'] or 0:>9.3f}{results['p95_s'] or 0:>9.3f}{results['p99_s'] or 0:>9.3f}"
+        f"{errors:>8}{results['rss_after_mb'] or 0:>9.1f}{results.get('rss_growth_mb', 0):>8.1f}{results['rss_peak_mb'] or 0:>8.1f}"
+    )
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    failures = []
+    for limit, key, worse in (
+        (args.max_p95, "p95_s", lambda value, limit: value > limit),
+        (args.max_p99, "p99_s", lambda value, limit: value > limit),
+        (args.min_rps, "rps", lambda value, limit: value < limit),
+        (args.max_rss_growth_mb, "rss_growth_mb", lambda value, limit: value > limit),
+    ):
+        if limit is not None and results.get(key) is not None and worse(results[key], limit):
+            failures.append(f"{key} {results[key]} (limit {limit})")
+    if errors and args.max_errors is not None and errors > args.max_errors:
+        failures.append(f"errors {errors} (limit {args.max_errors})")
+    for failure in failures:
+        print(f"FAIL {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=16, help="Requests in flight")
+    parser.add_argument("--requests", type=int, default=500, help="Measured requests")
+    parser.add_argument("--warmup", type=int, default=50, help="Requests sent before measuring")
+    parser.add_argument("--sessions", type=int, default=0, help="Conversations reused round-robin (0: a new one per request)")
+    parser.add_argument("--history-turns", type=int, default=0, help="Question/answer pairs seeded in each session")
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--embedding-latency", type=float, default=0.05)
+    parser.add_argument("--search-latency", type=float, default=0.005)
+    parser.add_argument("--corpus", type=int, default=200, help="Chunks in the fake vector store")
+    parser.add_argument("--answer-cache", action="store_true", help="Keep the semantic answer cache on")
+    parser.add_argument("--log-level", default="WARNING", help="Server LOG_LEVEL")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--json", help="Write the results to this file")
+    parser.add_argument("--max-p95", type=float, help="Fail above this p95 latency (s)")
+    parser.add_argument("--max-p99", type=float, help="Fail above this p99 latency (s)")
+    parser.add_argument("--min-rps", type=float, help="Fail below this throughput")
+    parser.add_argument("--max-rss-growth-mb", type=float, help="Fail when server RSS grows more than this during the run")
+    parser.add_argument("--max-errors", type=int, default=0, help="Fail with more failed requests than this")
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,132 @@
+"""
+Request-path cost of observability: the per-request prints the server used
+to do vs. one queued structured log record, and of recording a latency in
+a histogram.
+
+Two destinations: a file, line-buffered like a terminal so each print is a
+write() syscall, and a pipe drained by a slow reader (a log collector that
+falls behind), where a print blocks once the pipe buffer is full. The queued
+logger only enqueues the record; the listener thread formats and writes it,
+and is the one that waits on a slow reader.
+
+Usage:
+    python -m benchmarks.bench_observability --requests 20000
+"""
+
+import argparse
+import logging
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+from metrics import Histogram
+from structured_logging import setup_logging, stop_logging
+
+ANSWER = "O banco de horas permite compensar horas extras em até seis meses, conforme o POP-0137. " * 6
+SOURCES = [f"Docs_md/POP-{i:04d}.md" for i in range(3)]
+
+
+def per_call(function, requests: int) -> float:
+    """Median microseconds of `function()` over batches of 100 calls"""
+    samples = []
+    for _ in range(max(1, requests // 100)):
+        started = time.perf_counter()
+        for _ in range(100):
+            function()
+        samples.append((time.perf_counter() - started) / 100 * 1e6)
+    return statistics.median(samples)
+
+
+def slow_pipe(bytes_per_second: int):
+    """Write end of a pipe whose reader drains `bytes_per_second`; call the returned stop() when done"""
+    read_fd, write_fd = os.pipe()
+
+    def drain():
+        while True:
+            data = os.read(read_fd, 4096)
+            if not data:
+                break
+            time.sleep(len(data) / bytes_per_second)
+        os.close(read_fd)
+
+    reader = threading.Thread(target=drain, daemon=True)
+    reader.start()
+    out = open(write_fd, "w", buffering=1, encoding="utf-8")
+
+    def stop():
+        out.close()
+        reader.join()
+    return out, stop
+
+
+def tail_latency(function, requests: int):
+    """p50 and p99 microseconds of single calls"""
+    samples = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        function()
+        samples.append((time.perf_counter() - started) * 1e6)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.99) - 1]
+
+
+def print_request(out):
+    for source in SOURCES:
+        print(source, file=out)
+    print(ANSWER, file=out)
+
+
+def log_request(logger):
+    logger.info("Answer generated", extra={
+        "session_id": "s", "input_tokens": 600, "output_tokens": 120, "token_source": "provider",
+    })
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as directory:
+        with open(os.path.join(directory, "stdout.log"), "w", buffering=1, encoding="utf-8") as out:
+            printed = per_call(lambda: print_request(out), args.requests)
+
+        logger = logging.getLogger("bench")
+        with open(os.path.join(directory, "app.log"), "w", encoding="utf-8") as out:
+            setup_logging("INFO", stream=out)
+            logged = per_call(lambda: log_request(logger), args.requests)
+            stop_logging()
+
+    out, stop = slow_pipe(args.reader_bytes_per_second)
+    slow_printed = tail_latency(lambda: print_request(out), args.slow_requests)
+    stop()
+    out, stop = slow_pipe(args.reader_bytes_per_second)
+    setup_logging("INFO", stream=out)
+    slow_logged = tail_latency(lambda: log_request(logger), args.slow_requests)
+    stop_logging()
+    stop()
+
+    histogram = Histogram("bench_seconds", "Bench", ("node",))
+    observed = per_call(lambda: histogram.observe(0.042, node="retrieve"), args.requests)
+    timed = Histogram("bench_timed_seconds", "Bench", ("node",))
+
+    def time_block():
+        with timed.time(node="retrieve"):
+            pass
+    with_timer = per_call(time_block, args.requests)
+
+    print(f"{'request-path work':<44}{'us/request':>12}")
+    print(f"{'4 prints (sources + answer), line-buffered':<44}{printed:>12.2f}")
+    print(f"{'1 queued JSON log record':<44}{logged:>12.2f}")
+    print(f"\nslow reader ({args.reader_bytes_per_second // 1000} kB/s){'':<21}{'p50 us':>10}{'p99 us':>10}")
+    print(f"{'4 prints (sources + answer)':<44}{slow_printed[0]:>10.1f}{slow_printed[1]:>10.1f}")
+    print(f"{'1 queued JSON log record':<44}{slow_logged[0]:>10.1f}{slow_logged[1]:>10.1f}")
+    print()
+    print(f"{'histogram observe':<44}{observed:>12.2f}")
+    print(f"{'histogram time() context manager':<44}{with_timer:>12.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--slow-requests", type=int, default=2000, help="Requests written to the slow pipe")
+    parser.add_argument("--reader-bytes-per-second", type=int, default=500_000)
+    main(parser.parse_args())
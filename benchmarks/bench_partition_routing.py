@@ -0,0 +1,152 @@
+"""
+Vector search latency and context noise of the retrieve node's search with
+one Chroma collection searched whole vs. partition routing (partitions.py):
+a metadata filter on the one collection, one collection per partition
+searched in parallel, or a partition mask on the memory-mapped index.
+
+The synthetic corpus has `--chunks` chunks split between the "pop" and
+"site" partitions (`--site-share`). Both partitions cover the same
+`--topics` subjects, as the POPs and the site pages do; a chunk's vector
+is its partition's direction plus its topic's direction plus noise.
+Questions are drawn the same way with a weaker partition component (they
+name a subject, not a source). Reported per layout:
+- p50/p95 of `vector_search` as the server calls it, routing included;
+- noise: share of the top-k chunks from the other partition than the one
+  the question was drawn from;
+- routed: share of questions the router sent to a single partition
+  (right or wrong, see "misrouted").
+
+Usage:
+    python -m benchmarks.bench_partition_routing --chunks 20000 --dimensions 384
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+PARTITIONS = ("pop", "site")
+
+
+def unit(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.linalg.norm(vectors, axis=-1, keepdims=True)
+
+
+def make_corpus(args, rng):
+    """Chunk vectors, their partition and topic; partition and topic directions are shared with the questions"""
+    directions = unit(rng.standard_normal((len(PARTITIONS) + args.topics, args.dimensions)))
+    partitions = (rng.random(args.chunks) < args.site_share).astype(int)
+    topics = rng.integers(0, args.topics, args.chunks)
+    noise = unit(rng.standard_normal((args.chunks, args.dimensions)))
+    vectors = unit(directions[partitions] * args.partition_weight + directions[len(PARTITIONS) + topics] + noise * args.noise)
+    return directions, partitions, topics, vectors
+
+
+def make_questions(args, directions, rng):
+    partitions = (rng.random(args.queries) < args.site_share).astype(int)
+    topics = rng.integers(0, args.topics, args.queries)
+    noise = unit(rng.standard_normal((args.queries, args.dimensions)))
+    vectors = unit(directions[partitions] * args.question_partition_weight + directions[len(PARTITIONS) + topics]
+                   + noise * args.noise)
+    return partitions, vectors
+
+
+def build_stores(path: str, vectors: np.ndarray, partitions: np.ndarray):
+    """One collection holding every chunk, and one collection per partition, with the metadata LoaderCloud.py writes"""
+    from langchain_chroma import Chroma
+    from partitions import PartitionedVectorStore
+
+    def fill(store, rows):
+        for start in range(0, len(rows), 2000):
+            batch = rows[start:start + 2000]
+            source = lambda row: f"{'ScrapedData' if partitions[row] else 'Docs_md'}/doc-{row // 8}.md"
+            store._collection.add(
+                ids=[f"chunk-{row}" for row in batch],
+                embeddings=vectors[batch],
+                documents=[f"Trecho {row}" for row in batch],
+                metadatas=[{"source": source(row), "category": PARTITIONS[partitions[row]],
+                            "partition": PARTITIONS[partitions[row]]} for row in batch],
+            )
+
+    single = Chroma(collection_name="dgt_rag", persist_directory=path)
+    fill(single, np.arange(len(vectors)))
+    partitioned = PartitionedVectorStore({
+        name: Chroma(collection_name=f"dgt_rag_{name}", persist_directory=path) for name in PARTITIONS
+    })
+    for index, name in enumerate(PARTITIONS):
+        fill(partitioned.stores[name], np.flatnonzero(partitions == index))
+    return single, partitioned
+
+
+def percentile(ordered: list, share: float) -> float:
+    return ordered[min(len(ordered) - 1, max(0, int(len(ordered) * share + 0.5) - 1))]
+
+
+async def measure(server, questions: np.ndarray, truth: np.ndarray, k: int):
+    latencies, noise, routed, misrouted = [], [], 0, 0
+    for vector, partition in zip(questions.tolist(), truth):
+        started = time.perf_counter()
+        chosen = server.route(vector)
+        hits = await server.vector_search(vector, k, chosen)
+        latencies.append(time.perf_counter() - started)
+        noise.append(sum(doc.metadata["partition"] != PARTITIONS[partition] for doc in hits) / max(len(hits), 1))
+        if chosen is not None:
+            routed += 1
+            misrouted += chosen != [PARTITIONS[partition]]
+    latencies.sort()
+    return latencies, statistics.mean(noise), routed / len(questions), misrouted / len(questions)
+
+
+async def main(args):
+    os.environ.setdefault("OPENAI_API_KEY", "sk-offline-benchmark")
+    import AgentRAGServer as server
+    from partitions import CENTROIDS_FILENAME, QueryRouter, compute_centroids, write_centroids
+    from vector_index import MmapVectorIndex, export_collection
+
+    rng = np.random.default_rng(0)
+    directions, partitions, _, vectors = make_corpus(args, rng)
+    truth, questions = make_questions(args, directions, rng)
+    path = tempfile.mkdtemp(prefix="bench-partitions-")
+    started = time.perf_counter()
+    single, partitioned = build_stores(path, vectors.astype(np.float32), partitions)
+    print(f"{args.chunks} chunks x {args.dimensions} dims, {partitions.mean():.0%} site, {args.topics} shared topics "
+          f"({time.perf_counter() - started:.1f}s to build); {args.queries} questions, k={args.k}")
+
+    centroids_path = os.path.join(path, CENTROIDS_FILENAME)
+    write_centroids(compute_centroids(partitioned.collections()), centroids_path)
+    export_collection(single._collection, os.path.join(path, "vector_index"))
+    mmap_index = MmapVectorIndex(os.path.join(path, "vector_index"))
+    layouts = [
+        ("one collection", single, None),
+        ("filtered", single, QueryRouter(centroids_path, args.margin)),
+        ("per partition", partitioned, QueryRouter(centroids_path, args.margin)),
+        ("mmap", mmap_index, None),
+        ("mmap routed", mmap_index, QueryRouter(centroids_path, args.margin)),
+    ]
+    print(f"\n{'layout':<16}{'p50 ms':>9}{'p95 ms':>9}{'noise':>8}{'routed':>8}{'misrouted':>11}")
+    for name, store, router in layouts:
+        server.vector_store, server.partition_router = store, router
+        await measure(server, questions[:10], truth[:10], args.k)
+        latencies, noise, routed, misrouted = await measure(server, questions, truth, args.k)
+        print(f"{name:<16}{statistics.median(latencies) * 1000:>9.2f}{percentile(latencies, 0.95) * 1000:>9.2f}"
+              f"{noise:>8.3f}{routed:>8.0%}{misrouted:>11.1%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--dimensions", type=int, default=384)
+    parser.add_argument("--site-share", type=float, default=0.5, help="Share of the chunks in the site partition")
+    parser.add_argument("--topics", type=int, default=40)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--k", type=int, default=10, help="Hits per question (HYBRID_CANDIDATES)")
+    parser.add_argument("--margin", type=float, default=0.05, help="PARTITION_ROUTING_MARGIN")
+    parser.add_argument("--partition-weight", type=float, default=0.3, help="Weight of the partition direction in chunks")
+    parser.add_argument("--question-partition-weight", type=float, default=0.15,
+                        help="Weight of the partition direction in questions")
+    parser.add_argument("--noise", type=float, default=1.0, help="Weight of the random component")
+    asyncio.run(main(parser.parse_args()))
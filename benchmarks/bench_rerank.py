@@ -0,0 +1,145 @@
+"""
+Context quality per prompt token and rerank latency, top-k retrieval vs. the
+rerank node.
+
+Builds long synthetic POPs (one procedure code each, numbered steps with
+distinct content), splits them like LoaderCloud.py (1000 characters, 200 of
+overlap) and indexes the chunks in the fake vector store. Each question asks
+for the steps of one POP; the benchmark counts how many distinct steps of that
+POP reach the prompt and how many context tokens they cost.
+
+Modes:
+- `top-k`: RETRIEVAL_K nearest chunks, no rerank node;
+- `mmr`: RERANK_CANDIDATES chunks reranked by MMR under `--budget` tokens.
+
+With `--hybrid` the chunks are also put in a BM25 index and retrieval fuses
+both (see bm25.py). Retrieval and rerank latency are reported separately.
+
+Usage:
+    python -m benchmarks.bench_rerank --documents 200 --hybrid
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import random
+import re
+import statistics
+import tempfile
+import time
+
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+import settings
+from benchmarks.fakes import SUBJECTS, FakeEmbeddings, FakeVectorStore, load_server
+from bm25 import BM25_FILENAME, BM25Index, PersistedBM25
+from rerank import Reranker
+from token_accounting import count_tokens
+
+WORDS = (
+    "registrar anexar aprovar conferir assinar enviar validar arquivar consultar notificar "
+    "planilha formulário sistema portal gestor fornecedor contrato nota recibo comprovante "
+    "prazo valor limite código setor diretoria financeiro jurídico compras almoxarifado"
+).split()
+
+
+def make_documents(count: int, steps: int, seed: int = 0) -> list[Document]:
+    rng = random.Random(seed)
+    documents = []
+    for i in range(count):
+        code = f"POP-{i:04d}"
+        subject = SUBJECTS[i % len(SUBJECTS)]
+        lines = [f"{code} Procedimento operacional padrão de {subject}."]
+        for step in range(1, steps + 1):
+            lines.append(f"Passo {step} do {code}: " + " ".join(rng.choice(WORDS) for _ in range(18)) + ".")
+        documents.append(Document(page_content="\n".join(lines), metadata={"source": f"Docs_md/{code}.md"}))
+    return documents
+
+
+def split(documents: list[Document]) -> list[Document]:
+    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200, add_start_index=True)
+    chunks = []
+    for document in documents:
+        code = document.metadata["source"][8:16]
+        for index, chunk in enumerate(splitter.split_documents([document])):
+            chunk.id = f"{code}-{index}"
+            chunks.append(chunk)
+    return chunks
+
+
+def steps_covered(code: str, documents: list[Document]) -> int:
+    pattern = re.compile(rf"Passo (\d+) do {code}:")
+    return len({step for doc in documents for step in pattern.findall(doc.page_content)})
+
+
+async def run(server, questions, encoding: str):
+    rows = []
+    for code, question in questions:
+        with contextlib.redirect_stdout(io.StringIO()):
+            started = time.perf_counter()
+            state = {"question": question, **await server.retrieve({"question": question})}
+            retrieved = time.perf_counter()
+            if server.reranker is not None:
+                state.update(await server.rerank(state))
+            reranked = time.perf_counter()
+        context = state["context"]
+        tokens = count_tokens("\n\n".join(doc.page_content for doc in context), encoding)
+        rows.append((steps_covered(code, context), tokens, retrieved - started, reranked - retrieved))
+    return rows
+
+
+async def main(args):
+    server = load_server(embedding_latency=0.0, search_latency=0.0)
+    server.context_packer = None
+    chunks = split(make_documents(args.documents, args.steps))
+    server.vector_store = FakeVectorStore(FakeEmbeddings(), latency=args.search_latency)
+    server.vector_store.add_documents(chunks)
+    server.settings.HYBRID_RETRIEVAL = args.hybrid
+    directory = tempfile.TemporaryDirectory()
+    if args.hybrid:
+        index = BM25Index()
+        index.add([chunk.id for chunk in chunks], [chunk.page_content for chunk in chunks])
+        index.save(f"{directory.name}/{BM25_FILENAME}")
+        server.lexical_index = PersistedBM25(f"{directory.name}/{BM25_FILENAME}")
+    encoding = server.settings.TOKEN_ENCODING
+    rng = random.Random(1)
+    questions = []
+    for _ in range(args.questions):
+        number = rng.randrange(args.documents)
+        subject = SUBJECTS[number % len(SUBJECTS)]
+        questions.append((f"POP-{number:04d}", f"Quais são os passos de {subject} no POP-{number:04d}?"))
+    print(f"{len(chunks)} chunks from {args.documents} documents, {'hybrid' if args.hybrid else 'vector-only'} retrieval")
+
+    modes = [
+        (f"top-{server.settings.RETRIEVAL_K}", None),
+        (f"mmr {server.settings.RERANK_CANDIDATES}->{args.budget}t",
+         Reranker(token_budget=args.budget, diversity=args.diversity, encoding_name=encoding)),
+    ]
+    print(f"{'mode':<20}{'steps':>8}{'tokens':>9}{'steps/1k tok':>14}{'retrieve ms':>13}{'rerank ms':>11}{'rerank p95':>12}")
+    for mode, reranker in modes:
+        server.reranker = reranker
+        rows = await run(server, questions, encoding)
+        steps = statistics.mean(row[0] for row in rows)
+        tokens = statistics.mean(row[1] for row in rows)
+        rerank_times = sorted(row[3] for row in rows)
+        print(
+            f"{mode:<20}{steps:>8.1f}{tokens:>9.0f}{steps / tokens * 1000:>14.2f}"
+            f"{statistics.mean(row[2] for row in rows) * 1000:>13.2f}"
+            f"{statistics.mean(rerank_times) * 1000:>11.2f}"
+            f"{rerank_times[int(len(rerank_times) * 0.95) - 1] * 1000:>12.2f}"
+        )
+    directory.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=200)
+    parser.add_argument("--steps", type=int, default=30, help="Numbered steps per document")
+    parser.add_argument("--questions", type=int, default=100)
+    parser.add_argument("--budget", type=int, default=settings.RERANK_TOKEN_BUDGET, help="Rerank token budget")
+    parser.add_argument("--diversity", type=float, default=settings.RERANK_DIVERSITY, help="MMR diversity weight")
+    parser.add_argument("--hybrid", action="store_true", help="Fuse BM25 hits into the candidates")
+    parser.add_argument("--search-latency", type=float, default=0.005, help="Fake vector search seconds")
+    asyncio.run(main(parser.parse_args()))
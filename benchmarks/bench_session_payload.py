@@ -0,0 +1,109 @@
+"""
+Response size and server time of long conversations: full-history
+responses vs. delta responses, and whole vs. paged GET /conversation.
+
+Sends `--turns` questions in one session through POST /AgentInvoke, once
+returning the whole history with every answer and once with `"delta": true`.
+The history token budget is lifted so the stored history keeps growing, as
+it does until HISTORY_TOKEN_BUDGET first triggers a summary. Reported at
+checkpoints: response bytes and request time. Then GET /conversation is
+timed for the whole history and for a `--page`-message page, and the
+history-serialization step alone is timed the way the server did it before
+Turn records (dicts to messages on load, messages to dicts and a pydantic
+ChatResponse on reply) vs. from the Turns' cached JSON.
+
+Usage:
+    python -m benchmarks.bench_session_payload --turns 200
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from benchmarks.fakes import load_server, make_questions
+
+
+async def run_session(client, server, turns: int, delta: bool) -> list[tuple[int, float]]:
+    server.conversation_sessions.clear()
+    session_id = "bench-payload"
+    rows = []
+    for question in make_questions(turns):
+        started = time.perf_counter()
+        response = await client.post("/AgentInvoke", json={"question": question, "session_id": session_id, "delta": delta})
+        response.raise_for_status()
+        rows.append((len(response.content), time.perf_counter() - started))
+    return rows
+
+
+def time_call(function, repeat: int) -> float:
+    """Median seconds of `function()` over `repeat` calls"""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples)
+
+
+def legacy_round_trip(server, stored: list):
+    """History handling of one request before Turn records: stored dicts to messages, then back for the reply"""
+    classes = {"HumanMessage": HumanMessage, "AIMessage": AIMessage, "SystemMessage": SystemMessage}
+    history = [classes[message["type"]](content=message["content"]) for message in stored]
+    dicts = [{"type": message.__class__.__name__, "content": message.content} for message in history]
+    return server.ChatResponse(answer="", session_id="bench-payload", conversation_history=dicts).model_dump_json()
+
+
+async def main(args):
+    server = load_server(llm_latency=0.0, embedding_latency=0.0, search_latency=0.0)
+    server.answer_cache = None
+    server.coalescer = None
+    server.history_manager.token_budget = 10 ** 9
+    server.conversation_sessions.max_turns = args.turns
+    server.conversation_sessions.max_bytes = 10 ** 9
+    checkpoints = sorted({1, *range(50, args.turns + 1, 50), args.turns})
+
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        results = {mode: await run_session(client, server, args.turns, mode == "delta") for mode in ("full", "delta")}
+
+        print(f"{args.turns} turns in one session, history budget lifted\n")
+        print(f"{'turn':>6}" + "".join(f"{mode + ' bytes':>14}{mode + ' ms':>11}" for mode in results))
+        for turn in checkpoints:
+            print(f"{turn:>6}" + "".join(f"{rows[turn - 1][0]:>14}{rows[turn - 1][1] * 1000:>11.2f}"
+                                         for rows in results.values()))
+        for mode, rows in results.items():
+            print(f"{mode}: {sum(size for size, _ in rows) / 2**20:.2f} MB sent over {args.turns} turns, "
+                  f"median {statistics.median(elapsed for _, elapsed in rows[-50:]) * 1000:.2f} ms over the last 50")
+
+        pages = {}
+        for name, params in (("whole", {}), (f"page of {args.page}", {"since": 2 * args.turns - args.page})):
+            if "since" in params:
+                params["limit"] = args.page
+            response = await client.get("/conversation/bench-payload", params=params)
+            started = time.perf_counter()
+            for _ in range(args.repeat):
+                await client.get("/conversation/bench-payload", params=params)
+            pages[name] = (len(response.content), (time.perf_counter() - started) / args.repeat)
+        print(f"\nGET /conversation over {2 * args.turns} messages")
+        for name, (size, elapsed) in pages.items():
+            print(f"{name:<14}{size:>10} bytes{elapsed * 1000:>9.2f} ms")
+
+    stored = server.conversation_sessions.get("bench-payload")
+    as_dicts = [turn.to_dict() for turn in stored]
+    legacy = time_call(lambda: legacy_round_trip(server, as_dicts), args.repeat)
+    turns = time_call(lambda: server.chat_response_json("", "bench-payload", server.load_session_history("bench-payload")),
+                      args.repeat)
+    print(f"\nHistory load and serialization of one request at {len(stored)} messages: "
+          f"messages and dicts {legacy * 1000:.2f} ms, Turn records {turns * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--page", type=int, default=20, help="Messages per GET /conversation page")
+    parser.add_argument("--repeat", type=int, default=50, help="Calls per timed GET and serialization")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,57 @@
+"""
+Time-to-first-token benchmark: POST /AgentInvoke vs. POST /AgentInvoke/stream.
+
+For the blocking endpoint the first byte arrives with the whole answer; for
+the SSE endpoint it is the first `token` event. The app is served by uvicorn
+on localhost because httpx's in-process ASGI transport buffers whole bodies.
+
+Usage:
+    python -m benchmarks.bench_streaming_ttft --requests 10 --token-latency 0.03
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+import uvicorn
+
+from benchmarks.fakes import load_server, make_questions
+
+
+async def measure(client: httpx.AsyncClient, path: str, question: str) -> tuple[float, float]:
+    started = time.perf_counter()
+    first_token = None
+    async with client.stream("POST", path, json={"question": question}) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if first_token is None and (path == "/AgentInvoke" or line == "event: token"):
+                first_token = time.perf_counter() - started
+    return first_token, time.perf_counter() - started
+
+
+async def main(args):
+    server = load_server(llm_latency=args.llm_latency, token_latency=args.token_latency)
+    http_server = uvicorn.Server(uvicorn.Config(server.app, port=args.port, log_level="warning"))
+    serving = asyncio.create_task(http_server.serve())
+    while not http_server.started:
+        await asyncio.sleep(0.01)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", timeout=None) as client:
+        print(f"{'endpoint':<24}{'ttft p50':>10}{'total p50':>11}")
+        for path in ("/AgentInvoke", "/AgentInvoke/stream"):
+            samples = [await measure(client, path, q) for q in make_questions(args.requests)]
+            ttft = statistics.median(s[0] for s in samples)
+            total = statistics.median(s[1] for s in samples)
+            print(f"{path:<24}{ttft:>10.3f}{total:>11.3f}")
+    http_server.should_exit = True
+    await serving
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=10)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="Seconds until the first token")
+    parser.add_argument("--token-latency", type=float, default=0.03, help="Seconds between streamed tokens")
+    asyncio.run(main(parser.parse_args()))
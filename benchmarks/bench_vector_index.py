@@ -0,0 +1,186 @@
+"""
+Search latency and memory of the Chroma `similarity_search_by_vector` path
+vs. the memory-mapped exact index (vector_index.py), float32 and float16.
+
+A temporary persistent Chroma collection is filled with `--chunks` random
+`--dimensions`-wide vectors and ~1 kB texts, then exported. Reported:
+- per-query latency (p50/p95) through the call the server makes, and per
+  query when `--batch` queries are searched in one call
+  (`similarity_search_by_vectors`, the batch endpoint's path, or one
+  Chroma `collection.query`);
+- recall@k of Chroma's approximate HNSW search against the exact result;
+- memory of `--workers` processes each holding the index after some
+  queries, like uvicorn workers: RSS counts shared pages in every process,
+  PSS (Linux /proc) splits them between the processes sharing them.
+
+Usage:
+    python -m benchmarks.bench_vector_index --chunks 20000 --dimensions 1536 --workers 4
+    python -m benchmarks.bench_vector_index --chroma-dir /tmp/bench-chroma   # reuse a built collection
+"""
+
+import argparse
+import multiprocessing
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+COLLECTION = "dgt_rag"
+TEXT = "O procedimento exige registro no portal e aprovação do gestor imediato. " * 14
+
+
+def build_collection(path: str, chunks: int, dimensions: int, seed: int = 0):
+    import chromadb
+
+    client = chromadb.PersistentClient(path=path)
+    collection = client.get_or_create_collection(COLLECTION, metadata={"hnsw:space": "cosine"})
+    if collection.count() >= chunks:
+        return collection
+    rng = np.random.default_rng(seed)
+    for start in range(collection.count(), chunks, 2000):
+        rows = range(start, min(start + 2000, chunks))
+        collection.add(
+            ids=[f"chunk-{i}" for i in rows],
+            embeddings=rng.standard_normal((len(rows), dimensions)).astype(np.float32),
+            documents=[TEXT[:1000] for _ in rows],
+            metadatas=[{"source": f"Docs_md/POP-{i // 8:04d}.md", "start_index": (i % 8) * 800} for i in rows],
+        )
+    return collection
+
+
+def open_backend(backend: str, chroma_dir: str, index_dir: str):
+    if backend == "chroma":
+        from langchain_chroma import Chroma
+        return Chroma(collection_name=COLLECTION, persist_directory=chroma_dir)
+    from vector_index import MmapVectorIndex
+    return MmapVectorIndex(index_dir)
+
+
+def percentile(ordered: list, share: float) -> float:
+    return ordered[min(len(ordered) - 1, max(0, int(len(ordered) * share + 0.5) - 1))]
+
+
+def single_latencies(store, queries: np.ndarray, k: int) -> list:
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        store.similarity_search_by_vector(query.tolist(), k=k)
+        latencies.append(time.perf_counter() - started)
+    return sorted(latencies)
+
+
+def memory_kb(pid: int) -> dict:
+    """RSS from /proc/<pid>/status and PSS from smaps_rollup, in kB (empty off Linux)"""
+    values = {}
+    for name, keys in (("status", ("VmRSS",)), ("smaps_rollup", ("Pss",))):
+        try:
+            with open(f"/proc/{pid}/{name}", encoding="ascii") as f:
+                for line in f:
+                    key, _, rest = line.partition(":")
+                    if key in keys:
+                        values[key] = int(rest.split()[0])
+        except OSError:
+            pass
+    return values
+
+
+def hold(backend: str, chroma_dir: str, index_dir: str, queries, k: int, ready, stop):
+    """
+    Worker process: open the backend and answer the queries, then keep it
+    open until told to stop. Without queries it only imports the backend's
+    modules, as the baseline.
+    """
+    if queries is None:
+        __import__("langchain_chroma" if backend == "chroma" else "vector_index")
+    else:
+        store = open_backend(backend, chroma_dir, index_dir)
+        for query in queries:
+            store.similarity_search_by_vector(query.tolist(), k=k)
+    ready.set()
+    stop.wait()
+
+
+def worker_memory(backend: str, chroma_dir: str, index_dir: str, queries: np.ndarray, k: int, workers: int):
+    """Total RSS and PSS (MB) of `workers` processes holding the backend, minus the same processes idle"""
+    context = multiprocessing.get_context("spawn")
+    totals = []
+    for held in (None, queries):
+        stop = context.Event()
+        started = []
+        for _ in range(workers):
+            ready = context.Event()
+            process = context.Process(target=hold, args=(backend, chroma_dir, index_dir, held, k, ready, stop), daemon=True)
+            process.start()
+            started.append((process, ready))
+        for _, ready in started:
+            ready.wait(300)
+        samples = [memory_kb(process.pid) for process, _ in started]
+        stop.set()
+        for process, _ in started:
+            process.join()
+        totals.append({key: sum(sample.get(key, 0) for sample in samples) / 1024 for key in ("VmRSS", "Pss")})
+    return {key: totals[1][key] - totals[0][key] for key in ("VmRSS", "Pss")}
+
+
+def main(args):
+    from vector_index import MmapVectorIndex, export_collection
+
+    chroma_dir = args.chroma_dir or tempfile.mkdtemp(prefix="bench-chroma-")
+    started = time.perf_counter()
+    collection = build_collection(chroma_dir, args.chunks, args.dimensions)
+    print(f"{collection.count()} chunks x {args.dimensions} dims in Chroma ({time.perf_counter() - started:.1f}s to build)")
+
+    index_dirs = {}
+    for dtype in ("float32", "float16"):
+        started = time.perf_counter()
+        index_dirs[dtype] = tempfile.mkdtemp(prefix=f"bench-index-{dtype}-")
+        export_collection(collection, index_dirs[dtype], dtype=dtype)
+        print(f"Exported {dtype} in {time.perf_counter() - started:.1f}s")
+
+    rng = np.random.default_rng(1)
+    queries = rng.standard_normal((args.queries, args.dimensions)).astype(np.float32)
+    backends = [("chroma", "chroma", None)] + [(f"mmap {dtype}", "mmap", index_dirs[dtype]) for dtype in index_dirs]
+
+    # Before this process maps the files itself, so PSS is split between the workers only
+    memory = {name: worker_memory(backend, chroma_dir, index_dir, queries[:20], args.k, args.workers)
+              if args.workers else {"VmRSS": 0, "Pss": 0} for name, backend, index_dir in backends}
+
+    print(f"\n{'backend':<15}{'p50 ms':>9}{'p95 ms':>9}{f'batch {args.batch} ms/q':>17}{'recall@' + str(args.k):>11}"
+          f"{'RSS MB':>9}{'PSS MB':>9}")
+    exact = MmapVectorIndex(index_dirs["float32"]).search(queries, args.k)
+    for name, backend, index_dir in backends:
+        store = open_backend(backend, chroma_dir, index_dir)
+        single_latencies(store, queries[:5], args.k)
+        latencies = single_latencies(store, queries, args.k)
+
+        batch = queries[:args.batch]
+        started = time.perf_counter()
+        if backend == "chroma":
+            store._collection.query(query_embeddings=batch, n_results=args.k)
+            batch_ms = (time.perf_counter() - started) / len(batch) * 1000
+            hits = [[doc.id for doc in store.similarity_search_by_vector(query.tolist(), k=args.k)] for query in queries]
+        else:
+            store.similarity_search_by_vectors(batch.tolist(), k=args.k)
+            batch_ms = (time.perf_counter() - started) / len(batch) * 1000
+            hits = [[doc_id for doc_id, _ in result] for result in store.search(queries, args.k)]
+        recall = statistics.mean(
+            len(set(found) & {doc_id for doc_id, _ in truth}) / args.k for found, truth in zip(hits, exact)
+        )
+        print(f"{name:<15}{statistics.median(latencies) * 1000:>9.2f}{percentile(latencies, 0.95) * 1000:>9.2f}"
+              f"{batch_ms:>17.2f}{recall:>11.3f}{memory[name]['VmRSS']:>9.0f}{memory[name]['Pss']:>9.0f}")
+    if args.workers:
+        print(f"\nMemory: {args.workers} worker processes in total, above the same processes without an index. "
+              "Chroma's batch column is one collection.query() with all the query vectors.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--dimensions", type=int, default=1536, help="1536 for text-embedding-3-small, 384 for MiniLM")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=20, help="Hits per query (HYBRID_CANDIDATES)")
+    parser.add_argument("--batch", type=int, default=64, help="Queries per batched search")
+    parser.add_argument("--workers", type=int, default=4, help="Processes holding the index for the memory columns (0 skips)")
+    parser.add_argument("--chroma-dir", help="Reuse (or build once in) this Chroma folder")
+    main(parser.parse_args())
@@ -0,0 +1,233 @@
+"""
+Throughput, latency and memory of the server as gunicorn workers are added
+(gunicorn.conf.py), fully offline.
+
+Each run starts gunicorn with uvicorn workers serving AgentRAGServer with the
+stand-ins from `fakes.py`, over a synthetic BM25 index of `--chunks` chunks
+as the large read-only state. Runs per worker count:
+- preload: the master loads the app and the shared state (prompt, BM25
+  index, tokenizer; see preload_shared_state) and freezes the heap before
+  forking, as gunicorn.conf.py does; sessions in SQLite (SESSION_STORE=sqlite);
+- no preload: each worker imports the app and loads its own copy;
+- memory sessions: preload, but sessions kept in each worker (SESSION_STORE=memory).
+
+Every closed-loop client keeps one conversation going, so "follow-ups"
+is the share of follow-up questions answered with the previous turn in
+their history, whichever worker served it. Memory is summed over the
+master and its workers: PSS counts shared pages once, split between the
+processes sharing them; USS is what each worker holds alone.
+
+Usage:
+    python -m benchmarks.bench_workers --workers 1 2 4 --chunks 50000 --requests 400
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.fakes import SUBJECTS
+
+VARIANTS = (
+    ("preload", True, "sqlite"),
+    ("no preload", False, "sqlite"),
+    ("memory sessions", True, "memory"),
+)
+
+
+def build_bm25(path: str, chunks: int):
+    """A BM25 index of synthetic POP-style chunks over a vocabulary large enough to weigh like a real one"""
+    from bm25 import BM25Index
+
+    rng = random.Random(0)
+    vocabulary = [f"termo{i}" for i in range(20000)] + " ".join(SUBJECTS).split()
+    index = BM25Index()
+    for start in range(0, chunks, 5000):
+        ids = [f"POP-{i:06d}-0" for i in range(start, min(chunks, start + 5000))]
+        index.add(ids, [" ".join(rng.choices(vocabulary, k=80)) for _ in ids])
+    index.save(path)
+
+
+def serve(port: int, workers: int, preload: bool, options: dict):
+    """Child process: gunicorn master over AgentRAGServer with the fake backends"""
+    import runpy
+    from gunicorn.app.base import BaseApplication
+
+    config = runpy.run_path("gunicorn.conf.py") if preload else {}
+    if not preload:
+        import gc
+        gc.enable()
+
+    class BenchApplication(BaseApplication):
+        def load_config(self):
+            self.cfg.set("bind", f"127.0.0.1:{port}")
+            self.cfg.set("workers", workers)
+            self.cfg.set("worker_class", "uvicorn_worker.UvicornWorker")
+            self.cfg.set("preload_app", preload)
+            self.cfg.set("loglevel", "warning")
+            if preload:
+                self.cfg.set("when_ready", config["when_ready"])
+
+        def load(self):
+            from benchmarks.fakes import load_server
+
+            server = load_server(llm_latency=options["llm_latency"], embedding_latency=options["embedding_latency"],
+                                 search_latency=options["search_latency"])
+            server.settings.LOG_LEVEL = "WARNING"
+            server.answer_cache = None
+            return server.app
+
+    BenchApplication().run()
+
+
+def memory_kb(pid: int) -> dict:
+    """RSS, PSS and USS (private pages) of a process from /proc/<pid>/smaps_rollup, in kB"""
+    values = {"Rss": 0, "Pss": 0, "Private_Clean": 0, "Private_Dirty": 0}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", encoding="ascii") as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                if key in values:
+                    values[key] = int(rest.split()[0])
+    except OSError:
+        pass
+    return {"rss": values["Rss"], "pss": values["Pss"], "uss": values["Private_Clean"] + values["Private_Dirty"]}
+
+
+def children(pid: int) -> list:
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children", encoding="ascii") as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+
+
+def percentile(ordered: list, share: float) -> float:
+    return ordered[min(len(ordered) - 1, max(0, int(len(ordered) * share + 0.5) - 1))]
+
+
+async def wait_ready(client: httpx.AsyncClient, master: int, workers: int, timeout: float = 120.0):
+    """Until every worker has forked and enough /ready calls succeed in a row to have reached each of them"""
+    deadline = time.monotonic() + timeout
+    streak = 0
+    while time.monotonic() < deadline and streak < 4 * workers:
+        await asyncio.sleep(0.05)
+        if len(children(master)) < workers:
+            continue
+        try:
+            streak = streak + 1 if (await client.get("/ready")).status_code == 200 else 0
+        except httpx.TransportError:
+            streak = 0
+    if streak < 4 * workers:
+        raise RuntimeError("Server not ready in time")
+
+
+async def drive(client: httpx.AsyncClient, requests: int, concurrency: int, tag: str):
+    """Closed loop: each client asks its own conversation's questions one after another"""
+    next_request = iter(range(requests))
+    latencies, errors, follow_ups, continued = [], 0, 0, 0
+
+    async def conversation(number: int):
+        nonlocal errors, follow_ups, continued
+        session_id, previous = f"{tag}-{number}", None
+        for i in next_request:
+            body = {"question": f"Como funciona {SUBJECTS[i % len(SUBJECTS)]}? ({i})", "session_id": session_id}
+            started = time.perf_counter()
+            try:
+                response = await client.post("/AgentInvoke", json=body)
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            if response.status_code != 200:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+            if previous is not None:
+                follow_ups += 1
+                continued += any(message["content"] == previous for message in response.json()["conversation_history"])
+            previous = body["question"]
+
+    started = time.perf_counter()
+    await asyncio.gather(*(conversation(number) for number in range(concurrency)))
+    return latencies, errors, time.perf_counter() - started, continued / max(follow_ups, 1)
+
+
+async def run(args, workers: int, preload: bool, port: int) -> dict:
+    options = {key: getattr(args, key) for key in ("llm_latency", "embedding_latency", "search_latency")}
+    process = multiprocessing.get_context("spawn").Process(target=serve, args=(port, workers, preload, options))
+    process.start()
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=0)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=None, limits=limits) as client:
+            await wait_ready(client, process.pid, workers)
+            await drive(client, args.warmup, args.concurrency, f"warmup-{port}")
+            latencies, errors, elapsed, continuity = await drive(client, args.requests, args.concurrency, f"run-{port}")
+        worker_memory = [memory_kb(pid) for pid in children(process.pid)]
+        master_memory = memory_kb(process.pid)
+    finally:
+        process.terminate()
+        process.join()
+    latencies.sort()
+    return {
+        "rps": len(latencies) / elapsed,
+        "p50": statistics.median(latencies) if latencies else 0,
+        "p95": percentile(latencies, 0.95) if latencies else 0,
+        "errors": errors,
+        "continuity": continuity,
+        "worker_rss": statistics.mean(m["rss"] for m in worker_memory) / 1024,
+        "worker_uss": statistics.mean(m["uss"] for m in worker_memory) / 1024,
+        "total_pss": (master_memory["pss"] + sum(m["pss"] for m in worker_memory)) / 1024,
+    }
+
+
+async def main(args):
+    directory = tempfile.mkdtemp(prefix="bench-workers-")
+    os.environ.update(CHROMA_PERSIST_DIRECTORY=directory, HYBRID_RETRIEVAL="true", STARTUP_WARMUP="true",
+                      PYTHONWARNINGS="ignore",
+                      OPENAI_API_KEY=os.environ.get("OPENAI_API_KEY", "sk-offline-benchmark"))
+    started = time.perf_counter()
+    build_bm25(os.path.join(directory, "bm25_index.json"), args.chunks)
+    size = os.path.getsize(os.path.join(directory, "bm25_index.json")) / 2**20
+    print(f"BM25 index of {args.chunks} chunks ({size:.0f} MB on disk, {time.perf_counter() - started:.1f}s to build); "
+          f"{args.requests} requests from {args.concurrency} conversations, llm {args.llm_latency}s, "
+          f"{os.cpu_count()} CPUs")
+
+    print(f"\n{'variant':<17}{'workers':>8}{'req/s':>8}{'p50 s':>8}{'p95 s':>8}{'errors':>7}{'follow-ups':>11}"
+          f"{'RSS/w MB':>10}{'USS/w MB':>10}{'PSS MB':>9}")
+    port = args.port
+    try:
+        for name, preload, store in VARIANTS:
+            if name not in args.variants:
+                continue
+            for workers in args.workers:
+                os.environ.update(SESSION_STORE=store, SESSION_DB_PATH=os.path.join(directory, f"sessions-{port}.sqlite3"))
+                result = await run(args, workers, preload, port)
+                port += 1
+                print(f"{name:<17}{workers:>8}{result['rps']:>8.1f}{result['p50']:>8.3f}{result['p95']:>8.3f}"
+                      f"{result['errors']:>7}{result['continuity']:>11.0%}{result['worker_rss']:>10.0f}"
+                      f"{result['worker_uss']:>10.0f}{result['total_pss']:>9.0f}")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="Worker counts to run")
+    parser.add_argument("--variants", nargs="+", default=[name for name, _, _ in VARIANTS],
+                        choices=[name for name, _, _ in VARIANTS])
+    parser.add_argument("--chunks", type=int, default=50000, help="Chunks in the BM25 index")
+    parser.add_argument("--concurrency", type=int, default=32, help="Conversations in flight")
+    parser.add_argument("--requests", type=int, default=400, help="Measured requests per run")
+    parser.add_argument("--warmup", type=int, default=64, help="Requests sent before measuring")
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--embedding-latency", type=float, default=0.05)
+    parser.add_argument("--search-latency", type=float, default=0.005)
+    parser.add_argument("--port", type=int, default=8790, help="First port; each run takes the next one")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,126 @@
+"""
+Local stand-in for the OpenAI embeddings API (POST /v1/embeddings).
+
+Responses take `latency + tokens * token_latency` seconds, vectors are
+deterministic per input, and a token bucket refilled at `tokens_per_second`
+answers 429 with a Retry-After header once it is exhausted, like the real
+rate limiter. Point OpenAIEmbeddings at it with base_url=server.url.
+"""
+
+import base64
+import hashlib
+import json
+import threading
+import time
+from array import array
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.available = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, amount: float) -> float:
+        """Take `amount` tokens; returns 0 on success or the seconds to wait before retrying."""
+        with self.lock:
+            now = time.monotonic()
+            self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+            self.updated = now
+            if amount <= self.available:
+                self.available -= amount
+                return 0.0
+            return (amount - self.available) / self.rate
+
+
+def count_tokens(item) -> int:
+    if isinstance(item, str):
+        return len(item) // 4 + 1
+    return len(item)
+
+
+def fake_vector(item, dimensions: int) -> list[float]:
+    seed = hashlib.sha256(json.dumps(item).encode("utf-8")).digest()
+    return [((seed[i % 32] + i * 31) % 255) / 255.0 - 0.5 for i in range(dimensions)]
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, payload: dict, headers: dict = None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        if not self.path.endswith("/embeddings"):
+            self._send(404, {"error": {"message": "Not found"}})
+            return
+        server = self.server
+        inputs = body["input"]
+        if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        tokens = sum(count_tokens(item) for item in inputs)
+        server.requests += 1
+
+        wait = server.bucket.acquire(tokens) if server.bucket else 0.0
+        if wait:
+            server.rate_limited += 1
+            self._send(429, {"error": {
+                "message": "Rate limit reached for requests", "type": "tokens", "code": "rate_limit_exceeded",
+            }}, {"Retry-After": f"{wait:.3f}"})
+            return
+
+        time.sleep(server.latency + tokens * server.token_latency)
+        data = []
+        for index, item in enumerate(inputs):
+            vector = fake_vector(item, server.dimensions)
+            if body.get("encoding_format") == "base64":
+                vector = base64.b64encode(array("f", vector).tobytes()).decode("ascii")
+            data.append({"object": "embedding", "index": index, "embedding": vector})
+        self._send(200, {
+            "object": "list",
+            "data": data,
+            "model": body.get("model", "text-embedding-3-small"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        })
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port: int = 0, latency: float = 0.2, token_latency: float = 2e-6,
+                 tokens_per_second: float = 0, dimensions: int = 1536):
+        super().__init__(("127.0.0.1", port), FakeOpenAIHandler)
+        self.latency = latency
+        self.token_latency = token_latency
+        self.dimensions = dimensions
+        self.bucket = TokenBucket(tokens_per_second, tokens_per_second) if tokens_per_second else None
+        self.requests = 0
+        self.rate_limited = 0
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,248 @@
+"""
+Deterministic, offline stand-ins for the OpenAI chat model, the OpenAI
+embeddings client, the Chroma vector store and the LangChain hub prompt.
+
+They let the benchmarks drive AgentRAGServer end to end without network
+access or API keys, with configurable simulated latency.
+"""
+
+import asyncio
+import hashlib
+import math
+import re
+import time
+from unittest.mock import patch
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.vectorstores import InMemoryVectorStore
+
+# Same template as rlm/rag-prompt on the LangChain hub
+RAG_PROMPT_TEMPLATE = (
+    "You are an assistant for question-answering tasks. Use the following pieces of "
+    "retrieved context to answer the question. If you don't know the answer, just say "
+    "that you don't know. Use three sentences maximum and keep the answer concise.\n"
+    "Question: {question} \nContext: {context} \nAnswer:"
+)
+
+FAKE_ANSWER = (
+    "De acordo com o procedimento operacional padrão, a solicitação deve ser aberta "
+    "no portal interno e aprovada pelo gestor imediato antes do prazo informado."
+)
+
+FAKE_SUMMARY = (
+    "O usuário perguntou sobre vários procedimentos operacionais padrão (férias, banco de horas, "
+    "reembolso); as respostas indicaram abertura de solicitação no portal interno e aprovação do gestor."
+)
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+class FakeEncoding:
+    """tiktoken-compatible encoder (about four characters per token) that needs no BPE download."""
+
+    name = "fake"
+
+    def encode(self, text: str, **kwargs) -> list[int]:
+        return list(range((len(text) + 3) // 4))
+
+
+def fake_prompt() -> ChatPromptTemplate:
+    """Local copy of the rlm/rag-prompt template."""
+    return ChatPromptTemplate.from_messages([("human", RAG_PROMPT_TEMPLATE)])
+
+
+class FakeEmbeddings(Embeddings):
+    """
+    Hashed bag-of-words embeddings. Texts sharing words get similar vectors, so
+    retrieval over a synthetic corpus behaves plausibly.
+
+    Args:
+        dimensions (int): Size of the produced vectors.
+        latency (float): Simulated seconds per embedding request.
+    """
+
+    def __init__(self, dimensions: int = 256, latency: float = 0.0):
+        self.dimensions = dimensions
+        self.latency = latency
+        self.model = f"fake-embedding-{dimensions}"
+        self.calls = 0
+
+    def _vector(self, text: str) -> list[float]:
+        vector = [0.0] * self.dimensions
+        for word in _WORD.findall(text.lower()):
+            digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.dimensions
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(v * v for v in vector))
+        if not norm:
+            # A text without words still needs a direction, or cosine similarity against it is NaN
+            vector[0] = norm = 1.0
+        return [v / norm for v in vector]
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return [self._vector(text) for text in texts]
+
+    async def aembed_query(self, text: str) -> list[float]:
+        return (await self.aembed_documents([text]))[0]
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Chat model that answers with a canned text after a simulated delay.
+
+    `latency` is the time to first token and `token_latency` the delay between
+    streamed tokens; `prompt_token_latency` adds a delay per prompt token, like
+    prompt processing on a real model. With `blocking=True` the async path
+    sleeps synchronously, reproducing a client that stalls the event loop.
+    """
+
+    answer: str = FAKE_ANSWER
+    latency: float = 0.3
+    token_latency: float = 0.0
+    prompt_token_latency: float = 0.0
+    blocking: bool = False
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _tokens(self) -> list[str]:
+        return re.findall(r"\S+\s*", self.answer)
+
+    def _delay(self, messages) -> float:
+        return self.latency + self.prompt_token_latency * self._prompt_tokens(messages)
+
+    def _prompt_tokens(self, messages) -> int:
+        return sum(len(str(m.content)) for m in messages) // 4
+
+    def _result(self, messages) -> ChatResult:
+        prompt_chars = sum(len(str(m.content)) for m in messages)
+        output_tokens = len(self._tokens())
+        message = AIMessage(
+            content=self.answer,
+            usage_metadata={
+                "input_tokens": prompt_chars // 4,
+                "output_tokens": output_tokens,
+                "total_tokens": prompt_chars // 4 + output_tokens,
+            },
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        time.sleep(self._delay(messages) + self.token_latency * len(self._tokens()))
+        return self._result(messages)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        delay = self._delay(messages) + self.token_latency * len(self._tokens())
+        if self.blocking:
+            time.sleep(delay)
+        else:
+            await asyncio.sleep(delay)
+        return self._result(messages)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self._delay(messages))
+        for token in self._tokens():
+            if self.token_latency:
+                await asyncio.sleep(self.token_latency)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+
+class FakeVectorStore(InMemoryVectorStore):
+    """In-memory vector store whose searches take `latency` seconds of blocking time, like Chroma."""
+
+    def __init__(self, embedding: Embeddings, latency: float = 0.0):
+        super().__init__(embedding=embedding)
+        self.latency = latency
+
+    def similarity_search_by_vector(self, embedding, k: int = 4, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        return super().similarity_search_by_vector(embedding, k=k, **kwargs)
+
+
+SUBJECTS = [
+    "banco de horas", "férias", "reembolso de despesas", "phishing", "senha do e-mail",
+    "compra de materiais", "cadastro de fornecedor", "viagem a trabalho", "ponto eletrônico",
+    "equipamento de proteção", "acesso à VPN", "solicitação de crachá",
+]
+
+
+def make_corpus(size: int = 200) -> list[Document]:
+    """Synthetic POP-style chunks, each tagged with a procedure code."""
+    documents = []
+    for i in range(size):
+        subject = SUBJECTS[i % len(SUBJECTS)]
+        code = f"POP-{i:04d}"
+        text = (
+            f"{code} Procedimento operacional padrão sobre {subject}. "
+            f"O colaborador deve registrar a solicitação de {subject} no portal, "
+            f"anexar os comprovantes e aguardar a aprovação do gestor em até {i % 7 + 1} dias úteis."
+        )
+        source = f"Docs_md/{code}.md"
+        documents.append(Document(id=f"{code}-0", page_content=text, metadata={"source": source}))
+    return documents
+
+
+def make_questions(count: int) -> list[str]:
+    return [f"Como funciona {SUBJECTS[i % len(SUBJECTS)]}? ({i})" for i in range(count)]
+
+
+def build_backends(
+    llm_latency: float = 0.3,
+    embedding_latency: float = 0.05,
+    search_latency: float = 0.005,
+    token_latency: float = 0.0,
+    prompt_token_latency: float = 0.0,
+    blocking: bool = False,
+    corpus_size: int = 200,
+):
+    """Return (llm, embeddings, vector_store, prompt) stand-ins."""
+    embeddings = FakeEmbeddings(latency=embedding_latency)
+    vector_store = FakeVectorStore(FakeEmbeddings(), latency=search_latency)
+    vector_store.add_documents(make_corpus(corpus_size))
+    llm = FakeChatModel(
+        latency=llm_latency, token_latency=token_latency, prompt_token_latency=prompt_token_latency, blocking=blocking
+    )
+    return llm, embeddings, vector_store, fake_prompt()
+
+
+def load_server(**backend_options):
+    """
+    Import AgentRAGServer and set its clients to the fakes above; the
+    module builds its own clients only on first use, so nothing touches the
+    network.
+    """
+    import os
+    import importlib
+
+    os.environ.setdefault("OPENAI_API_KEY", "sk-offline-benchmark")
+    patch("tiktoken.get_encoding", return_value=FakeEncoding()).start()
+    llm, embeddings, vector_store, prompt = build_backends(**backend_options)
+    server = importlib.import_module("AgentRAGServer")
+    server.llm = llm
+    server.summary_llm = llm.model_copy(update={"answer": FAKE_SUMMARY})
+    server.embeddings = embeddings
+    server.vector_store = vector_store
+    server.prompt = prompt
+    return server
@@ -0,0 +1,167 @@
+"""
+Synthetic int8 ONNX encoder and tokenizer for offline benchmarks and tests.
+
+No real embedding model can be downloaded here, and the `onnx` package is
+not installed, so `write_model` encodes the ModelProto by hand (protobuf wire
+format). The graph has the shape of a dynamically quantized transformer
+encoder without attention: a token embedding (Gather), then per layer an
+up- and a down-projection, each DynamicQuantizeLinear -> MatMulInteger with
+int8 weights -> rescale, with Tanh and a residual connection. With the
+defaults (384 wide, 1536 hidden, 6 layers) a token costs about as many
+multiply-adds as in all-MiniLM-L6-v2, so latency and throughput are in the
+right range; the vectors themselves mean nothing.
+
+`write_tokenizer` saves a word-level `tokenizer.json` for the same vocabulary.
+
+Usage:
+    python -m benchmarks.onnx_stub /tmp/stub-encoder
+"""
+
+import argparse
+import os
+import struct
+
+import numpy as np
+
+FLOAT, UINT8, INT8, INT64 = 1, 2, 3, 7
+PAD, UNK = "[PAD]", "[UNK]"
+
+
+def _varint(value: int) -> bytes:
+    value &= (1 << 64) - 1
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _int(field: int, value: int) -> bytes:
+    return _varint(field << 3) + _varint(value)
+
+
+def _bytes(field: int, value) -> bytes:
+    if isinstance(value, str):
+        value = value.encode("utf-8")
+    return _varint(field << 3 | 2) + _varint(len(value)) + value
+
+
+def _float(field: int, value: float) -> bytes:
+    return _varint(field << 3 | 5) + struct.pack("<f", value)
+
+
+def tensor(name: str, array: np.ndarray) -> bytes:
+    data_type = {np.float32: FLOAT, np.uint8: UINT8, np.int8: INT8, np.int64: INT64}[array.dtype.type]
+    body = b"".join(_int(1, dim) for dim in array.shape)
+    return body + _int(2, data_type) + _bytes(8, name) + _bytes(9, np.ascontiguousarray(array).tobytes())
+
+
+def node(op_type: str, inputs, outputs, name: str, **attributes) -> bytes:
+    body = b"".join(_bytes(1, value) for value in inputs)
+    body += b"".join(_bytes(2, value) for value in outputs)
+    body += _bytes(3, name) + _bytes(4, op_type)
+    for key, value in attributes.items():
+        if isinstance(value, float):
+            attribute = _bytes(1, key) + _float(2, value) + _int(20, 1)
+        else:
+            attribute = _bytes(1, key) + _int(3, value) + _int(20, 2)
+        body += _bytes(5, attribute)
+    return body
+
+
+def value_info(name: str, elem_type: int, dims) -> bytes:
+    shape = b"".join(
+        _bytes(1, _bytes(2, dim) if isinstance(dim, str) else _int(1, dim)) for dim in dims
+    )
+    tensor_type = _int(1, elem_type) + _bytes(2, shape)
+    return _bytes(1, name) + _bytes(2, _bytes(1, tensor_type))
+
+
+def _quantized_matmul(x: str, out: str, weight: np.ndarray, prefix: str, nodes: list, initializers: list):
+    """Nodes onnxruntime's quantize_dynamic emits for a float MatMul with int8 weights"""
+    scale = float(np.abs(weight).max() / 127) or 1.0
+    initializers.append(tensor(f"{prefix}.weight", np.round(weight / scale).astype(np.int8)))
+    initializers.append(tensor(f"{prefix}.weight_scale", np.array(scale, dtype=np.float32)))
+    nodes.append(node("DynamicQuantizeLinear", [x], [f"{prefix}.x_q", f"{prefix}.x_scale", f"{prefix}.x_zero"],
+                      f"{prefix}.quantize"))
+    nodes.append(node("MatMulInteger", [f"{prefix}.x_q", f"{prefix}.weight", f"{prefix}.x_zero"],
+                      [f"{prefix}.int32"], f"{prefix}.matmul"))
+    nodes.append(node("Cast", [f"{prefix}.int32"], [f"{prefix}.float"], f"{prefix}.cast", to=FLOAT))
+    nodes.append(node("Mul", [f"{prefix}.x_scale", f"{prefix}.weight_scale"], [f"{prefix}.scale"], f"{prefix}.scale"))
+    nodes.append(node("Mul", [f"{prefix}.float", f"{prefix}.scale"], [out], f"{prefix}.rescale"))
+
+
+def write_model(path: str, vocab_size: int, dimensions: int = 384, hidden: int = 1536, layers: int = 6,
+                seed: int = 0):
+    """Write the int8 encoder: inputs input_ids/attention_mask [batch, seq], output last_hidden_state"""
+    rng = np.random.default_rng(seed)
+    nodes, initializers = [], []
+    initializers.append(tensor("embeddings", rng.standard_normal((vocab_size, dimensions)).astype(np.float32)))
+    nodes.append(node("Gather", ["embeddings", "input_ids"], ["hidden.0"], "embed"))
+    for layer in range(layers):
+        x = f"hidden.{layer}"
+        up = rng.standard_normal((dimensions, hidden)).astype(np.float32) / np.sqrt(dimensions)
+        down = rng.standard_normal((hidden, dimensions)).astype(np.float32) / np.sqrt(hidden)
+        _quantized_matmul(x, f"layer{layer}.up", up, f"layer{layer}.up", nodes, initializers)
+        nodes.append(node("Tanh", [f"layer{layer}.up"], [f"layer{layer}.act"], f"layer{layer}.tanh"))
+        _quantized_matmul(f"layer{layer}.act", f"layer{layer}.down", down, f"layer{layer}.down", nodes, initializers)
+        out = "last_hidden_state" if layer == layers - 1 else f"hidden.{layer + 1}"
+        nodes.append(node("Add", [x, f"layer{layer}.down"], [out], f"layer{layer}.residual"))
+
+    graph = b"".join(_bytes(1, item) for item in nodes)
+    graph += _bytes(2, "stub_encoder")
+    graph += b"".join(_bytes(5, item) for item in initializers)
+    graph += _bytes(11, value_info("input_ids", INT64, ["batch", "sequence"]))
+    graph += _bytes(11, value_info("attention_mask", INT64, ["batch", "sequence"]))
+    graph += _bytes(12, value_info("last_hidden_state", FLOAT, ["batch", "sequence", dimensions]))
+    model = _int(1, 7) + _bytes(2, "benchmarks.onnx_stub") + _bytes(7, graph) + _bytes(8, _bytes(1, "") + _int(2, 13))
+    with open(path, "wb") as f:
+        f.write(model)
+
+
+def write_tokenizer(path: str, words) -> int:
+    """Word-level tokenizer.json over `words` plus [PAD] and [UNK]; returns the vocabulary size"""
+    from tokenizers import Tokenizer, models, normalizers, pre_tokenizers
+
+    vocab = {PAD: 0, UNK: 1}
+    for word in words:
+        vocab.setdefault(word.lower(), len(vocab))
+    tokenizer = Tokenizer(models.WordLevel(vocab, unk_token=UNK))
+    tokenizer.normalizer = normalizers.Lowercase()
+    tokenizer.pre_tokenizer = pre_tokenizers.Whitespace()
+    tokenizer.enable_padding(pad_id=0, pad_token=PAD)
+    tokenizer.save(path)
+    return len(vocab)
+
+
+def default_words(size: int = 30000) -> list:
+    """Portuguese procedure vocabulary and filler words, `size` in all"""
+    from benchmarks.fakes import SUBJECTS
+
+    base = ["o", "a", "de", "do", "da", "para", "com", "no", "portal", "gestor", "procedimento", "solicitação",
+            "prazo", "aprovação", "registro", "exige", "qual", "como", "item", "e", "é", "pop"]
+    base += [word for subject in SUBJECTS for word in subject.split()]
+    return base + [f"termo{i}" for i in range(max(0, size - len(base)))]
+
+
+def write_stub(directory: str, **options) -> str:
+    """model_quantized.onnx and tokenizer.json in `directory`; returns the model path"""
+    os.makedirs(directory, exist_ok=True)
+    vocab_size = write_tokenizer(os.path.join(directory, "tokenizer.json"), default_words())
+    model_path = os.path.join(directory, "model_quantized.onnx")
+    write_model(model_path, vocab_size, **options)
+    return model_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory")
+    parser.add_argument("--dimensions", type=int, default=384)
+    parser.add_argument("--hidden", type=int, default=1536)
+    parser.add_argument("--layers", type=int, default=6)
+    args = parser.parse_args()
+    print(write_stub(args.directory, dimensions=args.dimensions, hidden=args.hidden, layers=args.layers))
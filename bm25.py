@@ -0,0 +1,188 @@
+"""
+BM25 inverted index over the indexed chunks, for hybrid lexical + vector retrieval.
+
+The POPs are full of exact codes, names and form titles that embeddings blur
+together; BM25 matches them literally. The index is built by LoaderCloud.py
+alongside the Chroma collection (same chunk IDs) and persisted next to it as
+JSON. The server searches it and merges the result with the vector hits by
+reciprocal rank fusion (see `reciprocal_rank_fusion`).
+
+Tokens are lower-cased and accent-folded, so "Férias" matches "ferias", and
+codes such as "POP-012" or "7.3.1" are kept whole as well as split into parts.
+"""
+
+import json
+import math
+import os
+import re
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+STOPWORDS = frozenset(
+    "a o as os um uma uns umas de da do das dos em na no nas nos por para pelo pela pelos pelas com sem "
+    "e ou que se ao aos à às é ser são foi como mais mas não nao sua seu suas seus ele ela eles elas isso "
+    "este esta esse essa qual quais quando onde ja já the of and to in for".split()
+)
+BM25_FILENAME = "bm25_index.json"
+_TOKEN = re.compile(r"\w+(?:[-./]\w+)*")
+
+
+def fold(text: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for match in _TOKEN.finditer(fold(text)):
+        token = match.group()
+        parts = re.split(r"[-./]", token)
+        if len(parts) > 1:
+            tokens.append(token)
+        tokens.extend(part for part in parts if part and part not in STOPWORDS)
+    return tokens
+
+
+class BM25Index:
+    """
+    Okapi BM25 over chunk IDs. Documents can be added and removed in place, so
+    incremental indexing keeps it in step with the vector store.
+
+    Args:
+        k1 (float): Term-frequency saturation.
+        b (float): Document-length normalisation.
+    """
+
+    FORMAT_VERSION = 1
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        # chunk id -> (length in tokens, term frequencies)
+        self.documents: Dict[str, Tuple[int, Dict[str, int]]] = {}
+        self.postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self.total_length = 0
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def add(self, ids: Sequence[str], texts: Sequence[str]):
+        for doc_id, text in zip(ids, texts):
+            self.remove([doc_id])
+            tokens = tokenize(text)
+            frequencies = dict(Counter(tokens))
+            self.documents[doc_id] = (len(tokens), frequencies)
+            self.total_length += len(tokens)
+            for term, frequency in frequencies.items():
+                self.postings[term][doc_id] = frequency
+
+    def remove(self, ids: Iterable[str]):
+        for doc_id in ids:
+            entry = self.documents.pop(doc_id, None)
+            if entry is None:
+                continue
+            length, frequencies = entry
+            self.total_length -= length
+            for term in frequencies:
+                posting = self.postings[term]
+                posting.pop(doc_id, None)
+                if not posting:
+                    del self.postings[term]
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[str, float]]:
+        """Top `k` (chunk id, score) pairs for `query`, best first"""
+        count = len(self.documents)
+        if not count:
+            return []
+        average_length = self.total_length / count
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (count - len(posting) + 0.5) / (len(posting) + 0.5))
+            for doc_id, frequency in posting.items():
+                length = self.documents[doc_id][0]
+                norm = self.k1 * (1 - self.b + self.b * length / average_length)
+                scores[doc_id] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:k]
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        temp_path = path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "version": self.FORMAT_VERSION,
+                "k1": self.k1,
+                "b": self.b,
+                "documents": {doc_id: [length, frequencies] for doc_id, (length, frequencies) in self.documents.items()},
+            }, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        """Load the index at `path`, or return an empty one when the file does not exist"""
+        if not os.path.exists(path):
+            return cls()
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        index = cls(k1=data["k1"], b=data["b"])
+        for doc_id, (length, frequencies) in data["documents"].items():
+            index.documents[doc_id] = (length, frequencies)
+            index.total_length += length
+            for term, frequency in frequencies.items():
+                index.postings[term][doc_id] = frequency
+        return index
+
+
+class PersistedBM25:
+    """
+    Read-side handle that reloads the index when LoaderCloud.py rewrites the
+    file, so a running server picks up re-indexing without a restart.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._index: Optional[BM25Index] = None
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def get(self) -> Optional[BM25Index]:
+        """The current index, or None when none has been built"""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            if mtime != self._mtime:
+                self._index = BM25Index.load(self.path)
+                self._mtime = mtime
+            return self._index
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = 60) -> List[str]:
+    """Merge ranked ID lists: each ID scores sum(1 / (k + rank)), best first"""
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] += 1.0 / (k + rank)
+    return sorted(scores, key=lambda doc_id: -scores[doc_id])
+
+
+def fuse(vector_docs: Sequence, lexical_ids: Sequence[str], fetch: Callable[[List[str]], List], k: int,
+         rrf_k: int = 60) -> List:
+    """
+    The top `k` documents by reciprocal rank fusion of the vector hits and the
+    BM25 chunk IDs. `fetch(ids)` loads the BM25-only hits from the vector store.
+    """
+    if not all(doc.id for doc in vector_docs):
+        # Chunks without IDs cannot be matched with the BM25 hits
+        return list(vector_docs[:k])
+    by_id = {doc.id: doc for doc in vector_docs}
+    ranked = reciprocal_rank_fusion([list(by_id), lexical_ids], rrf_k)[:k]
+    missing = [doc_id for doc_id in ranked if doc_id not in by_id]
+    if missing:
+        by_id.update((doc.id, doc) for doc in fetch(missing))
+    return [by_id[doc_id] for doc_id in ranked if doc_id in by_id]
@@ -0,0 +1,252 @@
+"""
+Cleaning rules applied to the converted markdown files.
+
+Rules are loaded and compiled once per process, either from the built-in
+DEFAULT_RULES or from a JSON file with the same shape. Each rule is either a
+regex substitution (`pattern`, optional `replacement` and `flags`) or a named
+`handler` for rules whose regex form backtracks badly; the handlers produce
+exactly what the original regexes did, in linear time. Rules run in order, as
+the original chain of `re.sub` calls did, and a RuleProfiler can record the
+time and number of substitutions of each rule.
+"""
+
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+
+URL_PATTERN = (
+    r"https?:\/\/(?:www\.)?[-a-zA-Z0-9@:%._\+~#=]{2,256}\.[a-z]{2,4}\b(?:[-a-zA-Z0-9@:%_\+.~#?&//=]*)"
+)
+
+DEFAULT_RULES = [
+    # Repetitive footer/header data
+    {"name": "header_suprimentos", "pattern": r"PROCEDIMENTO OPERACIONAL PADRÃO SETOR SUPRIMENTOS(?:\n[^\n]*){10}"},
+    {"name": "header_pop", "pattern": r"PROCEDIMENTO OPERACIONAL PADRÃO(?:\n[^\n]*){14}"},
+    # The company name with the 7 lines after it, or on its own when fewer lines follow
+    {"name": "company_name", "pattern": r"DGT TECNOLOGIA LTDA(?:(?:\n[^\n]*){7})?"},
+    {"name": "company_address", "pattern": r"R. Evaristo José Fernandes, 121,(?:\n[^\n]*){9}"},
+    {"name": "notes", "pattern": r"### Notes:\n[^\n]*"},
+    # .*(\n.*){12}.*PADRÃO\n\n(Elaborador).*(\n.*){6}
+    {"name": "signature_block", "handler": "signature_block"},
+    # Sumário: .*\.{4}.*\n.*|^\d\.\d$|^SUMÁRIO$|^\d{2}$\n.*  (multiline)
+    {"name": "table_of_contents", "handler": "table_of_contents"},
+    {"name": "urls", "pattern": URL_PATTERN},
+    {"name": "blank_lines", "pattern": r"\n\n+", "replacement": "\n\n"},
+    {"name": "strip_lines", "handler": "strip_lines"},
+]
+
+SIGNATURE_ANCHOR = "PADRÃO\n\nElaborador"
+TOC_LINE = re.compile(r"^(?:\d\.\d$|SUMÁRIO$|\d{2}$\n.*)", re.MULTILINE)
+
+
+def _newline_before(text: str, index: int, count: int) -> int:
+    """Index of the `count`-th newline before `index`, or -1 when there are fewer"""
+    for _ in range(count):
+        index = text.rfind("\n", 0, index)
+        if index == -1:
+            return -1
+    return index
+
+
+def _line_end(text: str, index: int) -> int:
+    end = text.find("\n", index)
+    return len(text) if end == -1 else end
+
+
+def signature_block(text: str) -> Tuple[str, int]:
+    """
+    Same result as re.subn(r'.*(\\n.*){12}.*PADRÃO\\n\\n(Elaborador).*(\\n.*){6}', '', text).
+
+    A match covers the 12 lines before a line ending in "PADRÃO" that is
+    followed by a blank line and a line starting with "Elaborador", and the 6
+    lines after that one. Instead of trying the pattern at every position, this
+    looks for the anchor and counts lines around it.
+    """
+    parts, pos, count = [], 0, 0
+    anchor = text.find(SIGNATURE_ANCHOR)
+    while anchor != -1:
+        first_newline = _newline_before(text, anchor, 12)
+        if first_newline != -1 and pos <= first_newline:
+            # 6 more lines must follow the "Elaborador" line
+            end = text.find("\n", anchor + len(SIGNATURE_ANCHOR))
+            for _ in range(5):
+                if end == -1:
+                    break
+                end = text.find("\n", end + 1)
+            if end == -1:
+                # Later anchors have even fewer lines after them
+                break
+            start = max(pos, text.rfind("\n", 0, first_newline) + 1)
+            end = _line_end(text, end + 1)
+            parts.append(text[pos:start])
+            pos = end
+            count += 1
+        anchor = text.find(SIGNATURE_ANCHOR, anchor + 1)
+    parts.append(text[pos:])
+    return "".join(parts), count
+
+
+def table_of_contents(text: str) -> Tuple[str, int]:
+    """
+    Same result as re.subn(r'.*\\.{4}.*\\n.*|^\\d\\.\\d$|^SUMÁRIO$|^\\d{2}$\\n.*', '', text, flags=re.MULTILINE).
+
+    The first alternative can start anywhere in a line, so the regex retries
+    `.*\\.{4}` from every position; here a line is only looked at when it
+    contains "....", and the anchored alternatives are searched separately.
+    """
+    parts, pos, count = [], 0, 0
+    dots = anchored = None
+    while True:
+        # Leftmost position where ".*\.{4}.*\n.*" matches: the line of the next "....", from pos at the earliest
+        if dots is None or (dots is not False and dots[0] < pos):
+            index = text.find("....", pos)
+            newline = text.find("\n", index) if index != -1 else -1
+            dots = (max(pos, text.rfind("\n", 0, index) + 1), newline) if newline != -1 else False
+        if anchored is None or (anchored is not False and anchored.start() < pos):
+            anchored = TOC_LINE.search(text, pos) or False
+        if dots is False and anchored is False:
+            break
+        # The dots alternative comes first in the pattern, so it wins a tie
+        if dots is not False and (anchored is False or dots[0] <= anchored.start()):
+            start, end = dots[0], _line_end(text, dots[1] + 1)
+        else:
+            start, end = anchored.span()
+        parts.append(text[pos:start])
+        pos = end
+        count += 1
+    parts.append(text[pos:])
+    return "".join(parts), count
+
+
+def strip_lines(text: str) -> Tuple[str, int]:
+    """Remove leading/trailing whitespace from each line"""
+    return "\n".join(line.strip() for line in text.split("\n")), 0
+
+
+HANDLERS: Dict[str, Callable[[str], Tuple[str, int]]] = {
+    "signature_block": signature_block,
+    "table_of_contents": table_of_contents,
+    "strip_lines": strip_lines,
+}
+
+
+@dataclass
+class Rule:
+    name: str
+    apply: Callable[[str], Tuple[str, int]]
+
+
+def compile_rule(spec: dict) -> Rule:
+    if "handler" in spec:
+        if spec["handler"] not in HANDLERS:
+            raise ValueError(f"Unknown cleaning handler {spec['handler']!r} in rule {spec.get('name')!r}")
+        return Rule(spec.get("name", spec["handler"]), HANDLERS[spec["handler"]])
+    flags = 0
+    for flag in spec.get("flags", []):
+        flags |= getattr(re, flag)
+    pattern = re.compile(spec["pattern"], flags)
+    replacement = spec.get("replacement", "")
+    return Rule(spec.get("name", spec["pattern"]), lambda text: pattern.subn(replacement, text))
+
+
+@lru_cache(maxsize=None)
+def load_rules(path: Optional[str] = None) -> Tuple[Rule, ...]:
+    """Compiled rules from a JSON file (a list shaped like DEFAULT_RULES), or the built-in ones"""
+    specs = DEFAULT_RULES
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            specs = json.load(f)
+    return tuple(compile_rule(spec) for spec in specs)
+
+
+@dataclass
+class RuleStats:
+    seconds: float = 0.0
+    substitutions: int = 0
+    calls: int = 0
+
+
+@dataclass
+class RuleProfiler:
+    """Time spent and substitutions made per rule"""
+    rules: Dict[str, RuleStats] = field(default_factory=dict)
+
+    def record(self, name: str, seconds: float, substitutions: int):
+        stats = self.rules.setdefault(name, RuleStats())
+        stats.seconds += seconds
+        stats.substitutions += substitutions
+        stats.calls += 1
+
+    def merge(self, other: "RuleProfiler"):
+        for name, stats in other.rules.items():
+            merged = self.rules.setdefault(name, RuleStats())
+            merged.seconds += stats.seconds
+            merged.substitutions += stats.substitutions
+            merged.calls += stats.calls
+
+    def report(self) -> str:
+        total = sum(stats.seconds for stats in self.rules.values()) or 1.0
+        lines = [f"{'rule':<22}{'seconds':>10}{'share':>8}{'subs':>8}"]
+        for name, stats in sorted(self.rules.items(), key=lambda item: -item[1].seconds):
+            lines.append(f"{name:<22}{stats.seconds:>10.4f}{stats.seconds / total:>7.1%}{stats.substitutions:>8}")
+        return "\n".join(lines)
+
+
+def clean_text(content: str, rules: Optional[Tuple[Rule, ...]] = None, profiler: Optional[RuleProfiler] = None) -> str:
+    for rule in rules or load_rules():
+        if profiler is None:
+            content, _ = rule.apply(content)
+            continue
+        started = time.perf_counter()
+        content, substitutions = rule.apply(content)
+        profiler.record(rule.name, time.perf_counter() - started, substitutions)
+    return content
+
+
+def clean_file(file_path: str, rules_path: Optional[str] = None, profile: bool = False) -> Optional[RuleProfiler]:
+    """Clean one markdown file in place"""
+    profiler = RuleProfiler() if profile else None
+    with open(file_path, "r", encoding="utf-8") as f:
+        content = f.read()
+    content = clean_text(content, load_rules(rules_path), profiler)
+    with open(file_path, "w", encoding="utf-8") as f:
+        f.write(content)
+    return profiler
+
+
+def markdown_files(*directories) -> List[str]:
+    return [
+        os.path.join(root, file_name)
+        for directory in directories
+        for root, _, files in os.walk(directory)
+        for file_name in files
+        if file_name.endswith(".md")
+    ]
+
+
+def clean_files(paths: List[str], workers: int = 0, rules_path: Optional[str] = None,
+                profile: bool = False) -> Optional[RuleProfiler]:
+    """
+    Clean `paths` in place, on `workers` processes (0 cleans them in this
+    process). Returns the merged per-rule profile when `profile` is set.
+    """
+    load_rules(rules_path)  # Fail on a bad rules file before starting workers
+    profiler = RuleProfiler() if profile else None
+    if workers > 0 and len(paths) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            chunksize = max(1, len(paths) // (workers * 4))
+            results = pool.map(clean_file, paths, [rules_path] * len(paths), [profile] * len(paths), chunksize=chunksize)
+            for result in results:
+                if profiler is not None:
+                    profiler.merge(result)
+    else:
+        for path in paths:
+            result = clean_file(path, rules_path, profile)
+            if profiler is not None:
+                profiler.merge(result)
+    return profiler
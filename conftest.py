@@ -0,0 +1,67 @@
+"""
+Test doubles shared by several test modules.
+"""
+
+import time
+
+import numpy as np
+
+
+class FakeClock:
+    """Injectable time source; tests move `now` by hand"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeResult:
+    def __init__(self, text_content):
+        self.text_content = text_content
+
+
+class FakeConverter:
+    """Converter stub: records every file it reads, hangs on *hang*, crashes on *boom*, rejects *.bin,
+    and returns `render` of the file's text (upper-cased unless a subclass says otherwise)"""
+    reads = []
+
+    def convert(self, source):
+        from markitdown import UnsupportedFormatException
+        type(self).reads.append(source)
+        if "hang" in source:
+            time.sleep(60)
+        if "boom" in source:
+            raise ValueError("corrupt file")
+        if source.endswith(".bin"):
+            raise UnsupportedFormatException("unsupported")
+        with open(source, encoding="utf-8") as f:
+            return FakeResult(self.render(f.read()))
+
+    def render(self, text):
+        return text.upper()
+
+
+class FakeCollection:
+    """The slice of the chromadb Collection API the vector index exporter and compute_centroids read"""
+
+    name = "dgt_rag"
+
+    def __init__(self, vectors, texts=None, folder="Docs_md", prefix="chunk", metadatas=None):
+        self.vectors = [list(map(float, vector)) for vector in vectors]
+        self.ids = [f"{prefix}-{i}" for i in range(len(vectors))]
+        self.texts = texts or [f"Texto {i} sobre férias" for i in range(len(vectors))]
+        self.metadatas = metadatas or [{"source": f"{folder}/POP-{i}.md", "start_index": i * 10} for i in range(len(vectors))]
+
+    def count(self):
+        return len(self.ids)
+
+    def get(self, include, limit, offset):
+        rows = range(offset, min(offset + limit, len(self.ids)))
+        return {
+            "ids": [self.ids[i] for i in rows],
+            "embeddings": np.array([self.vectors[i] for i in rows]),
+            "documents": [self.texts[i] for i in rows],
+            "metadatas": [self.metadatas[i] for i in rows],
+        }
@@ -0,0 +1,164 @@
+"""
+Packing of the retrieved chunks into the prompt context.
+
+LoaderCloud.py splits with a 200-character overlap, so neighbouring chunks of
+the same file that are retrieved together repeat text, and joining them as
+they are pays for it twice. The packer merges chunks of the same source that
+overlap or sit next to each other into one block, drops chunks whose text is
+already in a block, and takes chunks in relevance order while their added
+tokens fit the budget, instead of a fixed number of chunks.
+
+Overlap is found from the text itself (the end of one chunk equals the start
+of the other), so it works on chunks indexed before `start_index` was
+recorded. Adjacent chunks without shared text are only detected from
+`start_index`. A block keeps the ID and metadata of its most relevant chunk,
+with the block's own `start_index` and the IDs of all its chunks in
+`chunk_ids`.
+"""
+
+from dataclasses import dataclass, field
+from typing import List, Optional, Sequence
+
+from langchain_core.documents import Document
+
+from token_accounting import count_tokens
+
+# Characters between two chunks that still count as adjacent (the separator the splitter dropped)
+ADJACENT_GAP = 2
+
+
+def join_overlap(first: str, second: str, min_overlap: int) -> Optional[str]:
+    """`first` followed by `second` when the end of `first` is the start of `second`, else None"""
+    if len(second) < min_overlap:
+        return None
+    probe = second[:min_overlap]
+    position = first.find(probe, max(0, len(first) - len(second)))
+    while position != -1:
+        # The earliest match is the longest overlap
+        if second.startswith(first[position:]):
+            return first + second[len(first) - position:]
+        position = first.find(probe, position + 1)
+    return None
+
+
+def merge_texts(first: str, second: str, min_overlap: int = 20) -> Optional[str]:
+    """One text holding both, when one contains the other or they overlap, else None"""
+    if second in first:
+        return first
+    if first in second:
+        return second
+    return join_overlap(first, second, min_overlap) or join_overlap(second, first, min_overlap)
+
+
+@dataclass
+class Block:
+    """Merged text of one or more chunks of the same source"""
+    source: Optional[str]
+    text: str
+    ids: List[str] = field(default_factory=list)
+    start: Optional[int] = None
+    tokens: int = 0
+    # Metadata of the block's first, most relevant, chunk
+    metadata: dict = field(default_factory=dict)
+
+    @property
+    def end(self) -> Optional[int]:
+        return None if self.start is None else self.start + len(self.text)
+
+    def merged_with(self, chunk: Document, min_overlap: int) -> Optional[tuple]:
+        """(text, start) of this block with `chunk` added, or None when they do not touch"""
+        start = chunk.metadata.get("start_index")
+        text = merge_texts(self.text, chunk.page_content, min_overlap)
+        if text is not None:
+            # The merged text starts where the chunk does when the chunk came first
+            return text, start if text != self.text and text.startswith(chunk.page_content) else self.start
+        if start is None or self.start is None:
+            return None
+        if 0 <= start - self.end <= ADJACENT_GAP:
+            return self.text + "\n" + chunk.page_content, self.start
+        if 0 <= self.start - (start + len(chunk.page_content)) <= ADJACENT_GAP:
+            return chunk.page_content + "\n" + self.text, start
+        return None
+
+    def document(self) -> Document:
+        metadata = {key: value for key, value in self.metadata.items() if key != "start_index"}
+        if self.start is not None:
+            metadata["start_index"] = self.start
+        metadata["chunk_ids"] = list(self.ids)
+        return Document(id=self.ids[0] if self.ids else None, page_content=self.text, metadata=metadata)
+
+
+@dataclass
+class PackedContext:
+    documents: List[Document]
+    # Chunks that made it into the context, merged or not
+    chunks: int = 0
+    tokens: int = 0
+    # Tokens the same chunks would have cost joined as they are, minus `tokens`
+    tokens_saved: int = 0
+
+
+class ContextPacker:
+    """
+    Merges and budgets the retrieved chunks.
+
+    Args:
+        token_budget (int): Tokens of context; the first chunk is kept even if it alone is larger.
+        min_overlap (int): Shortest shared text, in characters, that counts as an overlap.
+        encoding_name (str): tiktoken encoding used to measure the context.
+    """
+
+    def __init__(self, token_budget: int = 800, min_overlap: int = 20, encoding_name: str = "cl100k_base"):
+        self.token_budget = token_budget
+        self.min_overlap = min_overlap
+        self.encoding_name = encoding_name
+
+    def pack(self, documents: Sequence[Document]) -> PackedContext:
+        """Blocks in the order their best chunk was retrieved"""
+        blocks: List[Block] = []
+        used = unpacked = chunks = 0
+        for chunk in documents:
+            size = count_tokens(chunk.page_content, self.encoding_name)
+            source = chunk.metadata.get("source")
+            block, merged = None, None
+            for candidate in blocks:
+                if candidate.source == source and source is not None:
+                    merged = candidate.merged_with(chunk, self.min_overlap)
+                    if merged is not None:
+                        block = candidate
+                        break
+
+            if block is None:
+                if blocks and used + size > self.token_budget:
+                    continue
+                blocks.append(Block(source, chunk.page_content, [chunk.id] if chunk.id else [],
+                                    chunk.metadata.get("start_index"), size, dict(chunk.metadata)))
+                used += size
+            else:
+                tokens = count_tokens(merged[0], self.encoding_name)
+                if used + tokens - block.tokens > self.token_budget:
+                    continue
+                block.text, block.start, block.tokens = merged[0], merged[1], tokens
+                if chunk.id:
+                    block.ids.append(chunk.id)
+                self._absorb(blocks, block)
+                used = sum(item.tokens for item in blocks)
+            chunks += 1
+            unpacked += size
+
+        return PackedContext([block.document() for block in blocks], chunks, used, max(0, unpacked - used))
+
+    def _absorb(self, blocks: List[Block], block: Block):
+        """Fold other blocks of the same source into `block` once a new chunk bridges them"""
+        for other in list(blocks):
+            if other is block or other.source != block.source:
+                continue
+            chunk = Document(page_content=other.text,
+                             metadata={"start_index": other.start} if other.start is not None else {})
+            merged = block.merged_with(chunk, self.min_overlap)
+            if merged is None:
+                continue
+            block.text, block.start = merged
+            block.tokens = count_tokens(block.text, self.encoding_name)
+            block.ids.extend(other.ids)
+            blocks.remove(other)
@@ -0,0 +1,260 @@
+"""
+Document-to-markdown conversion with MarkItDown, serially or on a pool of
+worker processes.
+
+Each worker process creates its MarkItDown converter once and then converts
+files sent to it over a pipe, so converter start-up (format detection models,
+plugin discovery) is paid once per worker instead of once per file. A file that
+takes longer than `timeout` seconds gets its worker killed and replaced; the
+file is reported as timed out and the run goes on. All outcomes are collected
+in a ConversionReport instead of being printed as they happen.
+"""
+
+import multiprocessing
+import re
+import time
+import traceback
+from collections import deque
+from dataclasses import dataclass, field
+from multiprocessing.connection import wait
+from typing import Callable, Iterable, List, Optional
+
+CONVERTED = "converted"
+SKIPPED = "skipped"
+FAILED = "failed"
+TIMED_OUT = "timed out"
+
+
+@dataclass
+class ConversionResult:
+    source: str
+    status: str
+    output: Optional[str] = None
+    detail: str = ""
+    seconds: float = 0.0
+    # Converted text, for callers that consume it directly instead of reading the output file
+    text: Optional[str] = None
+
+
+@dataclass
+class ConversionReport:
+    """Outcome of converting a batch of files"""
+    results: List[ConversionResult] = field(default_factory=list)
+    workers: int = 0
+    elapsed: float = 0.0
+
+    def by_status(self, status: str) -> List[ConversionResult]:
+        return [result for result in self.results if result.status == status]
+
+    @property
+    def files_per_second(self) -> float:
+        return len(self.results) / self.elapsed if self.elapsed else 0.0
+
+    def summary(self) -> str:
+        mode = f"{self.workers} worker processes" if self.workers else "in-process"
+        lines = [
+            f"Converted {len(self.by_status(CONVERTED))} of {len(self.results)} files in {self.elapsed:.1f}s "
+            f"({self.files_per_second:.1f} files/s, {mode}); skipped: {len(self.by_status(SKIPPED))}, "
+            f"failed: {len(self.by_status(FAILED))}, timed out: {len(self.by_status(TIMED_OUT))}"
+        ]
+        for status in (SKIPPED, FAILED, TIMED_OUT):
+            lines.extend(f"  {status}: {result.source}: {result.detail}" for result in self.by_status(status))
+        return "\n".join(lines)
+
+
+def markdown_path(filename: str) -> str:
+    return re.sub(r"\.\w{2,4}$", ".md", filename)
+
+
+def default_converter():
+    from markitdown import MarkItDown
+    return MarkItDown()
+
+
+def convert_file(converter, source: str) -> ConversionResult:
+    """Convert `source` and write the markdown next to it"""
+    from markitdown import FileConversionException, UnsupportedFormatException
+
+    started = time.perf_counter()
+    try:
+        result = converter.convert(source)
+        output = markdown_path(source)
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(result.text_content)
+        return ConversionResult(source, CONVERTED, output, seconds=time.perf_counter() - started)
+    except (UnsupportedFormatException, FileConversionException) as e:
+        return ConversionResult(source, SKIPPED, detail=str(e).splitlines()[0] if str(e) else type(e).__name__,
+                                seconds=time.perf_counter() - started)
+    except Exception as e:
+        return ConversionResult(source, FAILED, detail=f"{type(e).__name__}: {e}", seconds=time.perf_counter() - started)
+
+
+def _worker_main(connection, converter_factory: Callable, convert: Callable):
+    converter = converter_factory()
+    while True:
+        source = connection.recv()
+        if source is None:
+            return
+        try:
+            result = convert(converter, source)
+        except Exception:
+            result = ConversionResult(source, FAILED, detail=traceback.format_exc(limit=1).strip())
+        connection.send(result)
+
+
+class _Worker:
+    def __init__(self, context, converter_factory, convert):
+        self.connection, child = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child, converter_factory, convert), daemon=True)
+        self.process.start()
+        child.close()
+        self.source = None
+        self.deadline = None
+
+    def submit(self, source: str, timeout: Optional[float]):
+        self.source = source
+        self.started = time.perf_counter()
+        self.deadline = time.monotonic() + timeout if timeout else None
+        self.connection.send(source)
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.connection.close()
+
+    def stop(self):
+        try:
+            self.connection.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.kill()
+        self.connection.close()
+
+
+class ConversionPool:
+    """
+    Persistent worker processes that convert one file at a time each.
+
+    Args:
+        workers (int): Number of worker processes.
+        timeout (float): Seconds a single file may take before its worker is killed; None waits forever.
+        converter_factory: Builds the converter inside each worker (MarkItDown by default).
+        convert: Callable(converter, source) -> ConversionResult run in the workers.
+    """
+
+    def __init__(self, workers: int, timeout: Optional[float] = None,
+                 converter_factory: Callable = default_converter, convert: Callable = convert_file):
+        self.workers = workers
+        self.timeout = timeout
+        self.converter_factory = converter_factory
+        self.convert = convert
+        self.context = multiprocessing.get_context()
+        self.replaced = 0
+
+    def _spawn(self) -> _Worker:
+        return _Worker(self.context, self.converter_factory, self.convert)
+
+    def imap(self, sources: Iterable[str]):
+        """Yield a ConversionResult per source, in completion order"""
+        pending = deque(sources)
+        idle = [self._spawn() for _ in range(min(self.workers, len(pending)) or 1)]
+        busy = {}
+        try:
+            while pending or busy:
+                while pending and idle:
+                    worker = idle.pop()
+                    worker.submit(pending.popleft(), self.timeout)
+                    busy[worker.connection] = worker
+
+                deadlines = [worker.deadline for worker in busy.values() if worker.deadline]
+                wait_for = max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+                for connection in wait(list(busy), timeout=wait_for):
+                    worker = busy.pop(connection)
+                    try:
+                        result = connection.recv()
+                        idle.append(worker)
+                    except EOFError:
+                        # The worker died mid-file (e.g. a converter crashed the interpreter)
+                        result = ConversionResult(worker.source, FAILED, detail="worker process exited",
+                                                  seconds=time.perf_counter() - worker.started)
+                        worker.kill()
+                        idle.append(self._spawn())
+                        self.replaced += 1
+                    yield result
+
+                now = time.monotonic()
+                for connection, worker in list(busy.items()):
+                    if worker.deadline and now >= worker.deadline:
+                        del busy[connection]
+                        worker.kill()
+                        self.replaced += 1
+                        idle.append(self._spawn())
+                        yield ConversionResult(worker.source, TIMED_OUT, detail=f"exceeded {self.timeout:g}s",
+                                               seconds=time.perf_counter() - worker.started)
+        finally:
+            for worker in busy.values():
+                worker.kill()
+            for worker in idle:
+                worker.stop()
+
+
+def iter_conversions(sources: List[str], workers: int = 0, timeout: Optional[float] = None,
+                     converter_factory: Callable = default_converter, convert: Callable = convert_file):
+    """
+    Yield a ConversionResult per source as soon as it is ready: from a
+    ConversionPool of `workers` processes, or converted one by one in this
+    process (without timeouts) when `workers` is 0.
+    """
+    if workers > 0:
+        yield from ConversionPool(workers, timeout, converter_factory, convert).imap(sources)
+        return
+    converter = converter_factory()
+    for source in sources:
+        yield convert(converter, source)
+
+
+def _record(result: ConversionResult, report: ConversionReport, total: int, progress: bool):
+    report.results.append(result)
+    if progress:
+        print(f"\r  {len(report.results)}/{total} files", end="", flush=True)
+
+
+def _finish(report: ConversionReport, started: float, total: int, progress: bool):
+    if progress and total:
+        print()
+    report.elapsed += time.perf_counter() - started
+
+
+def collect(results: Iterable[ConversionResult], report: ConversionReport, total: int, progress: bool = True):
+    """Pass results through while recording them in `report` and printing a progress line"""
+    started = time.perf_counter()
+    for result in results:
+        _record(result, report, total, progress)
+        yield result
+    _finish(report, started, total, progress)
+
+
+def collect_all(results: Iterable[ConversionResult], report: ConversionReport, total: int,
+                progress: bool = True) -> ConversionReport:
+    """Record every result in `report`, for callers that do not use the results as they come"""
+    started = time.perf_counter()
+    for result in results:
+        _record(result, report, total, progress)
+    _finish(report, started, total, progress)
+    return report
+
+
+def convert_files(sources: List[str], workers: int = 0, timeout: Optional[float] = None,
+                  converter_factory: Callable = default_converter, convert: Callable = convert_file,
+                  progress: bool = True) -> ConversionReport:
+    """
+    Convert `sources` to markdown files written next to them.
+
+    With `workers` > 0 the files are converted on a ConversionPool of that
+    size; 0 converts them one by one in this process, without timeouts.
+    """
+    results = iter_conversions(sources, workers, timeout, converter_factory, convert)
+    return collect_all(results, ConversionReport(workers=workers), len(sources), progress)
+
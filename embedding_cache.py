@@ -0,0 +1,177 @@
+"""
+Query-embedding cache for the retrieve node.
+
+Wraps any LangChain Embeddings client. Query vectors are kept in an
+in-process LRU and, optionally, in a SQLite file that survives restarts.
+Keys include the embedding model name, so switching models never returns a
+vector from the old embedding space. Document embedding calls pass through
+untouched.
+"""
+
+import asyncio
+import hashlib
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
+from typing import List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+
+def embedding_model_name(embeddings: Embeddings) -> str:
+    return getattr(embeddings, "model", None) or getattr(embeddings, "model_name", None) or type(embeddings).__name__
+
+
+class SQLiteVectorStore:
+    """Tiny key -> float32 vector table used as the persistent cache tier."""
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS query_embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+        )
+        self._connection.commit()
+
+    def get(self, key: str) -> Optional[List[float]]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT vector FROM query_embeddings WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        vector = array("f")
+        vector.frombytes(row[0])
+        return vector.tolist()
+
+    def put(self, key: str, vector: List[float]) -> None:
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO query_embeddings (key, vector) VALUES (?, ?)",
+                (key, array("f", vector).tobytes()),
+            )
+            self._connection.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that caches `embed_query`/`aembed_query` results.
+
+    Args:
+        embeddings (Embeddings): The client that computes embeddings on a miss.
+        max_entries (int): Size of the in-process LRU.
+        disk_path (str): Optional SQLite file for the persistent tier.
+        model_name (str): Overrides the model name used in cache keys.
+    """
+
+    def __init__(self, embeddings: Embeddings, max_entries: int = 10000,
+                 disk_path: Optional[str] = None, model_name: Optional[str] = None):
+        self.embeddings = embeddings
+        self.model = model_name or embedding_model_name(embeddings)
+        self.max_entries = max_entries
+        self.disk = SQLiteVectorStore(disk_path) if disk_path else None
+        self._memory: "OrderedDict[str, List[float]]" = OrderedDict()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def cache_key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model}\x00{text}".encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, vector: List[float]) -> None:
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _from_memory(self, key: str) -> Optional[List[float]]:
+        vector = self._memory.get(key)
+        if vector is not None:
+            self._memory.move_to_end(key)
+            self.memory_hits += 1
+        return vector
+
+    def _from_disk(self, key: str) -> Optional[List[float]]:
+        vector = self.disk.get(key) if self.disk else None
+        if vector is not None:
+            self.disk_hits += 1
+            self._remember(key, vector)
+        return vector
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.embeddings.aembed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        key = self.cache_key(text)
+        vector = self._from_memory(key) or self._from_disk(key)
+        if vector is None:
+            self.misses += 1
+            vector = self.embeddings.embed_query(text)
+            self._remember(key, vector)
+            if self.disk:
+                self.disk.put(key, vector)
+        return vector
+
+    async def aembed_query(self, text: str) -> List[float]:
+        key = self.cache_key(text)
+        vector = self._from_memory(key)
+        if vector is None and self.disk:
+            vector = await asyncio.to_thread(self._from_disk, key)
+        if vector is None:
+            self.misses += 1
+            vector = await self.embeddings.aembed_query(text)
+            self._remember(key, vector)
+            if self.disk:
+                await asyncio.to_thread(self.disk.put, key, vector)
+        return vector
+
+    async def aembed_queries(self, texts: List[str]) -> List[List[float]]:
+        """
+        Query vectors for many texts, with every cache miss embedded in one
+        request. Misses go through the client's own `aembed_queries` when it
+        has one (query prefixes, as in OnnxEmbeddings), otherwise through
+        `aembed_documents`, which returns the same vectors as `aembed_query`
+        for OpenAI embeddings.
+        """
+        keys = [self.cache_key(text) for text in texts]
+        vectors: List[Optional[List[float]]] = [self._from_memory(key) for key in keys]
+        if self.disk:
+            for i, key in enumerate(keys):
+                if vectors[i] is None:
+                    vectors[i] = await asyncio.to_thread(self._from_disk, key)
+        missing: "OrderedDict[str, str]" = OrderedDict()
+        for key, text, vector in zip(keys, texts, vectors):
+            if vector is None:
+                missing.setdefault(key, text)
+        if missing:
+            self.misses += len(missing)
+            embed_many = getattr(self.embeddings, "aembed_queries", self.embeddings.aembed_documents)
+            embedded = dict(zip(missing, await embed_many(list(missing.values()))))
+            for key, vector in embedded.items():
+                self._remember(key, vector)
+                if self.disk:
+                    await asyncio.to_thread(self.disk.put, key, vector)
+            vectors = [vector if vector is not None else embedded[key] for key, vector in zip(keys, vectors)]
+        return vectors
+
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "model": self.model,
+            "entries": len(self._memory),
+            "max_entries": self.max_entries,
+            "persistent": self.disk is not None,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+        }
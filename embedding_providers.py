@@ -0,0 +1,275 @@
+"""
+Embedding providers shared by indexing (LoaderCloud.py) and the server.
+
+EMBEDDING_PROVIDER picks the client:
+- `openai`: OpenAIEmbeddings(EMBEDDING_MODEL); every query costs a network
+  round trip before the search can start;
+- `onnx`: a sentence-embedding model exported to ONNX (e.g. the
+  `model_quantized.onnx` int8 export of nomic-embed-text or a MiniLM model,
+  with its `tokenizer.json`), run on the CPU by ONNX Runtime in-process.
+
+Queries and chunks must be embedded by the same model, so switching
+provider means re-indexing; the query-embedding cache keys include the model
+name, so it never mixes vectors from the two.
+
+The ONNX backend runs inference in a thread pool of ONNX_WORKERS threads
+(ONNX Runtime releases the GIL) and batches concurrent query embeddings:
+queries that arrive while every worker is busy go through the model
+together in the next run, which costs little more than a single query.
+
+`python embedding_providers.py quantize model.onnx model_quantized.onnx`
+writes an int8 copy of a float model (needs the `onnx` package).
+"""
+
+import argparse
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Sequence
+
+from langchain_core.embeddings import Embeddings
+
+import settings
+
+
+class QueryBatcher:
+    """
+    Groups concurrent calls into `encode(texts)` runs in `executor`.
+
+    A text starts a run at once while fewer than `max_runs` are in flight;
+    otherwise it waits, and everything that queued up meanwhile goes into
+    the next run as soon as one finishes. An idle server pays no batching
+    delay and a busy one gets larger batches.
+
+    Args:
+        encode: Callable(texts) -> one vector per text; blocking, runs in the executor.
+        executor: Thread pool for `encode`.
+        max_runs (int): Runs in flight at once.
+        max_batch (int): Texts per run.
+    """
+
+    def __init__(self, encode: Callable[[List[str]], List[List[float]]], executor: ThreadPoolExecutor,
+                 max_runs: int = 2, max_batch: int = 32):
+        self.encode = encode
+        self.executor = executor
+        self.max_runs = max_runs
+        self.max_batch = max_batch
+        self.loop = asyncio.get_running_loop()
+        self._pending = []
+        self._running = 0
+        self.queries = 0
+        self.batches = 0
+
+    async def submit(self, text: str) -> List[float]:
+        future = self.loop.create_future()
+        self._pending.append((text, future))
+        if self._running < self.max_runs:
+            self._start()
+        return await future
+
+    def _start(self):
+        batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+        self._running += 1
+        self.queries += len(batch)
+        self.batches += 1
+        running = self.loop.run_in_executor(self.executor, self.encode, [text for text, _ in batch])
+        running.add_done_callback(lambda done: self._finish(batch, done))
+
+    def _finish(self, batch, done: asyncio.Future):
+        self._running -= 1
+        error = done.exception()
+        for index, (_, future) in enumerate(batch):
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(done.result()[index])
+        if self._pending:
+            self._start()
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+    Sentence embeddings from an ONNX model on the CPU.
+
+    Args:
+        model_path (str): ONNX file; outputs token states (mean-pooled here) or pooled sentence vectors.
+        tokenizer_path (str): Hugging Face `tokenizer.json`; defaults to the one next to the model.
+        max_length (int): Tokens per text; longer texts are truncated.
+        query_prefix (str): Prepended to queries (nomic-embed-text expects "search_query: ").
+        document_prefix (str): Prepended to documents ("search_document: " for nomic-embed-text).
+        batch_size (int): Documents per inference run.
+        intra_op_threads (int): ONNX Runtime threads per run; 0 lets it use every core.
+        workers (int): Inference runs in flight at once.
+        max_query_batch (int): Queries per shared run; 1 turns query batching off.
+        session: Preloaded onnxruntime InferenceSession (tests); built from `model_path` otherwise.
+        tokenizer: Preloaded tokenizers.Tokenizer (tests).
+    """
+
+    def __init__(self, model_path: str, tokenizer_path: Optional[str] = None, max_length: int = 512,
+                 query_prefix: str = "", document_prefix: str = "", batch_size: int = 32,
+                 intra_op_threads: int = 0, workers: int = 2, max_query_batch: int = 32,
+                 session=None, tokenizer=None):
+        self.model_path = model_path
+        self.tokenizer_path = tokenizer_path or os.path.join(os.path.dirname(model_path), "tokenizer.json")
+        self.model = os.path.abspath(model_path)
+        self.max_length = max_length
+        self.query_prefix = query_prefix
+        self.document_prefix = document_prefix
+        self.batch_size = batch_size
+        self.intra_op_threads = intra_op_threads
+        self.workers = workers
+        self.max_query_batch = max_query_batch
+        self._session = session
+        self._tokenizer = tokenizer
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="onnx-embed")
+        self._batcher: Optional[QueryBatcher] = None
+        self.runs = 0
+        self.texts = 0
+        self.seconds = 0.0
+
+    def _load(self):
+        with self._lock:
+            if self._session is None:
+                try:
+                    import onnxruntime
+                except ImportError as e:
+                    raise ImportError("EMBEDDING_PROVIDER=onnx needs onnxruntime: pip install onnxruntime") from e
+                options = onnxruntime.SessionOptions()
+                options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+                if self.intra_op_threads:
+                    options.intra_op_num_threads = self.intra_op_threads
+                self._session = onnxruntime.InferenceSession(
+                    self.model_path, options, providers=["CPUExecutionProvider"]
+                )
+            if self._tokenizer is None:
+                try:
+                    from tokenizers import Tokenizer
+                except ImportError as e:
+                    raise ImportError("EMBEDDING_PROVIDER=onnx needs tokenizers: pip install tokenizers") from e
+                self._tokenizer = Tokenizer.from_file(self.tokenizer_path)
+            self._tokenizer.enable_truncation(self.max_length)
+            if self._tokenizer.padding is None:
+                self._tokenizer.enable_padding()
+        return self._session, self._tokenizer
+
+    def encode(self, texts: Sequence[str]) -> List[List[float]]:
+        """One inference run: L2-normalized vectors, mean-pooled over the real tokens"""
+        import numpy as np
+
+        session, tokenizer = self._session, self._tokenizer
+        if session is None or tokenizer is None:
+            session, tokenizer = self._load()
+        started = time.perf_counter()
+        encodings = tokenizer.encode_batch(list(texts))
+        input_ids = np.array([encoding.ids for encoding in encodings], dtype=np.int64)
+        attention_mask = np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64)
+        feeds = {}
+        for model_input in session.get_inputs():
+            if model_input.name == "input_ids":
+                feeds["input_ids"] = input_ids
+            elif model_input.name == "attention_mask":
+                feeds["attention_mask"] = attention_mask
+            elif model_input.name == "token_type_ids":
+                feeds["token_type_ids"] = np.zeros_like(input_ids)
+        output = session.run(None, feeds)[0]
+        if output.ndim == 3:
+            mask = attention_mask[:, :, None].astype(output.dtype)
+            output = (output * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        output = output / np.maximum(np.linalg.norm(output, axis=1, keepdims=True), 1e-12)
+        with self._lock:
+            self.runs += 1
+            self.texts += len(texts)
+            self.seconds += time.perf_counter() - started
+        return output.astype("float32").tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        texts = [self.document_prefix + text for text in texts]
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            vectors.extend(self.encode(texts[start:start + self.batch_size]))
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.encode([self.query_prefix + text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self.embed_documents, texts)
+
+    async def aembed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Query vectors for many texts in `batch_size` runs (the batch endpoint's path)"""
+        texts = [self.query_prefix + text for text in texts]
+
+        def encode_all():
+            vectors = []
+            for start in range(0, len(texts), self.batch_size):
+                vectors.extend(self.encode(texts[start:start + self.batch_size]))
+            return vectors
+
+        return await asyncio.get_running_loop().run_in_executor(self._executor, encode_all)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        batcher = self._batcher
+        if batcher is None or batcher.loop is not asyncio.get_running_loop():
+            batcher = self._batcher = QueryBatcher(self.encode, self._executor, self.workers, self.max_query_batch)
+        return await batcher.submit(self.query_prefix + text)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = {
+                "runs": self.runs,
+                "texts": self.texts,
+                "average_run_ms": round(self.seconds * 1000 / self.runs, 3) if self.runs else 0.0,
+            }
+        if self._batcher is not None and self._batcher.batches:
+            stats["query_batches"] = self._batcher.batches
+            stats["average_query_batch"] = round(self._batcher.queries / self._batcher.batches, 2)
+        return stats
+
+
+def make_embeddings(provider: Optional[str] = None, max_retries: Optional[int] = None) -> Embeddings:
+    """Embeddings client for EMBEDDING_PROVIDER ("openai" or "onnx"); `max_retries` only applies to OpenAI"""
+    provider = (provider or settings.EMBEDDING_PROVIDER).strip().lower()
+    if provider == "openai":
+        from langchain_openai import OpenAIEmbeddings
+        options = {} if max_retries is None else {"max_retries": max_retries}
+        return OpenAIEmbeddings(model=settings.EMBEDDING_MODEL, **options)
+    if provider == "onnx":
+        if not settings.ONNX_MODEL_PATH:
+            raise ValueError("EMBEDDING_PROVIDER=onnx needs ONNX_MODEL_PATH")
+        return OnnxEmbeddings(
+            settings.ONNX_MODEL_PATH,
+            tokenizer_path=settings.ONNX_TOKENIZER_PATH or None,
+            max_length=settings.ONNX_MAX_LENGTH,
+            query_prefix=settings.EMBEDDING_QUERY_PREFIX,
+            document_prefix=settings.EMBEDDING_DOCUMENT_PREFIX,
+            batch_size=settings.ONNX_BATCH_SIZE,
+            intra_op_threads=settings.ONNX_INTRA_OP_THREADS,
+            workers=settings.ONNX_WORKERS,
+            max_query_batch=settings.ONNX_QUERY_MAX_BATCH,
+        )
+    raise ValueError(f"Unknown EMBEDDING_PROVIDER {provider!r}: use openai or onnx")
+
+
+def quantize(model_path: str, output_path: str):
+    """Write an int8 (dynamic quantization) copy of a float ONNX model"""
+    try:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+    except ImportError as e:
+        raise ImportError("Quantizing needs the onnx package: pip install onnx") from e
+    quantize_dynamic(model_path, output_path, weight_type=QuantType.QInt8)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Embedding provider tools.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    quantize_command = commands.add_parser("quantize", help="Write an int8 copy of an ONNX embedding model")
+    quantize_command.add_argument("model")
+    quantize_command.add_argument("output")
+    args = parser.parse_args()
+    quantize(args.model, args.output)
+    print(f"Wrote {args.output} ({os.path.getsize(args.model) / 1e6:.1f} MB -> {os.path.getsize(args.output) / 1e6:.1f} MB)")
@@ -0,0 +1,194 @@
+"""
+Rate-limit-aware embedding scheduler used at indexing time.
+
+Chunks are packed into batches under a token budget (and an input-count cap),
+a bounded number of embedding requests run concurrently, rate-limit (429) and
+transient server errors are retried with exponential backoff and jitter
+(honouring Retry-After), and each embedded batch is written to the vector
+store in a single bulk upsert. A 429 pauses every worker, not just the one
+that hit it, so concurrent requests do not keep hammering an exhausted quota.
+"""
+
+import asyncio
+import random
+import time
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Sequence
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from token_accounting import count_tokens
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+def estimate_tokens(text: str) -> int:
+    """cl100k_base token count (the text-embedding-3 tokenizer)"""
+    return count_tokens(text, "cl100k_base")
+
+
+def is_retryable(error: Exception) -> bool:
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    if status is not None:
+        return status in RETRYABLE_STATUS_CODES
+    return type(error).__name__ in ("RateLimitError", "APIConnectionError", "APITimeoutError")
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    value = headers.get("retry-after")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+@dataclass
+class Batch:
+    ids: List[str]
+    documents: List[Document]
+    tokens: int
+
+
+def pack_batches(documents: Sequence[Document], ids: Sequence[str], max_batch_tokens: int,
+                 max_batch_size: int, count_tokens: Callable[[str], int] = estimate_tokens) -> List[Batch]:
+    """Greedily pack chunks, in order, into batches under both limits. An oversized chunk gets its own batch."""
+    batches = []
+    current = Batch([], [], 0)
+    for doc_id, document in zip(ids, documents):
+        tokens = count_tokens(document.page_content)
+        if current.documents and (current.tokens + tokens > max_batch_tokens or len(current.documents) >= max_batch_size):
+            batches.append(current)
+            current = Batch([], [], 0)
+        current.ids.append(doc_id)
+        current.documents.append(document)
+        current.tokens += tokens
+    if current.documents:
+        batches.append(current)
+    return batches
+
+
+@dataclass
+class EmbeddingRunStats:
+    chunks: int = 0
+    tokens: int = 0
+    batches: int = 0
+    retries: int = 0
+    rate_limited: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def chunks_per_second(self) -> float:
+        return self.chunks / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def tokens_per_second(self) -> float:
+        return self.tokens / self.elapsed if self.elapsed else 0.0
+
+    def merge(self, other: "EmbeddingRunStats"):
+        """Add the counters of another run (e.g. the next batch of a streamed index)"""
+        self.chunks += other.chunks
+        self.tokens += other.tokens
+        self.batches += other.batches
+        self.retries += other.retries
+        self.rate_limited += other.rate_limited
+        self.elapsed += other.elapsed
+
+    def summary(self) -> str:
+        return (
+            f"Embedded {self.chunks} chunks ({self.tokens} tokens) in {self.batches} batches "
+            f"in {self.elapsed:.1f}s: {self.chunks_per_second:.1f} chunks/s, "
+            f"{self.tokens_per_second:.0f} tokens/s, {self.retries} retries ({self.rate_limited} rate limited)"
+        )
+
+
+def chroma_writer(vector_store):
+    """Bulk writer that upserts precomputed embeddings into a langchain Chroma store"""
+    def write(ids: List[str], documents: List[Document], vectors: List[List[float]]):
+        vector_store._collection.upsert(
+            ids=ids,
+            embeddings=vectors,
+            documents=[doc.page_content for doc in documents],
+            metadatas=[doc.metadata or None for doc in documents],
+        )
+    return write
+
+
+class EmbeddingScheduler:
+    """
+    Embeds documents with bounded concurrency and hands each batch to `writer`.
+
+    Args:
+        embeddings (Embeddings): Client whose aembed_documents is called once per batch.
+        writer: Callable(ids, documents, vectors) run in a worker thread, one call per batch.
+        max_batch_tokens (int): Token budget of a single embedding request.
+        max_batch_size (int): Maximum number of inputs in a single embedding request.
+        max_concurrency (int): Embedding requests in flight at once.
+        max_retries (int): Attempts per batch after the first one fails with a retryable error.
+        base_delay (float): First backoff delay in seconds; doubles on every retry. Retry-After wins when longer.
+        max_delay (float): Upper bound of a single backoff delay.
+    """
+
+    def __init__(self, embeddings: Embeddings, writer: Callable, max_batch_tokens: int = 100_000,
+                 max_batch_size: int = 512, max_concurrency: int = 4, max_retries: int = 6,
+                 base_delay: float = 1.0, max_delay: float = 60.0,
+                 count_tokens: Callable[[str], int] = estimate_tokens):
+        self.embeddings = embeddings
+        self.writer = writer
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.count_tokens = count_tokens
+        self._resume_at = 0.0
+
+    async def _wait_for_cooldown(self):
+        delay = self._resume_at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def _embed(self, batch: Batch, stats: EmbeddingRunStats) -> List[List[float]]:
+        texts = [doc.page_content for doc in batch.documents]
+        for attempt in range(self.max_retries + 1):
+            await self._wait_for_cooldown()
+            try:
+                return await self.embeddings.aembed_documents(texts)
+            except Exception as e:
+                if attempt == self.max_retries or not is_retryable(e):
+                    raise
+                stats.retries += 1
+                backoff = min(self.max_delay, self.base_delay * 2 ** attempt)
+                delay = max(retry_after_seconds(e) or 0.0, backoff) * random.uniform(1.0, 1.5)
+                if getattr(e, "status_code", None) == 429 or type(e).__name__ == "RateLimitError":
+                    stats.rate_limited += 1
+                    self._resume_at = max(self._resume_at, time.monotonic() + delay)
+                else:
+                    await asyncio.sleep(delay)
+
+    async def run(self, documents: Sequence[Document], ids: Sequence[str]) -> EmbeddingRunStats:
+        stats = EmbeddingRunStats()
+        batches = pack_batches(documents, ids, self.max_batch_tokens, self.max_batch_size, self.count_tokens)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        write_lock = asyncio.Lock()
+        started = time.perf_counter()
+
+        async def process(batch: Batch):
+            async with semaphore:
+                vectors = await self._embed(batch, stats)
+            async with write_lock:
+                await asyncio.to_thread(self.writer, batch.ids, batch.documents, vectors)
+            stats.chunks += len(batch.documents)
+            stats.tokens += batch.tokens
+            stats.batches += 1
+
+        await asyncio.gather(*(process(batch) for batch in batches))
+        stats.elapsed = time.perf_counter() - started
+        return stats
+
+    def run_sync(self, documents: Sequence[Document], ids: Sequence[str]) -> EmbeddingRunStats:
+        return asyncio.run(self.run(documents, ids))
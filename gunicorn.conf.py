@@ -0,0 +1,41 @@
+"""
+Multi-worker serving: gunicorn AgentRAGServer:app -c gunicorn.conf.py
+
+The master imports the app and loads the read-only state (prompt, tokenizer,
+BM25 index, memory-mapped vector index; see preload_shared_state) once, then
+forks SERVER_WORKERS uvicorn workers that share it copy-on-write. Each worker
+builds its own model, embedding and Chroma clients in the app's lifespan.
+Set SESSION_STORE=sqlite so a follow-up question finds its session whichever
+worker answers it.
+"""
+
+import gc
+
+import settings
+
+# Objects allocated while the master loads the app stay where they are, and gc.freeze() below moves
+# them out of the collector's reach, so no worker's collections write to (and copy) the shared pages
+gc.disable()
+
+bind = settings.SERVER_BIND
+workers = settings.SERVER_WORKERS
+worker_class = "uvicorn_worker.UvicornWorker"
+preload_app = True
+# Model calls can take a while; the default 30s would kill workers mid-answer
+timeout = 120
+graceful_timeout = 30
+
+
+def when_ready(server):
+    import AgentRAGServer
+
+    timings, failed = AgentRAGServer.preload_shared_state()
+    gc.freeze()
+    gc.enable()
+    server.log.info("Preloaded shared state: %s", timings)
+    if failed:
+        server.log.warning("Degraded start: preloading %s failed; each worker loads its own copy on first use",
+                           ", ".join(failed))
+    if server.num_workers > 1 and settings.SESSION_STORE == "memory":
+        server.log.warning("SESSION_STORE=memory with %d workers: follow-up questions that reach another worker "
+                           "lose their session; set SESSION_STORE=sqlite", server.num_workers)
@@ -0,0 +1,205 @@
+"""
+Token-budgeted conversation history.
+
+The last `keep_turns` question/answer pairs are kept verbatim. Once the
+history (summary included) grows past `token_budget`, every older turn is
+folded into a running summary with one LLM call, and the summary replaces those
+turns at the head of the history as a SystemMessage. Between overflows the
+summary is reused as is, so the summarizer runs once per overflow rather than
+on every turn, and the prompt stays roughly between
+`keep_turns` turns and `token_budget` tokens however long the session gets.
+"""
+
+import asyncio
+import json
+import logging
+from typing import List, Optional, Tuple
+
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+
+from token_accounting import count_tokens
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PROMPT = (
+    "You keep a running summary of a conversation between a user and an assistant "
+    "that answers questions about internal procedures. Update the summary with the new "
+    "turns below. Keep facts, names, numbers and open questions the user may refer back "
+    "to; drop pleasantries. Write in the language of the conversation, at most "
+    "{max_words} words.\n\n"
+    "Current summary:\n{summary}\n\n"
+    "New turns:\n{turns}\n\n"
+    "Updated summary:"
+)
+
+
+def message_type(message) -> str:
+    if isinstance(message, dict):
+        return message.get("type", "")
+    if isinstance(message, Turn):
+        return message.type
+    return message.__class__.__name__
+
+
+def message_content(message) -> str:
+    if isinstance(message, dict):
+        return message.get("content", "")
+    return message.content
+
+
+class Turn:
+    """
+    Compact record of one stored message, in place of a LangChain message
+    object or a dict. Its JSON is serialized once and reused by every response
+    and SQLite write that includes it. Compares equal to a message of the same
+    type and content.
+
+    Args:
+        type (str): Message class name: HumanMessage, AIMessage or SystemMessage.
+        content (str): Message text.
+    """
+
+    __slots__ = ("type", "content", "_json")
+
+    def __init__(self, type: str, content: str):
+        self.type = type
+        self.content = content
+        self._json = None
+
+    @classmethod
+    def of(cls, message) -> "Turn":
+        """`message` as a Turn; Turns are returned as they are"""
+        if isinstance(message, cls):
+            return message
+        return cls(message_type(message), message_content(message))
+
+    @classmethod
+    def from_json(cls, data: str) -> "Turn":
+        """The Turn serialized as `data` by json(), which it keeps rather than serializing again"""
+        message = json.loads(data)
+        turn = cls(message["type"], message["content"])
+        turn._json = data
+        return turn
+
+    def to_dict(self) -> dict:
+        return {"type": self.type, "content": self.content}
+
+    def json(self) -> str:
+        if self._json is None:
+            self._json = json.dumps(self.to_dict(), ensure_ascii=False)
+        return self._json
+
+    def __eq__(self, other):
+        if isinstance(other, (Turn, BaseMessage, dict)):
+            return self.type == message_type(other) and self.content == message_content(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return f"Turn({self.type!r}, {self.content!r})"
+
+
+def compact_history(history: List) -> List[Turn]:
+    """`history` as Turn records, converting only the messages that are not Turns yet"""
+    return [Turn.of(message) for message in history]
+
+
+def turns_json(history: List) -> str:
+    """JSON array of the messages in `history`, from each Turn's cached JSON"""
+    return "[" + ",".join(Turn.of(message).json() for message in history) + "]"
+
+
+def split_summary(history: List) -> Tuple[str, List]:
+    """Return the running summary (empty if none) and the verbatim messages after it"""
+    if history and message_type(history[0]) == "SystemMessage":
+        return message_content(history[0]), list(history[1:])
+    return "", list(history)
+
+
+def format_turns(messages: List) -> str:
+    parts = []
+    for msg in messages:
+        msg_type = message_type(msg)
+        if msg_type == "HumanMessage":
+            parts.append(f"Human: {message_content(msg)}")
+        elif msg_type == "AIMessage":
+            parts.append(f"Assistant: {message_content(msg)}")
+    return "\n".join(parts)
+
+
+def format_history(history: List) -> str:
+    """Conversation context prepended to the prompt: the summary, then the verbatim turns"""
+    summary, messages = split_summary(history)
+    context = ""
+    if summary:
+        context += "\n\nSummary of the earlier conversation:\n" + summary
+    turns = format_turns(messages)
+    if turns:
+        context += "\n\nPrevious conversation:\n" + turns
+    return context + "\n\n" if context else ""
+
+
+class HistoryManager:
+    """
+    Keeps the conversation history that goes into the prompt under a token budget.
+
+    Args:
+        token_budget (int): Tokens of history (summary plus verbatim turns) allowed before folding.
+        keep_turns (int): Most recent question/answer pairs that are never folded.
+        summary_words (int): Length the summarizer is asked to stay under.
+        encoding_name (str): tiktoken encoding used to measure the history.
+    """
+
+    def __init__(self, token_budget: int = 2000, keep_turns: int = 4, summary_words: int = 200,
+                 encoding_name: str = "cl100k_base"):
+        self.token_budget = token_budget
+        self.keep_turns = keep_turns
+        self.summary_words = summary_words
+        self.encoding_name = encoding_name
+        self.summaries = 0
+        self.failures = 0
+
+    def history_tokens(self, history: List) -> int:
+        return count_tokens(format_history(history), self.encoding_name)
+
+    async def condense(self, history: List[BaseMessage], llm) -> Optional[List[BaseMessage]]:
+        """
+        Fold the turns older than `keep_turns` into the summary when `history`
+        (which ends with the current question) is over budget.
+
+        Returns the new history, or None when it is within budget, there is
+        nothing old enough to fold, or the summarizer failed.
+        """
+        previous, current = history[:-1], history[-1:]
+        summary, messages = split_summary(previous)
+        fold = len(messages) - 2 * self.keep_turns
+        # Fold whole turns only, so the verbatim part still starts with a question
+        fold -= fold % 2
+        if fold <= 0:
+            return None
+        if await asyncio.to_thread(self.history_tokens, previous) <= self.token_budget:
+            return None
+
+        request = SUMMARY_PROMPT.format(
+            max_words=self.summary_words,
+            summary=summary or "(none)",
+            turns=format_turns(messages[:fold]),
+        )
+        try:
+            response = await llm.ainvoke([HumanMessage(content=request)])
+        except Exception as e:
+            # Keep answering with the full history; the next turn tries again
+            logger.warning("History summarization failed", extra={"error": str(e)})
+            self.failures += 1
+            return None
+        self.summaries += 1
+        return [SystemMessage(content=response.content.strip())] + messages[fold:] + current
+
+    def stats(self) -> dict:
+        return {
+            "token_budget": self.token_budget,
+            "keep_turns": self.keep_turns,
+            "summaries": self.summaries,
+            "failures": self.failures,
+        }
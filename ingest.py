@@ -0,0 +1,150 @@
+"""
+Streaming ingestion: convert → clean → (chunk and index) in one pass per document.
+
+Each source document is read once by the converter, cleaned in memory and
+written once, as markdown, to the mirrored path under the destination folder.
+The origin folder is left untouched and nothing is copied or re-read. When a
+vector store is given, the cleaned text is also handed straight to
+LoaderCloud.index_texts, which chunks and embeds it without reading the
+destination file back.
+
+Documents are converted on a ConversionPool (or in-process with 0 workers)
+and consumed as they finish, so at most one document per worker plus one
+embedding batch of chunks is held in memory at a time.
+"""
+
+import os
+from dataclasses import dataclass
+from functools import partial
+from pathlib import Path
+from typing import List, Optional
+
+from cleaning import clean_text, load_rules, markdown_files
+from conversion import (
+    CONVERTED,
+    FAILED,
+    SKIPPED,
+    ConversionReport,
+    ConversionResult,
+    collect,
+    collect_all,
+    default_converter,
+    iter_conversions,
+)
+
+
+def destination_path(source: str, origin_folder: str, dest_folder: str) -> str:
+    relative = Path(os.path.relpath(source, origin_folder))
+    return str(Path(dest_folder) / relative.with_suffix(".md"))
+
+
+def ingest_file(converter, source: str, origin_folder: str, dest_folder: str,
+                rules_path: Optional[str] = None, return_text: bool = False) -> ConversionResult:
+    """Convert, clean and write one document; runs inside the conversion workers"""
+    from markitdown import FileConversionException, UnsupportedFormatException
+
+    try:
+        result = converter.convert(source)
+    except (UnsupportedFormatException, FileConversionException) as e:
+        return ConversionResult(source, SKIPPED, detail=str(e).splitlines()[0] if str(e) else type(e).__name__)
+    except Exception as e:
+        return ConversionResult(source, FAILED, detail=f"{type(e).__name__}: {e}")
+
+    text = clean_text(result.text_content, load_rules(rules_path))
+    output = destination_path(source, origin_folder, dest_folder)
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        f.write(text)
+    return ConversionResult(source, CONVERTED, output, text=text if return_text else None)
+
+
+@dataclass
+class IngestReport:
+    conversion: ConversionReport
+    index: Optional[object] = None
+
+    def summary(self) -> str:
+        lines = [self.conversion.summary()]
+        if self.index is not None:
+            lines.append(self.index.summary())
+        return "\n".join(lines)
+
+
+def clean_file(path: str, rules) -> tuple[str, bool]:
+    """Clean one .md file in place, writing it back only if cleaning changed it; returns (text, changed)"""
+    with open(path, "r", encoding="utf-8") as f:
+        content = f.read()
+    text = clean_text(content, rules)
+    if text != content:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+    return text, text != content
+
+
+def iter_clean_in_place(folder: str, rules_path: Optional[str] = None):
+    """Clean every .md file under `folder` in place and yield (path, cleaned text) for indexing"""
+    rules = load_rules(rules_path)
+    for path in sorted(markdown_files(folder)):
+        yield str(Path(path)), clean_file(path, rules)[0]
+
+
+def clean_in_place(folder: str, rules_path: Optional[str] = None) -> int:
+    """Clean every .md file under `folder` in place; returns how many files cleaning changed"""
+    rules = load_rules(rules_path)
+    return sum(clean_file(path, rules)[1] for path in markdown_files(folder))
+
+
+def list_sources(origin_folder: str) -> List[str]:
+    return sorted(os.path.join(root, file) for root, _, files in os.walk(origin_folder) for file in files)
+
+
+def ingest_documents(origin_folder: str, dest_folder: str, workers: int = 0, timeout: Optional[float] = None,
+                     rules_path: Optional[str] = None, vector_store=None, scheduler=None,
+                     manifest_path: Optional[str] = None, converter_factory=default_converter,
+                     progress: bool = True) -> IngestReport:
+    """
+    Convert every file under `origin_folder` into cleaned markdown under
+    `dest_folder`, and index it when `vector_store` is given.
+
+    Args:
+        workers (int): Conversion worker processes; 0 converts in this process.
+        timeout (float): Seconds a single document may take in a worker.
+        rules_path (str): JSON cleaning rule set; None uses the built-in rules.
+        vector_store: Store to index the cleaned documents into (incrementally, see LoaderCloud.index_texts).
+        scheduler: EmbeddingScheduler used for indexing.
+        manifest_path (str): Index manifest; defaults to LoaderCloud.MANIFEST_PATH.
+    """
+    load_rules(rules_path)  # Fail on a bad rules file before converting anything
+    sources = list_sources(origin_folder)
+    convert = partial(ingest_file, origin_folder=origin_folder, dest_folder=dest_folder,
+                      rules_path=rules_path, return_text=vector_store is not None)
+    report = IngestReport(ConversionReport(workers=workers))
+    conversions = iter_conversions(sources, workers, timeout, converter_factory, convert)
+
+    if vector_store is None:
+        collect_all(conversions, report.conversion, len(sources), progress)
+        return report
+
+    import LoaderCloud
+
+    results = collect(conversions, report.conversion, len(sources), progress)
+
+    # Documents that failed this time keep their chunks from earlier runs
+    failed = set()
+
+    def converted_documents():
+        for result in results:
+            if result.status == CONVERTED:
+                yield result.output, result.text
+            else:
+                failed.add(destination_path(result.source, origin_folder, dest_folder))
+
+    report.index = LoaderCloud.index_texts(
+        vector_store,
+        converted_documents(),
+        manifest_path or LoaderCloud.MANIFEST_PATH,
+        scheduler,
+        prune_folders=[dest_folder],
+        keep=failed,
+    )
+    return report
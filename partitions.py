@@ -0,0 +1,245 @@
+"""
+Source partitions of the index and the query router that picks which of
+them a question searches.
+
+Every chunk is tagged with the category of the folder it came from
+(`category_of`: Docs_md holds the internal POPs, ScrapedData the public
+site pages) and with its partition, the unit that is stored and searched
+separately. Today each category is its own partition.
+
+With PARTITIONED_COLLECTIONS, LoaderCloud.py writes each partition to its
+own Chroma collection (`<CHROMA_COLLECTION>_<partition>`) through
+`PartitionedVectorStore`; otherwise they share one collection and searches
+filter on the `partition` metadata.
+
+After indexing, LoaderCloud.py saves the normalized mean embedding of each
+partition (`write_centroids`). `QueryRouter` compares a question's embedding
+with those centroids and keeps the partitions within a margin of the best
+match, so a question about a POP procedure does not pull site pages into
+the context. Without a centroid file every partition is searched.
+"""
+
+import json
+import os
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+CENTROIDS_FILENAME = "partition_centroids.json"
+# Top-level source folder -> category
+CATEGORIES = {"Docs_md": "pop", "ScrapedData": "site"}
+DEFAULT_CATEGORY = "other"
+PARTITIONS = sorted(set(CATEGORIES.values()) | {DEFAULT_CATEGORY})
+
+
+def category_of(source: str) -> str:
+    """Category of a chunk from the source folder in its path ("Docs_md/POP-01.md" -> "pop")"""
+    for folder in source.replace("\\", "/").split("/"):
+        if folder in CATEGORIES:
+            return CATEGORIES[folder]
+    return DEFAULT_CATEGORY
+
+
+def partition_metadata(source: str) -> dict:
+    """Metadata keys LoaderCloud.py adds to every chunk of `source`"""
+    category = category_of(source)
+    return {"category": category, "partition": category}
+
+
+def partition_of(metadata: dict) -> str:
+    """Partition of a stored chunk; chunks indexed before tagging fall back to their source"""
+    return metadata.get("partition") or category_of(metadata.get("source", ""))
+
+
+def partition_filter(partitions: Sequence[str]) -> dict:
+    """Chroma `where` filter matching chunks of the given partitions"""
+    if len(partitions) == 1:
+        return {"partition": partitions[0]}
+    return {"partition": {"$in": list(partitions)}}
+
+
+def filter_partitions(where: Optional[dict]) -> Optional[List[str]]:
+    """Partitions named by a `partition_filter` filter; None for no filter"""
+    if not where:
+        return None
+    value = where.get("partition")
+    if set(where) != {"partition"} or value is None:
+        raise ValueError(f"Only partition filters are supported, got {where!r}")
+    return list(value["$in"]) if isinstance(value, dict) else [value]
+
+
+def merge_hits(hits: Iterable[List[Tuple[Document, float]]], k: int) -> List[Document]:
+    """The `k` closest documents of several (document, distance) result lists"""
+    merged = sorted((hit for partition_hits in hits for hit in partition_hits), key=lambda hit: hit[1])
+    return [document for document, _ in merged[:k]]
+
+
+class PartitionedVectorStore:
+    """
+    One Chroma collection per partition, behind the calls LoaderCloud.py and
+    the server make on a single langchain Chroma store.
+
+    Args:
+        stores (dict): Partition name -> langchain Chroma store; they must share the embedding model.
+    """
+
+    def __init__(self, stores: Dict[str, object]):
+        self.stores = stores
+
+    @property
+    def embeddings(self):
+        return next(iter(self.stores.values())).embeddings
+
+    def partitions(self) -> List[str]:
+        return list(self.stores)
+
+    def add_documents(self, documents: List[Document], ids: List[str]):
+        grouped: Dict[str, Tuple[list, list]] = {}
+        for document, doc_id in zip(documents, ids):
+            batch = grouped.setdefault(partition_of(document.metadata), ([], []))
+            batch[0].append(document)
+            batch[1].append(doc_id)
+        for partition, (batch_documents, batch_ids) in grouped.items():
+            self.stores[partition].add_documents(documents=batch_documents, ids=batch_ids)
+
+    def writer(self):
+        """EmbeddingScheduler writer that upserts each chunk into its partition's collection"""
+        from embedding_scheduler import chroma_writer
+        writers = {partition: chroma_writer(store) for partition, store in self.stores.items()}
+
+        def write(ids: List[str], documents: List[Document], vectors: List[List[float]]):
+            grouped: Dict[str, Tuple[list, list, list]] = {}
+            for doc_id, document, vector in zip(ids, documents, vectors):
+                batch = grouped.setdefault(partition_of(document.metadata), ([], [], []))
+                batch[0].append(doc_id)
+                batch[1].append(document)
+                batch[2].append(vector)
+            for partition, (batch_ids, batch_documents, batch_vectors) in grouped.items():
+                writers[partition](batch_ids, batch_documents, batch_vectors)
+        return write
+
+    def delete(self, ids: List[str]):
+        # The manifest does not say which collection a chunk went to; deleting a missing ID is a no-op
+        for store in self.stores.values():
+            store.delete(ids=ids)
+
+    def get_by_ids(self, ids: Sequence[str]) -> List[Document]:
+        found = {}
+        for store in self.stores.values():
+            found.update((doc.id, doc) for doc in store.get_by_ids(ids))
+        return [found[doc_id] for doc_id in ids if doc_id in found]
+
+    def search_partition(self, partition: str, embedding: List[float], k: int) -> List[Tuple[Document, float]]:
+        """(document, distance) hits of one partition's collection"""
+        return self.stores[partition].similarity_search_by_vector_with_relevance_scores(embedding, k=k)
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, filter: Optional[dict] = None,
+                                    **kwargs) -> List[Document]:
+        partitions = filter_partitions(filter) or self.partitions()
+        return merge_hits((self.search_partition(partition, embedding, k) for partition in partitions), k)
+
+    def collections(self) -> list:
+        return [store._collection for store in self.stores.values()]
+
+    def count(self) -> int:
+        return sum(collection.count() for collection in self.collections())
+
+
+def collections_of(vector_store) -> list:
+    """The chromadb collections behind a single or partitioned store"""
+    if isinstance(vector_store, PartitionedVectorStore):
+        return vector_store.collections()
+    return [vector_store._collection]
+
+
+def compute_centroids(collections: Iterable, page_size: int = 5000) -> Dict[str, dict]:
+    """Normalized mean embedding and chunk count of every partition found in the collections"""
+    sums: Dict[str, np.ndarray] = {}
+    counts: Counter = Counter()
+    for collection in collections:
+        for offset in range(0, collection.count(), page_size):
+            page = collection.get(include=["embeddings", "metadatas"], limit=page_size, offset=offset)
+            vectors = np.asarray(page["embeddings"], dtype=np.float64)
+            vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+            for vector, metadata in zip(vectors, page["metadatas"]):
+                partition = partition_of(metadata or {})
+                sums[partition] = sums.get(partition, 0) + vector
+                counts[partition] += 1
+    return {
+        partition: {"centroid": (total / max(np.linalg.norm(total), 1e-12)).tolist(), "chunks": counts[partition]}
+        for partition, total in sorted(sums.items())
+    }
+
+
+def write_centroids(centroids: Dict[str, dict], path: str):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temp_path = path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump({"version": 1, "partitions": centroids}, f)
+    os.replace(temp_path, path)
+
+
+class QueryRouter:
+    """
+    Picks the partitions a question searches from the centroids LoaderCloud.py
+    writes, reloading the file when re-indexing rewrites it.
+
+    Args:
+        path (str): Centroid file (partition_centroids.json).
+        margin (float): Partitions whose centroid similarity is within this of the best one are searched too.
+    """
+
+    def __init__(self, path: str, margin: float = 0.05):
+        self.path = path
+        self.margin = margin
+        self._names: List[str] = []
+        self._centroids = np.zeros((0, 0), dtype=np.float32)
+        self._mtime = None
+        self._lock = threading.Lock()
+        self.questions = 0
+        self.routed = 0
+        self.searches: Counter = Counter()
+
+    def _load(self) -> Tuple[List[str], np.ndarray]:
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return [], np.zeros((0, 0), dtype=np.float32)
+        with self._lock:
+            if mtime != self._mtime:
+                with open(self.path, encoding="utf-8") as f:
+                    partitions = json.load(f)["partitions"]
+                self._names = [name for name, entry in partitions.items() if entry["chunks"]]
+                self._centroids = np.asarray([partitions[name]["centroid"] for name in self._names], dtype=np.float32)
+                self._mtime = mtime
+            return self._names, self._centroids
+
+    def route(self, embedding: Sequence[float]) -> Optional[List[str]]:
+        """Partitions to search for the question, or None to search them all"""
+        names, centroids = self._load()
+        if len(names) < 2:
+            return None
+        query = np.asarray(embedding, dtype=np.float32)
+        similarities = centroids @ (query / max(float(np.linalg.norm(query)), 1e-12))
+        best = similarities.max()
+        chosen = [name for name, similarity in zip(names, similarities) if similarity >= best - self.margin]
+        with self._lock:
+            self.questions += 1
+            self.searches.update(chosen)
+            if len(chosen) < len(names):
+                self.routed += 1
+        return None if len(chosen) == len(names) else chosen
+
+    def stats(self) -> dict:
+        names, _ = self._load()
+        with self._lock:
+            return {
+                "partitions": names,
+                "margin": self.margin,
+                "questions": self.questions,
+                "routed": self.routed,
+                "searches": dict(self.searches),
+            }
@@ -0,0 +1,83 @@
+"""
+The RAG prompt, pinned to a local snapshot of rlm/rag-prompt.
+
+The server reads the snapshot (rag_prompt.json) at start-up, so it starts
+without network access and always uses a reviewed version of the prompt.
+`python prompts.py --refresh` pulls the current version from the LangChain
+hub and rewrites the snapshot; with PROMPT_HUB_REFRESH the server also tries
+the hub at start-up and falls back to the snapshot when it cannot reach it.
+"""
+
+import argparse
+import json
+import logging
+import os
+from typing import Optional
+
+from langchain_core.prompts import ChatPromptTemplate
+
+logger = logging.getLogger(__name__)
+
+HUB_ID = "rlm/rag-prompt"
+SNAPSHOT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rag_prompt.json")
+
+ROLES = {
+    "HumanMessagePromptTemplate": "human",
+    "SystemMessagePromptTemplate": "system",
+    "AIMessagePromptTemplate": "ai",
+}
+
+
+def to_snapshot(prompt: ChatPromptTemplate, hub_id: str = HUB_ID) -> dict:
+    messages = []
+    for message in prompt.messages:
+        role = ROLES.get(type(message).__name__)
+        if role is None:
+            raise ValueError(f"Cannot snapshot prompt message of type {type(message).__name__}")
+        messages.append({"role": role, "template": message.prompt.template})
+    return {"hub_id": hub_id, "messages": messages}
+
+
+def load_prompt(path: str = SNAPSHOT_PATH) -> ChatPromptTemplate:
+    with open(path, "r", encoding="utf-8") as f:
+        snapshot = json.load(f)
+    return ChatPromptTemplate.from_messages([(message["role"], message["template"]) for message in snapshot["messages"]])
+
+
+def save_prompt(prompt: ChatPromptTemplate, path: str = SNAPSHOT_PATH, hub_id: str = HUB_ID):
+    temp_path = path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(to_snapshot(prompt, hub_id), f, ensure_ascii=False, indent=2)
+        f.write("\n")
+    os.replace(temp_path, path)
+
+
+def refresh_prompt(path: str = SNAPSHOT_PATH, hub_id: str = HUB_ID) -> ChatPromptTemplate:
+    """Pull `hub_id` from the LangChain hub and rewrite the snapshot"""
+    from langchain import hub
+
+    prompt = hub.pull(hub_id)
+    save_prompt(prompt, path, hub_id)
+    return prompt
+
+
+def get_prompt(path: Optional[str] = None, hub_id: str = HUB_ID, refresh: bool = False) -> ChatPromptTemplate:
+    """The snapshot at `path`, refreshed from the hub first when `refresh` is set and the hub answers"""
+    path = path or SNAPSHOT_PATH
+    if refresh:
+        try:
+            return refresh_prompt(path, hub_id)
+        except Exception as e:
+            logger.warning("Could not refresh the prompt from the hub, using the local snapshot",
+                           extra={"hub_id": hub_id, "error": str(e)})
+    return load_prompt(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show or refresh the local snapshot of the RAG prompt.")
+    parser.add_argument("--refresh", action="store_true", help=f"Pull {HUB_ID} from the LangChain hub and rewrite the snapshot")
+    parser.add_argument("--path", default=SNAPSHOT_PATH)
+    args = parser.parse_args()
+
+    prompt = refresh_prompt(args.path) if args.refresh else load_prompt(args.path)
+    print(json.dumps(to_snapshot(prompt), ensure_ascii=False, indent=2))
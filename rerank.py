@@ -0,0 +1,178 @@
+"""
+Reranking of the retrieved chunks before they go into the prompt.
+
+`retrieve` over-fetches candidates (RERANK_CANDIDATES, 30 by default, as the
+legacy AgentRAG.py did) and the rerank node keeps the best of them that fit
+a token budget, so the prompt carries more relevant context per token.
+
+Chunks are picked by maximal marginal relevance (MMR): each step takes the
+candidate with the best mix of relevance to the question and dissimilarity to
+the chunks already taken, which skips near-duplicates such as the 200-character
+overlap between neighbouring chunks. Relevance is the score of a local
+cross-encoder (sentence-transformers, optional) when one is configured, and
+otherwise the mean of the retrieval rank and the share of the question's
+terms the chunk contains. Similarity between chunks is the Jaccard overlap of
+their BM25 tokens, so no embeddings are needed and everything runs on the CPU.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from typing import Callable, List, Optional, Sequence
+
+from langchain_core.documents import Document
+
+from bm25 import tokenize
+from token_accounting import count_tokens
+
+logger = logging.getLogger(__name__)
+
+
+class CrossEncoderScorer:
+    """
+    Relevance scores from a sentence-transformers cross-encoder, loaded on first use.
+
+    Args:
+        model_name (str): Hugging Face model; the default is multilingual, so it handles Portuguese.
+    """
+
+    def __init__(self, model_name: str = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"):
+        self.model_name = model_name
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._model is None:
+                try:
+                    from sentence_transformers import CrossEncoder
+                except ImportError as e:
+                    raise ImportError(
+                        "RERANKER=cross-encoder needs sentence-transformers: pip install sentence-transformers"
+                    ) from e
+                self._model = CrossEncoder(self.model_name, device="cpu")
+        return self._model
+
+    def __call__(self, question: str, texts: Sequence[str]) -> List[float]:
+        return [float(score) for score in self._load().predict([(question, text) for text in texts])]
+
+
+def jaccard(a: frozenset, b: frozenset) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def normalize(scores: Sequence[float]) -> List[float]:
+    low, high = min(scores), max(scores)
+    if high == low:
+        return [1.0] * len(scores)
+    return [(score - low) / (high - low) for score in scores]
+
+
+class Reranker:
+    """
+    Picks the retrieved chunks that go into the prompt.
+
+    Args:
+        token_budget (int): Tokens of context kept; the best chunk is kept even if it alone is larger.
+        diversity (float): MMR weight of dissimilarity to the chunks already picked (0 ranks by relevance only).
+        scorer: Callable(question, texts) -> relevance scores; None uses retrieval order and term coverage.
+        encoding_name (str): tiktoken encoding used to measure the chunks.
+        recent (int): Latest rerank timings kept for stats().
+    """
+
+    def __init__(self, token_budget: int = 800, diversity: float = 0.5,
+                 scorer: Optional[Callable[[str, Sequence[str]], List[float]]] = None,
+                 encoding_name: str = "cl100k_base", recent: int = 100):
+        self.token_budget = token_budget
+        self.diversity = diversity
+        self.scorer = scorer
+        self.encoding_name = encoding_name
+        self._lock = threading.Lock()
+        self._timings = deque(maxlen=recent)
+        self.requests = 0
+        self.seconds = 0.0
+        self.candidates = 0
+        self.kept = 0
+
+    @property
+    def method(self) -> str:
+        return "mmr" if self.scorer is None else "cross-encoder"
+
+    def relevance(self, question: str, documents: Sequence[Document], tokens: Sequence[frozenset]) -> List[float]:
+        if self.scorer is not None:
+            return normalize(self.scorer(question, [doc.page_content for doc in documents]))
+        terms = set(tokenize(question))
+        count = len(documents)
+        return [
+            ((1.0 - rank / count) + len(terms & chunk_tokens) / max(1, len(terms))) / 2
+            for rank, chunk_tokens in enumerate(tokens)
+        ]
+
+    def rerank(self, question: str, documents: Sequence[Document]) -> List[Document]:
+        """The picked chunks, in the order they were picked (best first)"""
+        if not documents:
+            return []
+        started = time.perf_counter()
+        tokens = [frozenset(tokenize(doc.page_content)) for doc in documents]
+        relevance = self.relevance(question, documents, tokens)
+        sizes = [count_tokens(doc.page_content, self.encoding_name) for doc in documents]
+
+        picked, used = [], 0
+        # Highest similarity of each candidate to the picked chunks
+        redundancy = [0.0] * len(documents)
+        remaining = set(range(len(documents)))
+        while remaining:
+            best = max(remaining, key=lambda i: ((1 - self.diversity) * relevance[i] - self.diversity * redundancy[i], -i))
+            remaining.discard(best)
+            if picked and used + sizes[best] > self.token_budget:
+                continue
+            picked.append(best)
+            used += sizes[best]
+            for i in remaining:
+                redundancy[i] = max(redundancy[i], jaccard(tokens[i], tokens[best]))
+
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.requests += 1
+            self.seconds += elapsed
+            self.candidates += len(documents)
+            self.kept += len(picked)
+            self._timings.append(elapsed)
+        logger.debug("Reranked chunks", extra={
+            "method": self.method, "candidates": len(documents), "kept": len(picked),
+            "tokens": used, "ms": round(elapsed * 1000, 3),
+        })
+        return [documents[i] for i in picked]
+
+    def stats(self) -> dict:
+        with self._lock:
+            timings = sorted(self._timings)
+            return {
+                "method": self.method,
+                "token_budget": self.token_budget,
+                "requests": self.requests,
+                "candidates": self.candidates,
+                "kept": self.kept,
+                "total_ms": round(self.seconds * 1000, 3),
+                "average_ms": round(self.seconds * 1000 / self.requests, 3) if self.requests else 0.0,
+                "p50_ms": round(timings[len(timings) // 2] * 1000, 3) if timings else 0.0,
+                "p95_ms": round(timings[max(0, int(len(timings) * 0.95) - 1)] * 1000, 3) if timings else 0.0,
+            }
+
+
+def make_reranker(kind: str, token_budget: int = 800, diversity: float = 0.5, model_name: Optional[str] = None,
+                  encoding_name: str = "cl100k_base") -> Optional[Reranker]:
+    """Reranker for the RERANKER setting: "" (none), "mmr" or "cross-encoder" """
+    kind = kind.strip().lower()
+    if not kind:
+        return None
+    if kind == "mmr":
+        scorer = None
+    elif kind == "cross-encoder":
+        scorer = CrossEncoderScorer(model_name) if model_name else CrossEncoderScorer()
+    else:
+        raise ValueError(f"Unknown RERANKER {kind!r}: use mmr or cross-encoder")
+    return Reranker(token_budget, diversity, scorer, encoding_name)
@@ -9,7 +9,7 @@ import sys
 import os
 
 def run_tests():
-    """Run all tests with verbose output"""
+    """Run all tests (every test_*.py, see pytest.ini) with verbose output"""
     print("Running AgentRAGServer tests...")
     print("=" * 50)
     
@@ -17,7 +17,6 @@ def run_tests():
         # Run pytest with verbose output
         result = subprocess.run([
             sys.executable, "-m", "pytest", 
-            "test_agent_rag_server.py", 
             "-v", 
             "--tb=short",
             "--color=yes"
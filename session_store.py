@@ -0,0 +1,370 @@
+"""
+Bounded stores for conversation histories.
+
+Sessions expire after an idle TTL, the least recently used session is evicted
+once `max_sessions` is reached, and each history is trimmed (oldest turns
+first) to at most `max_turns` question/answer pairs and `max_bytes` of message
+text. Histories are kept as compact Turn records (see history_manager), so
+a message is converted and serialized once rather than on every request.
+The stores behave like the dict they replace.
+
+`SessionStore` keeps the histories in the process. `SqliteSessionStore` keeps
+them in a SQLite file in WAL mode, so every server worker on a machine sees
+the same conversations (SESSION_STORE=sqlite, see gunicorn.conf.py).
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, List, Optional
+
+from history_manager import Turn, compact_history, message_type
+
+# Rough per-message cost of the message object itself, on top of its text
+MESSAGE_OVERHEAD_BYTES = 200
+
+
+def message_bytes(message) -> int:
+    content = message.get("content", "") if isinstance(message, dict) else getattr(message, "content", "")
+    return len(str(content).encode("utf-8")) + MESSAGE_OVERHEAD_BYTES
+
+
+def trim_history(history: List, max_turns: int, max_bytes: int) -> tuple[List, int, int]:
+    """The history cut to the turn and byte caps, its size and the number of messages dropped"""
+    # A leading summary message (see history_manager) is always kept
+    head = []
+    if history and message_type(history[0]) == "SystemMessage":
+        head, history = list(history[:1]), history[1:]
+    history = list(history)
+    sizes = [message_bytes(message) for message in history]
+    drop = max(0, len(history) - 2 * max_turns)
+    size = sum(sizes[drop:])
+    # Always keep the latest message, even when it alone exceeds max_bytes
+    while drop < len(history) - 1 and size > max_bytes:
+        size -= sizes[drop]
+        drop += 1
+    # Drop whole turns so the history still starts with a question
+    if drop % 2 and drop < len(history) - 1:
+        size -= sizes[drop]
+        drop += 1
+    return head + history[drop:], size + sum(message_bytes(message) for message in head), drop
+
+
+class SessionStore:
+    """
+    Dict-like mapping of session ID to conversation history with LRU/TTL eviction.
+
+    Args:
+        ttl_seconds (float): Idle time after which a session expires; 0 disables expiry.
+        max_sessions (int): Live sessions kept before the least recently used one is evicted.
+        max_turns (int): Question/answer pairs kept per session.
+        max_bytes (int): Approximate size cap of a single history.
+        clock: Time source, injectable for tests.
+    """
+
+    def __init__(self, ttl_seconds: float = 3600, max_sessions: int = 10000, max_turns: int = 100,
+                 max_bytes: int = 256 * 1024, clock: Callable[[], float] = time.monotonic):
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self.max_turns = max_turns
+        self.max_bytes = max_bytes
+        self.clock = clock
+        # session_id -> (history, size in bytes, last access), least recently used first
+        self._sessions = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self.capacity_evictions = 0
+        self.idle_evictions = 0
+        self.trimmed_messages = 0
+
+    def _expired(self, last_access: float, now: float) -> bool:
+        return bool(self.ttl_seconds) and now - last_access > self.ttl_seconds
+
+    def _remove(self, session_id: str):
+        _, size, _ = self._sessions.pop(session_id)
+        self._bytes -= size
+
+    def _sweep(self, now: float):
+        """Drop expired sessions; they sit at the LRU end, so this stops at the first live one"""
+        while self._sessions:
+            session_id, (_, _, last_access) = next(iter(self._sessions.items()))
+            if not self._expired(last_access, now):
+                break
+            self._remove(session_id)
+            self.idle_evictions += 1
+
+    def _trim(self, history: List) -> tuple[List, int]:
+        history, size, dropped = trim_history(history, self.max_turns, self.max_bytes)
+        self.trimmed_messages += dropped
+        return history, size
+
+    def get(self, session_id: str, default=None):
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return default
+            now = self.clock()
+            if self._expired(entry[2], now):
+                self._remove(session_id)
+                self.idle_evictions += 1
+                return default
+            self._sessions[session_id] = (entry[0], entry[1], now)
+            self._sessions.move_to_end(session_id)
+            return entry[0]
+
+    def __getitem__(self, session_id: str) -> List:
+        history = self.get(session_id)
+        if history is None:
+            raise KeyError(session_id)
+        return history
+
+    def __setitem__(self, session_id: str, history: List):
+        self.put(session_id, history)
+
+    def put(self, session_id: str, history: List) -> List[Turn]:
+        """Store `history` and return it as stored: compacted and trimmed"""
+        with self._lock:
+            now = self.clock()
+            self._sweep(now)
+            if session_id in self._sessions:
+                self._remove(session_id)
+            elif len(self._sessions) >= self.max_sessions:
+                self._remove(next(iter(self._sessions)))
+                self.capacity_evictions += 1
+            history, size = self._trim(compact_history(history))
+            self._sessions[session_id] = (history, size, now)
+            self._bytes += size
+            return history
+
+    def __delitem__(self, session_id: str):
+        with self._lock:
+            self._remove(session_id)
+
+    def pop(self, session_id: str, default=None):
+        with self._lock:
+            history = self.get(session_id)
+            if history is None:
+                return default
+            self._remove(session_id)
+            return history
+
+    def __contains__(self, session_id: str) -> bool:
+        return self.get(session_id) is not None
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._sweep(self.clock())
+            return len(self._sessions)
+
+    def clear(self):
+        with self._lock:
+            self._sessions.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._sweep(self.clock())
+            return {
+                "sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "approx_bytes": self._bytes,
+                "capacity_evictions": self.capacity_evictions,
+                "idle_evictions": self.idle_evictions,
+                "trimmed_messages": self.trimmed_messages,
+            }
+
+
+class SqliteSessionStore:
+    """
+    SessionStore over a SQLite file shared by every process that opens it.
+
+    Expiry, LRU eviction and trimming follow SessionStore; last access times
+    use the wall clock, since they are compared across processes. Histories
+    are stored as one JSON line per Turn and come back as Turns that keep
+    that JSON, so a history read and stored again is not serialized again. Eviction counters
+    live in the database too, so stats() covers all workers.
+
+    Reads run in read transactions and only write when the session's last
+    access is more than `touch_seconds` old, so LRU order and expiry are that
+    coarse. Expired sessions are deleted by the next put(); until then reads
+    skip them and stats() counts them as idle evictions.
+
+    Args:
+        path (str): Database file; created with its tables if missing.
+        ttl_seconds (float): Idle time after which a session expires; 0 disables expiry.
+        max_sessions (int): Live sessions kept before the least recently used one is evicted.
+        max_turns (int): Question/answer pairs kept per session.
+        max_bytes (int): Approximate size cap of a single history.
+        clock: Time source, injectable for tests.
+        touch_seconds (float): Age of the last access a read refreshes; defaults to a tenth of the TTL, at most a minute.
+    """
+
+    COUNTERS = ("capacity_evictions", "idle_evictions", "trimmed_messages")
+
+    def __init__(self, path: str, ttl_seconds: float = 3600, max_sessions: int = 10000, max_turns: int = 100,
+                 max_bytes: int = 256 * 1024, clock: Callable[[], float] = time.time,
+                 touch_seconds: Optional[float] = None):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self.max_turns = max_turns
+        self.max_bytes = max_bytes
+        self.clock = clock
+        self.touch_seconds = min(60.0, ttl_seconds / 10 or 60.0) if touch_seconds is None else touch_seconds
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+        self._pid = None
+
+    def _db(self) -> sqlite3.Connection:
+        # Opened on first use in each process: a connection must not be carried across a fork
+        if self._connection is None or self._pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS sessions (session_id TEXT PRIMARY KEY, history TEXT NOT NULL, "
+                "bytes INTEGER NOT NULL, last_access REAL NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS sessions_by_access ON sessions (last_access)")
+            connection.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            self._connection, self._pid = connection, os.getpid()
+        return self._connection
+
+    def _write(self, operation: Callable[[sqlite3.Connection, float], object]):
+        """Run `operation(db, now)` in one write transaction, taken before reading so workers never interleave"""
+        with self._lock:
+            db = self._db()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                result = operation(db, self.clock())
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+            return result
+
+    def _read(self, operation: Callable[[sqlite3.Connection, float], object]):
+        """Run `operation(db, now)` in one read transaction, which neither waits for nor blocks writers"""
+        with self._lock:
+            db = self._db()
+            db.execute("BEGIN")
+            try:
+                return operation(db, self.clock())
+            finally:
+                db.execute("COMMIT")
+
+    def _expired_before(self, now: float) -> float:
+        """Last access times older than this have expired"""
+        return now - self.ttl_seconds if self.ttl_seconds else float("-inf")
+
+    def _count(self, db: sqlite3.Connection, name: str, amount: int):
+        if amount:
+            db.execute("INSERT INTO counters (name, value) VALUES (?, ?) "
+                       "ON CONFLICT (name) DO UPDATE SET value = value + excluded.value", (name, amount))
+
+    def _sweep(self, db: sqlite3.Connection, now: float):
+        if self.ttl_seconds:
+            expired = db.execute("DELETE FROM sessions WHERE last_access < ?", (now - self.ttl_seconds,)).rowcount
+            self._count(db, "idle_evictions", expired)
+
+    @staticmethod
+    def _encode(history: List[Turn]) -> str:
+        # JSON escapes line breaks inside strings, so each Turn's JSON is one line
+        return "\n".join(turn.json() for turn in history)
+
+    @staticmethod
+    def _decode(data: str) -> List[Turn]:
+        return [Turn.from_json(line) for line in data.split("\n") if line]
+
+    def get(self, session_id: str, default=None):
+        def read(db, now):
+            row = db.execute("SELECT history, last_access FROM sessions WHERE session_id = ? AND last_access >= ?",
+                             (session_id, self._expired_before(now))).fetchone()
+            return row, now
+
+        row, now = self._read(read)
+        if row is None:
+            return default
+        if now - row[1] > self.touch_seconds:
+            with self._lock:
+                # One statement, so SQLite runs it in its own short write transaction
+                self._db().execute("UPDATE sessions SET last_access = ? WHERE session_id = ? AND last_access < ?",
+                                   (now, session_id, now))
+        return self._decode(row[0])
+
+    def __getitem__(self, session_id: str) -> List:
+        history = self.get(session_id)
+        if history is None:
+            raise KeyError(session_id)
+        return history
+
+    def __setitem__(self, session_id: str, history: List):
+        self.put(session_id, history)
+
+    def put(self, session_id: str, history: List) -> List[Turn]:
+        """Store `history` and return it as stored: compacted and trimmed"""
+        history, size, dropped = trim_history(compact_history(history), self.max_turns, self.max_bytes)
+        data = self._encode(history)
+
+        def write(db, now):
+            self._sweep(db, now)
+            exists = db.execute("SELECT 1 FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+            if not exists and db.execute("SELECT COUNT(*) FROM sessions").fetchone()[0] >= self.max_sessions:
+                db.execute("DELETE FROM sessions WHERE session_id = "
+                           "(SELECT session_id FROM sessions ORDER BY last_access LIMIT 1)")
+                self._count(db, "capacity_evictions", 1)
+            db.execute("INSERT OR REPLACE INTO sessions (session_id, history, bytes, last_access) VALUES (?, ?, ?, ?)",
+                       (session_id, data, size, now))
+            self._count(db, "trimmed_messages", dropped)
+
+        self._write(write)
+        return history
+
+    def __delitem__(self, session_id: str):
+        if not self._write(lambda db, now: db.execute("DELETE FROM sessions WHERE session_id = ?",
+                                                      (session_id,)).rowcount):
+            raise KeyError(session_id)
+
+    def pop(self, session_id: str, default=None):
+        history = self.get(session_id)
+        if history is None:
+            return default
+        self._write(lambda db, now: db.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,)))
+        return history
+
+    def __contains__(self, session_id: str) -> bool:
+        return self.get(session_id) is not None
+
+    def __len__(self) -> int:
+        return self.stats()["sessions"]
+
+    def clear(self):
+        self._write(lambda db, now: db.execute("DELETE FROM sessions"))
+
+    def stats(self) -> dict:
+        def read(db, now):
+            cutoff = self._expired_before(now)
+            sessions, size = db.execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM sessions WHERE last_access >= ?",
+                                        (cutoff,)).fetchone()
+            expired = db.execute("SELECT COUNT(*) FROM sessions WHERE last_access < ?", (cutoff,)).fetchone()[0]
+            counters = dict(db.execute("SELECT name, value FROM counters").fetchall())
+            counters["idle_evictions"] = counters.get("idle_evictions", 0) + expired
+            return {
+                "sessions": sessions,
+                "max_sessions": self.max_sessions,
+                "approx_bytes": size,
+                **{name: counters.get(name, 0) for name in self.COUNTERS},
+            }
+
+        return self._read(read)
+
+
+def make_session_store(kind: str, path: str = "sessions.sqlite3", **limits):
+    """The session store for SESSION_STORE: "memory" (this process only) or "sqlite" (shared by all workers)"""
+    if kind == "memory":
+        return SessionStore(**limits)
+    if kind == "sqlite":
+        return SqliteSessionStore(path, **limits)
+    raise ValueError(f"Unknown session store {kind!r}: use memory or sqlite")
@@ -0,0 +1,144 @@
+"""
+Runtime configuration shared by the loader and the server.
+
+Every value can be overridden with an environment variable (or a .env file).
+"""
+
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def env_int(name: str, default: int) -> int:
+    return int(os.getenv(name, default))
+
+
+def env_float(name: str, default: float) -> float:
+    return float(os.getenv(name, default))
+
+
+# Vector store
+CHROMA_PERSIST_DIRECTORY = os.getenv("CHROMA_PERSIST_DIRECTORY", "./chroma_dgt_rag")
+CHROMA_COLLECTION = os.getenv("CHROMA_COLLECTION", "dgt_rag")
+# "chroma", or "mmap": exact search over a memory-mapped export of the collection (see vector_index.py)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+# Export folder; empty uses <CHROMA_PERSIST_DIRECTORY>/vector_index
+VECTOR_INDEX_PATH = os.getenv("VECTOR_INDEX_PATH", "")
+# float16 halves the index's memory, but searching it is several times slower than float32
+VECTOR_INDEX_DTYPE = os.getenv("VECTOR_INDEX_DTYPE", "float32")
+# One collection per source partition (<CHROMA_COLLECTION>_pop, _site, ...) instead of one; re-index after switching
+PARTITIONED_COLLECTIONS = env_bool("PARTITIONED_COLLECTIONS", False)
+# Search only the partitions whose centroid is within PARTITION_ROUTING_MARGIN (cosine) of the question's
+# closest one; needs the centroids LoaderCloud.py writes. Pair it with PARTITIONED_COLLECTIONS or
+# VECTOR_BACKEND=mmap: on one Chroma collection the partition filter makes every search much slower
+PARTITION_ROUTING = env_bool("PARTITION_ROUTING", False)
+PARTITION_ROUTING_MARGIN = env_float("PARTITION_ROUTING_MARGIN", 0.05)
+
+# Embeddings: "openai" (EMBEDDING_MODEL) or "onnx" (local CPU model at ONNX_MODEL_PATH); re-index after switching
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "openai")
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+# Prepended to queries and chunks by the onnx provider (nomic-embed-text: "search_query: " / "search_document: ")
+EMBEDDING_QUERY_PREFIX = os.getenv("EMBEDDING_QUERY_PREFIX", "")
+EMBEDDING_DOCUMENT_PREFIX = os.getenv("EMBEDDING_DOCUMENT_PREFIX", "")
+ONNX_MODEL_PATH = os.getenv("ONNX_MODEL_PATH", "")
+# Defaults to tokenizer.json next to the model
+ONNX_TOKENIZER_PATH = os.getenv("ONNX_TOKENIZER_PATH", "")
+ONNX_MAX_LENGTH = env_int("ONNX_MAX_LENGTH", 512)
+ONNX_BATCH_SIZE = env_int("ONNX_BATCH_SIZE", 32)
+# ONNX Runtime threads per inference run (0: one per core) and runs in flight at once
+ONNX_INTRA_OP_THREADS = env_int("ONNX_INTRA_OP_THREADS", 0)
+ONNX_WORKERS = env_int("ONNX_WORKERS", 2)
+# Queries arriving while every worker is busy share the next run, up to this many (1: no batching)
+ONNX_QUERY_MAX_BATCH = env_int("ONNX_QUERY_MAX_BATCH", 32)
+QUERY_EMBEDDING_CACHE_SIZE = env_int("QUERY_EMBEDDING_CACHE_SIZE", 10000)
+# SQLite file for query embeddings that survive restarts; empty keeps the cache in memory only
+QUERY_EMBEDDING_CACHE_PATH = os.getenv("QUERY_EMBEDDING_CACHE_PATH", "")
+
+# Indexing (LoaderCloud.py)
+EMBEDDING_BATCH_TOKENS = env_int("EMBEDDING_BATCH_TOKENS", 100_000)
+EMBEDDING_BATCH_SIZE = env_int("EMBEDDING_BATCH_SIZE", 512)
+EMBEDDING_CONCURRENCY = env_int("EMBEDDING_CONCURRENCY", 4)
+
+# Retrieval
+RETRIEVAL_K = env_int("RETRIEVAL_K", 3)
+# Fuse BM25 hits with the vector hits (once LoaderCloud.py has built the BM25 index)
+HYBRID_RETRIEVAL = env_bool("HYBRID_RETRIEVAL", True)
+# Candidates taken from each retriever before reciprocal rank fusion, and the fusion constant
+HYBRID_CANDIDATES = env_int("HYBRID_CANDIDATES", 10)
+RRF_K = env_int("RRF_K", 60)
+# Merge overlapping/adjacent chunks of the same file and fill CONTEXT_TOKEN_BUDGET tokens
+# from CONTEXT_CANDIDATES retrieved chunks instead of taking RETRIEVAL_K of them
+CONTEXT_PACKING = env_bool("CONTEXT_PACKING", True)
+CONTEXT_TOKEN_BUDGET = env_int("CONTEXT_TOKEN_BUDGET", 800)
+CONTEXT_CANDIDATES = env_int("CONTEXT_CANDIDATES", 10)
+# Rerank node: "" sends the retrieved chunks as they are, "mmr" or "cross-encoder" over-fetches
+# RERANK_CANDIDATES chunks and keeps the best that fit RERANK_TOKEN_BUDGET
+RERANKER = os.getenv("RERANKER", "")
+RERANK_CANDIDATES = env_int("RERANK_CANDIDATES", 30)
+RERANK_TOKEN_BUDGET = env_int("RERANK_TOKEN_BUDGET", 800)
+RERANK_DIVERSITY = env_float("RERANK_DIVERSITY", 0.5)
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1")
+
+# Start-up (AgentRAGServer lifespan)
+# The prompt comes from a local snapshot (rag_prompt.json by default); refreshing it from the hub is opt-in
+PROMPT_HUB_ID = os.getenv("PROMPT_HUB_ID", "rlm/rag-prompt")
+PROMPT_SNAPSHOT_PATH = os.getenv("PROMPT_SNAPSHOT_PATH", "")
+PROMPT_HUB_REFRESH = env_bool("PROMPT_HUB_REFRESH", False)
+STARTUP_WARMUP = env_bool("STARTUP_WARMUP", True)
+STARTUP_TIME_BUDGET_SECONDS = env_float("STARTUP_TIME_BUDGET_SECONDS", 10)
+
+# Logging (records go through a background queue; see structured_logging.py)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_JSON = env_bool("LOG_JSON", True)
+
+# Concurrent identical questions without session history share one graph run
+REQUEST_COALESCING = env_bool("REQUEST_COALESCING", True)
+
+# POST /AgentInvoke/batch
+BATCH_MAX_QUESTIONS = env_int("BATCH_MAX_QUESTIONS", 1000)
+# Model calls in flight per batch request
+BATCH_CONCURRENCY = env_int("BATCH_CONCURRENCY", 16)
+
+# Semantic answer cache
+ANSWER_CACHE_ENABLED = env_bool("ANSWER_CACHE_ENABLED", True)
+ANSWER_CACHE_SIMILARITY = env_float("ANSWER_CACHE_SIMILARITY", 0.95)
+ANSWER_CACHE_TTL_SECONDS = env_float("ANSWER_CACHE_TTL_SECONDS", 3600)
+ANSWER_CACHE_MAX_ENTRIES = env_int("ANSWER_CACHE_MAX_ENTRIES", 1000)
+
+# Token accounting
+# tiktoken encoding of the chat model (gpt-4o uses o200k_base)
+TOKEN_ENCODING = os.getenv("TOKEN_ENCODING", "o200k_base")
+TOKEN_METRICS_RECENT = env_int("TOKEN_METRICS_RECENT", 100)
+
+# Conversation sessions
+SESSION_TTL_SECONDS = env_float("SESSION_TTL_SECONDS", 3600)
+SESSION_MAX_SESSIONS = env_int("SESSION_MAX_SESSIONS", 10000)
+SESSION_MAX_TURNS = env_int("SESSION_MAX_TURNS", 100)
+SESSION_MAX_BYTES = env_int("SESSION_MAX_BYTES", 256 * 1024)
+# "memory" keeps sessions in the worker process; "sqlite" shares them between the workers of a multi-worker server
+SESSION_STORE = os.getenv("SESSION_STORE", "memory")
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "sessions.sqlite3")
+
+# Multi-worker serving (gunicorn -c gunicorn.conf.py)
+SERVER_BIND = os.getenv("SERVER_BIND", "0.0.0.0:8000")
+SERVER_WORKERS = env_int("SERVER_WORKERS", os.cpu_count() or 1)
+
+# Conversation history sent to the model
+HISTORY_TOKEN_BUDGET = env_int("HISTORY_TOKEN_BUDGET", 2000)
+HISTORY_KEEP_TURNS = env_int("HISTORY_KEEP_TURNS", 4)
+HISTORY_SUMMARY_MODEL = os.getenv("HISTORY_SUMMARY_MODEL", "openai:gpt-4o-mini")
+
+# Document conversion (Curator.py); 0 workers converts in-process, one file at a time
+CONVERSION_WORKERS = env_int("CONVERSION_WORKERS", os.cpu_count() or 1)
+CONVERSION_TIMEOUT_SECONDS = env_float("CONVERSION_TIMEOUT_SECONDS", 300)
+CLEANING_WORKERS = env_int("CLEANING_WORKERS", os.cpu_count() or 1)
+# JSON rule set for cleaning the markdown files; empty uses the rules built into cleaning.py
+CLEANING_RULES_PATH = os.getenv("CLEANING_RULES_PATH", "")
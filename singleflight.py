@@ -0,0 +1,74 @@
+"""
+Coalescing of identical in-flight requests ("single flight").
+
+When many people ask the same thing at once (a new procedure was just
+announced), every request would embed the question, search the index and
+call the model on its own. `SingleFlight.run(key, work)` starts `work` for
+the first caller of a key and makes every caller that arrives while it is
+still running await the same result (or the same exception). Nothing is
+kept after the call finishes; repeated questions later on are the answer
+cache's job.
+
+The work runs in its own task, so a caller that disconnects does not cancel
+it for the others.
+"""
+
+import asyncio
+import re
+import unicodedata
+from typing import Awaitable, Callable, Dict, TypeVar
+
+T = TypeVar("T")
+
+_SPACES = re.compile(r"\s+")
+
+
+def question_key(question: str) -> str:
+    """Questions that differ only in case, spacing, Unicode form or surrounding punctuation share a key"""
+    text = unicodedata.normalize("NFKC", question).casefold()
+    return _SPACES.sub(" ", text).strip(" ?!.,;:¿¡\"'")
+
+
+class SingleFlight:
+    """
+    Shares one in-flight call per key between concurrent callers.
+
+    Used from a single event loop, which serializes every change, so it takes no lock;
+    stats() read from another thread (a /metrics scrape) sees counters at most one call stale.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Future] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    async def run(self, key: str, work: Callable[[], Awaitable[T]]) -> T:
+        call = self._calls.get(key)
+        if call is None:
+            call = asyncio.ensure_future(work())
+            self._calls[key] = call
+            call.add_done_callback(lambda _, key=key, call=call: self._done(key, call))
+            self.leaders += 1
+        else:
+            self.followers += 1
+        return await asyncio.shield(call)
+
+    def _done(self, key: str, call: asyncio.Future):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        if not call.cancelled():
+            # Mark the exception as retrieved when every caller went away before it finished
+            call.exception()
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    def stats(self) -> dict:
+        leaders, followers = self.leaders, self.followers
+        total = leaders + followers
+        return {
+            "in_flight": len(self._calls),
+            "leaders": leaders,
+            "followers": followers,
+            "coalesced_rate": followers / total if total else 0.0,
+        }
@@ -0,0 +1,95 @@
+"""
+Structured logging written off the request path.
+
+`setup_logging()` routes the root logger through a QueueHandler: a request
+only puts the log record on an in-memory queue, and a QueueListener thread
+formats it and writes it to the stream. Records are JSON lines (timestamp,
+level, logger, message and any `extra={...}` fields), so they can be shipped
+and queried without parsing free text.
+"""
+
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+from typing import Optional, TextIO
+
+# LogRecord attributes that are not `extra` fields
+RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "taskName"}
+
+# Client libraries that log every HTTP call at INFO (each OpenAI request would add a line)
+QUIET_LOGGERS = ("httpx", "httpcore", "openai")
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_handler: Optional[logging.Handler] = None
+_lock = threading.Lock()
+
+
+class InProcessQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler for a queue read in this process: it only freezes the
+    message, instead of formatting and copying the whole record, and leaves
+    the rest (exception included) to the listener's formatter.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, with the record's `extra` fields at the top level"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in RESERVED and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def setup_logging(level: str = "INFO", json_format: bool = True, stream: Optional[TextIO] = None):
+    """Send the root logger's records through a background queue; calling it again replaces the setup"""
+    global _listener, _handler
+    with _lock:
+        _stop()
+        handler = logging.StreamHandler(stream or sys.stderr)
+        handler.setFormatter(JsonFormatter() if json_format else logging.Formatter(
+            "%(asctime)s %(levelname)s %(name)s: %(message)s"
+        ))
+        records = queue.SimpleQueue()
+        _handler = InProcessQueueHandler(records)
+        _listener = logging.handlers.QueueListener(records, handler, respect_handler_level=True)
+        root = logging.getLogger()
+        root.addHandler(_handler)
+        root.setLevel(level.upper())
+        for name in QUIET_LOGGERS:
+            logging.getLogger(name).setLevel(logging.WARNING)
+        _listener.start()
+
+
+def _stop():
+    global _listener, _handler
+    if _handler is not None:
+        logging.getLogger().removeHandler(_handler)
+        _handler = None
+    if _listener is not None:
+        # Writes whatever is still queued before the thread exits
+        _listener.stop()
+        _listener = None
+
+
+def stop_logging():
+    """Flush the queue and detach the handler"""
+    with _lock:
+        _stop()
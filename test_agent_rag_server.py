@@ -3,12 +3,32 @@ import httpx
 import asyncio
 from unittest.mock import Mock, patch, AsyncMock
 from fastapi.testclient import TestClient
-from AgentRAGServer import app, conversation_sessions, ChatRequest, ChatResponse
+from AgentRAGServer import app, conversation_sessions, ChatRequest, ChatResponse, answer_cache, generate, pack_context, rerank, retrieve, token_ledger
+from langchain_core.documents import Document
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage
+from rerank import Reranker
+import AgentRAGServer
+import json
+import os
+import subprocess
+import sys
+import time
 import uuid
 
 # Test client for FastAPI
 client = TestClient(app)
 
+
+@pytest.fixture(autouse=True)
+def offline_backends():
+    """Offline stand-ins for every model, embedding and vector store client, so no test builds a real one"""
+    from benchmarks.fakes import build_backends
+    llm, embeddings, vector_store, prompt = build_backends(llm_latency=0.0, embedding_latency=0.0, search_latency=0.0,
+                                                           corpus_size=24)
+    with patch.multiple('AgentRAGServer', llm=llm, summary_llm=llm, embeddings=embeddings, vector_store=vector_store,
+                        prompt=prompt):
+        yield
+
 class TestAgentRAGServer:
     """Test suite for AgentRAGServer FastAPI routes"""
     
@@ -33,7 +53,7 @@ class TestAgentRAGServer:
                 Mock(__class__=Mock(__name__="AIMessage"), content="Test answer")
             ]
         }
-        mock_graph.invoke.return_value = mock_response
+        mock_graph.ainvoke = AsyncMock(return_value=mock_response)
         
         # Test data
         test_data = {
@@ -64,7 +84,7 @@ class TestAgentRAGServer:
                 Mock(__class__=Mock(__name__="AIMessage"), content="Test answer")
             ]
         }
-        mock_graph.invoke.return_value = mock_response
+        mock_graph.ainvoke = AsyncMock(return_value=mock_response)
         
         # Create a session first
         session_id = str(uuid.uuid4())
@@ -168,19 +188,30 @@ class TestAgentRAGServer:
         assert "error" in data
         assert data["error"] == "Session not found"
     
+    def test_session_stats(self):
+        """Test GET /sessions/stats reports live sessions and their approximate size"""
+        conversation_sessions["stats-session"] = [HumanMessage(content="Oi"), AIMessage(content="Olá")]
+        
+        response = client.get("/sessions/stats")
+        
+        assert response.status_code == 200
+        data = response.json()
+        assert data["sessions"] == 1
+        assert data["approx_bytes"] > 0
+    
     def test_conversation_persistence(self):
         """Test that conversation history persists across multiple requests"""
         session_id = str(uuid.uuid4())
         
         # First request
         with patch('AgentRAGServer.graph') as mock_graph:
-            mock_graph.invoke.return_value = {
+            mock_graph.ainvoke = AsyncMock(return_value={
                 "answer": "First answer",
                 "conversation_history": [
                     Mock(__class__=Mock(__name__="HumanMessage"), content="First question"),
                     Mock(__class__=Mock(__name__="AIMessage"), content="First answer")
                 ]
-            }
+            })
             
             response1 = client.post("/AgentInvoke", json={
                 "question": "First question",
@@ -190,7 +221,7 @@ class TestAgentRAGServer:
         
         # Second request with same session
         with patch('AgentRAGServer.graph') as mock_graph:
-            mock_graph.invoke.return_value = {
+            mock_graph.ainvoke = AsyncMock(return_value={
                 "answer": "Second answer",
                 "conversation_history": [
                     Mock(__class__=Mock(__name__="HumanMessage"), content="First question"),
@@ -198,7 +229,7 @@ class TestAgentRAGServer:
                     Mock(__class__=Mock(__name__="HumanMessage"), content="Second question"),
                     Mock(__class__=Mock(__name__="AIMessage"), content="Second answer")
                 ]
-            }
+            })
             
             response2 = client.post("/AgentInvoke", json={
                 "question": "Second question",
@@ -211,7 +242,452 @@ class TestAgentRAGServer:
         assert response3.status_code == 200
         data = response3.json()
         assert len(data["conversation_history"]) == 4
+
+    def test_delta_response_and_history_pages(self):
+        """Test that delta responses carry only the new turn and GET /conversation pages by position"""
+        session_id = str(uuid.uuid4())
+        conversation_sessions[session_id] = [HumanMessage(content=f"Pergunta {i}") if i % 2 == 0 else
+                                             AIMessage(content=f"Resposta {i}") for i in range(6)]
+        first = conversation_sessions[session_id][0]
+
+        async def answer(state):
+            return {"answer": "Resposta nova",
+                    "conversation_history": state["conversation_history"] + [HumanMessage(content=state["question"]),
+                                                                             AIMessage(content="Resposta nova")]}
+
+        with patch('AgentRAGServer.graph') as mock_graph:
+            mock_graph.ainvoke = answer
+            data = client.post("/AgentInvoke", json={"question": "Pergunta nova", "session_id": session_id,
+                                                     "delta": True}).json()
+
+        assert data["conversation_history"] == [{"type": "HumanMessage", "content": "Pergunta nova"},
+                                                {"type": "AIMessage", "content": "Resposta nova"}]
+        assert (data["history_offset"], data["history_length"]) == (6, 8)
+        # Stored turns are reused, with their cached JSON, rather than converted again on every request
+        assert conversation_sessions[session_id][0] is first
+
+        page = client.get(f"/conversation/{session_id}", params={"since": 2, "limit": 3}).json()
+        assert [msg["content"] for msg in page["conversation_history"]] == ["Pergunta 2", "Resposta 3", "Pergunta 4"]
+        assert (page["history_offset"], page["history_length"]) == (2, 8)
+        assert client.get(f"/conversation/{session_id}", params={"since": 8}).json()["conversation_history"] == []
+        assert client.get(f"/conversation/{session_id}", params={"since": -1}).status_code == 422
+        assert client.get("/conversation/missing-session", params={"limit": -1}).status_code == 422
+        schema = client.get("/openapi.json").json()
+        assert {"history_offset", "history_length"} <= set(schema["components"]["schemas"]["ChatResponse"]["properties"])
+        assert "application/json" in schema["paths"]["/AgentInvoke"]["post"]["responses"]["200"]["content"]
     
+    @patch('AgentRAGServer.graph')
+    def test_agent_invoke_stream(self, mock_graph):
+        """Test POST /AgentInvoke/stream emits sources, tokens and a final done event"""
+        history = [
+            Mock(__class__=Mock(__name__="HumanMessage"), content="Test question"),
+            Mock(__class__=Mock(__name__="AIMessage"), content="Test answer")
+        ]
+
+        async def fake_astream(state, stream_mode):
+            yield "updates", {"update_memory": {"conversation_history": history[:1]}}
+            chunks = [Document(id="chunk-1", page_content="Chunk", metadata={"source": "Docs_md/POP.md"})]
+            yield "updates", {"retrieve": {"context": chunks}}
+            # Sources are sent once, for the chunks that reach the prompt
+            yield "updates", {"pack_context": {"context": chunks, "context_tokens_saved": 0}}
+            yield "messages", (AIMessageChunk(content="Test "), {"langgraph_node": "generate"})
+            yield "messages", (AIMessageChunk(content="answer"), {"langgraph_node": "generate"})
+            yield "updates", {"generate": {"answer": "Test answer", "conversation_history": history}}
+
+        mock_graph.astream = fake_astream
+
+        response = client.post("/AgentInvoke/stream", json={"question": "Test question"})
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = [
+            (block.split("\n")[0][len("event: "):], json.loads(block.split("\n")[1][len("data: "):]))
+            for block in response.text.strip().split("\n\n")
+        ]
+        assert [name for name, _ in events] == ["sources", "token", "token", "done"]
+        assert events[0][1] == [{"id": "chunk-1", "source": "Docs_md/POP.md"}]
+        assert "".join(data["content"] for name, data in events if name == "token") == "Test answer"
+
+        done = events[-1][1]
+        assert done["answer"] == "Test answer"
+        assert len(done["conversation_history"]) == 2
+        assert [turn.to_dict() for turn in conversation_sessions[done["session_id"]]] == done["conversation_history"] == [
+            {"type": "HumanMessage", "content": "Test question"}, {"type": "AIMessage", "content": "Test answer"}]
+
+    @pytest.mark.asyncio
+    async def test_generate_reuses_cached_answer(self):
+        """Test that a repeated standalone question over the same chunks skips the LLM"""
+        answer_cache.invalidate()
+        token_ledger.reset()
+        mock_llm = Mock()
+        mock_llm.ainvoke = AsyncMock(return_value=AIMessage(content="Cached answer"))
+        state = {
+            "question": "Como funciona o banco de horas?",
+            "context": [Document(id="chunk-1", page_content="Chunk")],
+            "answer": "",
+            "conversation_history": [HumanMessage(content="Como funciona o banco de horas?")],
+            "session_id": "session",
+            "question_embedding": [1.0, 0.0, 0.0]
+        }
+
+        with patch('AgentRAGServer.llm', mock_llm):
+            first = await generate(state)
+            second = await generate(state)
+            follow_up = await generate({**state, "conversation_history": [
+                HumanMessage(content="Oi"), AIMessage(content="Olá"), HumanMessage(content=state["question"])
+            ]})
+
+        assert first["answer"] == second["answer"] == "Cached answer"
+        assert len(second["conversation_history"]) == 2
+        # The follow-up turn has a different history scope, so it calls the LLM again
+        assert mock_llm.ainvoke.await_count == 2
+        assert follow_up["answer"] == "Cached answer"
+
+        response = client.get("/cache/stats")
+        assert response.status_code == 200
+        assert response.json()["hits"] == 1
+
+    @pytest.mark.asyncio
+    async def test_generate_records_token_usage(self):
+        """Test that generate records per-stage counts and prefers the model's reported usage"""
+        answer_cache.invalidate()
+        token_ledger.reset()
+        mock_llm = Mock()
+        mock_llm.ainvoke = AsyncMock(return_value=AIMessage(
+            content="Resposta",
+            usage_metadata={"input_tokens": 120, "output_tokens": 7, "total_tokens": 127}
+        ))
+        state = {
+            "question": "Quantos dias de férias?",
+            "context": [Document(id="chunk-2", page_content="Trinta dias corridos de férias por ano.")],
+            "answer": "",
+            "conversation_history": [HumanMessage(content="Oi"), AIMessage(content="Olá"), HumanMessage(content="Quantos dias de férias?")],
+            "session_id": "tokens-session",
+            "question_embedding": [0.0, 1.0, 0.0]
+        }
+
+        with patch('AgentRAGServer.llm', mock_llm):
+            await generate(state)
+
+        response = client.get("/metrics/tokens")
+        assert response.status_code == 200
+        metrics = response.json()
+        assert metrics["requests"] == 1
+        record = metrics["recent"][0]
+        assert record["session_id"] == "tokens-session"
+        assert record["source"] == "provider"
+        assert (record["input_tokens"], record["output_tokens"]) == (120, 7)
+        assert record["history"] > 0 and record["context"] > 0 and record["question"] > 0
+        assert metrics["totals"]["total_tokens"] == 127
+
+    @pytest.mark.asyncio
+    async def test_graph_runs_generate_once_with_context_nodes(self):
+        """Test that generate waits for retrieval and history instead of running once per branch"""
+        from benchmarks.fakes import fake_prompt
+        mock_llm = Mock()
+        mock_llm.ainvoke = AsyncMock(return_value=AIMessage(content="Resposta"))
+        mock_store = Mock()
+        mock_store.similarity_search_by_vector = Mock(return_value=[
+            Document(id="c1", page_content="Texto do procedimento", metadata={"source": "pop.md"})
+        ])
+        mock_embeddings = Mock()
+        mock_embeddings.aembed_query = AsyncMock(return_value=[1.0, 0.0])
+
+        with patch.multiple('AgentRAGServer', llm=mock_llm, summary_llm=mock_llm, vector_store=mock_store,
+                            embeddings=mock_embeddings, prompt=fake_prompt(), answer_cache=None,
+                            lexical_index=Mock(get=Mock(return_value=None)),
+                            reranker=Reranker(token_budget=800)):
+            result = await AgentRAGServer.build_graph().ainvoke({
+                "question": "Como tirar férias?", "context": [], "answer": "",
+                "conversation_history": [], "session_id": "graph-session",
+            })
+
+        assert result["answer"] == "Resposta"
+        assert mock_llm.ainvoke.await_count == 1
+        assert len(result["conversation_history"]) == 2
+
+    @pytest.mark.asyncio
+    async def test_retrieve_fuses_bm25_hits(self):
+        """Test that a chunk found only by BM25 is fused into the vector results"""
+        vector_docs = [Document(id=f"v{i}", page_content=f"Vetor {i}", metadata={"source": f"v{i}.md"}) for i in range(3)]
+        mock_store = Mock()
+        mock_store.similarity_search_by_vector = Mock(return_value=vector_docs)
+        mock_store.get_by_ids = Mock(return_value=[Document(id="code", page_content="POP-0137", metadata={"source": "pop.md"})])
+        mock_embeddings = Mock()
+        mock_embeddings.aembed_query = AsyncMock(return_value=[1.0, 0.0])
+        mock_index = Mock()
+        mock_index.search = Mock(return_value=[("code", 9.0), ("v2", 1.0)])
+
+        with patch('AgentRAGServer.vector_store', mock_store), \
+             patch('AgentRAGServer.embeddings', mock_embeddings), \
+             patch('AgentRAGServer.lexical_index', Mock(get=Mock(return_value=mock_index))), \
+             patch('AgentRAGServer.context_packer', None):
+            result = await retrieve({"question": "O que diz o POP-0137?"})
+
+        assert [doc.id for doc in result["context"]] == ["v2", "v0", "code"]
+        mock_store.get_by_ids.assert_called_once_with(["code"])
+        assert result["question_embedding"] == [1.0, 0.0]
+
+    @pytest.mark.asyncio
+    async def test_retrieve_searches_only_routed_partitions(self, tmp_path):
+        """Test that the router limits the vector search and the BM25 hits to the question's partitions"""
+        from partitions import PartitionedVectorStore, QueryRouter, write_centroids
+        path = str(tmp_path / "partition_centroids.json")
+        write_centroids({"pop": {"centroid": [1.0, 0.0], "chunks": 5}, "site": {"centroid": [0.0, 1.0], "chunks": 5}}, path)
+        pop_doc = Document(id="p1", page_content="Férias: 30 dias", metadata={"source": "Docs_md/ferias.md", "partition": "pop"})
+        site_doc = Document(id="s1", page_content="Férias no site", metadata={"source": "ScrapedData/site.md", "partition": "site"})
+        mock_store = Mock()
+        mock_store.similarity_search_by_vector = Mock(return_value=[pop_doc])
+        mock_store.get_by_ids = Mock(return_value=[site_doc])
+        mock_embeddings = Mock()
+        mock_embeddings.aembed_query = AsyncMock(return_value=[0.9, 0.1])
+        mock_index = Mock(search=Mock(return_value=[("s1", 9.0)]))
+
+        with patch.multiple('AgentRAGServer', vector_store=mock_store, embeddings=mock_embeddings,
+                            lexical_index=Mock(get=Mock(return_value=mock_index)), context_packer=None,
+                            partition_router=QueryRouter(path, margin=0.1)):
+            result = await retrieve({"question": "Quantos dias de férias?"})
+            assert [doc.id for doc in result["context"]] == ["p1"]
+            assert mock_store.similarity_search_by_vector.call_args.kwargs["filter"] == {"partition": "pop"}
+
+            # With one collection per partition, a question near both searches both and merges the hits
+            stores = {name: Mock(similarity_search_by_vector_with_relevance_scores=Mock(return_value=[(doc, distance)]))
+                      for name, doc, distance in (("pop", pop_doc, 0.4), ("site", site_doc, 0.2))}
+            with patch('AgentRAGServer.vector_store', PartitionedVectorStore(stores)), \
+                 patch('AgentRAGServer.lexical_index', Mock(get=Mock(return_value=None))):
+                mock_embeddings.aembed_query = AsyncMock(return_value=[1.0, 1.0])
+                result = await retrieve({"question": "Férias?"})
+            assert [doc.id for doc in result["context"]] == ["s1", "p1"]
+            assert client.get("/metrics/routing").json()["searches"] == {"pop": 2, "site": 1}
+            assert 'agentrag_partition_searches_total{partition="pop"} 2' in client.get("/metrics").text
+
+    @pytest.mark.asyncio
+    async def test_rerank_node_and_metrics(self):
+        """Test that the rerank node trims the over-fetched chunks and reports its latency"""
+        assert client.get("/metrics/rerank").json() == {"enabled": False}
+        candidates = [Document(id=f"c{i}", page_content=f"Trecho {i} " * 50) for i in range(30)]
+
+        with patch('AgentRAGServer.reranker', Reranker(token_budget=250, diversity=0.0)):
+            result = await rerank({"question": "Trecho", "context": candidates})
+            metrics = client.get("/metrics/rerank").json()
+
+        assert 1 <= len(result["context"]) < 30
+        assert result["context"][0].id == "c0"
+        assert metrics["enabled"] is True
+        assert metrics["method"] == "mmr"
+        assert (metrics["requests"], metrics["candidates"]) == (1, 30)
+        assert metrics["average_ms"] > 0
+
+    @pytest.mark.asyncio
+    async def test_pack_context_reports_saved_tokens(self):
+        """Test that overlapping chunks reach the prompt once and the saved tokens show up in /metrics/tokens"""
+        answer_cache.invalidate()
+        token_ledger.reset()
+        text = " ".join(f"Etapa {i} do reembolso de despesas." for i in range(60))
+        chunks = [
+            Document(id="r0", page_content=text[:1000], metadata={"source": "Docs_md/reembolso.md"}),
+            Document(id="r1", page_content=text[800:1800], metadata={"source": "Docs_md/reembolso.md"}),
+        ]
+        mock_llm = Mock()
+        mock_llm.ainvoke = AsyncMock(return_value=AIMessage(content="Resposta"))
+
+        packed = await pack_context({"question": "Como pedir reembolso?", "context": chunks})
+        with patch('AgentRAGServer.llm', mock_llm):
+            await generate({
+                "question": "Como pedir reembolso?",
+                "context": packed["context"],
+                "answer": "",
+                "conversation_history": [HumanMessage(content="Como pedir reembolso?")],
+                "session_id": "packing-session",
+                "question_embedding": [],
+                "context_tokens_saved": packed["context_tokens_saved"],
+            })
+
+        assert [doc.page_content for doc in packed["context"]] == [text[:1800]]
+        assert packed["context_tokens_saved"] > 0
+        metrics = client.get("/metrics/tokens").json()
+        assert metrics["recent"][0]["context_saved"] == packed["context_tokens_saved"]
+        assert metrics["totals"]["context_saved"] == packed["context_tokens_saved"]
+
+    @pytest.mark.asyncio
+    async def test_identical_stateless_questions_share_one_run(self):
+        """Test that concurrent identical questions without history run the graph once and all get the answer"""
+        async def slow_answer(state):
+            await asyncio.sleep(0.05)
+            return {"answer": "Resposta única", "conversation_history": []}
+
+        with patch('AgentRAGServer.graph') as mock_graph, \
+             patch('AgentRAGServer.coalescer', AgentRAGServer.SingleFlight()):
+            mock_graph.ainvoke = AsyncMock(side_effect=slow_answer)
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as async_client:
+                questions = ["Como tirar férias?", "como tirar  férias", "Como tirar férias?", "Outra pergunta?"]
+                responses = await asyncio.gather(*(
+                    async_client.post("/AgentInvoke", json={"question": question}) for question in questions
+                ))
+                metrics = (await async_client.get("/metrics/coalescing")).json()
+
+        assert mock_graph.ainvoke.await_count == 2
+        data = [response.json() for response in responses]
+        assert all(item["answer"] == "Resposta única" for item in data)
+        assert len({item["session_id"] for item in data}) == 4
+        assert data[1]["conversation_history"][0]["content"] == "como tirar  férias"
+        assert metrics["followers"] == 2
+        assert metrics["upstream_calls_saved"]["llm_calls"] == 2
+
+    def test_batch_endpoint(self):
+        """Test POST /AgentInvoke/batch embeds once, bounds model calls and keeps input order with per-item errors"""
+        from benchmarks.fakes import fake_prompt
+        running = peak = 0
+
+        async def answer(messages):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.02)
+            running -= 1
+            text = messages.messages[0].content
+            if "quebrada" in text:
+                raise RuntimeError("model unavailable")
+            return AIMessage(content="Resposta " + text.split("Question: ")[1].split(" \n")[0])
+
+        mock_llm = Mock()
+        mock_llm.ainvoke = AsyncMock(side_effect=answer)
+        mock_embeddings = Mock()
+        mock_embeddings.aembed_documents = AsyncMock(side_effect=lambda texts: [[float(i), 1.0] for i in range(len(texts))])
+        mock_store = Mock()
+        mock_store.similarity_search_by_vector = Mock(return_value=[
+            Document(id="c1", page_content="Texto", metadata={"source": "pop.md"})
+        ])
+        questions = [f"Pergunta {i}" for i in range(6)] + ["Pergunta quebrada"]
+
+        with patch.multiple('AgentRAGServer', llm=mock_llm, summary_llm=mock_llm, vector_store=mock_store,
+                            embeddings=mock_embeddings, prompt=fake_prompt(), answer_cache=None,
+                            lexical_index=Mock(get=Mock(return_value=None))), \
+             patch('AgentRAGServer.settings.BATCH_CONCURRENCY', 2):
+            response = client.post("/AgentInvoke/batch", json={"questions": questions})
+            with patch('AgentRAGServer.settings.BATCH_MAX_QUESTIONS', 3):
+                too_many = client.post("/AgentInvoke/batch", json={"questions": questions})
+
+        assert response.status_code == 200
+        results = response.json()["results"]
+        assert [item["question"] for item in results] == questions
+        assert [item["answer"] for item in results[:6]] == [f"Resposta Pergunta {i}" for i in range(6)]
+        assert results[0]["sources"] == [{"id": "c1", "source": "pop.md"}]
+        assert results[6]["answer"] is None and "model unavailable" in results[6]["error"]
+        mock_embeddings.aembed_documents.assert_awaited_once_with(questions)
+        assert peak == 2
+        assert too_many.status_code == 413
+
+    def test_batch_endpoint_searches_mmap_index_in_one_pass(self, tmp_path):
+        """Test that with the memory-mapped vector index a batch scores all its questions in one search"""
+        from benchmarks.fakes import fake_prompt
+        from vector_index import MmapVectorIndex, export_collection
+
+        collection = Mock(count=Mock(return_value=2), get=Mock(return_value={
+            "ids": ["ferias", "senha"], "embeddings": [[1.0, 0.0], [0.0, 1.0]],
+            "documents": ["Férias: 30 dias", "Senha: portal"],
+            "metadatas": [{"source": "ferias.md"}, {"source": "senha.md"}],
+        }))
+        collection.name = "dgt_rag"
+        export_collection(collection, str(tmp_path))
+        index = MmapVectorIndex(str(tmp_path))
+        index.similarity_search_by_vectors = Mock(wraps=index.similarity_search_by_vectors)
+        index.similarity_search_by_vector = Mock(side_effect=AssertionError("one search per question"))
+        mock_llm = Mock()
+        mock_llm.ainvoke = AsyncMock(return_value=AIMessage(content="Resposta"))
+        mock_embeddings = Mock()
+        mock_embeddings.aembed_documents = AsyncMock(return_value=[[0.9, 0.1], [0.1, 0.9]])
+
+        with patch.multiple('AgentRAGServer', llm=mock_llm, summary_llm=mock_llm, vector_store=index,
+                            embeddings=mock_embeddings, prompt=fake_prompt(), answer_cache=None,
+                            lexical_index=Mock(get=Mock(return_value=None))):
+            response = client.post("/AgentInvoke/batch", json={"questions": ["Férias?", "Senha?"]})
+
+        results = response.json()["results"]
+        assert [item["sources"][0]["id"] for item in results] == ["ferias", "senha"]
+        index.similarity_search_by_vectors.assert_called_once()
+
+    def test_ready_endpoint(self):
+        """Test GET /ready answers 503 before start-up and reports the cold start after it"""
+        with patch.dict('AgentRAGServer.startup_state', clear=True):
+            assert client.get("/ready").status_code == 503
+
+            backends = {name: Mock(spec=[]) for name in ("llm", "summary_llm", "embeddings", "vector_store", "prompt")}
+            with patch.multiple('AgentRAGServer', **backends), TestClient(app) as started_client:
+                response = started_client.get("/ready")
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["ready"] is True
+        assert data["cold_start_seconds"] > 0
+        assert set(data["steps"]) == {"backends", "vector_index", "bm25_index", "tokenizer"}
+
+    def test_import_is_offline_and_lazy(self):
+        """Test importing the server pulls no prompt from the hub and opens no vector store"""
+        script = (
+            "import sys; from unittest.mock import patch\n"
+            "with patch('langchain.hub.pull', side_effect=AssertionError('hub')), "
+            "patch('langchain_chroma.Chroma', side_effect=AssertionError('chroma')):\n"
+            "    import AgentRAGServer\n"
+            "assert AgentRAGServer.llm is None and AgentRAGServer.vector_store is None\n"
+            "assert AgentRAGServer.backends_missing()\n"
+        )
+        result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, timeout=120)
+        assert result.returncode == 0, result.stderr
+
+    def test_gunicorn_master_preloads_shared_state_only(self):
+        """Test the pre-fork hook loads the prompt and freezes the heap without building any client"""
+        script = (
+            "import gc, runpy; from unittest.mock import Mock, patch\n"
+            "config = runpy.run_path('gunicorn.conf.py')\n"
+            "assert not gc.isenabled() and config['preload_app']\n"
+            "server = Mock(num_workers=2)\n"
+            "with patch('langchain.chat_models.init_chat_model', side_effect=AssertionError('llm')), "
+            "patch('langchain_chroma.Chroma', side_effect=AssertionError('chroma')), "
+            "patch('tiktoken.get_encoding', return_value=Mock()):\n"
+            "    config['when_ready'](server)\n"
+            "import AgentRAGServer\n"
+            "assert AgentRAGServer.prompt is not None\n"
+            "assert AgentRAGServer.llm is None and AgentRAGServer.embeddings is None and AgentRAGServer.vector_store is None\n"
+            "assert gc.isenabled() and gc.get_freeze_count() > 0\n"
+            "server.log.warning.assert_called_once()\n"
+            "# A step that fails is reported as a degraded start, and the workers retry it\n"
+            "import token_accounting; token_accounting.load_encoding.cache_clear()\n"
+            "server = Mock(num_workers=1)\n"
+            "with patch('tiktoken.get_encoding', side_effect=OSError('no BPE file')):\n"
+            "    config['when_ready'](server)\n"
+            "assert 'Degraded start' in server.log.warning.call_args.args[0]\n"
+            "assert server.log.warning.call_args.args[1] == 'tokenizer'\n"
+        )
+        result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, timeout=120,
+                                env={**os.environ, "SESSION_STORE": "memory", "VECTOR_BACKEND": "chroma"})
+        assert result.returncode == 0, result.stderr
+
+    @pytest.mark.asyncio
+    async def test_prometheus_metrics(self):
+        """Test GET /metrics exposes node and HTTP latency histograms and the token/session series"""
+        conversation_sessions["metrics-session"] = []
+        node = AgentRAGServer.instrument("update_memory", AgentRAGServer.update_memory)
+        before = AgentRAGServer.NODE_SECONDS.count(node="update_memory")
+        await node({"question": "Oi", "conversation_history": []})
+        assert AgentRAGServer.NODE_SECONDS.count(node="update_memory") == before + 1
+
+        client.get("/conversation/metrics-session")
+        with patch.object(conversation_sessions, "stats", wraps=conversation_sessions.stats) as session_stats:
+            response = client.get("/metrics")
+        # The session gauges and the eviction counter share one store query per scrape
+        assert session_stats.call_count == 1
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+        text = response.text
+        assert 'agentrag_node_duration_seconds_count{node="update_memory"}' in text
+        assert 'agentrag_http_request_duration_seconds_count{method="GET",route="/conversation/{session_id}",status="200"}' in text
+        assert "metrics-session" not in text
+        assert "# TYPE agentrag_tokens_total counter" in text
+        assert "agentrag_sessions 1" in text
+
     def test_chat_request_model_validation(self):
         """Test ChatRequest Pydantic model validation"""
         # Valid request
@@ -282,6 +758,35 @@ class TestAgentRAGServerIntegration:
         assert all(status == 200 for status in results)
         assert len(results) == 5
 
+    @pytest.mark.asyncio
+    async def test_agent_invoke_does_not_block_event_loop(self):
+        """Test that concurrent /AgentInvoke calls overlap instead of queuing"""
+        async def slow_graph(state):
+            await asyncio.sleep(0.2)
+            return {
+                "answer": "Test answer",
+                "conversation_history": [
+                    Mock(__class__=Mock(__name__="HumanMessage"), content=state["question"]),
+                    Mock(__class__=Mock(__name__="AIMessage"), content="Test answer")
+                ]
+            }
+
+        with patch('AgentRAGServer.graph') as mock_graph:
+            mock_graph.ainvoke = AsyncMock(side_effect=slow_graph)
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as async_client:
+                started = time.perf_counter()
+                responses = await asyncio.gather(*(
+                    async_client.post("/AgentInvoke", json={"question": f"Question {i}"})
+                    for i in range(5)
+                ))
+                elapsed = time.perf_counter() - started
+
+        assert all(response.status_code == 200 for response in responses)
+        assert mock_graph.ainvoke.await_count == 5
+        # Five 0.2s graph runs should overlap, not add up to a full second
+        assert elapsed < 0.6
+
 # Additional edge case tests
 class TestAgentRAGServerEdgeCases:
     """Edge case tests for AgentRAGServer"""
@@ -303,13 +808,13 @@ class TestAgentRAGServerEdgeCases:
         test_data = {"question": long_question}
         
         with patch('AgentRAGServer.graph') as mock_graph:
-            mock_graph.invoke.return_value = {
+            mock_graph.ainvoke = AsyncMock(return_value={
                 "answer": "Test answer",
                 "conversation_history": [
                     Mock(__class__=Mock(__name__="HumanMessage"), content=long_question),
                     Mock(__class__=Mock(__name__="AIMessage"), content="Test answer")
                 ]
-            }
+            })
             
             response = client.post("/AgentInvoke", json=test_data)
             assert response.status_code == 200
@@ -320,13 +825,13 @@ class TestAgentRAGServerEdgeCases:
         test_data = {"question": special_question}
         
         with patch('AgentRAGServer.graph') as mock_graph:
-            mock_graph.invoke.return_value = {
+            mock_graph.ainvoke = AsyncMock(return_value={
                 "answer": "Test answer",
                 "conversation_history": [
                     Mock(__class__=Mock(__name__="HumanMessage"), content=special_question),
                     Mock(__class__=Mock(__name__="AIMessage"), content="Test answer")
                 ]
-            }
+            })
             
             response = client.post("/AgentInvoke", json=test_data)
             assert response.status_code == 200
@@ -339,13 +844,13 @@ class TestAgentRAGServerEdgeCases:
         }
         
         with patch('AgentRAGServer.graph') as mock_graph:
-            mock_graph.invoke.return_value = {
+            mock_graph.ainvoke = AsyncMock(return_value={
                 "answer": "Test answer",
                 "conversation_history": [
                     Mock(__class__=Mock(__name__="HumanMessage"), content="Test question"),
                     Mock(__class__=Mock(__name__="AIMessage"), content="Test answer")
                 ]
-            }
+            })
             
             response = client.post("/AgentInvoke", json=test_data)
             assert response.status_code == 200
@@ -390,13 +895,13 @@ class TestAgentRAGServerEdgeCases:
         unicode_session_id = "sëssion-ïd-🚀"
         
         with patch('AgentRAGServer.graph') as mock_graph:
-            mock_graph.invoke.return_value = {
+            mock_graph.ainvoke = AsyncMock(return_value={
                 "answer": "Test answer",
                 "conversation_history": [
                     Mock(__class__=Mock(__name__="HumanMessage"), content="Test question"),
                     Mock(__class__=Mock(__name__="AIMessage"), content="Test answer")
                 ]
-            }
+            })
             
             test_data = {
                 "question": "Test question",
@@ -0,0 +1,69 @@
+import pytest
+from unittest.mock import Mock
+from answer_cache import SemanticAnswerCache, history_scope, STANDALONE_SCOPE
+from conftest import FakeClock
+
+
+class TestSemanticAnswerCache:
+    """Test suite for the semantic answer cache"""
+
+    def setup_method(self):
+        self.clock = FakeClock()
+        self.cache = SemanticAnswerCache(similarity_threshold=0.9, ttl_seconds=60, max_entries=2, clock=self.clock)
+
+    def test_hit_for_similar_question_over_same_chunks(self):
+        """Test that a near-identical embedding with the same chunk set hits"""
+        self.cache.store(STANDALONE_SCOPE, [1.0, 0.0], ["a", "b"], "Answer")
+
+        assert self.cache.lookup(STANDALONE_SCOPE, [0.99, 0.05], ["b", "a"]) == "Answer"
+        assert self.cache.stats()["hits"] == 1
+
+    def test_miss_below_threshold_or_other_chunks(self):
+        """Test that dissimilar questions and different chunk sets miss"""
+        self.cache.store(STANDALONE_SCOPE, [1.0, 0.0], ["a"], "Answer")
+
+        assert self.cache.lookup(STANDALONE_SCOPE, [0.0, 1.0], ["a"]) is None
+        assert self.cache.lookup(STANDALONE_SCOPE, [1.0, 0.0], ["a", "b"]) is None
+        assert self.cache.stats()["misses"] == 2
+
+    def test_follow_up_scope_is_isolated(self):
+        """Test that a follow-up turn never receives a standalone answer"""
+        history = [
+            Mock(__class__=Mock(__name__="HumanMessage"), content="Previous question"),
+            Mock(__class__=Mock(__name__="AIMessage"), content="Previous answer")
+        ]
+        self.cache.store(STANDALONE_SCOPE, [1.0, 0.0], ["a"], "Standalone answer")
+
+        assert history_scope([]) == STANDALONE_SCOPE
+        assert self.cache.lookup(history_scope(history), [1.0, 0.0], ["a"]) is None
+
+    def test_ttl_expiry(self):
+        """Test that entries expire after the TTL"""
+        self.cache.store(STANDALONE_SCOPE, [1.0, 0.0], ["a"], "Answer")
+        self.clock.now = 61
+
+        assert self.cache.lookup(STANDALONE_SCOPE, [1.0, 0.0], ["a"]) is None
+        assert self.cache.stats()["expirations"] == 1
+        assert len(self.cache) == 0
+
+    def test_lru_eviction(self):
+        """Test that the least recently used entry is evicted at the size cap"""
+        self.cache.store(STANDALONE_SCOPE, [1.0, 0.0], ["a"], "A")
+        self.cache.store(STANDALONE_SCOPE, [1.0, 0.0], ["b"], "B")
+        self.cache.lookup(STANDALONE_SCOPE, [1.0, 0.0], ["a"])
+        self.cache.store(STANDALONE_SCOPE, [1.0, 0.0], ["c"], "C")
+
+        assert self.cache.lookup(STANDALONE_SCOPE, [1.0, 0.0], ["a"]) == "A"
+        assert self.cache.lookup(STANDALONE_SCOPE, [1.0, 0.0], ["b"]) is None
+        assert self.cache.stats()["evictions"] == 1
+
+    def test_index_change_invalidates(self):
+        """Test that a new index version drops every entry"""
+        self.cache.store(STANDALONE_SCOPE, [1.0, 0.0], ["a"], "Answer", index_version=1)
+
+        assert self.cache.lookup(STANDALONE_SCOPE, [1.0, 0.0], ["a"], index_version=2) is None
+        assert self.cache.stats()["invalidations"] == 1
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,78 @@
+import os
+import pytest
+from langchain_core.documents import Document
+from bm25 import BM25Index, PersistedBM25, fuse, reciprocal_rank_fusion, tokenize
+
+
+class TestBM25:
+    """Test suite for the BM25 index used by hybrid retrieval"""
+
+    def make_index(self):
+        index = BM25Index()
+        index.add(
+            ["a", "b", "c"],
+            [
+                "POP-0012 Solicitação de férias no portal",
+                "Formulário FR-031 de reembolso de despesas de viagem",
+                "Procedimento de férias coletivas aprovado pelo gestor",
+            ],
+        )
+        return index
+
+    def test_tokenizer_folds_accents_and_keeps_codes(self):
+        """Test that accents are folded, stopwords dropped and codes kept whole and in parts"""
+        assert tokenize("Solicitação de Férias POP-0012 seção 7.3") == [
+            "solicitacao", "ferias", "pop-0012", "pop", "0012", "secao", "7.3", "7", "3"
+        ]
+
+    def test_exact_code_ranks_first(self):
+        """Test that a query with a code finds its chunk, accents or not"""
+        index = self.make_index()
+
+        assert index.search("qual o procedimento do pop-0012?", k=1)[0][0] == "a"
+        assert index.search("formulario fr-031", k=1)[0][0] == "b"
+        assert [doc_id for doc_id, _ in index.search("FÉRIAS")] in (["a", "c"], ["c", "a"])
+        assert index.search("inexistente") == []
+
+    def test_remove_and_persist(self, tmp_path):
+        """Test that removed chunks stop matching and the index survives a save/load round trip"""
+        index = self.make_index()
+        index.remove(["a"])
+        path = str(tmp_path / "bm25_index.json")
+        index.save(path)
+
+        loaded = BM25Index.load(path)
+
+        assert len(loaded) == 2
+        assert "pop-0012" not in loaded.postings
+        assert loaded.search("ferias") == index.search("ferias")
+
+        handle = PersistedBM25(path)
+        assert handle.get().search("fr-031")[0][0] == "b"
+        loaded.add(["d"], ["Banco de horas"])
+        loaded.save(path)
+        os.utime(path, ns=(0, 1))  # Make sure the reload sees a new mtime
+        assert handle.get().search("banco de horas")[0][0] == "d"
+        assert PersistedBM25(str(tmp_path / "missing.json")).get() is None
+
+    def test_fusion_merges_both_rankings(self):
+        """Test reciprocal rank fusion and loading BM25-only hits from the vector store"""
+        assert reciprocal_rank_fusion([["x", "y", "z"], ["z", "w"]]) == ["z", "x", "y", "w"]
+
+        vector_docs = [Document(id="x", page_content="x"), Document(id="y", page_content="y")]
+        fetched = []
+
+        def fetch(ids):
+            fetched.extend(ids)
+            return [Document(id=doc_id, page_content=doc_id) for doc_id in ids]
+
+        fused = fuse(vector_docs, ["z", "y"], fetch, k=2)
+
+        assert [doc.id for doc in fused] == ["y", "x"]
+        assert fetched == []
+        assert [doc.id for doc in fuse(vector_docs, ["z"], fetch, k=3)] == ["x", "z", "y"]
+        assert fetched == ["z"]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
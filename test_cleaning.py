@@ -0,0 +1,69 @@
+import json
+import random
+import pytest
+from benchmarks.bench_cleaning import make_document, reference_clean
+from cleaning import clean_files, clean_text, load_rules, signature_block, table_of_contents
+
+PIECES = [
+    "\n", "\n", "\n", "\n\n", "  ", "texto", "....", "...", ".", "1.2", "12", "SUMÁRIO", "PADRÃO",
+    "PADRÃO\n\nElaborador", "Elaborador", "DGT TECNOLOGIA LTDA", "PROCEDIMENTO OPERACIONAL PADRÃO",
+    "### Notes:\n", "https://dgt.com.br/a?b=1", "R. Evaristo José Fernandes, 121,", "\t", "é",
+]
+
+
+def random_text(rng, size):
+    return "".join(rng.choice(PIECES) for _ in range(size))
+
+
+class TestCleaning:
+    """Test suite for the compiled cleaning rule set"""
+
+    def test_matches_original_function_on_pop_documents(self):
+        """Test that the rule set cleans synthetic POP documents exactly like the original re.sub chain"""
+        for seed in range(3):
+            document = make_document(seed, sections=12, width=8)
+            assert clean_text(document) == reference_clean(document)
+
+    def test_matches_original_function_on_random_text(self):
+        """Test the linear-time handlers against the original regexes on adversarial input"""
+        rng = random.Random(7)
+        for _ in range(300):
+            text = random_text(rng, rng.randint(0, 120))
+            assert clean_text(text) == reference_clean(text), repr(text)
+
+    def test_handlers_count_substitutions(self):
+        """Test that handlers report how many matches they removed"""
+        block = "\n".join(f"linha {n}" for n in range(12)) + "\nPOP PADRÃO\n\nElaborador: A\n1\n2\n3\n4\n5\n6"
+        text, count = signature_block("antes\n" + block + "\ndepois")
+        assert (text, count) == ("antes\n\ndepois", 1)
+
+        text, count = table_of_contents("SUMÁRIO\n1. Férias ..... 03\n1.1\nCorpo")
+        assert (text, count) == ("\n\nCorpo", 2)
+
+    def test_rules_file_and_profiler(self, tmp_path):
+        """Test loading rules from JSON, cleaning files in place and profiling each rule"""
+        rules_path = tmp_path / "rules.json"
+        rules_path.write_text(json.dumps([
+            {"name": "drafts", "pattern": r"^RASCUNHO.*$", "flags": ["MULTILINE"]},
+            {"name": "strip", "handler": "strip_lines"},
+        ]), encoding="utf-8")
+        document = tmp_path / "pop.md"
+        document.write_text("RASCUNHO v2\n  Corpo  \nRASCUNHO", encoding="utf-8")
+
+        profiler = clean_files([str(document)], rules_path=str(rules_path), profile=True)
+
+        assert document.read_text(encoding="utf-8") == "\nCorpo\n"
+        assert profiler.rules["drafts"].substitutions == 2
+        assert "drafts" in profiler.report()
+        assert len(load_rules(str(rules_path))) == 2
+
+    def test_unknown_handler_is_rejected(self, tmp_path):
+        """Test that a rules file naming a missing handler fails before any file is touched"""
+        rules_path = tmp_path / "bad.json"
+        rules_path.write_text(json.dumps([{"name": "x", "handler": "nope"}]), encoding="utf-8")
+        with pytest.raises(ValueError):
+            load_rules(str(rules_path))
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,94 @@
+import pytest
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from context_packing import ContextPacker, merge_texts
+
+TEXT = " ".join(f"Passo {i}: o colaborador registra a etapa {i} no portal e aguarda o gestor." for i in range(60))
+
+
+def split(text=TEXT, source="Docs_md/POP-0001.md", start_index=True):
+    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200, add_start_index=start_index)
+    chunks = splitter.split_documents([Document(page_content=text, metadata={"source": source})])
+    for index, chunk in enumerate(chunks):
+        chunk.id = f"{source}#{index}"
+    return chunks
+
+
+def words(text, encoding_name=None):
+    return len(text.split())
+
+
+class TestContextPacker:
+    """Test suite for token-budget context packing"""
+
+    @pytest.fixture(autouse=True)
+    def word_tokens(self, monkeypatch):
+        monkeypatch.setattr("context_packing.count_tokens", lambda text, encoding_name: words(text))
+
+    def test_overlapping_chunks_merge_back_into_the_source_text(self):
+        """Test that overlapping neighbours retrieved out of order become one block without repeated text"""
+        chunks = split(start_index=False)
+        packed = ContextPacker(token_budget=10_000).pack([chunks[2], chunks[0], chunks[1]])
+
+        assert len(packed.documents) == 1
+        block = packed.documents[0]
+        assert block.page_content == TEXT[:TEXT.index(chunks[2].page_content) + len(chunks[2].page_content)]
+        # The block is the most relevant chunk grown to its neighbours: its ID, metadata and the IDs of all three
+        assert block.id == chunks[2].id
+        assert block.metadata["source"] == chunks[2].metadata["source"]
+        assert sorted(block.metadata["chunk_ids"]) == [chunk.id for chunk in chunks[:3]]
+        assert packed.chunks == 3
+        assert packed.tokens_saved == sum(words(chunk.page_content) for chunk in chunks[:3]) - words(block.page_content) > 0
+
+    def test_sources_are_kept_apart_and_contained_chunks_are_free(self):
+        """Test that other files get their own block and a chunk already in a block costs nothing"""
+        chunks = split()
+        other = Document(id="other", page_content="Outro procedimento", metadata={"source": "Docs_md/POP-0002.md"})
+        inside = Document(id="inside", page_content=chunks[0].page_content[:300], metadata=chunks[0].metadata)
+
+        packed = ContextPacker(token_budget=words(chunks[0].page_content) + 2).pack([chunks[0], other, inside])
+
+        assert [doc.metadata["source"] for doc in packed.documents] == ["Docs_md/POP-0001.md", "Docs_md/POP-0002.md"]
+        assert packed.documents[0].page_content == chunks[0].page_content
+        assert packed.chunks == 3
+        assert packed.tokens_saved == words(inside.page_content)
+
+    def test_adjacent_chunks_merge_by_start_index(self):
+        """Test that chunks without shared text but next to each other in the file are joined"""
+        first = Document(id="a", page_content="Primeira parte do texto", metadata={"source": "s", "start_index": 0})
+        second = Document(id="b", page_content="segunda parte", metadata={"source": "s", "partition": "pop", "start_index": 24})
+        far = Document(id="c", page_content="bem mais adiante", metadata={"source": "s", "start_index": 500})
+
+        packed = ContextPacker().pack([second, far, first])
+
+        assert [doc.page_content for doc in packed.documents] == [
+            "Primeira parte do texto\nsegunda parte", "bem mais adiante"
+        ]
+        # The block keeps the partition tags of its best chunk and starts where the file's first chunk does
+        assert packed.documents[0].id == "b"
+        assert packed.documents[0].metadata == {"source": "s", "partition": "pop", "start_index": 0, "chunk_ids": ["b", "a"]}
+        assert merge_texts("abc", "xyz", min_overlap=2) is None
+
+    def test_budget_is_filled_in_relevance_order(self):
+        """Test that chunks past the budget are skipped, smaller later ones still fit and the first is always kept"""
+        docs = [
+            Document(id=str(i), page_content=text, metadata={"source": str(i)})
+            for i, text in enumerate(["um dois tres quatro", "cinco seis sete", "oito", "nove dez"])
+        ]
+
+        assert [doc.id for doc in ContextPacker(token_budget=2).pack(docs).documents] == ["0"]
+        assert [doc.id for doc in ContextPacker(token_budget=7).pack(docs).documents] == ["0", "1"]
+        assert [doc.id for doc in ContextPacker(token_budget=6).pack(docs).documents] == ["0", "2"]
+
+    def test_bridging_chunk_joins_two_blocks(self):
+        """Test that a chunk overlapping two blocks of the same file folds them into one"""
+        chunks = split()
+        packed = ContextPacker(token_budget=10_000).pack([chunks[0], chunks[2], chunks[1]])
+
+        assert len(packed.documents) == 1
+        assert TEXT.startswith(packed.documents[0].page_content)
+        assert len(packed.documents[0].metadata["chunk_ids"]) == 3
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
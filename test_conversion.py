@@ -0,0 +1,48 @@
+import os
+import time
+import pytest
+from conftest import FakeConverter
+from conversion import CONVERTED, FAILED, SKIPPED, TIMED_OUT, ConversionPool, convert_files
+
+
+def make_files(folder, names):
+    paths = []
+    for name in names:
+        path = os.path.join(folder, name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(f"conteúdo de {name}")
+        paths.append(path)
+    return paths
+
+
+class TestConversion:
+    """Test suite for serial and process-pool document conversion"""
+
+    def test_serial_conversion_reports_every_outcome(self, tmp_path):
+        """Test that in-process conversion writes markdown and sorts files by outcome"""
+        sources = make_files(tmp_path, ["a.txt", "b.bin", "boom.txt"])
+
+        report = convert_files(sources, workers=0, converter_factory=FakeConverter, progress=False)
+
+        assert [r.status for r in report.results] == [CONVERTED, SKIPPED, FAILED]
+        assert (tmp_path / "a.md").read_text(encoding="utf-8") == "CONTEÚDO DE A.TXT"
+        assert "corrupt file" in report.by_status(FAILED)[0].detail
+        assert "Converted 1 of 3 files" in report.summary()
+
+    def test_pool_kills_hung_converter_and_keeps_going(self, tmp_path):
+        """Test that a file over the timeout is reported and its worker replaced"""
+        sources = make_files(tmp_path, ["hang.txt"] + [f"doc{i}.txt" for i in range(6)])
+        pool = ConversionPool(workers=2, timeout=1.0, converter_factory=FakeConverter)
+
+        started = time.perf_counter()
+        results = {os.path.basename(r.source): r for r in pool.imap(sources)}
+
+        assert time.perf_counter() - started < 10
+        assert results["hang.txt"].status == TIMED_OUT
+        assert all(results[f"doc{i}.txt"].status == CONVERTED for i in range(6))
+        assert (tmp_path / "doc5.md").read_text(encoding="utf-8") == "CONTEÚDO DE DOC5.TXT"
+        assert pool.replaced == 1
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
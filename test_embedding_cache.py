@@ -0,0 +1,105 @@
+import pytest
+from langchain_core.embeddings import Embeddings
+from embedding_cache import CachedQueryEmbeddings
+
+
+class CountingEmbeddings(Embeddings):
+    """Embeddings stub that records how often the backend is called"""
+
+    def __init__(self, model="model-a"):
+        self.model = model
+        self.calls = 0
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        return [[float(len(text)), 1.0] for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+class TestCachedQueryEmbeddings:
+    """Test suite for the query-embedding cache"""
+
+    def test_memory_hit_skips_backend(self):
+        """Test that repeated queries are served from the LRU"""
+        backend = CountingEmbeddings()
+        cached = CachedQueryEmbeddings(backend)
+
+        assert cached.embed_query("banco de horas") == cached.embed_query("banco de horas")
+        assert backend.calls == 1
+        assert cached.stats()["memory_hits"] == 1
+
+    @pytest.mark.asyncio
+    async def test_async_path_uses_cache(self):
+        """Test that aembed_query shares the cache with embed_query"""
+        backend = CountingEmbeddings()
+        cached = CachedQueryEmbeddings(backend)
+
+        first = await cached.aembed_query("phishing")
+        second = await cached.aembed_query("phishing")
+
+        assert first == second
+        assert backend.calls == 1
+
+    @pytest.mark.asyncio
+    async def test_batch_embeds_all_misses_in_one_request(self):
+        """Test that aembed_queries serves hits from the cache and embeds the distinct misses together"""
+        backend = CountingEmbeddings()
+        cached = CachedQueryEmbeddings(backend)
+        await cached.aembed_query("férias")
+
+        vectors = await cached.aembed_queries(["férias", "ponto", "crachá", "ponto"])
+
+        assert vectors == [[6.0, 1.0], [5.0, 1.0], [6.0, 1.0], [5.0, 1.0]]
+        assert backend.calls == 2
+        assert cached.stats()["misses"] == 3
+        assert await cached.aembed_query("crachá") == [6.0, 1.0]
+        assert backend.calls == 2
+
+    def test_lru_size_cap(self):
+        """Test that the in-process tier evicts the least recently used query"""
+        backend = CountingEmbeddings()
+        cached = CachedQueryEmbeddings(backend, max_entries=1)
+
+        cached.embed_query("a")
+        cached.embed_query("b")
+        cached.embed_query("a")
+
+        assert backend.calls == 3
+
+    def test_disk_tier_survives_restart(self, tmp_path):
+        """Test that a new wrapper reads vectors persisted by a previous one"""
+        path = str(tmp_path / "query_embeddings.sqlite3")
+        CachedQueryEmbeddings(CountingEmbeddings(), disk_path=path).embed_query("férias")
+
+        backend = CountingEmbeddings()
+        restarted = CachedQueryEmbeddings(backend, disk_path=path)
+
+        assert restarted.embed_query("férias") == [6.0, 1.0]
+        assert backend.calls == 0
+        assert restarted.stats()["disk_hits"] == 1
+
+    def test_model_change_invalidates(self, tmp_path):
+        """Test that vectors cached for another model are not reused"""
+        path = str(tmp_path / "query_embeddings.sqlite3")
+        CachedQueryEmbeddings(CountingEmbeddings("model-a"), disk_path=path).embed_query("férias")
+
+        backend = CountingEmbeddings("model-b")
+        CachedQueryEmbeddings(backend, disk_path=path).embed_query("férias")
+
+        assert backend.calls == 1
+
+    def test_documents_pass_through(self):
+        """Test that document embeddings are not cached"""
+        backend = CountingEmbeddings()
+        cached = CachedQueryEmbeddings(backend)
+
+        cached.embed_documents(["a", "b"])
+        cached.embed_documents(["a", "b"])
+
+        assert backend.calls == 2
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,73 @@
+import asyncio
+import pytest
+
+pytest.importorskip("onnxruntime")
+pytest.importorskip("tokenizers")
+
+import numpy as np
+import settings
+from benchmarks.onnx_stub import write_stub
+from embedding_cache import CachedQueryEmbeddings
+from embedding_providers import OnnxEmbeddings, make_embeddings
+
+# Dynamic int8 quantization scales each run by its largest activation, so a
+# text's vector moves slightly with the rest of its batch
+BATCH_TOLERANCE = 0.02
+
+
+@pytest.fixture(scope="module")
+def model_path(tmp_path_factory):
+    return write_stub(str(tmp_path_factory.mktemp("onnx")), dimensions=32, hidden=64, layers=2)
+
+
+class TestOnnxEmbeddings:
+    """Test suite for the local ONNX Runtime embedding provider"""
+
+    def test_vectors_are_normalized_and_ignore_padding(self, model_path):
+        """Test that vectors are unit length and padding does not change a short text's vector"""
+        embeddings = OnnxEmbeddings(model_path)
+        short, long = embeddings.embed_documents(["férias", "o procedimento de férias exige registro no portal"])
+        assert len(short) == 32
+        assert np.linalg.norm(short) == pytest.approx(1.0, abs=1e-5)
+        assert embeddings.embed_documents(["férias"])[0] == pytest.approx(short, abs=BATCH_TOLERANCE)
+        assert embeddings.embed_query("férias") == embeddings.embed_documents(["férias"])[0]
+        assert embeddings.stats()["texts"] == 5
+
+    def test_prefixes(self, model_path):
+        """Test that query and document prefixes are part of the embedded text"""
+        embeddings = OnnxEmbeddings(model_path, query_prefix="qual ", document_prefix="pop ")
+        plain = OnnxEmbeddings(model_path)
+        assert embeddings.embed_query("férias") == pytest.approx(plain.embed_query("qual férias"), abs=1e-5)
+        assert embeddings.embed_documents(["férias"])[0] == pytest.approx(plain.embed_query("pop férias"), abs=1e-5)
+
+    @pytest.mark.asyncio
+    async def test_concurrent_queries_share_inference_runs(self, model_path):
+        """Test that concurrent aembed_query calls are batched and each gets its own vector"""
+        embeddings = OnnxEmbeddings(model_path, workers=1, max_query_batch=4)
+        questions = [f"prazo de férias item{i}" for i in range(10)]
+        vectors = await asyncio.gather(*(embeddings.aembed_query(question) for question in questions))
+        for question, vector in zip(questions, vectors):
+            assert vector == pytest.approx(embeddings.embed_query(question), abs=BATCH_TOLERANCE)
+        stats = embeddings.stats()
+        # The first query runs alone; the other nine queue behind it
+        assert stats["query_batches"] == 4
+        assert stats["average_query_batch"] == 2.5
+
+        # The cache sends batch-endpoint misses through the provider's query path
+        cached = CachedQueryEmbeddings(OnnxEmbeddings(model_path, query_prefix="qual "))
+        assert (await cached.aembed_queries(["férias"]))[0] == pytest.approx(
+            OnnxEmbeddings(model_path).embed_query("qual férias"), abs=1e-5
+        )
+
+    def test_make_embeddings(self, model_path, monkeypatch):
+        """Test that the provider setting picks the client and unknown providers are rejected"""
+        monkeypatch.setattr(settings, "ONNX_MODEL_PATH", model_path)
+        monkeypatch.setattr(settings, "ONNX_QUERY_MAX_BATCH", 8)
+        embeddings = make_embeddings("onnx")
+        assert isinstance(embeddings, OnnxEmbeddings)
+        assert embeddings.max_query_batch == 8
+        with pytest.raises(ValueError):
+            make_embeddings("nomic")
+        monkeypatch.setattr(settings, "ONNX_MODEL_PATH", "")
+        with pytest.raises(ValueError):
+            make_embeddings("onnx")
@@ -0,0 +1,109 @@
+import asyncio
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from embedding_scheduler import EmbeddingScheduler, pack_batches
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+
+class FlakyEmbeddings(Embeddings):
+    """Embeddings stub that rate-limits the first `failures` calls and tracks concurrency"""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def embed_documents(self, texts):
+        raise NotImplementedError
+
+    def embed_query(self, text):
+        raise NotImplementedError
+
+    async def aembed_documents(self, texts):
+        self.calls += 1
+        if self.failures:
+            self.failures -= 1
+            raise RateLimitError("Too many requests")
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        return [[float(len(text))] for text in texts]
+
+
+def make_documents(count, words=10):
+    return [Document(page_content=" ".join(["palavra"] * words), metadata={"source": f"doc{i}.md"}) for i in range(count)]
+
+
+def count_words(text):
+    return len(text.split())
+
+
+class TestEmbeddingScheduler:
+    """Test suite for the indexing embedding scheduler"""
+
+    def test_pack_batches_respects_token_and_size_limits(self):
+        """Test that batches stay under the token budget and the input cap"""
+        documents = make_documents(10, words=10)
+        ids = [str(i) for i in range(10)]
+
+        by_tokens = pack_batches(documents, ids, max_batch_tokens=35, max_batch_size=100, count_tokens=count_words)
+        by_size = pack_batches(documents, ids, max_batch_tokens=1000, max_batch_size=4, count_tokens=count_words)
+
+        assert [len(batch.documents) for batch in by_tokens] == [3, 3, 3, 1]
+        assert all(batch.tokens <= 35 for batch in by_tokens)
+        assert [len(batch.documents) for batch in by_size] == [4, 4, 2]
+        assert [i for batch in by_size for i in batch.ids] == ids
+
+    def test_bounded_concurrency_and_bulk_writes(self):
+        """Test that in-flight requests are capped and each batch is written once"""
+        embeddings = FlakyEmbeddings()
+        writes = []
+        scheduler = EmbeddingScheduler(
+            embeddings, lambda ids, docs, vectors: writes.append((ids, vectors)),
+            max_batch_tokens=1000, max_batch_size=2, max_concurrency=2, count_tokens=count_words,
+        )
+
+        stats = scheduler.run_sync(make_documents(10), [str(i) for i in range(10)])
+
+        assert embeddings.max_in_flight == 2
+        assert len(writes) == 5
+        assert sorted(i for ids, _ in writes for i in ids) == sorted(str(i) for i in range(10))
+        assert stats.chunks == 10
+        assert stats.tokens == 100
+        assert stats.chunks_per_second > 0
+
+    def test_backs_off_and_retries_on_429(self):
+        """Test that rate-limited batches are retried until they succeed"""
+        embeddings = FlakyEmbeddings(failures=2)
+        writes = []
+        scheduler = EmbeddingScheduler(
+            embeddings, lambda ids, docs, vectors: writes.append(ids),
+            max_concurrency=1, base_delay=0.001, count_tokens=count_words,
+        )
+
+        stats = scheduler.run_sync(make_documents(3), ["a", "b", "c"])
+
+        assert embeddings.calls == 3
+        assert stats.retries == 2
+        assert stats.rate_limited == 2
+        assert writes == [["a", "b", "c"]]
+
+    def test_gives_up_after_max_retries(self):
+        """Test that a persistently failing batch raises"""
+        scheduler = EmbeddingScheduler(
+            FlakyEmbeddings(failures=5), lambda *args: None,
+            max_retries=2, base_delay=0.001, count_tokens=count_words,
+        )
+
+        with pytest.raises(RateLimitError):
+            scheduler.run_sync(make_documents(1), ["a"])
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,91 @@
+import pytest
+from unittest.mock import AsyncMock, Mock
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+import json
+from history_manager import HistoryManager, Turn, compact_history, format_history, turns_json
+
+
+def make_turns(count, words=20):
+    history = []
+    for i in range(count):
+        history.extend([
+            HumanMessage(content=f"Pergunta {i} " + "palavra " * words),
+            AIMessage(content=f"Resposta {i} " + "palavra " * words),
+        ])
+    return history
+
+
+def make_summarizer(text="Resumo da conversa"):
+    llm = Mock()
+    llm.ainvoke = AsyncMock(return_value=AIMessage(content=text))
+    return llm
+
+
+class TestHistoryManager:
+    """Test suite for the token-budgeted conversation history"""
+
+    @pytest.mark.asyncio
+    async def test_history_within_budget_is_left_alone(self):
+        """Test that no summary is made while the history fits the budget"""
+        manager = HistoryManager(token_budget=10_000, keep_turns=2)
+        llm = make_summarizer()
+
+        result = await manager.condense(make_turns(6) + [HumanMessage(content="Nova pergunta")], llm)
+
+        assert result is None
+        llm.ainvoke.assert_not_awaited()
+
+    @pytest.mark.asyncio
+    async def test_overflow_folds_old_turns_once(self):
+        """Test that an overflow folds everything but the last turns, and the next turn reuses the summary"""
+        manager = HistoryManager(token_budget=300, keep_turns=2)
+        llm = make_summarizer()
+        history = make_turns(6) + [HumanMessage(content="Nova pergunta")]
+
+        condensed = await manager.condense(history, llm)
+
+        assert isinstance(condensed[0], SystemMessage)
+        assert condensed[0].content == "Resumo da conversa"
+        assert condensed[1:] == history[-5:]
+        assert "Pergunta 0" in llm.ainvoke.await_args.args[0][0].content
+        assert "Pergunta 4" not in llm.ainvoke.await_args.args[0][0].content
+
+        next_turn = condensed[:-1] + make_turns(1) + [HumanMessage(content="Outra pergunta")]
+        assert await manager.condense(next_turn, llm) is None
+        assert llm.ainvoke.await_count == 1
+        assert manager.stats()["summaries"] == 1
+
+    @pytest.mark.asyncio
+    async def test_summarizer_failure_keeps_history(self):
+        """Test that a failing summarizer leaves the history untouched"""
+        manager = HistoryManager(token_budget=100, keep_turns=1)
+        llm = Mock()
+        llm.ainvoke = AsyncMock(side_effect=RuntimeError("timeout"))
+
+        assert await manager.condense(make_turns(4) + [HumanMessage(content="?")], llm) is None
+        assert manager.stats()["failures"] == 1
+
+    def test_format_history_includes_summary(self):
+        """Test that the prompt context carries the summary before the verbatim turns"""
+        context = format_history([SystemMessage(content="Resumo"), HumanMessage(content="Oi"), AIMessage(content="Olá")])
+
+        assert context == "\n\nSummary of the earlier conversation:\nResumo\n\nPrevious conversation:\nHuman: Oi\nAssistant: Olá\n\n"
+        assert format_history([]) == ""
+
+    def test_turn_records(self):
+        """Test that Turns stand in for messages and serialize once"""
+        history = [SystemMessage(content="Resumo"), {"type": "HumanMessage", "content": "Férias?"}, AIMessage(content="30 dias")]
+        turns = compact_history(history)
+
+        assert turns == history and compact_history(turns)[2] is turns[2]
+        assert format_history(turns) == format_history(history)
+        assert json.loads(turns_json(turns)) == [{"type": "SystemMessage", "content": "Resumo"},
+                                                 {"type": "HumanMessage", "content": "Férias?"},
+                                                 {"type": "AIMessage", "content": "30 dias"}]
+        assert turns[1].json() is turns[1].json()
+        assert not hasattr(turns[0], "__dict__")
+        assert Turn("AIMessage", "30 dias") != HumanMessage(content="30 dias")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,76 @@
+import os
+import pytest
+from conftest import FakeConverter
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.vectorstores import InMemoryVectorStore
+from ingest import clean_in_place, ingest_documents, iter_clean_in_place
+from LoaderCloud import incremental_index, load_manifest
+
+
+class ReadOnceConverter(FakeConverter):
+    """Converter stub that records every file it reads and wraps it in a letterhead and footer"""
+    reads = []
+
+    def render(self, text):
+        return "DGT TECNOLOGIA LTDA\n  " + text + "  \n\n\n\nfim"
+
+
+class TestIngest:
+    """Test suite for the streaming convert → clean → index pipeline"""
+
+    def setup_method(self):
+        ReadOnceConverter.reads = []
+
+    def make_docs(self, tmp_path):
+        (tmp_path / "Docs" / "rh").mkdir(parents=True)
+        (tmp_path / "Docs" / "rh" / "ferias.docx").write_text("Trinta dias de férias", encoding="utf-8")
+        (tmp_path / "Docs" / "ti.xlsx").write_text("Senha do e-mail", encoding="utf-8")
+        return str(tmp_path / "Docs"), str(tmp_path / "Docs_md")
+
+    def test_writes_cleaned_markdown_once_and_leaves_origin_untouched(self, tmp_path):
+        """Test that each document is read once, cleaned in memory and written to the mirrored path"""
+        origin, dest = self.make_docs(tmp_path)
+
+        report = ingest_documents(origin, dest, converter_factory=ReadOnceConverter, progress=False)
+
+        assert len(report.conversion.by_status("converted")) == 2
+        assert sorted(ReadOnceConverter.reads) == sorted([
+            os.path.join(origin, "rh", "ferias.docx"), os.path.join(origin, "ti.xlsx")
+        ])
+        assert (tmp_path / "Docs_md" / "rh" / "ferias.md").read_text(encoding="utf-8") == "\nTrinta dias de férias\n\nfim"
+        assert sorted(os.listdir(origin)) == ["rh", "ti.xlsx"]
+
+    def test_hands_cleaned_text_to_the_indexer(self, tmp_path):
+        """Test that indexing from the pipeline matches a later incremental run over the written files"""
+        origin, dest = self.make_docs(tmp_path)
+        manifest_path = str(tmp_path / "index" / "index_manifest.json")
+        vector_store = InMemoryVectorStore(DeterministicFakeEmbedding(size=8))
+
+        report = ingest_documents(origin, dest, converter_factory=ReadOnceConverter, progress=False,
+                                  vector_store=vector_store, manifest_path=manifest_path)
+
+        assert report.index.chunks_added == 2
+        assert set(load_manifest(manifest_path)) == {
+            os.path.join(dest, "rh", "ferias.md"), os.path.join(dest, "ti.md")
+        }
+        rerun = incremental_index(vector_store, folders=[dest], manifest_path=manifest_path)
+        assert not rerun.changed
+        assert rerun.unchanged == 2
+
+    def test_clean_in_place_cleans_and_streams_text(self, tmp_path):
+        """Test that scraped markdown is cleaned in place and streamed for indexing"""
+        (tmp_path / "ScrapedData").mkdir()
+        (tmp_path / "ScrapedData" / "site.md").write_text("  Ouvidoria  \nhttps://dgt.com.br", encoding="utf-8")
+
+        documents = list(iter_clean_in_place(str(tmp_path / "ScrapedData")))
+
+        assert documents == [(str(tmp_path / "ScrapedData" / "site.md"), "Ouvidoria\n")]
+        assert (tmp_path / "ScrapedData" / "site.md").read_text(encoding="utf-8") == "Ouvidoria\n"
+        # The eager form does the work without being iterated, and counts only files it changed
+        (tmp_path / "ScrapedData" / "faq.md").write_text("  FAQ  ", encoding="utf-8")
+        assert clean_in_place(str(tmp_path / "ScrapedData")) == 1
+        assert (tmp_path / "ScrapedData" / "faq.md").read_text(encoding="utf-8") == "FAQ"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,117 @@
+import pytest
+from unittest.mock import Mock
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.vectorstores import InMemoryVectorStore
+from bm25 import BM25Index
+from LoaderCloud import content_hash, incremental_index, load_manifest, save_manifest, split_file
+
+
+class TestIncrementalIndex:
+    """Test suite for LoaderCloud's incremental indexing mode"""
+
+    def setup_method(self):
+        self.vector_store = InMemoryVectorStore(DeterministicFakeEmbedding(size=8))
+
+    def write(self, path, text):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text, encoding="utf-8")
+
+    def run(self, tmp_path):
+        return incremental_index(
+            self.vector_store,
+            folders=[str(tmp_path / "Docs_md")],
+            manifest_path=str(tmp_path / "index" / "index_manifest.json"),
+        )
+
+    def test_first_run_adds_every_file(self, tmp_path):
+        """Test that a fresh manifest indexes all files with deterministic IDs"""
+        self.write(tmp_path / "Docs_md" / "a.md", "Banco de horas")
+        self.write(tmp_path / "Docs_md" / "sub" / "b.md", "Phishing")
+
+        report = self.run(tmp_path)
+
+        assert len(report.added) == 2
+        assert report.chunks_added == 2
+        manifest = load_manifest(str(tmp_path / "index" / "index_manifest.json"))
+        assert set(self.vector_store.store) == {i for entry in manifest.values() for i in entry["chunk_ids"]}
+
+    def test_second_run_is_a_no_op(self, tmp_path):
+        """Test that re-running without changes embeds nothing and adds no duplicates"""
+        self.write(tmp_path / "Docs_md" / "a.md", "Banco de horas")
+        self.run(tmp_path)
+
+        report = self.run(tmp_path)
+
+        assert not report.changed
+        assert report.unchanged == 1
+        assert len(self.vector_store.store) == 1
+
+    def test_changed_and_removed_files(self, tmp_path):
+        """Test that changed files are re-embedded and removed files are deleted"""
+        self.write(tmp_path / "Docs_md" / "a.md", "Banco de horas")
+        self.write(tmp_path / "Docs_md" / "b.md", "Phishing")
+        self.run(tmp_path)
+
+        self.write(tmp_path / "Docs_md" / "a.md", "Banco de horas atualizado")
+        (tmp_path / "Docs_md" / "b.md").unlink()
+        report = self.run(tmp_path)
+
+        assert [source.split("/")[-1] for source in report.updated] == ["a.md"]
+        assert [source.split("/")[-1] for source in report.removed] == ["b.md"]
+        assert report.chunks_deleted == 2
+        assert [doc["text"] for doc in self.vector_store.store.values()] == ["Banco de horas atualizado"]
+
+    def test_bm25_index_follows_the_vector_store(self, tmp_path):
+        """Test that the BM25 index holds the same chunk IDs and is backfilled for unchanged files"""
+        self.write(tmp_path / "Docs_md" / "a.md", "Banco de horas POP-0012")
+        self.write(tmp_path / "Docs_md" / "b.md", "Phishing")
+        self.run(tmp_path)
+        bm25_path = tmp_path / "index" / "bm25_index.json"
+
+        assert set(BM25Index.load(str(bm25_path)).documents) == set(self.vector_store.store)
+
+        # An index built before the BM25 file existed is completed without re-embedding
+        bm25_path.unlink()
+        (tmp_path / "Docs_md" / "b.md").unlink()
+        report = self.run(tmp_path)
+
+        assert report.unchanged == 1 and report.chunks_added == 0
+        index = BM25Index.load(str(bm25_path))
+        assert set(index.documents) == set(self.vector_store.store)
+        assert index.search("pop-0012")[0][0] in self.vector_store.store
+
+    def test_chunks_are_tagged_with_their_partition(self, tmp_path):
+        """Test that chunks carry their partition and chunks stored before tagging are retagged in place"""
+        from langchain_chroma import Chroma
+        embeddings = Mock(wraps=DeterministicFakeEmbedding(size=8))
+        self.vector_store = Chroma(collection_name="dgt_rag", embedding_function=embeddings,
+                                   persist_directory=str(tmp_path / "chroma"))
+        self.write(tmp_path / "Docs_md" / "a.md", "Banco de horas")
+        source = str(tmp_path / "Docs_md" / "a.md")
+
+        # An index from before partitions: untagged chunks and no partition in the manifest
+        splits, ids = split_file(source, "Banco de horas")
+        self.vector_store.add_documents([Document(page_content=split.page_content, metadata={"source": source})
+                                         for split in splits], ids=ids)
+        manifest_path = str(tmp_path / "index" / "index_manifest.json")
+        save_manifest({source: {"sha256": content_hash("Banco de horas".encode("utf-8")), "chunk_ids": ids}}, manifest_path)
+        embeddings.embed_documents.reset_mock()
+
+        report = self.run(tmp_path)
+
+        assert (report.unchanged, report.chunks_added, report.chunks_retagged) == (1, 0, 1)
+        embeddings.embed_documents.assert_not_called()
+        assert self.vector_store.get_by_ids(ids)[0].metadata["partition"] == "pop"
+        assert load_manifest(manifest_path)[source]["partition"] == "pop"
+        assert self.run(tmp_path).chunks_retagged == 0
+
+        self.write(tmp_path / "ScrapedData" / "b.md", "Página do site")
+        incremental_index(self.vector_store, folders=[str(tmp_path / "ScrapedData")], manifest_path=manifest_path)
+        hits = self.vector_store.similarity_search("Página do site", k=1, filter={"partition": "site"})
+        assert hits[0].metadata == {"source": str(tmp_path / "ScrapedData" / "b.md"), "start_index": 0,
+                                    "category": "site", "partition": "site"}
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,66 @@
+import io
+import json
+import logging
+import pytest
+from metrics import Counter, Gauge, Histogram, Registry
+from structured_logging import setup_logging, stop_logging
+
+
+class TestMetrics:
+    """Test suite for the Prometheus metrics registry"""
+
+    def test_histogram_renders_cumulative_buckets(self):
+        """Test that observations land in cumulative buckets with sum and count per label set"""
+        histogram = Histogram("node_seconds", "Node latency", ("node",), buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 5.0):
+            histogram.observe(value, node="retrieve")
+        with histogram.time(node="generate"):
+            pass
+
+        lines = histogram.render().splitlines()
+        assert lines[:2] == ["# HELP node_seconds Node latency", "# TYPE node_seconds histogram"]
+        assert 'node_seconds_bucket{node="retrieve",le="0.1"} 1' in lines
+        assert 'node_seconds_bucket{node="retrieve",le="1"} 2' in lines
+        assert 'node_seconds_bucket{node="retrieve",le="+Inf"} 3' in lines
+        assert 'node_seconds_sum{node="retrieve"} 5.55' in lines
+        assert 'node_seconds_count{node="retrieve"} 3' in lines
+        assert histogram.count(node="generate") == 1
+
+    def test_counters_gauges_and_collectors(self):
+        """Test stored and scrape-time values, label escaping and label checks"""
+        registry = Registry()
+        counter = registry.register(Counter("requests_total", "Requests", ("route",)))
+        counter.inc(route='/a"b')
+        counter.inc(2, route='/a"b')
+        registry.register(Gauge("sessions", "Live sessions", collect=lambda: [((), 7)]))
+
+        text = registry.render()
+        assert 'requests_total{route="/a\\"b"} 3' in text
+        assert "# TYPE sessions gauge\nsessions 7\n" in text
+        with pytest.raises(ValueError):
+            counter.inc(status="200")
+        with pytest.raises(ValueError):
+            registry.register(Gauge("sessions", "Duplicate"))
+
+
+class TestStructuredLogging:
+    """Test suite for the queue-based JSON logging"""
+
+    def test_records_are_written_as_json_lines(self):
+        """Test that records and their extra fields come out as JSON once the queue is flushed"""
+        stream = io.StringIO()
+        setup_logging("DEBUG", stream=stream)
+        try:
+            logging.getLogger("AgentRAGServer").info("Answer generated", extra={"session_id": "s1", "output_tokens": 42})
+        finally:
+            stop_logging()
+
+        entry = json.loads(stream.getvalue().splitlines()[-1])
+        assert entry["level"] == "INFO"
+        assert entry["logger"] == "AgentRAGServer"
+        assert entry["message"] == "Answer generated"
+        assert entry["session_id"] == "s1" and entry["output_tokens"] == 42
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
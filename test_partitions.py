@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+from conftest import FakeCollection
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from partitions import (PartitionedVectorStore, QueryRouter, category_of, compute_centroids, filter_partitions,
+                        merge_hits, partition_filter, partition_metadata, write_centroids)
+
+
+class TestPartitions:
+    """Test suite for source partitions and the query router"""
+
+    def test_categories_and_filters(self):
+        """Test that sources map to their folder's category and filters round-trip"""
+        assert category_of("Docs_md/sub/POP-01.md") == "pop"
+        assert category_of("./ScrapedData/page.md") == "site"
+        assert category_of("C:\\dgt\\ScrapedData\\page.md") == "site"
+        assert category_of("notes.md") == "other"
+        assert partition_metadata("Docs_md/a.md") == {"category": "pop", "partition": "pop"}
+        assert partition_filter(["pop"]) == {"partition": "pop"}
+        assert filter_partitions(partition_filter(["pop", "site"])) == ["pop", "site"]
+        assert filter_partitions(None) is None
+        with pytest.raises(ValueError):
+            filter_partitions({"source": "a.md"})
+
+        hits = [[(Document(id="p1", page_content=""), 0.3), (Document(id="p2", page_content=""), 0.9)],
+                [(Document(id="s1", page_content=""), 0.1)]]
+        assert [doc.id for doc in merge_hits(hits, 2)] == ["s1", "p1"]
+
+    def test_router_picks_partitions_near_the_question(self, tmp_path):
+        """Test that the router keeps partitions within the margin of the best centroid and reloads the file"""
+        path = str(tmp_path / "partition_centroids.json")
+        router = QueryRouter(path, margin=0.1)
+        assert router.route([1.0, 0.0]) is None
+
+        sources = ["Docs_md/a.md", "Docs_md/b.md", "ScrapedData/c.md", "ScrapedData/d.md"]
+        collection = FakeCollection([[2.0, 0.0], [1.0, 0.1], [0.0, 1.0], [0.1, 1.0]],
+                                    metadatas=[{"source": source, **partition_metadata(source)} for source in sources])
+        centroids = compute_centroids([collection], page_size=3)
+        assert {name: entry["chunks"] for name, entry in centroids.items()} == {"pop": 2, "site": 2}
+        assert np.linalg.norm(centroids["pop"]["centroid"]) == pytest.approx(1.0)
+        write_centroids(centroids, path)
+
+        assert router.route([1.0, 0.05]) == ["pop"]
+        assert router.route([0.1, 3.0]) == ["site"]
+        assert router.route([1.0, 1.0]) is None
+        stats = router.stats()
+        assert stats["partitions"] == ["pop", "site"]
+        assert (stats["questions"], stats["routed"]) == (3, 2)
+        assert stats["searches"] == {"pop": 2, "site": 2}
+
+        write_centroids({"pop": centroids["pop"]}, path)
+        assert router.route([0.0, 1.0]) is None
+
+    def test_partitioned_store(self, tmp_path):
+        """Test that chunks land in their partition's collection and searches merge or filter them"""
+        from langchain_chroma import Chroma
+
+        embeddings = DeterministicFakeEmbedding(size=8)
+        store = PartitionedVectorStore({
+            partition: Chroma(collection_name=f"dgt_rag_{partition}", embedding_function=embeddings,
+                              persist_directory=str(tmp_path))
+            for partition in ("other", "pop", "site")
+        })
+        documents = [Document(page_content=f"Texto {source}", metadata={"source": source, **partition_metadata(source)})
+                     for source in ("Docs_md/a.md", "Docs_md/b.md", "ScrapedData/c.md")]
+        store.add_documents(documents[:1], ids=["a"])
+        store.writer()(["b", "c"], documents[1:], embeddings.embed_documents([doc.page_content for doc in documents[1:]]))
+
+        assert [collection.count() for collection in store.collections()] == [0, 2, 1]
+        assert store.embeddings is embeddings
+        query = embeddings.embed_query("Texto ScrapedData/c.md")
+        assert store.similarity_search_by_vector(query, k=1)[0].id == "c"
+        assert {doc.id for doc in store.similarity_search_by_vector(query, k=3, filter=partition_filter(["pop"]))} == \
+            {"a", "b"}
+        assert [doc.id for doc in store.get_by_ids(["c", "missing", "a"])] == ["c", "a"]
+
+        store.delete(ids=["a", "c"])
+        assert store.count() == 1
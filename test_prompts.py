@@ -0,0 +1,43 @@
+import pytest
+from unittest.mock import patch
+from langchain_core.prompts import ChatPromptTemplate
+from prompts import SNAPSHOT_PATH, get_prompt, load_prompt, save_prompt
+
+
+class TestPrompts:
+    """Test suite for the local RAG prompt snapshot"""
+
+    def test_snapshot_loads_without_the_hub(self):
+        """Test the shipped snapshot is a prompt with the question and context inputs"""
+        with patch("langchain.hub.pull", side_effect=AssertionError("hub")):
+            prompt = get_prompt()
+
+        assert set(prompt.input_variables) == {"question", "context"}
+        messages = prompt.invoke({"question": "Qual o prazo?", "context": "Trinta dias."}).to_messages()
+        assert "Qual o prazo?" in messages[0].content and "Trinta dias." in messages[0].content
+
+    def test_save_and_load_round_trip(self, tmp_path):
+        """Test a saved prompt loads back with the same messages"""
+        prompt = ChatPromptTemplate.from_messages([("system", "Responda em português."), ("human", "{question}\n{context}")])
+        path = str(tmp_path / "prompt.json")
+        save_prompt(prompt, path)
+
+        loaded = load_prompt(path)
+        assert loaded.format_messages(question="q", context="c") == prompt.format_messages(question="q", context="c")
+
+    def test_refresh_rewrites_the_snapshot_or_falls_back(self, tmp_path):
+        """Test a refresh stores the hub prompt, and a hub failure keeps the snapshot"""
+        path = str(tmp_path / "prompt.json")
+        save_prompt(load_prompt(SNAPSHOT_PATH), path)
+        pulled = ChatPromptTemplate.from_messages([("human", "Novo: {question} {context}")])
+
+        with patch("langchain.hub.pull", return_value=pulled):
+            assert get_prompt(path, refresh=True) is pulled
+        assert load_prompt(path).messages[0].prompt.template == "Novo: {question} {context}"
+
+        with patch("langchain.hub.pull", side_effect=OSError("offline")):
+            assert get_prompt(path, refresh=True).messages[0].prompt.template == "Novo: {question} {context}"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,55 @@
+import pytest
+from langchain_core.documents import Document
+from rerank import Reranker, make_reranker
+
+
+def doc(doc_id, text):
+    return Document(id=doc_id, page_content=text)
+
+
+class TestReranker:
+    """Test suite for the MMR / cross-encoder rerank stage"""
+
+    def test_mmr_skips_near_duplicates(self):
+        """Test that an overlapping neighbour loses to a different chunk when diversity is on"""
+        documents = [
+            doc("a", "Férias devem ser solicitadas no portal com trinta dias de antecedência"),
+            doc("a-overlap", "Férias devem ser solicitadas no portal com trinta dias de antecedência pelo gestor"),
+            doc("b", "O banco de horas é compensado em até seis meses"),
+        ]
+
+        assert [d.id for d in Reranker(diversity=0.0).rerank("férias", documents)] == ["a", "a-overlap", "b"]
+        assert [d.id for d in Reranker(diversity=0.5).rerank("férias", documents)] == ["a", "b", "a-overlap"]
+
+    def test_token_budget(self, monkeypatch):
+        """Test that chunks past the budget are dropped but the best chunk is always kept"""
+        monkeypatch.setattr("rerank.count_tokens", lambda text, encoding_name: len(text.split()))
+        documents = [doc("long", "um dois tres quatro cinco"), doc("short", "seis"), doc("mid", "sete oito nove")]
+
+        assert [d.id for d in Reranker(token_budget=2, diversity=0.0).rerank("q", documents)] == ["long"]
+        assert [d.id for d in Reranker(token_budget=9, diversity=0.0).rerank("q", documents)] == ["long", "short", "mid"]
+        assert [d.id for d in Reranker(token_budget=7, diversity=0.0).rerank("q", documents)] == ["long", "short"]
+
+    def test_scorer_orders_and_stats(self):
+        """Test that scorer relevance replaces the retrieval order and timings are reported"""
+        documents = [doc("x", "alfa"), doc("y", "beta"), doc("z", "gama")]
+        reranker = Reranker(diversity=0.0, scorer=lambda question, texts: [0.1, 3.0, 1.5])
+
+        assert [d.id for d in reranker.rerank("beta?", documents)] == ["y", "z", "x"]
+        assert reranker.rerank("vazio", []) == []
+        stats = reranker.stats()
+        assert stats["method"] == "cross-encoder"
+        assert (stats["requests"], stats["candidates"], stats["kept"]) == (1, 3, 3)
+        assert stats["total_ms"] >= stats["p50_ms"] > 0
+
+    def test_make_reranker(self):
+        """Test the RERANKER setting values"""
+        assert make_reranker("") is None
+        assert make_reranker("MMR").method == "mmr"
+        assert make_reranker("cross-encoder", model_name="some/model").scorer.model_name == "some/model"
+        with pytest.raises(ValueError):
+            make_reranker("colbert")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
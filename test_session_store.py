@@ -0,0 +1,171 @@
+import multiprocessing
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from conftest import FakeClock
+from history_manager import turns_json
+from session_store import SessionStore, SqliteSessionStore, make_session_store
+
+
+def make_history(turns, size=10):
+    history = []
+    for i in range(turns):
+        history.extend([HumanMessage(content=f"{i}" * size), AIMessage(content=f"{i}" * size)])
+    return history
+
+
+class TestSessionStore:
+    """Test suite for the bounded conversation session store"""
+
+    def test_idle_sessions_expire(self):
+        """Test that sessions idle for longer than the TTL are dropped, and that reads refresh them"""
+        clock = FakeClock()
+        store = SessionStore(ttl_seconds=10, clock=clock)
+        store["active"] = make_history(1)
+        store["idle"] = make_history(1)
+
+        clock.now = 8
+        assert "active" in store
+        clock.now = 15
+
+        assert store.get("idle") is None
+        assert store["active"] == make_history(1)
+        assert len(store) == 1
+        assert store.stats()["idle_evictions"] == 1
+
+    def test_least_recently_used_session_is_evicted(self):
+        """Test that the store never holds more than max_sessions"""
+        store = SessionStore(max_sessions=2)
+        store["a"] = make_history(1)
+        store["b"] = make_history(1)
+        store.get("a")
+        store["c"] = make_history(1)
+
+        assert "b" not in store
+        assert "a" in store and "c" in store
+        assert store.stats()["capacity_evictions"] == 1
+
+    def test_history_is_trimmed_to_turn_and_byte_caps(self):
+        """Test that the oldest turns are dropped first, always in whole turns"""
+        store = SessionStore(max_turns=3, max_bytes=10_000)
+        store["turns"] = make_history(5)
+        assert store["turns"] == make_history(5)[4:]
+
+        small = SessionStore(max_turns=100, max_bytes=2 * (200 + 100))
+        small["bytes"] = make_history(4, size=100)
+        assert [msg.content for msg in small["bytes"]] == ["3" * 100, "3" * 100]
+        assert small.stats()["trimmed_messages"] == 6
+
+        summarized = SessionStore(max_turns=2)
+        summarized["summary"] = [SystemMessage(content="Resumo")] + make_history(3)
+        assert summarized["summary"] == [SystemMessage(content="Resumo")] + make_history(3)[2:]
+
+    def test_memory_gauge_follows_writes_and_deletes(self):
+        """Test that approx_bytes tracks stored histories"""
+        store = SessionStore()
+        store["a"] = make_history(2)
+        store["b"] = make_history(1)
+        both = store.stats()["approx_bytes"]
+        store["a"] = make_history(1)
+        del store["b"]
+
+        assert both == 6 * (200 + 10)
+        assert store.stats()["approx_bytes"] == 2 * (200 + 10)
+        assert store.pop("b") is None
+        store.clear()
+        assert store.stats() | {"max_sessions": 0} == {
+            "sessions": 0, "max_sessions": 0, "approx_bytes": 0,
+            "capacity_evictions": 0, "idle_evictions": 0, "trimmed_messages": 0,
+        }
+
+
+def write_session(path, session_id):
+    SqliteSessionStore(path)[session_id] = make_history(1)
+
+
+class TestSqliteSessionStore:
+    """Test suite for the session store shared by server workers"""
+
+    def test_same_bounds_as_the_memory_store(self, tmp_path):
+        """Test expiry, eviction, trimming and stats against the SQLite file"""
+        clock = FakeClock()
+        store = SqliteSessionStore(str(tmp_path / "sessions.sqlite3"), ttl_seconds=10, max_sessions=2, max_turns=2,
+                                   clock=clock)
+        store["a"] = [SystemMessage(content="Resumo")] + make_history(3)
+        clock.now = 1
+        store["b"] = make_history(1)
+        clock.now = 2
+        store.get("a")
+        clock.now = 3
+        store["c"] = make_history(1)
+
+        assert "b" not in store
+        assert store["a"] == [SystemMessage(content="Resumo")] + make_history(3)[2:]
+        clock.now = 8
+        assert "c" in store
+        clock.now = 14
+        assert store.get("a") is None
+        assert store.stats() == {
+            "sessions": 1, "max_sessions": 2, "approx_bytes": 2 * (200 + 10),
+            "capacity_evictions": 1, "idle_evictions": 1, "trimmed_messages": 2,
+        }
+        assert store.pop("c") == make_history(1) and store.pop("c") is None
+        with pytest.raises(KeyError):
+            del store["c"]
+
+    def test_reads_and_stats_do_not_write(self, tmp_path):
+        """Test that reads refresh the last access only when it is stale and that stats() leaves expired rows to put()"""
+        clock = FakeClock()
+        path = str(tmp_path / "sessions.sqlite3")
+        store = SqliteSessionStore(path, ttl_seconds=100, clock=clock)
+        assert store.touch_seconds == 10
+        store["a"] = make_history(1)
+        store["b"] = make_history(1)
+        changes = store._db().total_changes
+
+        clock.now = 5
+        assert store["a"] == make_history(1) and "b" in store
+        assert store._db().total_changes == changes
+        clock.now = 11
+        assert "a" in store
+        assert store._db().total_changes == changes + 1
+
+        clock.now = 105
+        assert "b" not in store
+        assert store.stats()["sessions"] == 1 and store.stats()["idle_evictions"] == 1
+        assert store._db().execute("SELECT COUNT(*) FROM sessions").fetchone()[0] == 2
+        store["c"] = make_history(1)
+        assert store._db().execute("SELECT COUNT(*) FROM sessions").fetchone()[0] == 2
+        assert store.stats()["idle_evictions"] == 1
+        assert len(SqliteSessionStore(path, ttl_seconds=0)) == 2
+
+    def test_turns_read_back_are_not_serialized_again(self, tmp_path, monkeypatch):
+        """Test that turns read from SQLite keep their stored JSON, so storing and answering with them dumps nothing"""
+        store = SqliteSessionStore(str(tmp_path / "sessions.sqlite3"))
+        store["a"] = make_history(1) + [HumanMessage(content="Linha 1\nLinha 2 \u00e7")]
+
+        monkeypatch.setattr("history_manager.json.dumps", lambda *args, **kwargs: pytest.fail("turn serialized again"))
+        history = store["a"]
+        assert turns_json(history) == turns_json(store["a"])
+        store["a"] = history + [history[0]]
+        assert store["a"] == make_history(1) + [HumanMessage(content="Linha 1\nLinha 2 \u00e7"), history[0]]
+
+    def test_workers_share_sessions(self, tmp_path):
+        """Test that a session written by another process, or after a fork, is visible to every store"""
+        path = str(tmp_path / "sessions.sqlite3")
+        store = make_session_store("sqlite", path=path)
+        store["parent"] = make_history(1)
+
+        context = multiprocessing.get_context("fork")
+        child = context.Process(target=write_session, args=(path, "child"))
+        child.start()
+        child.join()
+
+        assert child.exitcode == 0
+        assert store["child"] == make_history(1)
+        assert len(make_session_store("sqlite", path=path)) == 2
+        with pytest.raises(ValueError):
+            make_session_store("redis")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
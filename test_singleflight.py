@@ -0,0 +1,60 @@
+import asyncio
+import pytest
+from singleflight import SingleFlight, question_key
+
+
+class TestSingleFlight:
+    """Test suite for coalescing identical in-flight calls"""
+
+    def test_question_key_normalization(self):
+        """Test that case, spacing, Unicode form and surrounding punctuation do not change the key"""
+        assert question_key("  Como  funciona o BANCO de horas?? ") == question_key("como funciona o banco de horas")
+        assert question_key("Férias") == question_key("Férias")
+        assert question_key("Qual o prazo do POP-0012?") != question_key("Qual o prazo do POP-0013?")
+
+    @pytest.mark.asyncio
+    async def test_concurrent_callers_share_one_call(self):
+        """Test that callers arriving while a call runs get its result without running it again"""
+        flight = SingleFlight()
+        calls = 0
+
+        async def work():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.05)
+            return "resposta"
+
+        results = await asyncio.gather(*(flight.run("k", work) for _ in range(5)))
+        assert results == ["resposta"] * 5
+        assert calls == 1
+        assert flight.stats() == {"in_flight": 0, "leaders": 1, "followers": 4, "coalesced_rate": 0.8}
+
+        # Once finished, the next caller runs the work again
+        assert await flight.run("k", work) == "resposta"
+        assert calls == 2
+
+    @pytest.mark.asyncio
+    async def test_errors_reach_every_caller_and_cancel_is_per_caller(self):
+        """Test that a failure is raised to all waiters and one cancelled waiter leaves the call running"""
+        flight = SingleFlight()
+
+        async def failing():
+            await asyncio.sleep(0.02)
+            raise RuntimeError("upstream down")
+
+        results = await asyncio.gather(*(flight.run("k", failing) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(result, RuntimeError) for result in results)
+
+        async def slow():
+            await asyncio.sleep(0.05)
+            return 42
+
+        first = asyncio.ensure_future(flight.run("slow", slow))
+        second = asyncio.ensure_future(flight.run("slow", slow))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        assert await second == 42
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
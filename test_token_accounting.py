@@ -0,0 +1,76 @@
+import pytest
+from token_accounting import TokenLedger, TokenUsage, count_prompt_stages, get_encoding, load_encoding
+
+
+class WordEncoding:
+    def encode(self, text, **kwargs):
+        return text.split()
+
+
+class TestTokenAccounting:
+    """Test suite for per-stage token counting and the token ledger"""
+
+    def test_prompt_stages_split_the_rendered_prompt(self, monkeypatch):
+        """Test that whatever the prompt holds beyond history, context and question counts as template"""
+        monkeypatch.setattr("token_accounting.get_encoding", lambda name: WordEncoding())
+        history = "Human: oi Assistant: olá"
+        context = "trinta dias de férias"
+        question = "quantos dias?"
+        prompt_text = f"{history} Use the context: {context} Question: {question} Answer:"
+
+        counts = count_prompt_stages(history, context, question, prompt_text)
+
+        assert counts == {"history": 4, "context": 4, "question": 2, "template": 5}
+
+    def test_encoder_is_loaded_once(self, monkeypatch):
+        """Test that encoders are cached per encoding name"""
+        calls = []
+        monkeypatch.setattr("tiktoken.get_encoding", lambda name: calls.append(name) or WordEncoding())
+        load_encoding.cache_clear()
+        try:
+            assert get_encoding("test_base") is get_encoding("test_base")
+            assert calls == ["test_base"]
+        finally:
+            load_encoding.cache_clear()
+
+    def test_failed_load_is_retried(self, monkeypatch):
+        """Test that a failed encoder load is not cached: it is retried after a while, and at once after a fork"""
+        def unavailable(name):
+            raise OSError("no BPE file")
+
+        monkeypatch.setattr("tiktoken.get_encoding", unavailable)
+        monkeypatch.setattr("token_accounting._encoding_failures", {})
+        load_encoding.cache_clear()
+        try:
+            with pytest.raises(OSError):
+                load_encoding("test_base")
+            assert get_encoding("test_base") is None
+
+            monkeypatch.setattr("tiktoken.get_encoding", lambda name: WordEncoding())
+            assert get_encoding("test_base") is None
+            monkeypatch.setattr("token_accounting.os.getpid", lambda: -1)
+            assert isinstance(get_encoding("test_base"), WordEncoding)
+        finally:
+            load_encoding.cache_clear()
+
+    def test_ledger_aggregates_and_keeps_recent_records(self):
+        """Test totals, cached requests and the bounded list of recent records"""
+        ledger = TokenLedger(max_records=2)
+        ledger.record(TokenUsage(session_id="a", context=50, question=5, answer=10, input_tokens=60, output_tokens=10))
+        ledger.record(TokenUsage(session_id="b", cached=True, source="cache"))
+        ledger.record(TokenUsage(session_id="c", context=30, question=3, answer=6, input_tokens=40, output_tokens=6, source="provider"))
+
+        stats = ledger.stats()
+
+        assert stats["requests"] == 3
+        assert stats["cached_requests"] == 1
+        assert stats["provider_reported"] == 1
+        assert stats["totals"]["context"] == 80
+        assert stats["totals"]["total_tokens"] == 116
+        assert stats["averages"]["input_tokens"] == 50.0
+        assert [record["session_id"] for record in stats["recent"]] == ["c", "b"]
+        assert len(ledger.stats(limit=1)["recent"]) == 1
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,77 @@
+import os
+import numpy as np
+import pytest
+from conftest import FakeCollection
+from partitions import partition_filter
+from vector_index import MmapVectorIndex, export_collection
+
+
+class TestMmapVectorIndex:
+    """Test suite for the memory-mapped exact vector index"""
+
+    def test_export_and_search_match_exact_cosine_ranking(self, tmp_path):
+        """Test that top-k hits equal a brute-force cosine ranking, alone and in a batch, with documents intact"""
+        rng = np.random.default_rng(0)
+        vectors = rng.standard_normal((50, 16)) * rng.uniform(0.5, 3, (50, 1))
+        export_collection(FakeCollection(vectors), str(tmp_path), page_size=7)
+        index = MmapVectorIndex(str(tmp_path))
+
+        queries = rng.standard_normal((5, 16))
+        normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        expected = np.argsort(-(queries @ normalized.T), axis=1)[:, :4]
+        batch = index.similarity_search_by_vectors(queries.tolist(), k=4)
+        for query, hits, rows in zip(queries, batch, expected):
+            assert [doc.id for doc in hits] == [f"chunk-{row}" for row in rows]
+            assert [doc.id for doc in index.similarity_search_by_vector(query.tolist(), k=4)] == [doc.id for doc in hits]
+
+        document = index.get_by_ids(["chunk-3", "missing"])
+        assert len(document) == 1
+        assert document[0].page_content == "Texto 3 sobre férias"
+        assert document[0].metadata == {"source": "Docs_md/POP-3.md", "start_index": 30}
+        assert len(index.similarity_search_by_vector(queries[0].tolist(), k=100)) == 50
+        assert index.stats()["chunks"] == 50
+
+    def test_float16_keeps_the_ranking(self, tmp_path):
+        """Test that a float16 export returns the same hits as float32 for well separated chunks"""
+        rng = np.random.default_rng(1)
+        vectors = rng.standard_normal((30, 8))
+        export_collection(FakeCollection(vectors), str(tmp_path / "f32"))
+        export_collection(FakeCollection(vectors), str(tmp_path / "f16"), dtype="float16")
+        half = MmapVectorIndex(str(tmp_path / "f16"))
+        assert half.stats()["dtype"] == "float16"
+        query = vectors[7].tolist()
+        assert [doc.id for doc in half.similarity_search_by_vector(query, k=3)] == \
+            [doc.id for doc in MmapVectorIndex(str(tmp_path / "f32")).similarity_search_by_vector(query, k=3)]
+
+    def test_partition_filter(self, tmp_path):
+        """Test that partition collections export into one index whose searches can be limited to some partitions"""
+        rng = np.random.default_rng(2)
+        pop, site = rng.standard_normal((6, 8)), rng.standard_normal((4, 8))
+        export_collection([FakeCollection(pop), FakeCollection(site, folder="ScrapedData", prefix="site")], str(tmp_path))
+        index = MmapVectorIndex(str(tmp_path))
+
+        query = site[2].tolist()
+        assert index.similarity_search_by_vector(query, k=1)[0].id == "site-2"
+        hits = index.similarity_search_by_vector(query, k=10, filter=partition_filter(["pop"]))
+        assert sorted(doc.id for doc in hits) == [f"chunk-{i}" for i in range(6)]
+        batch = index.similarity_search_by_vectors([query, query], k=10, partitions=[["site"], None])
+        assert [len(hits) for hits in batch] == [4, 10]
+
+    def test_reexport_switches_generation(self, tmp_path):
+        """Test that a running index picks up a new export and old generations are pruned"""
+        with pytest.raises(FileNotFoundError, match="python vector_index.py"):
+            MmapVectorIndex(str(tmp_path)).similarity_search_by_vector([1.0, 0.0], k=1)
+
+        export_collection(FakeCollection([[1.0, 0.0], [0.0, 1.0]]), str(tmp_path))
+        index = MmapVectorIndex(str(tmp_path))
+        assert index.similarity_search_by_vector([1.0, 0.1], k=1)[0].page_content == "Texto 0 sobre férias"
+        version = index.version()
+
+        for text in ("Primeira", "Segunda", "Nova versão"):
+            export_collection(FakeCollection([[1.0, 0.0]], texts=[text]), str(tmp_path))
+        assert index.similarity_search_by_vector([1.0, 0.1], k=5)[0].page_content == "Nova versão"
+        assert index.version() != version
+        assert len([entry for entry in os.listdir(tmp_path) if (tmp_path / entry).is_dir()]) == 2
+
+        export_collection(FakeCollection([]), str(tmp_path))
+        assert index.similarity_search_by_vectors([[1.0, 0.0]], k=3) == [[]]
@@ -0,0 +1,163 @@
+"""
+Token accounting for the RAG pipeline.
+
+Encoders are loaded once per encoding name and reused; a failed load is
+retried later rather than remembered. Each request records
+how many tokens went into every prompt stage (conversation history, retrieved
+context, question, prompt template) and how many the answer used. When the
+model reports usage (`usage_metadata`), its input/output totals are kept as the
+authoritative numbers and the local stage counts only describe the split.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import asdict, dataclass
+from functools import lru_cache
+from typing import Optional
+
+STAGES = ("history", "context", "question", "template", "answer")
+
+# Seconds before a process tries again to load an encoder that failed to load
+ENCODING_RETRY_SECONDS = 60.0
+# Encoding name -> (pid, monotonic time) of its last failed load
+_encoding_failures = {}
+
+
+@lru_cache(maxsize=None)
+def load_encoding(name: str):
+    """Cached tiktoken encoder; raises when tiktoken or its BPE file is unavailable, and failures are not cached"""
+    import tiktoken
+    return tiktoken.get_encoding(name)
+
+
+def get_encoding(name: str):
+    """
+    Cached tiktoken encoder, or None when it cannot be loaded. A failed load is tried again after
+    ENCODING_RETRY_SECONDS, and at once in a forked process, so a failure in the gunicorn master
+    does not leave its workers without an encoder.
+    """
+    failure = _encoding_failures.get(name)
+    if failure is not None and failure[0] == os.getpid() and time.monotonic() - failure[1] < ENCODING_RETRY_SECONDS:
+        return None
+    try:
+        encoding = load_encoding(name)
+    except Exception:
+        _encoding_failures[name] = (os.getpid(), time.monotonic())
+        return None
+    _encoding_failures.pop(name, None)
+    return encoding
+
+
+def count_tokens(text: str, encoding_name: str = "cl100k_base") -> int:
+    """Token count of `text`, or a four characters per token estimate when no encoder can be loaded"""
+    if not text:
+        return 0
+    encoding = get_encoding(encoding_name)
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+@dataclass
+class TokenUsage:
+    """Token counts of one request"""
+    session_id: Optional[str] = None
+    history: int = 0
+    context: int = 0
+    question: int = 0
+    template: int = 0
+    answer: int = 0
+    # Context tokens the packer saved by merging overlapping chunks
+    context_saved: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    source: str = "estimate"
+    cached: bool = False
+    timestamp: float = 0.0
+
+    @property
+    def total_tokens(self) -> int:
+        return self.input_tokens + self.output_tokens
+
+    def to_dict(self) -> dict:
+        return {**asdict(self), "total_tokens": self.total_tokens}
+
+
+def count_prompt_stages(history: str, context: str, question: str, prompt_text: str,
+                        encoding_name: str = "cl100k_base") -> dict:
+    """
+    Per-stage token counts of a prompt. `prompt_text` is the full rendered
+    prompt; whatever it holds beyond history, context and question is counted
+    as template.
+    """
+    counts = {
+        "history": count_tokens(history, encoding_name),
+        "context": count_tokens(context, encoding_name),
+        "question": count_tokens(question, encoding_name),
+    }
+    counts["template"] = max(0, count_tokens(prompt_text, encoding_name) - sum(counts.values()))
+    return counts
+
+
+def provider_usage(message) -> Optional[dict]:
+    """Input/output token totals reported by the model, if any"""
+    usage = getattr(message, "usage_metadata", None)
+    if not usage:
+        return None
+    return {"input_tokens": usage.get("input_tokens", 0), "output_tokens": usage.get("output_tokens", 0)}
+
+
+class TokenLedger:
+    """
+    Keeps the most recent per-request records and running totals.
+
+    Args:
+        max_records (int): Number of recent requests returned by `stats()`.
+    """
+
+    def __init__(self, max_records: int = 100):
+        self.recent = deque(maxlen=max_records)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.recent.clear()
+            self.requests = 0
+            self.cached_requests = 0
+            self.provider_reported = 0
+            self.totals = {stage: 0 for stage in STAGES}
+            self.totals.update(context_saved=0, input_tokens=0, output_tokens=0)
+
+    def record(self, usage: TokenUsage):
+        usage.timestamp = usage.timestamp or time.time()
+        with self._lock:
+            self.recent.append(usage)
+            self.requests += 1
+            if usage.cached:
+                self.cached_requests += 1
+            if usage.source == "provider":
+                self.provider_reported += 1
+            for stage in STAGES:
+                self.totals[stage] += getattr(usage, stage)
+            self.totals["context_saved"] += usage.context_saved
+            self.totals["input_tokens"] += usage.input_tokens
+            self.totals["output_tokens"] += usage.output_tokens
+
+    def stats(self, limit: Optional[int] = None) -> dict:
+        with self._lock:
+            recent = list(self.recent)[-limit:] if limit else list(self.recent)
+            billed = self.requests - self.cached_requests
+            return {
+                "requests": self.requests,
+                "cached_requests": self.cached_requests,
+                "provider_reported": self.provider_reported,
+                "totals": {**self.totals, "total_tokens": self.totals["input_tokens"] + self.totals["output_tokens"]},
+                "averages": {
+                    key: round(value / billed, 1) if billed else 0.0
+                    for key, value in self.totals.items()
+                },
+                "recent": [usage.to_dict() for usage in reversed(recent)],
+            }
@@ -0,0 +1,271 @@
+"""
+In-process exact vector search over memory-mapped files, an alternative to
+Chroma for the server's retrieve node (VECTOR_BACKEND=mmap).
+
+`export_collection` copies the `dgt_rag` collection's embeddings (L2
+normalized), IDs, texts and metadata (or those of every partition's
+collection, see partitions.py) into a directory:
+
+    <directory>/CURRENT             name of the live generation
+    <directory>/<generation>/vectors.npy     float32 or float16 matrix, one row per chunk
+    <directory>/<generation>/documents.jsonl one JSON record per chunk
+    <directory>/<generation>/offsets.npy     byte offset of each record
+    <directory>/<generation>/manifest.json   IDs, partitions, dtype, source collections
+
+Each export writes a new generation and then switches CURRENT, so a running
+server never sees half a file; it maps the new files on its next search.
+
+`MmapVectorIndex` searches them with one matrix product per batch of queries
+and `argpartition` for the top k. The files are mapped read-only, so every
+uvicorn worker on a machine shares the same page-cache copy instead of
+loading its own. Its `similarity_search_by_vector` (with a partition
+filter) and `get_by_ids` match the Chroma calls the server makes.
+
+Exact search reads the whole matrix per query (batch), so its cost grows
+with chunks x dimensions; run benchmarks/bench_vector_index.py on your
+collection before switching. float16 halves the memory but NumPy has no
+half-precision matrix product, so rows are converted block by block and
+searches are several times slower than with float32.
+
+Usage:
+    python vector_index.py                   # export to VECTOR_INDEX_PATH
+    python vector_index.py --dtype float16
+"""
+
+import argparse
+import json
+import os
+import shutil
+import threading
+import time
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+import settings
+from partitions import filter_partitions, partition_of
+
+FORMAT_VERSION = 1
+CURRENT = "CURRENT"
+# Rows converted to float32 at a time when searching a float16 matrix
+FLOAT16_BLOCK_ROWS = 4096
+# Queries scored together; bounds the (queries x chunks) score matrix
+QUERY_BLOCK = 64
+
+
+def default_path() -> str:
+    return settings.VECTOR_INDEX_PATH or os.path.join(settings.CHROMA_PERSIST_DIRECTORY, "vector_index")
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def export_collection(collection, directory: str, dtype: str = "float32", page_size: int = 5000,
+                      keep_generations: int = 2) -> str:
+    """
+    Write a new generation of the index from a chromadb collection (e.g.
+    `vector_store._collection`), or a list of them, and make it current;
+    returns its folder.
+    """
+    if dtype not in ("float32", "float16"):
+        raise ValueError(f"Unsupported dtype {dtype!r}: use float32 or float16")
+    collections = collection if isinstance(collection, (list, tuple)) else [collection]
+    count = sum(source.count() for source in collections)
+    # Sorts by export time, which pruning relies on
+    generation = f"{time.strftime('%Y%m%d-%H%M%S')}-{time.time_ns() % 10**9:09d}"
+    target = os.path.join(directory, generation)
+    os.makedirs(target)
+
+    vectors = None
+    ids: List[str] = []
+    partitions: List[str] = []
+    offsets = [0]
+    with open(os.path.join(target, "documents.jsonl"), "wb") as records:
+        for source in collections:
+            for offset in range(0, source.count(), page_size):
+                page = source.get(include=["embeddings", "documents", "metadatas"], limit=page_size, offset=offset)
+                embeddings = np.asarray(page["embeddings"], dtype=np.float32)
+                if vectors is None:
+                    vectors = np.lib.format.open_memmap(
+                        os.path.join(target, "vectors.npy"), mode="w+", dtype=dtype, shape=(count, embeddings.shape[1])
+                    )
+                vectors[len(ids):len(ids) + len(embeddings)] = normalize(embeddings)
+                for doc_id, text, metadata in zip(page["ids"], page["documents"], page["metadatas"]):
+                    record = json.dumps({"id": doc_id, "page_content": text or "", "metadata": metadata or {}},
+                                        ensure_ascii=False).encode("utf-8") + b"\n"
+                    records.write(record)
+                    offsets.append(offsets[-1] + len(record))
+                    ids.append(doc_id)
+                    partitions.append(partition_of(metadata or {}))
+    if vectors is None:
+        np.save(os.path.join(target, "vectors.npy"), np.zeros((0, 0), dtype=dtype))
+    else:
+        vectors.flush()
+        del vectors
+    np.save(os.path.join(target, "offsets.npy"), np.asarray(offsets, dtype=np.int64))
+    with open(os.path.join(target, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump({"format_version": FORMAT_VERSION, "dtype": dtype, "count": len(ids),
+                   "collections": [getattr(source, "name", None) for source in collections],
+                   "ids": ids, "partitions": partitions}, f)
+
+    pointer = os.path.join(directory, f".{CURRENT}.{generation}")
+    with open(pointer, "w", encoding="utf-8") as f:
+        f.write(generation)
+    os.replace(pointer, os.path.join(directory, CURRENT))
+
+    # Older generations go; a server still mapping one keeps reading it until it switches
+    generations = sorted(entry for entry in os.listdir(directory)
+                         if entry != generation and os.path.isdir(os.path.join(directory, entry)))
+    for old in generations[:max(0, len(generations) - (keep_generations - 1))]:
+        shutil.rmtree(os.path.join(directory, old), ignore_errors=True)
+    return target
+
+
+class _Generation:
+    """One exported generation, mapped read-only"""
+
+    def __init__(self, path: str):
+        with open(os.path.join(path, "manifest.json"), encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported vector index format in {path}")
+        self.path = path
+        self.ids: List[str] = manifest["ids"]
+        self.rows = {doc_id: row for row, doc_id in enumerate(self.ids)}
+        # Exports written before partitions were recorded cannot be filtered
+        self.partitions = np.asarray(manifest["partitions"]) if "partitions" in manifest else None
+        self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        self.records = np.memmap(os.path.join(path, "documents.jsonl"), dtype=np.uint8, mode="r") \
+            if len(self.ids) else np.zeros(0, dtype=np.uint8)
+
+    def document(self, row: int) -> Document:
+        record = json.loads(self.records[self.offsets[row]:self.offsets[row + 1]].tobytes())
+        return Document(id=record["id"], page_content=record["page_content"], metadata=record["metadata"])
+
+    def scores(self, queries: np.ndarray) -> np.ndarray:
+        """(queries x chunks) cosine similarities"""
+        if self.vectors.dtype == np.float32:
+            return queries @ self.vectors.T
+        scores = np.empty((len(queries), len(self.ids)), dtype=np.float32)
+        for start in range(0, len(self.ids), FLOAT16_BLOCK_ROWS):
+            block = self.vectors[start:start + FLOAT16_BLOCK_ROWS].astype(np.float32)
+            scores[:, start:start + len(block)] = queries @ block.T
+        return scores
+
+
+class MmapVectorIndex:
+    """
+    Exact cosine search over the index written by `export_collection`.
+
+    Args:
+        directory (str): Index folder (the one holding CURRENT).
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._generation: Optional[_Generation] = None
+        self._lock = threading.Lock()
+        self.searches = 0
+        self.queries = 0
+
+    def version(self) -> Optional[str]:
+        """Name of the current generation; changes with every export"""
+        try:
+            with open(os.path.join(self.directory, CURRENT), encoding="utf-8") as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def _current(self) -> _Generation:
+        # CURRENT is a few bytes and replaced atomically, so reading it per search is cheap and never torn
+        generation = self.version()
+        if generation is None:
+            raise FileNotFoundError(f"No vector index in {self.directory}: export one with `python vector_index.py`")
+        with self._lock:
+            if self._generation is None or os.path.basename(self._generation.path) != generation:
+                self._generation = _Generation(os.path.join(self.directory, generation))
+            return self._generation
+
+    def preload(self):
+        """Map the current generation and read its matrix once, so the first query finds it in memory"""
+        generation = self._current()
+        if len(generation.ids):
+            generation.vectors.sum(axis=0, dtype=np.float32)
+
+    def search(self, queries: Sequence[Sequence[float]], k: int,
+               partitions: Optional[Sequence[Optional[Sequence[str]]]] = None) -> List[List[Tuple[str, float]]]:
+        """
+        Top `k` (chunk ID, cosine similarity) pairs per query, best first;
+        `partitions` holds, per query, the partitions to search (None for all).
+        """
+        generation = self._current()
+        queries = np.asarray(queries, dtype=np.float32)
+        k = min(k, len(generation.ids))
+        if not k or not len(queries):
+            return [[] for _ in range(len(queries))]
+        queries = normalize(queries.reshape(len(queries), -1))
+        masks = {}
+        results = []
+        for start in range(0, len(queries), QUERY_BLOCK):
+            for row, row_scores in enumerate(generation.scores(queries[start:start + QUERY_BLOCK]), start):
+                allowed = partitions[row] if partitions is not None else None
+                if allowed is not None and generation.partitions is not None:
+                    key = tuple(sorted(allowed))
+                    if key not in masks:
+                        masks[key] = np.isin(generation.partitions, key)
+                    row_scores = np.where(masks[key], row_scores, -np.inf)
+                top = np.argpartition(-row_scores, k - 1)[:k]
+                top = top[np.argsort(-row_scores[top], kind="stable")]
+                results.append([(generation.ids[hit], float(row_scores[hit])) for hit in top
+                                if row_scores[hit] != -np.inf])
+        with self._lock:
+            self.searches += 1
+            self.queries += len(queries)
+        return results
+
+    def similarity_search_by_vectors(self, embeddings: Sequence[Sequence[float]], k: int = 4,
+                                     partitions: Optional[Sequence[Optional[Sequence[str]]]] = None
+                                     ) -> List[List[Document]]:
+        """Chroma-style results for many queries, scored in one pass over the matrix"""
+        generation = self._current()
+        return [[generation.document(generation.rows[doc_id]) for doc_id, _ in hits]
+                for hits in self.search(embeddings, k, partitions)]
+
+    def similarity_search_by_vector(self, embedding: Sequence[float], k: int = 4, filter: Optional[dict] = None,
+                                    **kwargs) -> List[Document]:
+        """`filter` takes the partition filter of partitions.partition_filter"""
+        return self.similarity_search_by_vectors([embedding], k, [filter_partitions(filter)])[0]
+
+    def get_by_ids(self, ids: Sequence[str]) -> List[Document]:
+        generation = self._current()
+        return [generation.document(generation.rows[doc_id]) for doc_id in ids if doc_id in generation.rows]
+
+    def stats(self) -> dict:
+        generation = self._current()
+        with self._lock:
+            return {
+                "generation": os.path.basename(generation.path),
+                "chunks": len(generation.ids),
+                "dimensions": generation.vectors.shape[1] if generation.vectors.ndim == 2 else 0,
+                "dtype": str(generation.vectors.dtype),
+                "matrix_mb": round(generation.vectors.nbytes / 1e6, 1),
+                "searches": self.searches,
+                "queries": self.queries,
+            }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the Chroma collection to the memory-mapped vector index.")
+    parser.add_argument("--output", default=default_path(), help="Index folder (default: VECTOR_INDEX_PATH)")
+    parser.add_argument("--dtype", choices=("float32", "float16"), default=settings.VECTOR_INDEX_DTYPE)
+    args = parser.parse_args()
+
+    import chromadb
+    collection = chromadb.PersistentClient(path=settings.CHROMA_PERSIST_DIRECTORY).get_collection(settings.CHROMA_COLLECTION)
+    started = time.perf_counter()
+    path = export_collection(collection, args.output, args.dtype)
+    print(f"Exported {collection.count()} chunks to {path} in {time.perf_counter() - started:.1f}s")